@@ -1,6 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from datetime import datetime, timedelta
 from loguru import logger
+import json
+import os
 import pandas as pd
 import numpy as np
 
@@ -18,7 +20,6 @@ factor_engine = None
 ml_manager = None
 scoring_engine = None
 portfolio_optimizer = None
-backtest_engine = None
 
 # JSON序列化辅助函数
 def convert_numpy_types(obj):
@@ -64,12 +65,20 @@ def get_portfolio_optimizer():
         portfolio_optimizer = PortfolioOptimizer()
     return portfolio_optimizer
 
+def clamp_workers(value):
+    """请求体中的工作进程数限制在 [1, CPU核数]，未指定时返回 None（由服务取默认值）"""
+    if value is None:
+        return None
+    return max(1, min(int(value), os.cpu_count() or 1))
+
 def get_backtest_engine():
-    """获取回测引擎实例（延迟初始化）"""
-    global backtest_engine
-    if backtest_engine is None:
-        backtest_engine = BacktestEngine()
-    return backtest_engine
+    """
+    创建回测引擎实例
+
+    回测引擎在实例上保存单次回测的面板和选股/权重/交易日缓存，每个请求使用独立实例，
+    避免并发请求复用或提前释放其他请求的面板
+    """
+    return BacktestEngine()
 
 
 @ml_factor_bp.route('/factors/calculate', methods=['POST'])
@@ -708,7 +717,8 @@ def optimize_portfolio():
             expected_returns_series, 
             risk_model_df, 
             method, 
-            constraints
+            constraints,
+            as_of_date=data.get('as_of_date')
         )
         
         if 'error' in result:
@@ -721,6 +731,91 @@ def optimize_portfolio():
         return jsonify({'error': str(e)}), 500
 
 
+@ml_factor_bp.route('/portfolio/frontier', methods=['POST'])
+def portfolio_frontier():
+    """
+    有效前沿 / 多情景组合优化
+    
+    请求体: expected_returns, risk_aversions（风险厌恶系数网格）和/或 constraint_sets（约束集合网格），
+    可选 constraints（共用约束）、method、risk_model、as_of_date、max_workers、stream（默认true）
+    
+    stream 为 true 时以 NDJSON 逐行返回：start 事件、每个情景完成时一条 point 事件、最后一条 done 事件；
+    否则一次性返回按预期风险排序的前沿
+    """
+    try:
+        from app.services.efficient_frontier import EfficientFrontierRunner, build_scenarios
+        
+        data = request.get_json()
+        
+        # 参数验证
+        expected_returns = data.get('expected_returns')
+        if not expected_returns:
+            return jsonify({'error': '缺少预期收益率数据'}), 400
+        risk_aversions = data.get('risk_aversions')
+        constraint_sets = data.get('constraint_sets')
+        if not risk_aversions and not constraint_sets:
+            return jsonify({'error': '缺少情景参数: risk_aversions 或 constraint_sets'}), 400
+        n_scenarios = len(risk_aversions or [None]) * len(constraint_sets or [None])
+        max_scenarios = current_app.config.get('FRONTIER_MAX_SCENARIOS', 200)
+        if n_scenarios > max_scenarios:
+            return jsonify({'error': f'情景数 {n_scenarios} 超过上限 {max_scenarios}'}), 400
+        try:
+            max_workers = clamp_workers(data.get('max_workers'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_workers 必须为整数'}), 400
+        
+        expected_returns_series = pd.Series(expected_returns)
+        method = data.get('method', 'mean_variance')
+        risk_model = data.get('risk_model')
+        risk_model_df = pd.DataFrame(risk_model) if risk_model else None
+        optimizer = get_portfolio_optimizer()
+        
+        if not data.get('stream', True):
+            result = optimizer.efficient_frontier(
+                expected_returns_series, risk_aversions, constraint_sets, data.get('constraints'),
+                risk_model_df, method, data.get('as_of_date'), max_workers
+            )
+            if 'error' in result:
+                return jsonify({'error': result['error']}), 500
+            return jsonify(convert_numpy_types(result))
+        
+        if method not in optimizer.optimization_methods:
+            return jsonify({'error': f'不支持的优化方法: {method}'}), 400
+        
+        # 风险模型在开始流式返回之前取好（需要应用上下文访问数据库）
+        runner = EfficientFrontierRunner(optimizer, max_workers)
+        scenarios = build_scenarios(data.get('constraints'), risk_aversions, constraint_sets)
+        model = runner.prepare(expected_returns_series, risk_model_df, data.get('as_of_date'))
+        
+        def generate():
+            started = datetime.now()
+            yield json.dumps({
+                'event': 'start',
+                'method': method,
+                'scenarios': len(scenarios),
+                'workers': runner.workers(len(scenarios)),
+                'risk_model_date': str(model.trade_date) if model.trade_date else None
+            }, ensure_ascii=False) + '\n'
+            
+            succeeded = 0
+            for point in runner.iter_points(expected_returns_series, scenarios, model, method):
+                succeeded += int(point['success'])
+                yield json.dumps({'event': 'point', **convert_numpy_types(point)}, ensure_ascii=False) + '\n'
+            
+            yield json.dumps({
+                'event': 'done',
+                'succeeded': succeeded,
+                'failed': len(scenarios) - succeeded,
+                'total_seconds': (datetime.now() - started).total_seconds()
+            }, ensure_ascii=False) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        logger.error(f"有效前沿求解失败: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @ml_factor_bp.route('/portfolio/rebalance', methods=['POST'])
 def rebalance_portfolio():
     """组合再平衡"""
@@ -908,8 +1003,13 @@ def compare_strategies():
         if not isinstance(strategies, list) or len(strategies) < 2:
             return jsonify({'error': '至少需要2个策略进行比较'}), 400
         
+        try:
+            max_workers = clamp_workers(data.get('max_workers'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'max_workers 必须为整数'}), 400
+        
         # 执行策略比较
-        result = get_backtest_engine().compare_strategies(strategies, start_date, end_date)
+        result = get_backtest_engine().compare_strategies(strategies, start_date, end_date, max_workers)
         
         if 'error' in result:
             return jsonify({'error': result['error']}), 500
@@ -248,6 +248,42 @@ def check_data_quality():
         }), 500
 
 
+@realtime_analysis_bp.route('/data/audit', methods=['POST'])
+def audit_data_quality():
+    """全市场分钟数据质量审计，可选按缺口列表补齐"""
+    try:
+        from datetime import datetime
+        from app.services.data_quality_auditor import MinuteDataAuditor
+        from app.services.minute_data_sync_service import MinuteDataSyncService
+
+        data = request.get_json() or {}
+        period_type = data.get('period_type', '5min')
+        start_date = data.get('start_date')
+        end_date = data.get('end_date')
+        start_time = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        end_time = datetime.strptime(end_date, '%Y-%m-%d').replace(hour=23, minute=59) if end_date else None
+
+        result = MinuteDataAuditor().audit(period_type, start_time, end_time, ts_codes=data.get('ts_codes'),
+                                           threshold=float(data.get('threshold', 100.0)))
+        if data.get('backfill') and result['gaps']:
+            with MinuteDataSyncService() as sync_service:
+                result['backfill'] = sync_service.backfill_gaps(result['gaps'])
+
+        result['gaps'] = [{**gap, 'start': gap['start'].isoformat(), 'end': gap['end'].isoformat()}
+                          for gap in result['gaps']]
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+
+    except Exception as e:
+        logger.error(f"数据质量审计API错误: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f'审计失败: {str(e)}'
+        }), 500
+
+
 @realtime_analysis_bp.route('/data/latest', methods=['GET'])
 def get_latest_data():
     """获取最新数据"""
@@ -12,6 +12,7 @@ import pandas as pd
 import math
 
 from app.services.realtime_indicator_engine import RealtimeIndicatorEngine
+from app.services.batch_indicator_engine import BatchIndicatorEngine
 from app.models.realtime_indicator import RealtimeIndicator
 from app.models.stock_minute_data import StockMinuteData
 
@@ -22,6 +23,7 @@ realtime_indicators_bp = Blueprint('realtime_indicators', __name__)
 
 # 初始化指标引擎
 indicator_engine = RealtimeIndicatorEngine()
+batch_indicator_engine = BatchIndicatorEngine()
 
 
 @realtime_indicators_bp.route('/calculate', methods=['POST'])
@@ -315,6 +317,54 @@ def batch_calculate_indicators():
         return jsonify({'success': False, 'message': str(e)})
 
 
+@realtime_indicators_bp.route('/v2/batch-calculate', methods=['POST'])
+def batch_calculate_indicators_v2():
+    """
+    批量计算指标（多只股票、多个周期一次读取、一次计算、一次写入）
+    返回按周期汇总的统计，不含每只股票的指标值；需要逐只股票结果的调用方使用 /batch-calculate
+    """
+    try:
+        data = request.get_json()
+        stock_codes = data.get('stock_codes', [])
+        period_types = data.get('period_types') or [data.get('period_type', '1min')]
+        indicators = data.get('indicators')
+        lookback_days = data.get('lookback_days', 7)
+        layout = data.get('layout', 'long')
+        
+        if not stock_codes:
+            return jsonify({'success': False, 'message': '股票代码列表不能为空'})
+        if layout not in ('long', 'wide'):
+            return jsonify({'success': False, 'message': f'不支持的存储格式: {layout}'})
+        
+        result = batch_indicator_engine.calculate(
+            ts_codes=stock_codes,
+            period_types=period_types,
+            indicators=indicators,
+            lookback_days=lookback_days,
+            layout=layout
+        )
+        
+        if not result.get('success'):
+            return jsonify(result)
+        
+        return jsonify({
+            'success': True,
+            'data': result['period_stats'],
+            'summary': {
+                'total': len(stock_codes),
+                'total_bars': result['total_bars'],
+                'stored_records': result['stored_records'],
+                'layout': result['layout'],
+                'elapsed_seconds': result['elapsed_seconds'],
+                'bars_per_second': result['bars_per_second']
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"批量计算指标失败: {str(e)}")
+        return jsonify({'success': False, 'message': str(e)})
+
+
 @realtime_indicators_bp.route('/compare', methods=['POST'])
 def compare_indicators():
     """比较多个股票的指标"""
@@ -3,7 +3,7 @@ WebSocket管理API
 提供WebSocket连接管理和推送配置功能
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app.services.websocket_push_service import push_service
 from app.websocket.websocket_events import get_connection_stats
 import logging
@@ -116,11 +116,19 @@ def update_push_config():
 def start_push_service():
     """启动推送服务"""
     try:
-        push_service.start_push_service()
+        data = request.get_json(silent=True) or {}
+        mode = data.get('mode', 'polling')
+        if mode not in ('polling', 'event'):
+            return jsonify({
+                'success': False,
+                'message': f'不支持的推送模式: {mode}'
+            }), 400
+        
+        push_service.start_push_service(mode=mode, app=current_app._get_current_object())
         
         return jsonify({
             'success': True,
-            'message': '推送服务启动成功'
+            'message': f'推送服务启动成功（{mode}模式）'
         })
         
     except Exception as e:
@@ -184,6 +192,63 @@ def trigger_push():
             'message': f'触发推送失败: {str(e)}'
         }), 500
 
+@websocket_api_bp.route('/publish-bars', methods=['POST'])
+def publish_bars():
+    """发布新K线到实时事件管道（event 模式）"""
+    try:
+        data = request.get_json() or {}
+        bars = data.get('bars', [])
+        period_type = data.get('period_type', '1min')
+        
+        if not push_service.pipeline:
+            return jsonify({
+                'success': False,
+                'message': '推送服务未以event模式运行'
+            }), 400
+        if not bars:
+            return jsonify({
+                'success': False,
+                'message': '请提供K线数据'
+            }), 400
+        
+        published = push_service.publish_bars(bars, period_type)
+        
+        return jsonify({
+            'success': True,
+            'data': {'published': published},
+            'message': f'已发布 {published} 根K线'
+        })
+        
+    except Exception as e:
+        logger.error(f"发布K线失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'发布K线失败: {str(e)}'
+        }), 500
+
+@websocket_api_bp.route('/pipeline-latency', methods=['GET'])
+def get_pipeline_latency():
+    """获取实时管道各阶段的延迟分布"""
+    try:
+        if not push_service.pipeline:
+            return jsonify({
+                'success': False,
+                'message': '推送服务未以event模式运行'
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': push_service.pipeline.get_latency_stats(),
+            'message': '延迟统计获取成功'
+        })
+        
+    except Exception as e:
+        logger.error(f"获取管道延迟统计失败: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'获取管道延迟统计失败: {str(e)}'
+        }), 500
+
 @websocket_api_bp.route('/test-connection', methods=['POST'])
 def test_connection():
     """测试WebSocket连接"""
@@ -12,6 +12,7 @@ from .ml_model_definition import MLModelDefinition
 from .ml_predictions import MLPredictions
 from .stock_income_statement import StockIncomeStatement
 from .stock_balance_sheet import StockBalanceSheet
+from .risk_model_snapshot import RiskModelSnapshot
 from .text2sql_metadata import TableMetadata, FieldMetadata, QueryTemplate, QueryHistory, BusinessDictionary
 
 __all__ = [
@@ -29,6 +30,7 @@ __all__ = [
     'MLPredictions',
     'StockIncomeStatement',
     'StockBalanceSheet',
+    'RiskModelSnapshot',
     'TableMetadata',
     'FieldMetadata', 
     'QueryTemplate',
@@ -0,0 +1,44 @@
+"""
+流式指标状态快照模型
+按 (ts_code, period_type) 保存指标运行状态，服务重启后恢复，无需全量重算
+"""
+
+from app.extensions import db
+from datetime import datetime
+import pandas as pd
+
+
+class IndicatorStreamState(db.Model):
+    """流式指标状态快照表"""
+    __tablename__ = 'indicator_stream_state'
+    
+    ts_code = db.Column(db.String(20), primary_key=True, comment='股票代码')
+    period_type = db.Column(db.String(10), primary_key=True, comment='周期类型')
+    last_datetime = db.Column(db.DateTime, comment='已处理的最新K线时间')
+    state = db.Column(db.Text, comment='状态快照(JSON)')
+    updated_at = db.Column(db.DateTime, default=datetime.now, comment='更新时间')
+    
+    def __repr__(self):
+        return f'<IndicatorStreamState {self.ts_code} {self.period_type} {self.last_datetime}>'
+    
+    @classmethod
+    def load_states(cls, ts_codes=None, period_type=None):
+        """读取状态快照"""
+        query = cls.query
+        if ts_codes:
+            query = query.filter(cls.ts_code.in_(ts_codes))
+        if period_type:
+            query = query.filter(cls.period_type == period_type)
+        return query.all()
+    
+    @classmethod
+    def save_states(cls, records):
+        """批量写入状态快照"""
+        if not records:
+            return 0
+        from app.utils.db_utils import DatabaseUtils
+        
+        result = DatabaseUtils.bulk_upsert_dataframe(
+            pd.DataFrame(records), cls, key_columns=['ts_code', 'period_type']
+        )
+        return result['rows_written']
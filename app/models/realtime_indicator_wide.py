@@ -0,0 +1,199 @@
+"""
+实时技术指标宽表模型
+每根K线一行 (ts_code, period_type, datetime)，每个指标输出一个单精度浮点列，
+相比 realtime_indicators 的 (指标名, value1..value4) 长表约少十倍行数，读取时一次范围扫描即可得到全部指标
+"""
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, select
+
+from app.extensions import db
+
+
+# 指标名 -> 宽表列（按 value1..value4 的顺序）
+WIDE_INDICATOR_COLUMNS = {
+    'MA5': ['ma5'],
+    'MA10': ['ma10'],
+    'MA20': ['ma20'],
+    'MA30': ['ma30'],
+    'MA60': ['ma60'],
+    'EMA12': ['ema12'],
+    'EMA26': ['ema26'],
+    'MACD': ['macd_dif', 'macd_dea', 'macd_hist'],
+    'RSI': ['rsi'],
+    'KDJ': ['kdj_k', 'kdj_d', 'kdj_j'],
+    'BOLL': ['boll_upper', 'boll_mid', 'boll_lower'],
+    'CCI': ['cci'],
+    'WR': ['wr'],
+    'ATR': ['atr'],
+    'OBV': ['obv'],
+}
+
+INDICATOR_VALUE_COLUMNS = [column for columns in WIDE_INDICATOR_COLUMNS.values() for column in columns]
+
+KEY_COLUMNS = ['ts_code', 'period_type', 'datetime']
+
+# 单精度浮点（MySQL FLOAT，4字节）
+Float32 = Float(precision=24)
+
+
+class RealtimeIndicatorWide(db.Model):
+    """实时技术指标宽表"""
+    __tablename__ = 'realtime_indicators_wide'
+
+    ts_code = db.Column(db.String(10), primary_key=True, comment='股票代码')
+    period_type = db.Column(db.String(10), primary_key=True, comment='周期类型')
+    datetime = db.Column(db.DateTime, primary_key=True, comment='K线时间')
+
+    ma5 = db.Column(Float32, comment='MA5')
+    ma10 = db.Column(Float32, comment='MA10')
+    ma20 = db.Column(Float32, comment='MA20')
+    ma30 = db.Column(Float32, comment='MA30')
+    ma60 = db.Column(Float32, comment='MA60')
+    ema12 = db.Column(Float32, comment='EMA12')
+    ema26 = db.Column(Float32, comment='EMA26')
+    macd_dif = db.Column(Float32, comment='MACD DIF')
+    macd_dea = db.Column(Float32, comment='MACD DEA')
+    macd_hist = db.Column(Float32, comment='MACD柱')
+    rsi = db.Column(Float32, comment='RSI')
+    kdj_k = db.Column(Float32, comment='KDJ K值')
+    kdj_d = db.Column(Float32, comment='KDJ D值')
+    kdj_j = db.Column(Float32, comment='KDJ J值')
+    boll_upper = db.Column(Float32, comment='布林上轨')
+    boll_mid = db.Column(Float32, comment='布林中轨')
+    boll_lower = db.Column(Float32, comment='布林下轨')
+    cci = db.Column(Float32, comment='CCI')
+    wr = db.Column(Float32, comment='威廉指标')
+    atr = db.Column(Float32, comment='ATR')
+    obv = db.Column(Float32, comment='OBV（单精度，约7位有效数字）')
+
+    def __repr__(self):
+        return f'<RealtimeIndicatorWide {self.ts_code} {self.period_type} {self.datetime}>'
+
+    def to_dict(self):
+        """转换为字典格式"""
+        data = {
+            'ts_code': self.ts_code,
+            'period_type': self.period_type,
+            'datetime': self.datetime.isoformat() if self.datetime else None,
+        }
+        for column in INDICATOR_VALUE_COLUMNS:
+            data[column] = getattr(self, column)
+        return data
+
+    @classmethod
+    def read_arrays(cls, ts_code: str, period_type: str, start_time=None, end_time=None,
+                    columns: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        按主键范围读取一只股票的指标，直接返回NumPy数组
+
+        Returns:
+            {'datetime': datetime64数组, 列名: float32数组}，按时间升序，缺失值为NaN
+        """
+        columns = [c for c in (columns or INDICATOR_VALUE_COLUMNS) if c in INDICATOR_VALUE_COLUMNS]
+        query = select(cls.datetime, *[getattr(cls, c) for c in columns]).where(
+            cls.ts_code == ts_code, cls.period_type == period_type
+        )
+        if start_time:
+            query = query.where(cls.datetime >= start_time)
+        if end_time:
+            query = query.where(cls.datetime <= end_time)
+        rows = db.session.execute(query.order_by(cls.datetime)).fetchall()
+
+        arrays = {'datetime': np.array([row[0] for row in rows], dtype='datetime64[us]')}
+        values = np.array([row[1:] for row in rows], dtype=np.float32).reshape(len(rows), len(columns))
+        for i, column in enumerate(columns):
+            arrays[column] = values[:, i]
+        return arrays
+
+    @classmethod
+    def long_to_wide(cls, long_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        将 realtime_indicators 长表格式（indicator_name + value1..value4）转换为宽表行
+        不在 WIDE_INDICATOR_COLUMNS 中的指标名被忽略
+        """
+        parts = []
+        for name, columns in WIDE_INDICATOR_COLUMNS.items():
+            subset = long_df[long_df['indicator_name'] == name]
+            if subset.empty:
+                continue
+            part = subset[KEY_COLUMNS].copy()
+            for i, column in enumerate(columns):
+                part[column] = pd.to_numeric(subset[f'value{i + 1}'], errors='coerce')
+            # 同一根K线同一指标重复时保留最后一条
+            parts.append(part.drop_duplicates(KEY_COLUMNS, keep='last').set_index(KEY_COLUMNS))
+
+        if not parts:
+            return pd.DataFrame(columns=KEY_COLUMNS + INDICATOR_VALUE_COLUMNS)
+
+        wide = pd.concat(parts, axis=1).reindex(columns=INDICATOR_VALUE_COLUMNS)
+        wide = wide.astype(np.float32).reset_index()
+        return wide.sort_values(KEY_COLUMNS).reset_index(drop=True)
+
+    @classmethod
+    def prepare_frame(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """整理为宽表列顺序，数值先舍入到单精度，inf视为缺失，再以float64交给驱动（DBAPI不接受numpy.float32）"""
+        df = df.reindex(columns=KEY_COLUMNS + INDICATOR_VALUE_COLUMNS).copy()
+        values = df[INDICATOR_VALUE_COLUMNS].astype(np.float32).astype(np.float64)
+        df[INDICATOR_VALUE_COLUMNS] = values.where(np.isfinite(values))
+        return df
+
+    @classmethod
+    def save_frame(cls, df: pd.DataFrame, chunk_size: int = 5000) -> int:
+        """按主键批量写入（已存在的行更新为新值）"""
+        if df is None or df.empty:
+            return 0
+        from app.utils.db_utils import DatabaseUtils
+
+        result = DatabaseUtils.bulk_upsert_dataframe(cls.prepare_frame(df), cls, key_columns=KEY_COLUMNS,
+                                                     chunk_size=chunk_size)
+        return result['rows_written']
+
+    @classmethod
+    def migrate_from_long(cls, period_types: List[str] = None, ts_codes: List[str] = None,
+                          batch_size: int = 200, start_time=None) -> Dict[str, int]:
+        """
+        从 realtime_indicators 长表迁移到宽表
+        按周期、每批 batch_size 只股票读取长表，在内存中转为宽表行后按主键写入，可重复执行
+
+        Returns:
+            {'long_rows': 读取的长表行数, 'wide_rows': 写入的宽表行数}
+        """
+        from app.models.realtime_indicator import RealtimeIndicator
+
+        if not period_types:
+            period_types = [row[0] for row in db.session.execute(
+                select(RealtimeIndicator.period_type).distinct()).fetchall()]
+
+        long_rows = 0
+        wide_rows = 0
+        for period_type in period_types:
+            codes = ts_codes or [row[0] for row in db.session.execute(
+                select(RealtimeIndicator.ts_code).where(RealtimeIndicator.period_type == period_type)
+                .distinct().order_by(RealtimeIndicator.ts_code)).fetchall()]
+
+            for offset in range(0, len(codes), batch_size):
+                batch = codes[offset:offset + batch_size]
+                query = select(
+                    RealtimeIndicator.ts_code, RealtimeIndicator.period_type, RealtimeIndicator.datetime,
+                    RealtimeIndicator.indicator_name, RealtimeIndicator.value1, RealtimeIndicator.value2,
+                    RealtimeIndicator.value3, RealtimeIndicator.value4
+                ).where(
+                    RealtimeIndicator.period_type == period_type,
+                    RealtimeIndicator.ts_code.in_(batch),
+                    RealtimeIndicator.indicator_name.in_(list(WIDE_INDICATOR_COLUMNS.keys()))
+                ).order_by(RealtimeIndicator.id)
+                if start_time:
+                    query = query.where(RealtimeIndicator.datetime >= start_time)
+
+                long_df = pd.read_sql(query, db.engine)
+                long_rows += len(long_df)
+                if long_df.empty:
+                    continue
+                long_df['datetime'] = pd.to_datetime(long_df['datetime'])
+                wide_rows += cls.save_frame(cls.long_to_wide(long_df))
+
+        return {'long_rows': long_rows, 'wide_rows': wide_rows}
@@ -0,0 +1,35 @@
+"""
+因子风险模型快照
+按 (trade_date, model_name) 保存某日估计的结构化风险模型：因子暴露矩阵、因子协方差和特异方差，
+以压缩的numpy数组打包存储，供组合优化按日期时点查询
+"""
+
+from app.extensions import db
+from datetime import datetime
+from sqlalchemy.dialects.mysql import LONGBLOB
+
+
+class RiskModelSnapshot(db.Model):
+    """因子风险模型快照表"""
+    __tablename__ = 'risk_model_snapshot'
+
+    trade_date = db.Column(db.Date, primary_key=True, comment='估计日期（只使用该日及之前的数据）')
+    model_name = db.Column(db.String(50), primary_key=True, default='default', comment='模型名称')
+    n_stocks = db.Column(db.Integer, comment='股票数量')
+    n_factors = db.Column(db.Integer, comment='因子数量')
+    payload = db.Column(db.LargeBinary().with_variant(LONGBLOB, 'mysql'), nullable=False,
+                        comment='npz打包的 ts_codes/factor_names/exposures/factor_cov/specific_var')
+    created_at = db.Column(db.DateTime, default=datetime.now, comment='创建时间')
+
+    def __repr__(self):
+        return f'<RiskModelSnapshot {self.model_name} {self.trade_date} {self.n_stocks}x{self.n_factors}>'
+
+    def to_dict(self):
+        """转换为字典格式（不含数组数据）"""
+        return {
+            'trade_date': self.trade_date.isoformat() if self.trade_date else None,
+            'model_name': self.model_name,
+            'n_stocks': self.n_stocks,
+            'n_factors': self.n_factors,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
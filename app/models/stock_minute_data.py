@@ -34,9 +34,9 @@ class StockMinuteData(db.Model):
     created_at = db.Column(db.DateTime, default=func.now(), comment='创建时间')
     updated_at = db.Column(db.DateTime, default=func.now(), onupdate=func.now(), comment='更新时间')
     
-    # 创建复合索引以提高查询性能
+    # 创建复合索引以提高查询性能，(ts_code, datetime, period_type) 唯一，支持批量upsert
     __table_args__ = (
-        Index('idx_ts_code_datetime_period', 'ts_code', 'datetime', 'period_type'),
+        Index('idx_ts_code_datetime_period', 'ts_code', 'datetime', 'period_type', unique=True),
         Index('idx_datetime_period', 'datetime', 'period_type'),
         Index('idx_ts_code_period', 'ts_code', 'period_type'),
     )
@@ -114,48 +114,7 @@ class StockMinuteData(db.Model):
     
     @classmethod
     def check_data_quality(cls, ts_code, period_type='1min', hours=24):
-        """检查数据质量"""
-        from datetime import datetime, timedelta
+        """检查数据质量（按交易日历和交易时段计算应有K线数，见 MinuteDataAuditor）"""
+        from app.services.data_quality_auditor import MinuteDataAuditor
         
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=hours)
-        
-        # 获取时间范围内的数据
-        data = cls.get_data_by_time_range(ts_code, start_time, end_time, period_type)
-        
-        if not data:
-            return {
-                'status': 'no_data',
-                'message': f'没有找到 {ts_code} 在过去 {hours} 小时的 {period_type} 数据',
-                'data_count': 0,
-                'missing_count': 0,
-                'completeness': 0.0
-            }
-        
-        # 计算预期数据点数量（简化计算，实际需要考虑交易时间）
-        if period_type == '1min':
-            expected_points = hours * 60
-        elif period_type == '5min':
-            expected_points = hours * 12
-        elif period_type == '15min':
-            expected_points = hours * 4
-        elif period_type == '30min':
-            expected_points = hours * 2
-        elif period_type == '60min':
-            expected_points = hours
-        else:
-            expected_points = len(data)
-        
-        actual_points = len(data)
-        missing_points = max(0, expected_points - actual_points)
-        completeness = (actual_points / expected_points) * 100 if expected_points > 0 else 0
-        
-        return {
-            'status': 'ok' if completeness > 80 else 'incomplete',
-            'message': f'数据完整性: {completeness:.1f}%',
-            'data_count': actual_points,
-            'missing_count': missing_points,
-            'completeness': completeness,
-            'latest_time': data[-1].datetime.isoformat() if data else None,
-            'earliest_time': data[0].datetime.isoformat() if data else None
-        } 
\ No newline at end of file
+        return MinuteDataAuditor().check_stock(ts_code, period_type, hours) 
\ No newline at end of file
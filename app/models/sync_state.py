@@ -0,0 +1,71 @@
+"""
+数据同步状态模型
+按 (ts_code, period_type) 记录已同步数据的高水位，用于增量同步
+"""
+
+from app.extensions import db
+from datetime import datetime
+from sqlalchemy import func, select
+import pandas as pd
+
+
+class SyncState(db.Model):
+    """数据同步高水位表"""
+    __tablename__ = 'sync_state'
+    
+    ts_code = db.Column(db.String(20), primary_key=True, comment='股票代码')
+    period_type = db.Column(db.String(10), primary_key=True, comment='周期类型')
+    last_datetime = db.Column(db.DateTime, comment='已同步的最新K线时间')
+    last_sync_at = db.Column(db.DateTime, default=datetime.now, comment='最近同步时间')
+    
+    def __repr__(self):
+        return f'<SyncState {self.ts_code} {self.period_type} {self.last_datetime}>'
+    
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'ts_code': self.ts_code,
+            'period_type': self.period_type,
+            'last_datetime': self.last_datetime.isoformat() if self.last_datetime else None,
+            'last_sync_at': self.last_sync_at.isoformat() if self.last_sync_at else None
+        }
+    
+    @classmethod
+    def load_watermarks(cls, period_type):
+        """
+        一次查询加载某周期所有股票的高水位
+        同步状态表为空时，用一次分组查询从分钟数据表初始化并写回
+        :return: {ts_code: last_datetime}
+        """
+        rows = db.session.execute(
+            select(cls.ts_code, cls.last_datetime).where(cls.period_type == period_type)
+        ).fetchall()
+        if rows:
+            return {row[0]: row[1] for row in rows}
+        
+        from app.models.stock_minute_data import StockMinuteData
+        rows = db.session.execute(
+            select(StockMinuteData.ts_code, func.max(StockMinuteData.datetime))
+            .where(StockMinuteData.period_type == period_type)
+            .group_by(StockMinuteData.ts_code)
+        ).fetchall()
+        watermarks = {row[0]: row[1] for row in rows}
+        if watermarks:
+            cls.save_watermarks(period_type, watermarks)
+        return watermarks
+    
+    @classmethod
+    def save_watermarks(cls, period_type, watermarks):
+        """批量写入高水位 {ts_code: last_datetime}"""
+        if not watermarks:
+            return 0
+        from app.utils.db_utils import DatabaseUtils
+        
+        df = pd.DataFrame({
+            'ts_code': list(watermarks.keys()),
+            'period_type': period_type,
+            'last_datetime': list(watermarks.values()),
+            'last_sync_at': datetime.now()
+        })
+        result = DatabaseUtils.bulk_upsert_dataframe(df, cls, key_columns=['ts_code', 'period_type'])
+        return result['rows_written']
@@ -1,3 +1,4 @@
+import json
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
@@ -8,20 +9,33 @@ warnings.filterwarnings('ignore')
 
 from app.extensions import db
 from app.models import StockDailyHistory, FactorValues, MLPredictions
+from app.utils.columnar_store import read_daily_table
 from app.services.factor_engine import FactorEngine
 from app.services.ml_models import MLModelManager
 from app.services.stock_scoring import StockScoringEngine
 from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.backtest_panel import BacktestPricePanel
 
 
 class BacktestEngine:
-    """回测验证引擎"""
+    """
+    回测验证引擎
+
+    实例上保存单次回测（或一次策略比较）的面板和缓存，不能在并发请求之间共享
+    """
     
     def __init__(self):
         self.factor_engine = None
         self.ml_manager = None
         self.scoring_engine = None
         self.portfolio_optimizer = None
+        self.panel = None
+        # 按 (选股配置, 日期) 缓存的选股结果、按 (选股配置, 优化配置, 日期) 缓存的目标权重，
+        # 同一引擎上比较多个策略时，选股口径相同的策略共享结果
+        self.selection_cache = {}
+        self.weight_cache = {}
+        # 按 (开始日期, 结束日期) 缓存的全部交易日
+        self.trade_day_cache = {}
     
     def _get_factor_engine(self):
         """延迟初始化因子引擎"""
@@ -47,10 +61,41 @@ class BacktestEngine:
             self.portfolio_optimizer = PortfolioOptimizer()
         return self.portfolio_optimizer
         
+    def reset_caches(self):
+        """清空选股、权重和交易日缓存"""
+        self.selection_cache = {}
+        self.weight_cache = {}
+        self.trade_day_cache = {}
+    
+    @staticmethod
+    def selection_key(strategy_config: Dict[str, Any]) -> str:
+        """选股配置的规范化键：只包含影响选股结果的字段"""
+        selection_method = strategy_config.get('selection_method', 'factor_based')
+        if selection_method == 'ml_based':
+            fields = {'model_ids': list(strategy_config.get('model_ids', []))}
+        else:
+            fields = {'factor_list': list(strategy_config.get('factor_list', [])),
+                      'weights': strategy_config.get('weights', {})}
+        fields.update(selection_method=selection_method, top_n=strategy_config.get('top_n', 50))
+        return json.dumps(fields, sort_keys=True, default=str)
+    
+    @staticmethod
+    def optimization_key(optimization_config: Dict[str, Any]) -> str:
+        """组合优化配置的规范化键"""
+        return json.dumps(optimization_config or {}, sort_keys=True, default=str)
+    
+    @staticmethod
+    def path_dependent(optimization_config: Dict[str, Any]) -> bool:
+        """目标权重是否依赖上一期权重（此时不能按日期在策略间共享）"""
+        optimization_config = optimization_config or {}
+        return PortfolioOptimizer.uses_previous_weights(optimization_config.get('method', 'equal_weight'),
+                                                        optimization_config.get('constraints'))
+    
     def run_backtest(self, strategy_config: Dict[str, Any], 
                     start_date: str, end_date: str,
                     initial_capital: float = 1000000.0,
-                    rebalance_frequency: str = 'monthly') -> Dict[str, Any]:
+                    rebalance_frequency: str = 'monthly',
+                    preload: bool = True) -> Dict[str, Any]:
         """
         运行回测
         
@@ -60,16 +105,33 @@ class BacktestEngine:
             end_date: 结束日期
             initial_capital: 初始资金
             rebalance_frequency: 再平衡频率 ('daily', 'weekly', 'monthly')
+            preload: 是否预加载价格和因子面板，关闭时每个交易日单独查询数据库；
+                     引擎上已有面板（如策略比较时共享的面板）时直接使用
             
         Returns:
             回测结果
         """
+        owns_panel = False
         try:
             logger.info(f"开始回测: {start_date} to {end_date}")
             
+            # 单独回测时不沿用上一次回测的缓存（期间数据可能已更新），共享面板的策略比较期间保留
+            if self.panel is None:
+                self.reset_caches()
+            
             # 生成交易日期
             trade_dates = self._generate_trade_dates(start_date, end_date, rebalance_frequency)
             
+            # 预加载整个回测区间的价格矩阵和因子立方体
+            owns_panel = preload and self.panel is None
+            if owns_panel:
+                factor_list = []
+                if strategy_config.get('selection_method', 'factor_based') != 'ml_based':
+                    factor_list = strategy_config.get('factor_list', [])
+                self.panel = BacktestPricePanel.load(start_date, end_date, factor_list)
+                # 一次性缓存面板内所有股票的基本信息，避免选股时逐日查询
+                self._get_scoring_engine()._get_stock_info(list(self.panel.ts_codes))
+            
             # 初始化回测状态
             portfolio_values = []
             positions = {}
@@ -80,6 +142,7 @@ class BacktestEngine:
             daily_returns = []
             daily_positions = []
             daily_turnover = []
+            previous_weights = None
             
             for i, trade_date in enumerate(trade_dates):
                 logger.info(f"处理交易日: {trade_date}")
@@ -93,12 +156,23 @@ class BacktestEngine:
                         continue
                     
                     # 组合优化
-                    target_weights = self._get_target_weights(
-                        selected_stocks, strategy_config.get('optimization', {})
-                    )
+                    optimization_config = strategy_config.get('optimization', {})
+                    weight_key = (self.selection_key(strategy_config),
+                                  self.optimization_key(optimization_config), str(trade_date))
+                    if self.path_dependent(optimization_config):
+                        # 带换手率项的优化结果取决于上一期权重，缓存键包含上一期权重
+                        weight_key += (tuple(sorted((previous_weights or {}).items())),)
+                    target_weights = self.weight_cache.get(weight_key)
+                    if target_weights is None:
+                        target_weights = self._get_target_weights(selected_stocks, optimization_config, trade_date,
+                                                                  previous_weights)
+                        self.weight_cache[weight_key] = target_weights
+                    previous_weights = target_weights
                     
-                    # 计算当前持仓价值
-                    current_prices = self._get_current_prices(trade_date, list(positions.keys()))
+                    # 计算当前持仓价值（同时取目标股票的价格用于建仓）
+                    current_prices = self._get_current_prices(
+                        trade_date, list(set(positions.keys()) | set(target_weights.keys()))
+                    )
                     current_portfolio_value = self._calculate_portfolio_value(
                         positions, current_prices, cash
                     )
@@ -160,18 +234,24 @@ class BacktestEngine:
         except Exception as e:
             logger.error(f"回测失败: {e}")
             return {'error': str(e)}
+        finally:
+            if owns_panel:
+                self.panel = None
     
     def _generate_trade_dates(self, start_date: str, end_date: str, 
                             frequency: str) -> List[str]:
         """生成交易日期"""
         try:
-            # 获取所有交易日
-            query = db.session.query(StockDailyHistory.trade_date).distinct()
-            query = query.filter(
-                StockDailyHistory.trade_date >= start_date,
-                StockDailyHistory.trade_date <= end_date
-            )
-            all_dates = [row[0] for row in query.order_by(StockDailyHistory.trade_date)]
+            # 获取所有交易日（同一区间只查询一次）
+            all_dates = self.trade_day_cache.get((str(start_date), str(end_date)))
+            if all_dates is None:
+                query = db.session.query(StockDailyHistory.trade_date).distinct()
+                query = query.filter(
+                    StockDailyHistory.trade_date >= start_date,
+                    StockDailyHistory.trade_date <= end_date
+                )
+                all_dates = [row[0] for row in query.order_by(StockDailyHistory.trade_date)]
+                self.trade_day_cache[(str(start_date), str(end_date))] = all_dates
             
             if frequency == 'daily':
                 return all_dates
@@ -204,7 +284,17 @@ class BacktestEngine:
     
     def _get_stock_selection(self, strategy_config: Dict[str, Any], 
                            trade_date: str) -> List[Dict[str, Any]]:
-        """获取股票选择结果"""
+        """获取股票选择结果（按选股配置和日期缓存）"""
+        cache_key = (self.selection_key(strategy_config), str(trade_date))
+        if cache_key in self.selection_cache:
+            return self.selection_cache[cache_key]
+        
+        selected = self._select_stocks(strategy_config, trade_date)
+        self.selection_cache[cache_key] = selected
+        return selected
+    
+    def _select_stocks(self, strategy_config: Dict[str, Any], trade_date: str) -> List[Dict[str, Any]]:
+        """计算股票选择结果"""
         try:
             selection_method = strategy_config.get('selection_method', 'factor_based')
             top_n = strategy_config.get('top_n', 50)
@@ -222,9 +312,12 @@ class BacktestEngine:
                 if not factor_list:
                     return []
                 
-                factor_scores = self._get_scoring_engine().calculate_factor_scores(
-                    trade_date, factor_list
-                )
+                if self.panel is not None:
+                    factor_scores = self.panel.get_factor_scores(trade_date, factor_list)
+                else:
+                    factor_scores = self._get_scoring_engine().calculate_factor_scores(
+                        trade_date, factor_list
+                    )
                 
                 if factor_scores.empty:
                     return []
@@ -241,8 +334,10 @@ class BacktestEngine:
             return []
     
     def _get_target_weights(self, selected_stocks: List[Dict[str, Any]], 
-                          optimization_config: Dict[str, Any]) -> Dict[str, float]:
-        """获取目标权重"""
+                          optimization_config: Dict[str, Any],
+                          trade_date=None,
+                          previous_weights: Dict[str, float] = None) -> Dict[str, float]:
+        """获取目标权重（风险模型取调仓日时点的估计，不使用未来数据；上一期目标权重用于热启动）"""
         try:
             method = optimization_config.get('method', 'equal_weight')
             
@@ -260,7 +355,9 @@ class BacktestEngine:
                 result = self._get_portfolio_optimizer().optimize_portfolio(
                     expected_returns,
                     method=method,
-                    constraints=optimization_config.get('constraints')
+                    constraints=optimization_config.get('constraints'),
+                    as_of_date=trade_date,
+                    previous_weights=pd.Series(previous_weights) if previous_weights else None
                 )
                 
                 if 'error' in result:
@@ -282,15 +379,14 @@ class BacktestEngine:
             if not ts_codes:
                 return {}
             
-            query = db.session.query(
-                StockDailyHistory.ts_code,
-                StockDailyHistory.close
-            ).filter(
-                StockDailyHistory.trade_date == trade_date,
-                StockDailyHistory.ts_code.in_(ts_codes)
-            )
+            if self.panel is not None and self.panel.date_position(trade_date) is not None:
+                return self.panel.get_prices(trade_date, ts_codes)
             
-            return {row[0]: float(row[1]) for row in query}
+            prices = read_daily_table('stock_daily_history', trade_date, trade_date, ts_codes,
+                                      columns=['ts_code', 'close'])
+            
+            return {row.ts_code: float(row.close) for row in prices.itertuples(index=False)
+                    if pd.notna(row.close)}
             
         except Exception as e:
             logger.error(f"获取当前价格失败: {e}")
@@ -432,33 +528,38 @@ class BacktestEngine:
             return []
     
     def compare_strategies(self, strategies: List[Dict[str, Any]], 
-                         start_date: str, end_date: str) -> Dict[str, Any]:
-        """比较多个策略"""
+                         start_date: str, end_date: str,
+                         max_workers: int = None) -> Dict[str, Any]:
+        """
+        比较多个策略
+        
+        策略分发到进程池并行回测，共享一次加载的价格/因子面板（只读内存映射），
+        选股口径相同的策略在同一再平衡日只计算一次选股和权重；比较使用独立的回测引擎，
+        不修改当前引擎的面板和缓存
+        
+        Args:
+            strategies: [{'name', 'config', 'initial_capital', 'rebalance_frequency'}]
+            start_date: 开始日期
+            end_date: 结束日期
+            max_workers: 工作进程数，默认为策略数与CPU核数中的较小值，不超过CPU核数，为1时串行
+        """
         try:
-            results = []
+            from app.services.strategy_comparison import StrategyComparisonRunner
             
-            for i, strategy in enumerate(strategies):
-                logger.info(f"回测策略 {i+1}: {strategy.get('name', f'Strategy_{i+1}')}")
-                
-                result = self.run_backtest(
-                    strategy['config'], start_date, end_date,
-                    strategy.get('initial_capital', 1000000.0),
-                    strategy.get('rebalance_frequency', 'monthly')
-                )
-                
-                if result.get('success'):
-                    results.append({
-                        'strategy_name': strategy.get('name', f'Strategy_{i+1}'),
-                        'result': result
-                    })
+            run = StrategyComparisonRunner(max_workers=max_workers).run(strategies, start_date, end_date)
+            results = run['strategies']
             
             # 生成比较报告
             comparison = self._generate_comparison_report(results)
+            if comparison:
+                comparison['wall_time'] = {r['strategy_name']: r['wall_time'] for r in results}
             
             return {
                 'success': True,
                 'strategies': results,
-                'comparison': comparison
+                'comparison': comparison,
+                'failed_strategies': run['failed'],
+                'timing': run['timing']
             }
             
         except Exception as e:
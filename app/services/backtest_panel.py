@@ -0,0 +1,141 @@
+import os
+
+import pandas as pd
+import numpy as np
+from typing import List, Dict, Optional
+from loguru import logger
+
+from app.utils.columnar_store import read_daily_table
+
+
+class BacktestPricePanel:
+    """
+    回测用的内存数据面板
+
+    回测开始时一次性读取整个区间的收盘价矩阵（日期 × 股票）和因子Z分数立方体（因子 × 日期 × 股票），
+    回测循环中按日期取价格和因子分数都只是数组切片，不再访问数据库。
+    """
+
+    def __init__(self, dates: List, ts_codes: List[str], prices: np.ndarray,
+                 factor_ids: List[str] = None, factor_cube: np.ndarray = None):
+        """
+        Args:
+            dates: 升序排列的交易日
+            ts_codes: 股票代码
+            prices: 收盘价矩阵 (日期, 股票)，缺失为NaN
+            factor_ids: 因子ID
+            factor_cube: 因子Z分数 (因子, 日期, 股票)，缺失为NaN
+        """
+        self.dates = pd.DatetimeIndex(pd.to_datetime(dates))
+        self.ts_codes = pd.Index(ts_codes)
+        self.prices = prices
+        self.factor_ids = list(factor_ids or [])
+        self.factor_cube = factor_cube if factor_cube is not None else \
+            np.full((0, len(self.dates), len(self.ts_codes)), np.nan, dtype=np.float32)
+        self._date_positions = {d: i for i, d in enumerate(self.dates)}
+        self._factor_positions = {f: i for i, f in enumerate(self.factor_ids)}
+
+    @classmethod
+    def load(cls, start_date: str, end_date: str, factor_list: List[str] = None,
+             ts_codes: List[str] = None) -> 'BacktestPricePanel':
+        """
+        读取回测区间的价格和因子数据并构建面板
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            factor_list: 需要预加载的因子，为空时只加载价格
+            ts_codes: 股票范围，默认全市场
+        """
+        price_data = read_daily_table('stock_daily_history', start_date, end_date, ts_codes,
+                                      columns=['ts_code', 'trade_date', 'close'])
+        factor_data = pd.DataFrame(columns=['ts_code', 'trade_date', 'factor_id', 'z_score'])
+        if factor_list:
+            factor_data = read_daily_table('factor_values', start_date, end_date, ts_codes,
+                                           columns=['ts_code', 'trade_date', 'factor_id', 'z_score'],
+                                           filters={'factor_id': factor_list})
+
+        price_dates = pd.to_datetime(price_data['trade_date'])
+        factor_dates = pd.to_datetime(factor_data['trade_date'])
+        dates = pd.DatetimeIndex(pd.concat([price_dates, factor_dates]).unique()).sort_values()
+        codes = pd.Index(pd.concat([price_data['ts_code'], factor_data['ts_code']]).unique()).sort_values()
+
+        prices = np.full((len(dates), len(codes)), np.nan, dtype=np.float64)
+        if not price_data.empty:
+            rows = dates.get_indexer(price_dates)
+            cols = codes.get_indexer(price_data['ts_code'])
+            prices[rows, cols] = pd.to_numeric(price_data['close'], errors='coerce').to_numpy(dtype=np.float64)
+
+        factor_ids = [f for f in (factor_list or []) if f in set(factor_data['factor_id'])]
+        factor_cube = np.full((len(factor_ids), len(dates), len(codes)), np.nan, dtype=np.float32)
+        if factor_ids:
+            layers = pd.Index(factor_ids).get_indexer(factor_data['factor_id'])
+            rows = dates.get_indexer(factor_dates)
+            cols = codes.get_indexer(factor_data['ts_code'])
+            factor_cube[layers, rows, cols] = pd.to_numeric(factor_data['z_score'], errors='coerce').to_numpy()
+
+        panel = cls(dates, codes, prices, factor_ids, factor_cube)
+        logger.info(f"回测面板加载完成: {len(dates)} 个交易日, {len(codes)} 只股票, {len(factor_ids)} 个因子, "
+                    f"{(prices.nbytes + factor_cube.nbytes) / 1024 / 1024:.1f} MB")
+        return panel
+
+    def save_arrays(self, directory: str) -> Dict:
+        """
+        将价格矩阵和因子立方体写入目录下的 .npy 文件，供其他进程以只读内存映射方式共享
+
+        Returns:
+            open_arrays 所需的元数据（日期、股票、因子）
+        """
+        np.save(os.path.join(directory, 'prices.npy'), self.prices)
+        np.save(os.path.join(directory, 'factor_cube.npy'), self.factor_cube)
+        return {'dates': list(self.dates), 'ts_codes': list(self.ts_codes), 'factor_ids': self.factor_ids}
+
+    @classmethod
+    def open_arrays(cls, directory: str, meta: Dict) -> 'BacktestPricePanel':
+        """以只读内存映射方式打开 save_arrays 写入的面板，多个进程共享同一份页缓存而不复制数据"""
+        prices = np.load(os.path.join(directory, 'prices.npy'), mmap_mode='r')
+        factor_cube = np.load(os.path.join(directory, 'factor_cube.npy'), mmap_mode='r')
+        return cls(meta['dates'], meta['ts_codes'], prices, meta['factor_ids'], factor_cube)
+
+    def date_position(self, trade_date) -> Optional[int]:
+        """交易日在面板中的行号，不在面板中时返回 None"""
+        return self._date_positions.get(pd.Timestamp(trade_date))
+
+    def get_prices(self, trade_date, ts_codes: List[str] = None) -> Dict[str, float]:
+        """取某日的收盘价 {ts_code: close}，停牌或缺失的股票不返回"""
+        row = self.date_position(trade_date)
+        if row is None:
+            return {}
+
+        if ts_codes is None:
+            cols = np.arange(len(self.ts_codes))
+        else:
+            cols = self.ts_codes.get_indexer(ts_codes)
+            cols = cols[cols >= 0]
+        values = self.prices[row, cols]
+        valid = ~np.isnan(values)
+        return dict(zip(self.ts_codes[cols[valid]], values[valid].tolist()))
+
+    def get_factor_scores(self, trade_date, factor_list: List[str]) -> pd.DataFrame:
+        """
+        取某日的因子分数矩阵，口径与 StockScoringEngine.calculate_factor_scores 一致：
+        行为当日有因子值的股票，列为当日有数据的因子，缺失填0
+        """
+        row = self.date_position(trade_date)
+        layers = [self._factor_positions[f] for f in factor_list if f in self._factor_positions]
+        if row is None or not layers:
+            return pd.DataFrame()
+
+        scores = self.factor_cube[layers, row, :]
+        present = ~np.isnan(scores)
+        factor_mask = present.any(axis=1)
+        stock_mask = present.any(axis=0)
+        if not stock_mask.any():
+            return pd.DataFrame()
+
+        values = np.nan_to_num(scores[factor_mask][:, stock_mask].T.astype(np.float64), nan=0.0)
+        return pd.DataFrame(
+            values,
+            index=pd.Index(self.ts_codes[stock_mask], name='ts_code'),
+            columns=pd.Index([self.factor_ids[i] for i, keep in zip(layers, factor_mask) if keep], name='factor_id')
+        ).sort_index(axis=1)
@@ -0,0 +1,229 @@
+"""
+多周期K线合成引擎
+由基础周期（1分钟或Baostock的5分钟）K线一次向量化合成 5/15/30/60 分钟K线，
+按A股交易时段（9:30-11:30、13:00-15:00）划分K线，不跨越午间休市；
+以 SyncState 中目标周期的高水位增量运行，每次只合成高水位之后已收盘的K线
+"""
+
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, select
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.sync_state import SyncState
+from app.services.minute_data_sync_service import MinuteDataSyncService
+from app.utils.market_calendar import AFTERNOON_OPEN, MORNING_CLOSE, MORNING_OPEN, PERIOD_MINUTES
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_PERIODS = ['5min', '15min', '30min', '60min']
+
+_MORNING_OPEN = MORNING_OPEN.hour * 60 + MORNING_OPEN.minute
+_MORNING_CLOSE = MORNING_CLOSE.hour * 60 + MORNING_CLOSE.minute
+_AFTERNOON_OPEN = AFTERNOON_OPEN.hour * 60 + AFTERNOON_OPEN.minute
+_SESSION_MINUTES = _MORNING_CLOSE - _MORNING_OPEN
+
+
+def session_bucket_end(datetimes: pd.Series, period_minutes: int) -> pd.Series:
+    """
+    K线（以结束时间标记，与Baostock口径一致）所属目标周期K线的结束时间
+    每个交易时段从开盘起按 period_minutes 切分，9:30、13:00 的集合竞价K线并入时段第一根，
+    因此60分钟K线为 10:30、11:30、14:00、15:00
+    """
+    minute_of_day = datetimes.dt.hour * 60 + datetimes.dt.minute
+    session_open = np.where(minute_of_day <= _MORNING_CLOSE, _MORNING_OPEN, _AFTERNOON_OPEN)
+    elapsed = np.clip(minute_of_day - session_open, 1, _SESSION_MINUTES)
+    bucket_end = session_open + np.ceil(elapsed / period_minutes).astype(int) * period_minutes
+    return datetimes.dt.normalize() + pd.to_timedelta(bucket_end, unit='m')
+
+
+class BarRollupEngine:
+    """由基础周期K线增量合成多周期K线"""
+
+    def __init__(self, source_period: str = '1min', batch_size: int = 500, sync_service=None):
+        """
+        Args:
+            source_period: 基础周期
+            batch_size: 每次读取的股票数
+            sync_service: 写入分钟数据用的 MinuteDataSyncService（批量upsert并更新行情快照）
+        """
+        self.source_period = source_period
+        self.batch_size = batch_size
+        self.sync_service = sync_service or MinuteDataSyncService()
+
+    def target_periods(self, periods: List[str] = None) -> List[str]:
+        """可由基础周期合成的目标周期（周期长度为基础周期的整数倍）"""
+        source_minutes = PERIOD_MINUTES[self.source_period]
+        return [p for p in (periods or ROLLUP_PERIODS)
+                if p in PERIOD_MINUTES and PERIOD_MINUTES[p] > source_minutes
+                and PERIOD_MINUTES[p] % source_minutes == 0]
+
+    def rollup_frame(self, bars: pd.DataFrame, target_period: str, watermarks: Dict[str, datetime] = None,
+                     prev_closes: Dict[str, float] = None, include_partial: bool = False) -> pd.DataFrame:
+        """
+        多只股票的基础周期K线一次合成为目标周期K线（纯计算，不读写数据库）
+
+        Args:
+            bars: ts_code, datetime, open, high, low, close, volume, amount
+            target_period: 目标周期
+            watermarks: {ts_code: 已合成的最新目标K线时间}，只输出其后的K线
+            prev_closes: {ts_code: 高水位处目标K线的收盘价}，作为第一根新K线的前收盘价
+            include_partial: 是否输出每只股票最后一根尚未收盘的K线
+
+        Returns:
+            与分钟数据表字段一致的DataFrame（含 pre_close/change/pct_chg）
+        """
+        columns = MinuteDataSyncService.MINUTE_DATA_COLUMNS
+        if bars is None or bars.empty:
+            return pd.DataFrame(columns=columns)
+
+        bars = bars.assign(datetime=pd.to_datetime(bars['datetime']))
+        bars = bars.assign(bucket=session_bucket_end(bars['datetime'], PERIOD_MINUTES[target_period]))
+        if watermarks:
+            watermark = bars['ts_code'].map(watermarks)
+            bars = bars[watermark.isna() | (bars['bucket'] > watermark)]
+        if bars.empty:
+            return pd.DataFrame(columns=columns)
+
+        bars = bars.sort_values(['ts_code', 'datetime'])
+        rolled = bars.groupby(['ts_code', 'bucket'], sort=True).agg(
+            open=('open', 'first'),
+            high=('high', 'max'),
+            low=('low', 'min'),
+            close=('close', 'last'),
+            volume=('volume', 'sum'),
+            amount=('amount', 'sum'),
+            last_time=('datetime', 'max')
+        ).reset_index().rename(columns={'bucket': 'datetime'})
+
+        if not include_partial:
+            # 基础周期已出现该K线结束时刻（或之后）的K线时，目标K线才算收盘
+            latest = rolled.groupby('ts_code')['last_time'].transform('max')
+            rolled = rolled[rolled['datetime'] <= latest]
+
+        # 前收盘价：同一股票上一根目标K线的收盘价，第一根取高水位K线收盘价，都没有时取自身收盘价
+        pre_close = rolled.groupby('ts_code')['close'].shift(1)
+        if prev_closes:
+            pre_close = pre_close.fillna(rolled['ts_code'].map(prev_closes))
+        rolled['pre_close'] = pre_close.fillna(rolled['close'])
+        rolled['change'] = rolled['close'] - rolled['pre_close']
+        rolled['pct_chg'] = (rolled['change'] / rolled['pre_close'] * 100).round(4)
+        rolled['period_type'] = target_period
+        return rolled.reindex(columns=columns).reset_index(drop=True)
+
+    def _load_prev_closes(self, target_period: str, ts_codes: List[str]) -> Dict[str, float]:
+        """一次查询读取各股票高水位处目标K线的收盘价"""
+        query = select(SyncState.ts_code, StockMinuteData.close).join(
+            StockMinuteData, and_(StockMinuteData.ts_code == SyncState.ts_code,
+                                  StockMinuteData.period_type == SyncState.period_type,
+                                  StockMinuteData.datetime == SyncState.last_datetime)
+        ).where(SyncState.period_type == target_period, SyncState.ts_code.in_(ts_codes))
+        return {row[0]: row[1] for row in db.session.execute(query).fetchall()}
+
+    def _load_source(self, ts_codes: List[str], start_time: Optional[datetime],
+                     end_time: Optional[datetime]) -> pd.DataFrame:
+        """一次查询读取一批股票的基础周期K线"""
+        query = select(
+            StockMinuteData.ts_code, StockMinuteData.datetime, StockMinuteData.open, StockMinuteData.high,
+            StockMinuteData.low, StockMinuteData.close, StockMinuteData.volume, StockMinuteData.amount
+        ).where(StockMinuteData.period_type == self.source_period, StockMinuteData.ts_code.in_(ts_codes))
+        if start_time is not None:
+            query = query.where(StockMinuteData.datetime > start_time)
+        if end_time is not None:
+            query = query.where(StockMinuteData.datetime <= end_time)
+        bars = pd.read_sql(query, db.engine)
+        bars['datetime'] = pd.to_datetime(bars['datetime'])
+        return bars
+
+    def _source_codes(self) -> List[str]:
+        rows = db.session.execute(
+            select(StockMinuteData.ts_code).where(StockMinuteData.period_type == self.source_period).distinct()
+        ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def rollup(self, ts_codes: List[str] = None, target_periods: List[str] = None,
+               start_time: datetime = None, end_time: datetime = None) -> Dict:
+        """
+        增量合成并写入多周期K线
+
+        默认从各目标周期的高水位之后开始，每批股票只读取一次基础周期K线，依次合成全部目标周期；
+        指定 start_time 时忽略高水位，重新合成该时间之后的K线（按交易日对齐，高水位只前移不后退）
+
+        Args:
+            ts_codes: 股票代码列表，默认为基础周期有数据的全部股票
+            target_periods: 目标周期列表，默认为基础周期可合成的全部周期
+            start_time: 重新合成的起始时间
+            end_time: 截止时间
+
+        Returns:
+            {'success', 'periods': {周期: 写入K线数}, 'source_bars', 'stocks', 'seconds'}
+        """
+        started = time.perf_counter()
+        try:
+            periods = self.target_periods(target_periods)
+            if not periods:
+                return {'success': False, 'message': f'{self.source_period} 不能合成 {target_periods}',
+                        'periods': {}, 'source_bars': 0, 'stocks': 0}
+
+            codes = list(ts_codes) if ts_codes else self._source_codes()
+            all_watermarks = {p: SyncState.load_watermarks(p) for p in periods}
+            if start_time is not None:
+                start_time = datetime.combine(start_time.date(), datetime.min.time())
+
+            written = {p: 0 for p in periods}
+            source_bars = 0
+            for offset in range(0, len(codes), self.batch_size):
+                batch = codes[offset:offset + self.batch_size]
+                batch_watermarks = {p: {} if start_time is not None else
+                                    {c: all_watermarks[p][c] for c in batch if all_watermarks[p].get(c)}
+                                    for p in periods}
+                if start_time is not None:
+                    read_from = start_time - timedelta(microseconds=1)
+                elif all(len(batch_watermarks[p]) == len(batch) for p in periods):
+                    # 所有股票、所有目标周期都有高水位时，从最早的高水位开始读取
+                    read_from = min(min(w.values()) for w in batch_watermarks.values())
+                else:
+                    read_from = None
+
+                bars = self._load_source(batch, read_from, end_time)
+                source_bars += len(bars)
+                if bars.empty:
+                    continue
+
+                for period in periods:
+                    prev_closes = self._load_prev_closes(period, batch) if batch_watermarks[period] else None
+                    rolled = self.rollup_frame(bars, period, batch_watermarks[period], prev_closes)
+                    if rolled.empty:
+                        continue
+                    self.sync_service.upsert_minute_dataframe(rolled)
+                    written[period] += len(rolled)
+
+                    latest = rolled.groupby('ts_code')['datetime'].max()
+                    new_watermarks = {c: t.to_pydatetime() for c, t in latest.items()
+                                      if all_watermarks[period].get(c) is None
+                                      or t.to_pydatetime() > all_watermarks[period][c]}
+                    SyncState.save_watermarks(period, new_watermarks)
+
+            seconds = time.perf_counter() - started
+            logger.info(f"多周期K线合成完成: {len(codes)} 只股票, 读取 {source_bars} 根{self.source_period}K线, "
+                        f"写入 {written}, 耗时 {seconds:.2f} 秒")
+            return {
+                'success': True,
+                'message': f'成功合成 {sum(written.values())} 条K线',
+                'periods': written,
+                'source_bars': source_bars,
+                'stocks': len(codes),
+                'seconds': seconds
+            }
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"多周期K线合成失败: {e}")
+            return {'success': False, 'message': f'合成失败: {str(e)}', 'periods': {}, 'source_bars': 0,
+                    'stocks': 0}
@@ -0,0 +1,362 @@
+"""
+全市场批量技术指标计算引擎
+一次查询读取多只股票、多个周期的K线，组成 K线序号 × 股票 的二维面板，
+十个指标全部以二维数组运算完成，结果一次批量写入
+"""
+
+import copy
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide, WIDE_INDICATOR_COLUMNS, KEY_COLUMNS
+from app.services.realtime_indicator_engine import DEFAULT_INDICATOR_PARAMS
+from app.utils.db_utils import DatabaseUtils
+
+logger = logger.bind(name=__name__)
+
+SUPPORTED_INDICATORS = ['MA', 'EMA', 'MACD', 'RSI', 'KDJ', 'BOLL', 'CCI', 'WR', 'ATR', 'OBV']
+
+
+class BarPanel:
+    """
+    单个周期的K线面板
+
+    每列是一只股票自身的K线序列（按时间左对齐，尾部以NaN补齐），
+    因此沿行方向的滚动/递推运算互不干扰，停牌缺失的K线也不会打断序列。
+    """
+
+    def __init__(self, ts_codes: List[str], datetimes: np.ndarray, fields: Dict[str, np.ndarray],
+                 lengths: np.ndarray):
+        self.ts_codes = ts_codes
+        self.datetimes = datetimes
+        self.fields = fields
+        self.lengths = lengths
+        self.valid = np.arange(datetimes.shape[0])[:, None] < lengths[None, :]
+
+    @property
+    def n_bars(self) -> int:
+        return int(self.lengths.sum())
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'BarPanel':
+        """由按 ts_code、datetime 排序的长表构建面板"""
+        codes, group_ids = np.unique(df['ts_code'].to_numpy(), return_inverse=True)
+        lengths = np.bincount(group_ids, minlength=len(codes))
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        positions = np.arange(len(df)) - starts[group_ids]
+
+        shape = (int(lengths.max()) if len(lengths) else 0, len(codes))
+        datetimes = np.full(shape, np.datetime64('NaT'), dtype='datetime64[ns]')
+        datetimes[positions, group_ids] = df['datetime'].to_numpy(dtype='datetime64[ns]')
+
+        fields = {}
+        for field in ('high', 'low', 'close', 'volume'):
+            panel = np.full(shape, np.nan)
+            panel[positions, group_ids] = pd.to_numeric(df[field], errors='coerce').to_numpy(dtype=float)
+            fields[field] = panel
+        return cls(list(codes), datetimes, fields, lengths)
+
+
+def _frame(values: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(values)
+
+
+def _wilder_average(values: np.ndarray, period: int) -> np.ndarray:
+    """Wilder平滑：第period行取前period个变化的均值作为初值，之后按 (n-1)/n 递推"""
+    seeded = np.full_like(values, np.nan)
+    if values.shape[0] > period:
+        seeded[period] = values[1:period + 1].mean(axis=0)
+        seeded[period + 1:] = values[period + 1:]
+    return _frame(seeded).ewm(alpha=1 / period, adjust=False).mean().to_numpy()
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return numerator / denominator
+
+
+class BatchIndicatorEngine:
+    """全市场批量技术指标计算引擎"""
+
+    def __init__(self, params: Dict = None):
+        self.params = copy.deepcopy(params or DEFAULT_INDICATOR_PARAMS)
+
+    def load_bars(self, ts_codes: List[str], period_types: List[str],
+                  start_time: datetime, end_time: datetime) -> pd.DataFrame:
+        """一次查询读取所有股票、所有周期的K线"""
+        query = db.session.query(
+            StockMinuteData.ts_code, StockMinuteData.period_type, StockMinuteData.datetime,
+            StockMinuteData.high, StockMinuteData.low, StockMinuteData.close, StockMinuteData.volume
+        ).filter(
+            StockMinuteData.ts_code.in_(ts_codes),
+            StockMinuteData.period_type.in_(period_types),
+            StockMinuteData.datetime >= start_time,
+            StockMinuteData.datetime <= end_time
+        )
+        df = pd.read_sql(query.statement, db.engine)
+        if df.empty:
+            return df
+        df['datetime'] = pd.to_datetime(df['datetime'])
+        return df.sort_values(['period_type', 'ts_code', 'datetime']).reset_index(drop=True)
+
+    def compute_panel(self, panel: BarPanel, indicators: List[str] = None) -> Dict[str, List[np.ndarray]]:
+        """
+        在面板上计算指标
+
+        Returns:
+            {输出名: [value1, value2, ...]}，每个值都是 K线序号 × 股票 的二维数组，无效位置为NaN；
+            输出名与流式引擎一致（MA5、EMA12、MACD、KDJ...）
+        """
+        indicators = indicators or SUPPORTED_INDICATORS
+        params = self.params
+        high, low = panel.fields['high'], panel.fields['low']
+        close, volume = panel.fields['close'], panel.fields['volume']
+        n_rows = close.shape[0]
+        row_index = np.arange(n_rows)[:, None]
+        close_df = _frame(close)
+        prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+        outputs = {}
+
+        if 'MA' in indicators:
+            for period in params['MA']['periods']:
+                outputs[f'MA{period}'] = [close_df.rolling(period).mean().to_numpy()]
+
+        if 'EMA' in indicators:
+            for period in params['EMA']['periods']:
+                ema = close_df.ewm(span=period).mean().to_numpy(copy=True)
+                ema[:period - 1] = np.nan
+                outputs[f'EMA{period}'] = [ema]
+
+        if 'MACD' in indicators:
+            macd = params['MACD']
+            macd_line = (close_df.ewm(span=macd['fast']).mean() - close_df.ewm(span=macd['slow']).mean())
+            signal_line = macd_line.ewm(span=macd['signal']).mean()
+            macd_line, signal_line = macd_line.to_numpy(), signal_line.to_numpy()
+            histogram = macd_line - signal_line
+            warmup = np.broadcast_to(row_index < macd['slow'] - 1, macd_line.shape)
+            outputs['MACD'] = [np.where(warmup, np.nan, v) for v in (macd_line, signal_line, histogram)]
+
+        if 'RSI' in indicators:
+            period = params['RSI']['period']
+            delta = close - prev_close
+            gain = np.where(delta > 0, delta, 0.0)
+            loss = np.where(delta < 0, -delta, 0.0)
+            rs = _divide(_wilder_average(gain, period), _wilder_average(loss, period))
+            outputs['RSI'] = [100 - 100 / (1 + rs)]
+
+        if 'KDJ' in indicators:
+            k_period = params['KDJ']['k_period']
+            highest = _frame(high).rolling(k_period).max().to_numpy()
+            lowest = _frame(low).rolling(k_period).min().to_numpy()
+            rsv = _divide(close - lowest, highest - lowest) * 100
+            rsv[np.isinf(rsv)] = np.nan
+            # K、D 以50为初值递推，RSV缺失时沿用上一值
+            seed = np.full((1, close.shape[1]), 50.0)
+            k_values = _frame(np.vstack([seed, rsv])).ewm(alpha=1 / 3, adjust=False, ignore_na=True).mean().to_numpy(copy=True)[1:]
+            k_values[np.isnan(rsv)] = np.nan
+            d_values = _frame(np.vstack([seed, k_values])).ewm(alpha=1 / 3, adjust=False, ignore_na=True).mean().to_numpy(copy=True)[1:]
+            d_values[np.isnan(rsv)] = np.nan
+            outputs['KDJ'] = [k_values, d_values, 3 * k_values - 2 * d_values]
+
+        if 'BOLL' in indicators:
+            period = params['BOLL']['period']
+            middle = close_df.rolling(period).mean().to_numpy()
+            width = close_df.rolling(period).std().to_numpy() * params['BOLL']['std_dev']
+            outputs['BOLL'] = [middle + width, middle, middle - width]
+
+        if 'CCI' in indicators:
+            period = params['CCI']['period']
+            typical_price = (high + low + close) / 3
+            ma_tp = _frame(typical_price).rolling(period).mean().to_numpy()
+            # 平均绝对偏差：按窗口内的 period 个滞后逐一累加，内存与面板同阶
+            mad = np.zeros_like(typical_price)
+            for lag in range(period):
+                shifted = np.full_like(typical_price, np.nan)
+                shifted[lag:] = typical_price[:n_rows - lag]
+                mad += np.abs(shifted - ma_tp)
+            outputs['CCI'] = [_divide(typical_price - ma_tp, 0.015 * (mad / period))]
+
+        if 'WR' in indicators:
+            period = params['WR']['period']
+            highest = _frame(high).rolling(period).max().to_numpy()
+            lowest = _frame(low).rolling(period).min().to_numpy()
+            outputs['WR'] = [_divide(highest - close, highest - lowest) * (-100)]
+
+        if 'ATR' in indicators:
+            true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+            outputs['ATR'] = [_frame(true_range).rolling(params['ATR']['period']).mean().to_numpy()]
+
+        if 'OBV' in indicators:
+            direction = np.sign(close - prev_close)
+            direction[0] = 0
+            obv = np.nancumsum(np.nan_to_num(direction) * volume, axis=0)
+            obv[:, panel.lengths < 2] = np.nan
+            outputs['OBV'] = [obv]
+
+        return outputs
+
+    def to_records(self, panel: BarPanel, outputs: Dict[str, List[np.ndarray]], period_type: str) -> pd.DataFrame:
+        """将面板指标结果展开为 RealtimeIndicator 格式的长表，NaN/inf 写为 None"""
+        frames = []
+        codes = np.asarray(panel.ts_codes, dtype=object)
+        for name, values in outputs.items():
+            primary = values[0]
+            mask = panel.valid & np.isfinite(primary)
+            rows, cols = np.nonzero(mask)
+            if len(rows) == 0:
+                continue
+            frame = pd.DataFrame({
+                'ts_code': codes[cols],
+                'datetime': panel.datetimes[rows, cols],
+                'period_type': period_type,
+                'indicator_name': name,
+            })
+            for i in range(4):
+                if i < len(values):
+                    column = values[i][rows, cols].astype(object)
+                    column[~np.isfinite(values[i][rows, cols])] = None
+                    frame[f'value{i + 1}'] = column
+                else:
+                    frame[f'value{i + 1}'] = None
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['ts_code', 'datetime', 'period_type', 'indicator_name',
+                                         'value1', 'value2', 'value3', 'value4'])
+        return pd.concat(frames, ignore_index=True)
+
+    def to_wide_frame(self, panel: BarPanel, outputs: Dict[str, List[np.ndarray]], period_type: str) -> pd.DataFrame:
+        """将面板指标结果展开为 RealtimeIndicatorWide 格式：每根K线一行，每个指标输出一列"""
+        rows, cols = np.nonzero(panel.valid)
+        frame = pd.DataFrame({
+            'ts_code': np.asarray(panel.ts_codes, dtype=object)[cols],
+            'period_type': period_type,
+            'datetime': panel.datetimes[rows, cols],
+        })
+        for name, values in outputs.items():
+            for column, array in zip(WIDE_INDICATOR_COLUMNS.get(name, []), values):
+                frame[column] = array[rows, cols].astype(np.float32)
+        return frame
+
+    def output_names(self, indicators: List[str]) -> List[str]:
+        """指标对应的输出名（与 compute_panel 的键一致）"""
+        names = []
+        for indicator in indicators:
+            if indicator in ('MA', 'EMA'):
+                names.extend(f'{indicator}{period}' for period in self.params[indicator]['periods'])
+            else:
+                names.append(indicator)
+        return names
+
+    def _store(self, records: pd.DataFrame, ts_codes: List[str], period_types: List[str],
+               start_time: datetime, end_time: datetime, output_names: List[str], layout: str = 'long') -> int:
+        """
+        写入计算结果，只替换本次计算的指标
+
+        长表：删除 [start_time, end_time] 内本次计算的指标名的旧行后批量追加写入，删除和写入在同一事务中，
+        失败时保留旧指标；宽表：按主键写入，只更新本次计算的指标列，其他指标列保持不变
+        """
+        # 结束会话中的读事务，避免与写事务争用锁
+        db.session.commit()
+        if layout == 'wide':
+            columns = [c for name in output_names for c in WIDE_INDICATOR_COLUMNS.get(name, [])]
+            records = RealtimeIndicatorWide.prepare_frame(records)[KEY_COLUMNS + columns]
+            result = DatabaseUtils.bulk_upsert_dataframe(records, RealtimeIndicatorWide, key_columns=KEY_COLUMNS)
+            return result['rows_written']
+
+        table = RealtimeIndicator.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(
+                table.c.ts_code.in_(ts_codes),
+                table.c.period_type.in_(period_types),
+                table.c.indicator_name.in_(output_names),
+                table.c.datetime >= start_time,
+                table.c.datetime <= end_time
+            ))
+            result = DatabaseUtils.bulk_insert_dataframe(records, table, connection=conn)
+        return result['rows_written']
+
+    def calculate(self, ts_codes: List[str], period_types: List[str] = None,
+                  indicators: List[str] = None, lookback_days: int = 7,
+                  end_time: datetime = None, store: bool = True, layout: str = 'long') -> Dict:
+        """
+        批量计算多只股票、多个周期的指标
+
+        Args:
+            ts_codes: 股票代码列表
+            period_types: 周期列表，默认 ['1min']
+            indicators: 指标列表，默认全部十个
+            lookback_days: 回看天数
+            end_time: 截止时间，默认当前时间
+            store: 是否写入数据库
+            layout: 存储格式，'long' 写入 realtime_indicators，'wide' 写入 realtime_indicators_wide
+
+        Returns:
+            计算结果字典，包含各周期的股票数、K线数、指标行数和耗时
+        """
+        try:
+            period_types = period_types or ['1min']
+            indicators = [i for i in (indicators or SUPPORTED_INDICATORS) if i in SUPPORTED_INDICATORS]
+            end_time = end_time or datetime.now()
+            start_time = end_time - timedelta(days=lookback_days)
+
+            started = time.perf_counter()
+            bars = self.load_bars(ts_codes, period_types, start_time, end_time)
+            load_seconds = time.perf_counter() - started
+
+            all_records = []
+            period_stats = {}
+            compute_started = time.perf_counter()
+            for period_type in period_types:
+                period_bars = bars[bars['period_type'] == period_type] if not bars.empty else bars
+                if period_bars.empty:
+                    period_stats[period_type] = {'stocks': 0, 'bars': 0, 'records': 0}
+                    continue
+                panel = BarPanel.from_frame(period_bars)
+                outputs = self.compute_panel(panel, indicators)
+                if layout == 'wide':
+                    records = self.to_wide_frame(panel, outputs, period_type)
+                else:
+                    records = self.to_records(panel, outputs, period_type)
+                all_records.append(records)
+                period_stats[period_type] = {'stocks': len(panel.ts_codes), 'bars': panel.n_bars,
+                                             'records': len(records)}
+            compute_seconds = time.perf_counter() - compute_started
+
+            records = pd.concat(all_records, ignore_index=True) if all_records else pd.DataFrame()
+            store_started = time.perf_counter()
+            stored = self._store(records, ts_codes, period_types, start_time, end_time,
+                                 self.output_names(indicators), layout) if store else 0
+            store_seconds = time.perf_counter() - store_started
+
+            total_bars = sum(stats['bars'] for stats in period_stats.values())
+            elapsed = time.perf_counter() - started
+            logger.info(f"批量计算指标完成: {len(ts_codes)} 只股票, {total_bars} 根K线, "
+                        f"{len(records)} 条指标, 耗时 {elapsed:.2f} 秒")
+            return {
+                'success': True,
+                'total_stocks': len(ts_codes),
+                'total_bars': total_bars,
+                'total_records': len(records),
+                'stored_records': stored,
+                'indicators': indicators,
+                'layout': layout,
+                'period_stats': period_stats,
+                'load_seconds': load_seconds,
+                'compute_seconds': compute_seconds,
+                'store_seconds': store_seconds,
+                'elapsed_seconds': elapsed,
+                'bars_per_second': total_bars / elapsed if elapsed > 0 else 0.0
+            }
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"批量计算指标失败: {str(e)}")
+            return {'success': False, 'message': str(e)}
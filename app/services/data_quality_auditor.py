@@ -0,0 +1,251 @@
+"""
+分钟数据质量审计
+按交易日历和交易时段生成应有的K线时间网格，一次分组计数查询得到全市场每只股票的K线数、
+去重后K线数、落在网格上的K线数和时间范围，只对不达标的股票读取时间戳明细，定位缺失区间、重复和非交易时段的K线
+（9:30、13:00 的开盘集合竞价K线不计入完整率，也不视为非交易时段K线）；
+输出的缺口列表可直接交给 MinuteDataSyncService.backfill_gaps 精确补齐
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, func, select
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.utils.market_calendar import AFTERNOON_OPEN, MORNING_OPEN, expected_bar_times, get_trade_dates
+
+logger = logging.getLogger(__name__)
+
+
+class MinuteDataAuditor:
+    """分钟数据完整性审计"""
+
+    def __init__(self, bs_module=None, drill_batch_size: int = 200, grid_chunk_size: int = 2000):
+        """
+        Args:
+            bs_module: 已登录的Baostock模块，交易日历表缺失时用于查询交易日
+            drill_batch_size: 明细检查每次读取的股票数
+            grid_chunk_size: 分组计数查询每次 IN 列表中的网格时间数
+        """
+        self.bs = bs_module
+        self.drill_batch_size = drill_batch_size
+        self.grid_chunk_size = grid_chunk_size
+
+    def expected_grid(self, start_time: datetime, end_time: datetime, period_type: str) -> pd.DatetimeIndex:
+        """区间内应有的K线结束时间（交易日 × 交易时段）"""
+        grid = [t for day in get_trade_dates(start_time, end_time, self.bs)
+                for t in expected_bar_times(day, period_type) if start_time <= t <= end_time]
+        return pd.DatetimeIndex(grid)
+
+    @staticmethod
+    def session_open_times(grid: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        """
+        网格内各交易日的开盘集合竞价K线时间（9:30、13:00）
+
+        部分数据源（如Tushare口径的1分钟线）单独给出这两根K线，合成时并入时段第一根（见 session_bucket_end），
+        审计时既不要求存在，也不视为非交易时段K线
+        """
+        days = grid.normalize().unique()
+        times = pd.DatetimeIndex([day + pd.Timedelta(hours=t.hour, minutes=t.minute)
+                                  for day in days for t in (MORNING_OPEN, AFTERNOON_OPEN)])
+        return times[(times >= grid[0]) & (times <= grid[-1])]
+
+    def _count_by_stock(self, period_type: str, grid: pd.DatetimeIndex,
+                        ts_codes: Optional[List[str]]) -> pd.DataFrame:
+        """
+        分组计数查询：每只股票的K线数、去重后K线数、落在网格上的K线数、合法时间（网格和集合竞价）的K线数、
+        最早和最晚时间
+
+        网格按 grid_chunk_size 分段，每段一次查询，用 IN 列表只统计网格上的时间戳，
+        非交易时段的K线不会补上缺失的网格K线
+        """
+        auction_times = self.session_open_times(grid)
+        frames = []
+        for offset in range(0, len(grid), self.grid_chunk_size):
+            chunk = grid[offset:offset + self.grid_chunk_size].to_pydatetime().tolist()
+            # 相邻分段按上一段最后一个网格时间衔接，段间的非交易时段K线也只统计一次
+            lower_time = chunk[0] if offset == 0 else grid[offset - 1].to_pydatetime()
+            lower = (StockMinuteData.datetime >= lower_time if offset == 0
+                     else StockMinuteData.datetime > lower_time)
+            allowed = chunk + auction_times[(auction_times > lower_time) &
+                                            (auction_times <= chunk[-1])].to_pydatetime().tolist()
+            query = select(
+                StockMinuteData.ts_code,
+                func.count().label('rows'),
+                func.count(func.distinct(StockMinuteData.datetime)).label('distinct_bars'),
+                func.count(func.distinct(case((StockMinuteData.datetime.in_(chunk), StockMinuteData.datetime))))
+                .label('on_grid_bars'),
+                func.count(func.distinct(case((StockMinuteData.datetime.in_(allowed), StockMinuteData.datetime))))
+                .label('allowed_bars'),
+                func.min(StockMinuteData.datetime).label('earliest_time'),
+                func.max(StockMinuteData.datetime).label('latest_time')
+            ).where(
+                StockMinuteData.period_type == period_type,
+                lower,
+                StockMinuteData.datetime <= chunk[-1]
+            ).group_by(StockMinuteData.ts_code)
+            if ts_codes:
+                query = query.where(StockMinuteData.ts_code.in_(ts_codes))
+            frames.append(pd.read_sql(query, db.engine, parse_dates=['earliest_time', 'latest_time']))
+
+        counts = pd.concat(frames).groupby('ts_code', sort=False).agg(
+            rows=('rows', 'sum'), distinct_bars=('distinct_bars', 'sum'), on_grid_bars=('on_grid_bars', 'sum'),
+            allowed_bars=('allowed_bars', 'sum'), earliest_time=('earliest_time', 'min'), latest_time=('latest_time', 'max'))
+        if ts_codes:
+            # 区间内完全没有数据的股票
+            counts = counts.reindex(ts_codes)
+        counts = counts.rename_axis('ts_code').reset_index()
+        columns = ['rows', 'distinct_bars', 'on_grid_bars', 'allowed_bars']
+        counts[columns] = counts[columns].fillna(0).astype(int)
+        return counts
+
+    @staticmethod
+    def _gap_ranges(missing: np.ndarray, grid: pd.DatetimeIndex) -> List[Dict]:
+        """缺失的网格位置按连续段合并为 [start, end] 区间"""
+        if len(missing) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(missing) > 1)
+        starts = np.concatenate([[0], breaks + 1])
+        ends = np.concatenate([breaks, [len(missing) - 1]])
+        return [{
+            'start': grid[missing[s]].to_pydatetime(),
+            'end': grid[missing[e]].to_pydatetime(),
+            'missing_bars': int(e - s + 1)
+        } for s, e in zip(starts, ends)]
+
+    def _drill_down(self, period_type: str, ts_codes: List[str], grid: pd.DatetimeIndex) -> Dict[str, Dict]:
+        """读取不达标股票的时间戳（只读主键列），定位缺失区间、重复和非交易时段K线"""
+        details = {}
+        grid_values = grid.values
+        allowed_values = grid.union(self.session_open_times(grid)).values
+        for offset in range(0, len(ts_codes), self.drill_batch_size):
+            batch = ts_codes[offset:offset + self.drill_batch_size]
+            stamps = pd.read_sql(
+                select(StockMinuteData.ts_code, StockMinuteData.datetime).where(
+                    StockMinuteData.period_type == period_type,
+                    StockMinuteData.ts_code.in_(batch),
+                    StockMinuteData.datetime >= grid[0].to_pydatetime(),
+                    StockMinuteData.datetime <= grid[-1].to_pydatetime()
+                ), db.engine
+            )
+            stamps['datetime'] = pd.to_datetime(stamps['datetime'])
+            grouped = dict(tuple(stamps.groupby('ts_code')['datetime']))
+
+            for ts_code in batch:
+                times = grouped.get(ts_code, pd.Series(dtype='datetime64[ns]')).to_numpy(dtype='datetime64[ns]')
+                unique_times, counts = np.unique(times, return_counts=True)
+                present = np.isin(grid_values, unique_times)
+                off_grid = unique_times[~np.isin(unique_times, allowed_values)]
+                details[ts_code] = {
+                    'gaps': self._gap_ranges(np.flatnonzero(~present), grid),
+                    'duplicate_times': [pd.Timestamp(t).to_pydatetime() for t in unique_times[counts > 1]],
+                    'off_grid_times': [pd.Timestamp(t).to_pydatetime() for t in off_grid]
+                }
+        return details
+
+    def audit(self, period_type: str = '5min', start_time: datetime = None, end_time: datetime = None,
+              ts_codes: List[str] = None, threshold: float = 100.0, drill_down: bool = True) -> Dict:
+        """
+        审计区间内全市场（或指定股票）的分钟数据
+
+        Args:
+            period_type: 周期类型
+            start_time: 开始时间，默认为7天前
+            end_time: 结束时间，默认为当前时间
+            ts_codes: 股票代码列表，默认为区间内有数据的全部股票
+            threshold: 完整率（%）低于该值或存在重复/非交易时段K线的股票视为不达标
+            drill_down: 是否对不达标股票定位缺失区间
+
+        Returns:
+            {'expected_bars', 'stocks': [逐股票结果], 'gaps': [缺口列表], 汇总字段...}
+        """
+        end_time = end_time or datetime.now()
+        start_time = start_time or end_time - timedelta(days=7)
+        grid = self.expected_grid(start_time, end_time, period_type)
+        expected = len(grid)
+        result = {
+            'period_type': period_type,
+            'start_time': start_time.isoformat(),
+            'end_time': end_time.isoformat(),
+            'expected_bars': expected,
+            'total_stocks': 0,
+            'failed_stocks': 0,
+            'stocks': [],
+            'gaps': []
+        }
+        if expected == 0:
+            return result
+
+        counts = self._count_by_stock(period_type, grid, ts_codes)
+        duplicates = counts['rows'] - counts['distinct_bars']
+        # 集合竞价K线不计入完整率，也不算非交易时段K线
+        off_grid = counts['distinct_bars'] - counts['allowed_bars']
+        completeness = counts['on_grid_bars'] / expected * 100
+        failed = (completeness < threshold) | (duplicates > 0) | (off_grid > 0)
+
+        details = {}
+        if drill_down and failed.any():
+            details = self._drill_down(period_type, counts.loc[failed, 'ts_code'].tolist(), grid)
+
+        for row, dup, pct, bad in zip(counts.itertuples(index=False), duplicates, completeness, failed):
+            stock = {
+                'ts_code': row.ts_code,
+                'data_count': int(row.on_grid_bars),
+                'expected_count': expected,
+                'missing_count': expected - int(row.on_grid_bars),
+                'duplicate_count': int(dup),
+                'completeness': round(float(pct), 2),
+                'status': 'incomplete' if bad else 'ok',
+                'earliest_time': row.earliest_time.isoformat() if pd.notna(row.earliest_time) else None,
+                'latest_time': row.latest_time.isoformat() if pd.notna(row.latest_time) else None
+            }
+            detail = details.get(row.ts_code)
+            if detail is not None:
+                stock['gaps'] = [{'start': g['start'].isoformat(), 'end': g['end'].isoformat(),
+                                  'missing_bars': g['missing_bars']} for g in detail['gaps']]
+                stock['duplicate_times'] = [t.isoformat() for t in detail['duplicate_times']]
+                stock['off_grid_times'] = [t.isoformat() for t in detail['off_grid_times']]
+                result['gaps'].extend({'ts_code': row.ts_code, 'period_type': period_type, **g}
+                                      for g in detail['gaps'])
+            result['stocks'].append(stock)
+
+        result['total_stocks'] = len(result['stocks'])
+        result['failed_stocks'] = int(failed.sum())
+        result['missing_bars'] = sum(gap['missing_bars'] for gap in result['gaps'])
+        logger.info(f"{period_type}数据审计: {result['total_stocks']} 只股票, 不达标 {result['failed_stocks']} 只, "
+                    f"缺口 {len(result['gaps'])} 段")
+        return result
+
+    def check_stock(self, ts_code: str, period_type: str = '1min', hours: int = 24,
+                    end_time: datetime = None) -> Dict:
+        """单只股票截至 end_time（默认当前时间）前 hours 小时的数据质量（兼容 StockMinuteData.check_data_quality 的返回格式）"""
+        end_time = end_time or datetime.now()
+        audit = self.audit(period_type, end_time - timedelta(hours=hours), end_time, ts_codes=[ts_code])
+        stock = audit['stocks'][0] if audit['stocks'] else None
+        if stock is None or stock['latest_time'] is None:
+            return {
+                'status': 'no_data',
+                'message': f'没有找到 {ts_code} 在过去 {hours} 小时的 {period_type} 数据',
+                'data_count': 0,
+                'missing_count': audit['expected_bars'],
+                'completeness': 0.0,
+                'expected_count': audit['expected_bars']
+            }
+
+        completeness = stock['completeness']
+        return {
+            'status': 'ok' if completeness > 80 else 'incomplete',
+            'message': f'数据完整性: {completeness:.1f}%',
+            'data_count': stock['data_count'],
+            'missing_count': stock['missing_count'],
+            'completeness': completeness,
+            'expected_count': stock['expected_count'],
+            'duplicate_count': stock['duplicate_count'],
+            'gaps': stock.get('gaps', []),
+            'latest_time': stock['latest_time'],
+            'earliest_time': stock['earliest_time']
+        }
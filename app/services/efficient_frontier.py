@@ -0,0 +1,158 @@
+import itertools
+import os
+import time
+from multiprocessing import Pool
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+from loguru import logger
+
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import FactorRiskModel
+
+
+# 工作进程内的优化器和共享输入（每个进程只编译一次同结构的问题）
+_worker_optimizer: Optional[PortfolioOptimizer] = None
+_worker_inputs = None
+
+
+def _init_frontier_worker(expected_returns: pd.Series, risk_model: FactorRiskModel, method: str):
+    """工作进程初始化：保存同一份预期收益和风险模型"""
+    global _worker_optimizer, _worker_inputs
+    _worker_optimizer = PortfolioOptimizer()
+    _worker_inputs = (expected_returns, risk_model, method)
+
+
+def _solve_point(optimizer: PortfolioOptimizer, expected_returns: pd.Series, risk_model: FactorRiskModel,
+                 method: str, index: int, constraints: Dict[str, Any]) -> Dict[str, Any]:
+    """求解一个情景，返回前沿上的一个点"""
+    started = time.perf_counter()
+    try:
+        result = optimizer._optimize_with_model(expected_returns, risk_model, method, constraints)
+    except Exception as e:
+        result = {'error': str(e)}
+    point = {'index': index, 'constraints': constraints, 'seconds': time.perf_counter() - started}
+    if 'error' in result:
+        point.update(success=False, error=result['error'])
+        return point
+    stats = result['portfolio_stats']
+    point.update(
+        success=True,
+        expected_return=stats.get('expected_return'),
+        expected_risk=stats.get('expected_risk'),
+        sharpe_ratio=stats.get('sharpe_ratio'),
+        effective_stocks=stats.get('effective_stocks'),
+        weights={code: weight for code, weight in result['weights'].items() if weight > 0}
+    )
+    return point
+
+
+def _frontier_task(task: tuple) -> Dict[str, Any]:
+    """工作进程中求解一个情景"""
+    index, constraints = task
+    expected_returns, risk_model, method = _worker_inputs
+    return _solve_point(_worker_optimizer, expected_returns, risk_model, method, index, constraints)
+
+
+def build_scenarios(base_constraints: Dict[str, Any] = None, risk_aversions: List[float] = None,
+                    constraint_sets: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    组合情景网格：基础约束 × 风险厌恶系数 × 约束集合（两者都给出时取笛卡尔积）
+
+    Returns:
+        每个情景合并后的约束条件
+    """
+    base_constraints = base_constraints or {}
+    aversion_grid = [{'risk_aversion': float(value)} for value in (risk_aversions or [])] or [{}]
+    constraint_grid = list(constraint_sets or []) or [{}]
+    return [{**base_constraints, **constraint_set, **aversion}
+            for constraint_set, aversion in itertools.product(constraint_grid, aversion_grid)]
+
+
+class EfficientFrontierRunner:
+    """
+    有效前沿 / 多情景组合优化
+
+    对同一组预期收益只取一次风险模型，按风险厌恶系数或约束集合网格求解；
+    情景分发到进程池，每个工作进程复用同一个编译好的参数化问题（情景之间只改变参数值），
+    结果按完成顺序逐个产出，便于流式返回
+    """
+
+    def __init__(self, optimizer: PortfolioOptimizer = None, max_workers: int = None):
+        """
+        Args:
+            optimizer: 主进程使用的组合优化器
+            max_workers: 工作进程数，默认为情景数与CPU核数中的较小值，不超过CPU核数；为1时在当前进程内串行
+        """
+        self.optimizer = optimizer or PortfolioOptimizer()
+        self.max_workers = max_workers
+
+    def prepare(self, expected_returns: pd.Series, risk_model=None, as_of_date=None) -> FactorRiskModel:
+        """取一次风险模型并对齐到预期收益的股票顺序"""
+        risk_model = self.optimizer._resolve_risk_model(expected_returns.index, risk_model, as_of_date)
+        # 载荷在主进程分解一次，随模型一起传给工作进程
+        risk_model.loadings
+        return risk_model
+
+    def iter_points(self, expected_returns: pd.Series, scenarios: List[Dict[str, Any]],
+                    risk_model: FactorRiskModel, method: str = 'mean_variance') -> Iterator[Dict[str, Any]]:
+        """
+        按完成顺序产出各情景的结果
+
+        Args:
+            expected_returns: 预期收益率
+            scenarios: 各情景的约束条件（见 build_scenarios）
+            risk_model: prepare 返回的风险模型
+            method: 优化方法
+
+        Yields:
+            {'index', 'constraints', 'success', 'expected_return', 'expected_risk', 'sharpe_ratio',
+             'effective_stocks', 'weights', 'seconds'}，失败时为 {'index', 'constraints', 'success', 'error'}
+        """
+        workers = self.workers(len(scenarios))
+        if workers <= 1:
+            for index, constraints in enumerate(scenarios):
+                yield _solve_point(self.optimizer, expected_returns, risk_model, method, index, constraints)
+            return
+
+        pool = Pool(processes=workers, initializer=_init_frontier_worker,
+                    initargs=(expected_returns, risk_model, method))
+        try:
+            for point in pool.imap_unordered(_frontier_task, list(enumerate(scenarios))):
+                yield point
+            pool.close()
+        finally:
+            # 调用方提前停止读取（如客户端断开）时结束工作进程
+            pool.terminate()
+            pool.join()
+
+    def workers(self, n_scenarios: int) -> int:
+        cpus = os.cpu_count() or 1
+        return max(1, min(self.max_workers or cpus, cpus, n_scenarios))
+
+    def run(self, expected_returns: pd.Series, scenarios: List[Dict[str, Any]], risk_model=None,
+            method: str = 'mean_variance', as_of_date=None) -> Dict[str, Any]:
+        """
+        求解全部情景
+
+        Returns:
+            {'points': 按预期风险排序的成功点, 'failed': 失败的情景, 'risk_model_date', 'timing'}
+        """
+        started = time.perf_counter()
+        risk_model = self.prepare(expected_returns, risk_model, as_of_date)
+        points = list(self.iter_points(expected_returns, scenarios, risk_model, method))
+        succeeded = sorted((p for p in points if p['success']), key=lambda p: (p['expected_risk'], p['index']))
+        failed = sorted((p for p in points if not p['success']), key=lambda p: p['index'])
+
+        total_seconds = time.perf_counter() - started
+        logger.info(f"有效前沿求解完成: {len(scenarios)} 个情景, {len(failed)} 个失败, 耗时 {total_seconds:.2f} 秒")
+        return {
+            'points': succeeded,
+            'failed': failed,
+            'risk_model_date': str(risk_model.trade_date) if risk_model.trade_date else None,
+            'timing': {
+                'total_seconds': total_seconds,
+                'solve_seconds_sum': sum(p['seconds'] for p in points),
+                'workers': self.workers(len(scenarios))
+            }
+        }
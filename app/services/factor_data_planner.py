@@ -0,0 +1,189 @@
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+from loguru import logger
+
+from app.extensions import db
+from app.utils.columnar_store import read_daily_table
+from app.models import (
+    StockDailyHistory, StockDailyBasic, StockFactor, StockMoneyflow,
+    StockCyqPerf, StockIncomeStatement, StockBalanceSheet
+)
+
+
+# 数据源定义：数据键 -> (模型, 日期字段, 排序字段)
+FACTOR_DATA_SOURCES = {
+    'history': (StockDailyHistory, 'trade_date', 'trade_date'),
+    'basic': (StockDailyBasic, 'trade_date', 'trade_date'),
+    'factor': (StockFactor, 'trade_date', 'trade_date'),
+    'moneyflow': (StockMoneyflow, 'trade_date', 'trade_date'),
+    'cyq': (StockCyqPerf, 'trade_date', 'trade_date'),
+    'income': (StockIncomeStatement, None, 'end_date'),
+    'balance': (StockBalanceSheet, None, 'end_date'),
+}
+
+# 有本地列式缓存的数据源：数据键 -> 缓存表名
+COLUMNAR_SOURCES = {
+    'history': 'stock_daily_history',
+    'basic': 'stock_daily_basic',
+}
+
+# 历史回溯天数
+LOOKBACK_DAYS = 252
+
+
+def get_factor_requirements(factor_id: str, start_date: str,
+                            end_date: str) -> Dict[str, Optional[Tuple[str, str]]]:
+    """
+    计算因子所需的数据源及日期范围
+
+    :return: {数据键: (开始日期, 结束日期)}，财务数据不限日期时为 None
+    """
+    extended_start = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=LOOKBACK_DAYS)).strftime('%Y-%m-%d')
+    requirements = {}
+
+    # 基础行情数据
+    if any(x in factor_id for x in ['momentum', 'volatility', 'volume', 'price']):
+        requirements['history'] = (extended_start, end_date)
+
+    # 基本面数据
+    if any(x in factor_id for x in ['pe', 'pb', 'ps']):
+        requirements['basic'] = (start_date, end_date)
+
+    # 技术因子数据
+    if 'ma' in factor_id:
+        requirements['factor'] = (start_date, end_date)
+
+    # 资金流向数据
+    if 'money' in factor_id:
+        requirements['moneyflow'] = (extended_start, end_date)
+
+    # 筹码数据
+    if 'chip' in factor_id or 'winner' in factor_id:
+        requirements['cyq'] = (extended_start, end_date)
+
+    # 财务数据
+    if any(x in factor_id for x in ['roe', 'roa', 'revenue', 'profit']):
+        requirements['income'] = None
+        requirements['balance'] = None
+
+    return requirements
+
+
+def load_source_table(key: str, ts_codes: List[str],
+                      date_range: Optional[Tuple[str, str]]) -> pd.DataFrame:
+    """按股票列表和日期范围读取单个数据源，日线数据优先读取本地列式缓存"""
+    model, date_field, order_field = FACTOR_DATA_SOURCES[key]
+
+    if key in COLUMNAR_SOURCES and date_range:
+        return read_daily_table(COLUMNAR_SOURCES[key], date_range[0], date_range[1], ts_codes)
+
+    query = model.query.filter(model.ts_code.in_(ts_codes))
+    if date_field and date_range:
+        date_column = getattr(model, date_field)
+        query = query.filter(date_column >= date_range[0], date_column <= date_range[1])
+
+    order_column = getattr(model, order_field)
+    if date_field:
+        query = query.order_by(model.ts_code, order_column)
+    else:
+        query = query.order_by(model.ts_code, order_column.desc())
+
+    return pd.read_sql(query.statement, db.engine)
+
+
+class FactorDataPlanner:
+    """
+    因子数据加载计划器
+
+    汇总一次计算请求中所有因子的数据需求，每个数据源只按并集日期范围读取一次，
+    再按各因子自身的日期范围切片提供给因子函数。
+    """
+
+    def __init__(self, ts_codes: List[str], factor_ids: List[str], start_date: str, end_date: str):
+        self.ts_codes = ts_codes
+        self.factor_ids = list(factor_ids)
+        self.start_date = start_date
+        self.end_date = end_date
+        self.plan = self._build_plan()
+        self.frames: Dict[str, pd.DataFrame] = {}
+        self.load_stats: Dict[str, Dict[str, Any]] = {}
+
+    def _build_plan(self) -> Dict[str, Optional[Tuple[str, str]]]:
+        """计算各数据源需要读取的日期范围并集"""
+        plan = {}
+        for factor_id in self.factor_ids:
+            requirements = get_factor_requirements(factor_id, self.start_date, self.end_date)
+            for key, date_range in requirements.items():
+                if key not in plan:
+                    plan[key] = date_range
+                elif plan[key] is not None and date_range is not None:
+                    plan[key] = (min(plan[key][0], date_range[0]), max(plan[key][1], date_range[1]))
+                else:
+                    plan[key] = None
+        return plan
+
+    def load(self) -> Dict[str, pd.DataFrame]:
+        """按计划读取所有数据源，每个数据源一次查询"""
+        for key, date_range in self.plan.items():
+            if key in self.frames:
+                continue
+
+            start_time = datetime.now()
+            try:
+                frame = load_source_table(key, self.ts_codes, date_range)
+            except Exception as e:
+                logger.error(f"读取数据源失败: {key}, 错误: {e}")
+                frame = pd.DataFrame()
+
+            if date_range and not frame.empty:
+                # 预先转换日期，便于后续按因子切片
+                frame['_date'] = pd.to_datetime(frame[FACTOR_DATA_SOURCES[key][1]])
+
+            self.frames[key] = frame
+            self.load_stats[key] = {
+                'rows': len(frame),
+                'bytes': int(frame.memory_usage(deep=True).sum()) if not frame.empty else 0,
+                'date_range': date_range,
+                'seconds': (datetime.now() - start_time).total_seconds(),
+                'consumers': sum(1 for f in self.factor_ids
+                                 if key in get_factor_requirements(f, self.start_date, self.end_date)),
+            }
+
+        report = self.get_load_report()
+        logger.info(f"因子数据加载完成: {report['tables']} 张表, {report['total_rows']} 行, "
+                    f"{report['total_bytes'] / 1024 / 1024:.1f} MB, 节省 {report['queries_saved']} 次查询")
+        return self.frames
+
+    def get_data(self, factor_id: str, start_date: str = None, end_date: str = None) -> Dict[str, pd.DataFrame]:
+        """返回单个因子所需的数据，按该因子的日期范围切片"""
+        if not self.frames:
+            self.load()
+
+        requirements = get_factor_requirements(factor_id, start_date or self.start_date,
+                                                end_date or self.end_date)
+        data = {}
+        for key, date_range in requirements.items():
+            frame = self.frames.get(key)
+            if frame is None:
+                frame = load_source_table(key, self.ts_codes, date_range)
+            elif date_range and not frame.empty:
+                in_range = (frame['_date'] >= date_range[0]) & (frame['_date'] <= date_range[1])
+                frame = frame.loc[in_range]
+
+            if '_date' in frame.columns:
+                frame = frame.drop(columns='_date')
+            data[key] = frame.reset_index(drop=True)
+        return data
+
+    def get_load_report(self) -> Dict[str, Any]:
+        """返回各数据源读取的行数与字节数"""
+        naive_queries = sum(stats['consumers'] for stats in self.load_stats.values())
+        return {
+            'tables': len(self.load_stats),
+            'total_rows': sum(stats['rows'] for stats in self.load_stats.values()),
+            'total_bytes': sum(stats['bytes'] for stats in self.load_stats.values()),
+            'queries': len(self.load_stats),
+            'queries_saved': max(naive_queries - len(self.load_stats), 0),
+            'per_table': self.load_stats,
+        }
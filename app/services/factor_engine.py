@@ -1,24 +1,73 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
 import re
-from scipy import stats
 from loguru import logger
 
 from app.extensions import db
-from app.models import (
-    FactorDefinition, FactorValues, StockDailyHistory, StockDailyBasic,
-    StockFactor, StockMoneyflow, StockCyqPerf, StockIncomeStatement,
-    StockBalanceSheet
-)
+from app.models import FactorDefinition, FactorValues
+from app.services.factor_data_planner import FactorDataPlanner, get_factor_requirements, load_source_table
+from app.utils.columnar_store import invalidate_daily_table
+from app.utils.db_utils import DatabaseUtils
+
+
+def rolling_percentile_rank(values: np.ndarray, group_ids: np.ndarray,
+                            window: int = 252, min_periods: int = 20) -> np.ndarray:
+    """
+    分组滚动分位数（与 stats.percentileofscore(x, x[-1], kind='rank') / 100 口径一致）
+    
+    values 需按 (分组, 日期) 排序，同一分组的数据连续存放。按窗口内的滞后期逐层比较，
+    每层对全部股票做一次向量化运算，不再对每个窗口回调Python函数。
+    :param values: 因子原始值，不含空值
+    :param group_ids: 与 values 对齐的分组编号
+    :return: 每个位置在其滚动窗口内的分位数，窗口数据不足 min_periods 时为 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    group_ids = np.asarray(group_ids)
+    n = len(values)
+    if n == 0:
+        return np.array([], dtype=float)
+    
+    # 每个元素在所属分组内的位置
+    starts = np.r_[0, np.flatnonzero(group_ids[1:] != group_ids[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, n])
+    offset = np.arange(n) - np.repeat(starts, lengths)
+    
+    less = np.zeros(n, dtype=np.int32)
+    equal = np.zeros(n, dtype=np.int32)
+    max_lag = min(window, int(lengths.max()))
+    for lag in range(1, max_lag):
+        current = values[lag:]
+        previous = values[:-lag]
+        in_window = offset[lag:] >= lag
+        less[lag:] += (previous < current) & in_window
+        equal[lag:] += (previous == current) & in_window
+    
+    count = np.minimum(offset + 1, window)
+    # 当前值本身计入 <= 一侧：(strict + weak + 1) / (2n)
+    result = (2 * less + equal + 2) / (2.0 * count)
+    result[count < min_periods] = np.nan
+    return result
 
 
 class FactorEngine:
     """因子计算引擎"""
     
-    def __init__(self):
+    # 支持面板模式（日期 × 股票矩阵）一次性计算的技术因子
+    PANEL_TECHNICAL_FACTORS = (
+        'momentum_1d', 'momentum_5d', 'momentum_20d',
+        'volatility_20d', 'volume_ratio_20d', 'price_to_ma20',
+    )
+    
+    def __init__(self, compute_mode: str = 'panel'):
+        """
+        :param compute_mode: 技术因子计算模式，'panel' 为面板矩阵模式，'per_stock' 为逐股票计算
+        """
+        self.compute_mode = compute_mode
         self.factor_definitions = {}
+        self._data_planner = None
+        self.last_load_report = None
         self.builtin_factors = {}
         self._init_builtin_factors()
         self.load_factor_definitions()
@@ -130,6 +179,9 @@ class FactorEngine:
     def _calculate_builtin_factor(self, factor_id: str, ts_codes: List[str], 
                                  start_date: str, end_date: str) -> pd.DataFrame:
         """计算内置因子"""
+        if self.compute_mode == 'panel' and factor_id in self.PANEL_TECHNICAL_FACTORS:
+            return self.calculate_technical_factors_panel(ts_codes, start_date, end_date, [factor_id])
+        
         factor_func = self.builtin_factors[factor_id]
         
         # 根据因子类型获取所需数据
@@ -143,85 +195,15 @@ class FactorEngine:
     def _get_factor_data(self, factor_id: str, ts_codes: List[str], 
                         start_date: str, end_date: str) -> Dict[str, pd.DataFrame]:
         """获取计算因子所需的数据"""
-        data = {}
-        
-        # 扩展日期范围以获取足够的历史数据
-        extended_start = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=252)).strftime('%Y-%m-%d')
+        # 批量计算期间由数据加载计划器统一提供数据
+        if self._data_planner is not None:
+            return self._data_planner.get_data(factor_id, start_date, end_date)
         
+        data = {}
         try:
-            # 基础行情数据
-            if any(x in factor_id for x in ['momentum', 'volatility', 'volume', 'price']):
-                history_query = StockDailyHistory.query.filter(
-                    StockDailyHistory.ts_code.in_(ts_codes),
-                    StockDailyHistory.trade_date >= extended_start,
-                    StockDailyHistory.trade_date <= end_date
-                ).order_by(StockDailyHistory.ts_code, StockDailyHistory.trade_date)
-                
-                history_data = pd.read_sql(history_query.statement, db.engine)
-                data['history'] = history_data
-                logger.info(f"获取历史数据: {len(history_data)} 条记录")
-            
-            # 基本面数据
-            if any(x in factor_id for x in ['pe', 'pb', 'ps']):
-                basic_query = StockDailyBasic.query.filter(
-                    StockDailyBasic.ts_code.in_(ts_codes),
-                    StockDailyBasic.trade_date >= start_date,
-                    StockDailyBasic.trade_date <= end_date
-                ).order_by(StockDailyBasic.ts_code, StockDailyBasic.trade_date)
-                
-                basic_data = pd.read_sql(basic_query.statement, db.engine)
-                data['basic'] = basic_data
-            
-            # 技术因子数据
-            if 'ma' in factor_id:
-                factor_query = StockFactor.query.filter(
-                    StockFactor.ts_code.in_(ts_codes),
-                    StockFactor.trade_date >= start_date,
-                    StockFactor.trade_date <= end_date
-                ).order_by(StockFactor.ts_code, StockFactor.trade_date)
-                
-                factor_data = pd.read_sql(factor_query.statement, db.engine)
-                data['factor'] = factor_data
-            
-            # 资金流向数据
-            if 'money' in factor_id:
-                money_query = StockMoneyflow.query.filter(
-                    StockMoneyflow.ts_code.in_(ts_codes),
-                    StockMoneyflow.trade_date >= extended_start,
-                    StockMoneyflow.trade_date <= end_date
-                ).order_by(StockMoneyflow.ts_code, StockMoneyflow.trade_date)
-                
-                money_data = pd.read_sql(money_query.statement, db.engine)
-                data['moneyflow'] = money_data
-            
-            # 筹码数据
-            if 'chip' in factor_id or 'winner' in factor_id:
-                cyq_query = StockCyqPerf.query.filter(
-                    StockCyqPerf.ts_code.in_(ts_codes),
-                    StockCyqPerf.trade_date >= extended_start,
-                    StockCyqPerf.trade_date <= end_date
-                ).order_by(StockCyqPerf.ts_code, StockCyqPerf.trade_date)
-                
-                cyq_data = pd.read_sql(cyq_query.statement, db.engine)
-                data['cyq'] = cyq_data
-            
-            # 财务数据
-            if any(x in factor_id for x in ['roe', 'roa', 'revenue', 'profit']):
-                # 获取最近4个季度的财务数据
-                income_query = StockIncomeStatement.query.filter(
-                    StockIncomeStatement.ts_code.in_(ts_codes)
-                ).order_by(StockIncomeStatement.ts_code, StockIncomeStatement.end_date.desc())
-                
-                income_data = pd.read_sql(income_query.statement, db.engine)
-                data['income'] = income_data
-                
-                balance_query = StockBalanceSheet.query.filter(
-                    StockBalanceSheet.ts_code.in_(ts_codes)
-                ).order_by(StockBalanceSheet.ts_code, StockBalanceSheet.end_date.desc())
-                
-                balance_data = pd.read_sql(balance_query.statement, db.engine)
-                data['balance'] = balance_data
-            
+            for key, date_range in get_factor_requirements(factor_id, start_date, end_date).items():
+                data[key] = load_source_table(key, ts_codes, date_range)
+                logger.info(f"获取{key}数据: {len(data[key])} 条记录")
         except Exception as e:
             logger.error(f"获取因子数据失败: {e}")
         
@@ -334,86 +316,40 @@ class FactorEngine:
         
         return pd.DataFrame()
     
-    def _pe_percentile_factor(self, data: Dict[str, pd.DataFrame], factor_id: str) -> pd.DataFrame:
-        """PE历史分位数因子"""
+    def _valuation_percentile_factor(self, data: Dict[str, pd.DataFrame], factor_id: str,
+                                     value_column: str) -> pd.DataFrame:
+        """估值历史分位数因子：所有股票一次性计算滚动252日分位数"""
         if 'basic' not in data or data['basic'].empty:
             return pd.DataFrame()
         
-        df = data['basic'].copy()
+        df = data['basic'][['ts_code', 'trade_date', value_column]].copy()
         df['trade_date'] = pd.to_datetime(df['trade_date'])
+        df[value_column] = df[value_column].astype(float)
+        df = df[df[value_column].notna() & (df[value_column] > 0)]
         
-        result_list = []
-        for ts_code in df['ts_code'].unique():
-            stock_data = df[df['ts_code'] == ts_code].sort_values('trade_date')
-            stock_data = stock_data[stock_data['pe_ttm'].notna() & (stock_data['pe_ttm'] > 0)]
-            
-            if len(stock_data) > 20:  # 至少需要20个数据点
-                stock_data['pe_percentile'] = stock_data['pe_ttm'].rolling(252, min_periods=20).apply(
-                    lambda x: stats.percentileofscore(x, x.iloc[-1]) / 100
-                )
-                result_list.append(stock_data[['ts_code', 'trade_date', 'pe_percentile']])
-        
-        if result_list:
-            result = pd.concat(result_list, ignore_index=True)
-            result = result.rename(columns={'pe_percentile': 'factor_value'})
-            result['factor_id'] = factor_id
-            return result[['ts_code', 'trade_date', 'factor_id', 'factor_value']].dropna()
+        # 至少需要20个数据点
+        counts = df.groupby('ts_code')[value_column].transform('size')
+        df = df[counts > 20].sort_values(['ts_code', 'trade_date'], kind='mergesort')
+        if df.empty:
+            return pd.DataFrame()
         
-        return pd.DataFrame()
+        group_ids = pd.factorize(df['ts_code'])[0]
+        df['factor_value'] = rolling_percentile_rank(df[value_column].to_numpy(), group_ids,
+                                                     window=252, min_periods=20)
+        df['factor_id'] = factor_id
+        return df[['ts_code', 'trade_date', 'factor_id', 'factor_value']].dropna().reset_index(drop=True)
+    
+    def _pe_percentile_factor(self, data: Dict[str, pd.DataFrame], factor_id: str) -> pd.DataFrame:
+        """PE历史分位数因子"""
+        return self._valuation_percentile_factor(data, factor_id, 'pe_ttm')
     
     def _pb_percentile_factor(self, data: Dict[str, pd.DataFrame], factor_id: str) -> pd.DataFrame:
         """PB历史分位数因子"""
-        if 'basic' not in data or data['basic'].empty:
-            return pd.DataFrame()
-        
-        df = data['basic'].copy()
-        df['trade_date'] = pd.to_datetime(df['trade_date'])
-        
-        result_list = []
-        for ts_code in df['ts_code'].unique():
-            stock_data = df[df['ts_code'] == ts_code].sort_values('trade_date')
-            stock_data = stock_data[stock_data['pb'].notna() & (stock_data['pb'] > 0)]
-            
-            if len(stock_data) > 20:
-                stock_data['pb_percentile'] = stock_data['pb'].rolling(252, min_periods=20).apply(
-                    lambda x: stats.percentileofscore(x, x.iloc[-1]) / 100
-                )
-                result_list.append(stock_data[['ts_code', 'trade_date', 'pb_percentile']])
-        
-        if result_list:
-            result = pd.concat(result_list, ignore_index=True)
-            result = result.rename(columns={'pb_percentile': 'factor_value'})
-            result['factor_id'] = factor_id
-            return result[['ts_code', 'trade_date', 'factor_id', 'factor_value']].dropna()
-        
-        return pd.DataFrame()
+        return self._valuation_percentile_factor(data, factor_id, 'pb')
     
     def _ps_percentile_factor(self, data: Dict[str, pd.DataFrame], factor_id: str) -> pd.DataFrame:
         """PS历史分位数因子"""
-        if 'basic' not in data or data['basic'].empty:
-            return pd.DataFrame()
-        
-        df = data['basic'].copy()
-        df['trade_date'] = pd.to_datetime(df['trade_date'])
-        
-        result_list = []
-        for ts_code in df['ts_code'].unique():
-            stock_data = df[df['ts_code'] == ts_code].sort_values('trade_date')
-            stock_data = stock_data[stock_data['ps_ttm'].notna() & (stock_data['ps_ttm'] > 0)]
-            
-            if len(stock_data) > 20:
-                stock_data['ps_percentile'] = stock_data['ps_ttm'].rolling(252, min_periods=20).apply(
-                    lambda x: stats.percentileofscore(x, x.iloc[-1]) / 100
-                )
-                result_list.append(stock_data[['ts_code', 'trade_date', 'ps_percentile']])
-        
-        if result_list:
-            result = pd.concat(result_list, ignore_index=True)
-            result = result.rename(columns={'ps_percentile': 'factor_value'})
-            result['factor_id'] = factor_id
-            return result[['ts_code', 'trade_date', 'factor_id', 'factor_value']].dropna()
-        
-        return pd.DataFrame()
+        return self._valuation_percentile_factor(data, factor_id, 'ps_ttm')
     
     def _roe_factor(self, data: Dict[str, pd.DataFrame], factor_id: str) -> pd.DataFrame:
         """ROE因子（TTM）"""
@@ -703,6 +639,106 @@ class FactorEngine:
         
         return pd.DataFrame()
     
+    # ==================== 面板模式技术因子 ====================
+    
+    @staticmethod
+    def _build_history_panels(history: pd.DataFrame, fields: List[str]) -> Dict[str, pd.DataFrame]:
+        """将长表行情数据一次性透视为 日期 × 股票 的矩阵"""
+        df = history[['ts_code', 'trade_date'] + fields].copy()
+        df['trade_date'] = pd.to_datetime(df['trade_date'])
+        df = df.drop_duplicates(subset=['trade_date', 'ts_code'], keep='last')
+        
+        panels = {}
+        for field in fields:
+            panel = df.pivot(index='trade_date', columns='ts_code', values=field).sort_index()
+            panels[field] = panel.astype(float)
+        return panels
+    
+    @staticmethod
+    def _panel_factor_values(factor_id: str, close: pd.Series, vol: pd.Series) -> pd.Series:
+        """
+        基于按股票压缩的价格/成交量序列计算单个技术因子
+        序列按 (ts_code, trade_date) 排列且只含有行情的交易日，位移和滚动窗口在每只股票自己的行上进行，
+        停牌日不占窗口位置，与逐股票计算的口径一致
+        """
+        def rolling(series: pd.Series, period: int):
+            return series.groupby(level=0, sort=False).rolling(period)
+        
+        if factor_id.startswith('momentum_'):
+            period = int(factor_id.split('_')[1].replace('d', ''))
+            return close / close.groupby(level=0, sort=False).shift(period) - 1
+        
+        if factor_id.startswith('volatility_'):
+            period = int(factor_id.split('_')[1].replace('d', ''))
+            daily_return = close / close.groupby(level=0, sort=False).shift(1) - 1
+            return rolling(daily_return, period).std().droplevel(0)
+        
+        if factor_id.startswith('volume_ratio_'):
+            period = int(factor_id.split('_')[2].replace('d', ''))
+            return vol / rolling(vol, period).mean().droplevel(0)
+        
+        if factor_id.startswith('price_to_ma'):
+            period = int(factor_id.split('ma')[1])
+            return close / rolling(close, period).mean().droplevel(0) - 1
+        
+        raise ValueError(f"面板模式不支持的因子: {factor_id}")
+    
+    @staticmethod
+    def _panel_to_frame(values: pd.Series, factor_id: str) -> pd.DataFrame:
+        """将因子序列展开为 ts_code, trade_date, factor_id, factor_value 长表"""
+        values = values[values.notna()]
+        
+        return pd.DataFrame({
+            'ts_code': values.index.get_level_values(0).to_numpy(),
+            'trade_date': values.index.get_level_values(1).to_numpy(),
+            'factor_id': factor_id,
+            'factor_value': values.to_numpy(),
+        })
+    
+    def calculate_technical_factors_panel(self, ts_codes: List[str], start_date: str, end_date: str,
+                                          factor_ids: List[str] = None,
+                                          history: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        面板模式计算技术因子
+        
+        行情数据只读取并透视一次，再按股票压缩为各自有行情的交易日序列，所有股票一次完成分组位移和滚动。
+        停牌日没有因子值，窗口按每只股票的行计数（跨过停牌日），与逐股票计算一致。
+        :param factor_ids: 需要计算的技术因子，默认全部 PANEL_TECHNICAL_FACTORS
+        :param history: 已加载的行情数据，为空时从数据库读取
+        :return: 与逐股票计算相同结构的 ts_code, trade_date, factor_id, factor_value 数据
+        """
+        factor_ids = list(factor_ids or self.PANEL_TECHNICAL_FACTORS)
+        
+        if history is None:
+            history = self._get_factor_data(factor_ids[0], ts_codes, start_date, end_date).get('history')
+        if history is None or history.empty:
+            return pd.DataFrame()
+        
+        panels = self._build_history_panels(history, ['close', 'vol'])
+        close_panel = panels['close']
+        # 按股票优先的顺序取出有行情的位置
+        code_idx, date_idx = np.nonzero(close_panel.notna().to_numpy().T)
+        index = pd.MultiIndex.from_arrays([close_panel.columns.to_numpy()[code_idx],
+                                           close_panel.index.to_numpy()[date_idx]], names=['ts_code', 'trade_date'])
+        close = pd.Series(close_panel.to_numpy()[date_idx, code_idx], index=index)
+        vol = pd.Series(panels['vol'].to_numpy()[date_idx, code_idx], index=index)
+        
+        result_list = []
+        for factor_id in factor_ids:
+            try:
+                factor_values = self._panel_factor_values(factor_id, close, vol)
+                result_list.append(self._panel_to_frame(factor_values, factor_id))
+            except Exception as e:
+                logger.error(f"面板模式计算因子失败: {factor_id}, 错误: {e}")
+        
+        if not result_list:
+            return pd.DataFrame()
+        
+        result = pd.concat(result_list, ignore_index=True)
+        logger.info(f"面板模式计算技术因子: {len(factor_ids)} 个因子, "
+                    f"{close_panel.shape[1]} 只股票 × {close_panel.shape[0]} 个交易日, {len(result)} 条记录")
+        return result
+    
     def calculate_all_factors(self, trade_date: str, ts_codes: List[str] = None) -> pd.DataFrame:
         """计算所有因子的当日值"""
         try:
@@ -714,14 +750,37 @@ class FactorEngine:
             
             all_results = []
             
-            # 计算内置因子
-            for factor_id in self.builtin_factors.keys():
-                try:
-                    result = self.calculate_factor(factor_id, ts_codes, trade_date, trade_date)
-                    if not result.empty:
-                        all_results.append(result)
-                except Exception as e:
-                    logger.error(f"计算内置因子失败: {factor_id}, 错误: {e}")
+            # 汇总所有内置因子的数据需求，每张表只读取一次
+            self._data_planner = FactorDataPlanner(ts_codes, list(self.builtin_factors.keys()),
+                                                   trade_date, trade_date)
+            try:
+                self._data_planner.load()
+                
+                # 面板模式下技术因子一次性计算
+                panel_factor_ids = []
+                if self.compute_mode == 'panel':
+                    panel_factor_ids = [f for f in self.PANEL_TECHNICAL_FACTORS if f in self.builtin_factors]
+                    try:
+                        result = self.calculate_technical_factors_panel(ts_codes, trade_date, trade_date,
+                                                                        panel_factor_ids)
+                        if not result.empty:
+                            all_results.append(self._calculate_factor_stats(result, trade_date))
+                    except Exception as e:
+                        logger.error(f"面板模式计算技术因子失败: {e}")
+                
+                # 计算内置因子
+                for factor_id in self.builtin_factors.keys():
+                    if factor_id in panel_factor_ids:
+                        continue
+                    try:
+                        result = self.calculate_factor(factor_id, ts_codes, trade_date, trade_date)
+                        if not result.empty:
+                            all_results.append(result)
+                    except Exception as e:
+                        logger.error(f"计算内置因子失败: {factor_id}, 错误: {e}")
+            finally:
+                self.last_load_report = self._data_planner.get_load_report()
+                self._data_planner = None
             
             # 计算自定义因子
             for factor_id in self.factor_definitions.keys():
@@ -777,46 +836,40 @@ class FactorEngine:
             logger.error(f"计算因子统计量失败: {e}")
             return df
     
-    def save_factor_values(self, df: pd.DataFrame) -> bool:
+    def save_factor_values(self, df: pd.DataFrame, chunk_size: int = 5000) -> bool:
         """保存因子值到数据库"""
+        result = self.bulk_upsert_factor_values(df, chunk_size)
+        return result['success']
+    
+    def bulk_upsert_factor_values(self, df: pd.DataFrame, chunk_size: int = 5000) -> Dict[str, Any]:
+        """
+        按 (ts_code, trade_date, factor_id) 主键批量写入因子值
+        :return: {'success': 是否成功, 'rows_written': 写入行数, 'seconds': 耗时}
+        """
         try:
             if df.empty:
-                return True
-            
-            # 删除已存在的数据
-            trade_dates = df['trade_date'].unique()
-            factor_ids = df['factor_id'].unique()
-            
-            for trade_date in trade_dates:
-                for factor_id in factor_ids:
-                    FactorValues.query.filter_by(
-                        trade_date=trade_date,
-                        factor_id=factor_id
-                    ).delete()
-            
-            # 批量插入新数据
-            records = []
-            for _, row in df.iterrows():
-                record = FactorValues(
-                    ts_code=row['ts_code'],
-                    trade_date=row['trade_date'],
-                    factor_id=row['factor_id'],
-                    factor_value=row['factor_value'],
-                    percentile_rank=row.get('percentile_rank'),
-                    z_score=row.get('z_score')
-                )
-                records.append(record)
+                return {'success': True, 'rows_written': 0, 'seconds': 0.0}
             
-            db.session.bulk_save_objects(records)
-            db.session.commit()
+            columns = ['ts_code', 'trade_date', 'factor_id', 'factor_value', 'percentile_rank', 'z_score']
+            records = df.reindex(columns=columns).replace([np.inf, -np.inf], np.nan)
+            records = records.drop_duplicates(subset=['ts_code', 'trade_date', 'factor_id'], keep='last')
+            records['created_at'] = datetime.utcnow()
             
-            logger.info(f"成功保存 {len(records)} 条因子值记录")
-            return True
+            stats = DatabaseUtils.bulk_upsert_dataframe(
+                records, FactorValues,
+                key_columns=['ts_code', 'trade_date', 'factor_id'],
+                update_columns=['factor_value', 'percentile_rank', 'z_score'],
+                chunk_size=chunk_size
+            )
+            # 已缓存月份的因子值发生变化，使列式缓存对应分区失效
+            invalidate_daily_table('factor_values', records['trade_date'])
+            
+            logger.info(f"成功保存 {stats['rows_written']} 条因子值记录, 耗时 {stats['seconds']:.2f} 秒")
+            return {'success': True, 'rows_written': stats['rows_written'], 'seconds': stats['seconds']}
             
         except Exception as e:
-            db.session.rollback()
             logger.error(f"保存因子值失败: {e}")
-            return False
+            return {'success': False, 'rows_written': 0, 'seconds': 0.0}
     
     def get_factor_exposure(self, factor_id: str, trade_date: str) -> pd.DataFrame:
         """获取因子暴露度"""
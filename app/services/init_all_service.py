@@ -5,6 +5,7 @@ from app.extensions import db
 from app.models import StockBasic, StockDailyHistory, StockDailyBasic
 from app.services.factor_engine import FactorEngine
 from app.services.stock_scoring import StockScoringEngine
+from app.utils.columnar_store import invalidate_daily_table
 from loguru import logger
 import threading
 
@@ -76,6 +77,9 @@ class InitAllService:
                         db.session.add(basic)
                     
                     db.session.commit()
+                    trade_dates = [data[0] for data in rows]
+                    invalidate_daily_table('stock_daily_history', trade_dates)
+                    invalidate_daily_table('stock_daily_basic', trade_dates)
                     
                     # 2. 计算因子 (每同步完一只股票计算一次)
                     try:
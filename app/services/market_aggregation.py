@@ -0,0 +1,204 @@
+"""
+市场聚合统计服务
+一次分组SQL取出窗口内每只股票的最新K线和窗口基准价，并关联 StockBasic 的行业归属，
+在DataFrame上向量化计算市场宽度（涨跌家数、成交量额）和行业板块表现；
+结果按最新K线时间缓存，同一根K线内重复的看板请求只需一次取最大时间的查询
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
+
+from app.extensions import db
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+
+logger = logging.getLogger(__name__)
+
+# StockBasic 中没有行业信息的股票归入该板块
+UNKNOWN_INDUSTRY = '未分类'
+
+
+class MarketAggregationService:
+    """市场宽度与行业板块聚合"""
+
+    def __init__(self):
+        self._cache: Dict[tuple, object] = {}
+        self._cache_time: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def get_latest_time(self, period_type: str = '1min') -> Optional[datetime]:
+        """最新K线时间（走 (datetime, period_type) 索引）"""
+        return db.session.query(func.max(StockMinuteData.datetime)).filter(
+            StockMinuteData.period_type == period_type
+        ).scalar()
+
+    def load_latest_frame(self, period_type: str, latest_time: datetime, window_minutes: int) -> pd.DataFrame:
+        """
+        一次查询读取 (latest_time - window_minutes, latest_time] 内每只股票的最新K线
+
+        Returns:
+            DataFrame: ts_code, name, industry, datetime, close, volume, amount, pct_chg（最新K线涨跌幅）,
+                       base_price（窗口首根K线的前收盘价）, change_pct（最新收盘价相对 base_price 的涨跌幅）
+        """
+        start_time = latest_time - timedelta(minutes=window_minutes)
+        window = select(
+            StockMinuteData.ts_code,
+            func.min(StockMinuteData.datetime).label('first_time'),
+            func.max(StockMinuteData.datetime).label('last_time')
+        ).where(
+            StockMinuteData.period_type == period_type,
+            StockMinuteData.datetime > start_time,
+            StockMinuteData.datetime <= latest_time
+        ).group_by(StockMinuteData.ts_code).subquery()
+
+        last_bar = aliased(StockMinuteData)
+        first_bar = aliased(StockMinuteData)
+        query = select(
+            window.c.ts_code, StockBasic.name, StockBasic.industry,
+            last_bar.datetime, last_bar.close, last_bar.pre_close, last_bar.pct_chg,
+            last_bar.volume, last_bar.amount,
+            first_bar.pre_close.label('first_pre_close'), first_bar.open.label('first_open')
+        ).join(
+            last_bar, and_(last_bar.ts_code == window.c.ts_code, last_bar.period_type == period_type,
+                           last_bar.datetime == window.c.last_time)
+        ).join(
+            first_bar, and_(first_bar.ts_code == window.c.ts_code, first_bar.period_type == period_type,
+                            first_bar.datetime == window.c.first_time)
+        ).outerjoin(StockBasic, StockBasic.ts_code == window.c.ts_code)
+
+        frame = pd.read_sql(query, db.engine)
+        if frame.empty:
+            return frame
+
+        frame['industry'] = frame['industry'].fillna(UNKNOWN_INDUSTRY).replace('', UNKNOWN_INDUSTRY)
+        frame['name'] = frame['name'].fillna(frame['ts_code'])
+        for column in ['close', 'pre_close', 'pct_chg', 'volume', 'amount', 'first_pre_close', 'first_open']:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype(np.float64)
+
+        # 最新K线涨跌幅缺失时按前收盘价补算
+        bar_change = (frame['close'] - frame['pre_close']) / frame['pre_close'].where(frame['pre_close'] > 0) * 100
+        frame['pct_chg'] = frame['pct_chg'].fillna(bar_change)
+
+        # 窗口基准价：窗口前最后一根K线的收盘价，缺失时取窗口首根K线开盘价
+        base_price = frame['first_pre_close'].fillna(frame['first_open'])
+        frame['base_price'] = base_price.where(base_price > 0)
+        frame['change_pct'] = (frame['close'] - frame['base_price']) / frame['base_price'] * 100
+        return frame.drop(columns=['pre_close', 'first_pre_close', 'first_open'])
+
+    def _cached(self, kind: str, period_type: str, window_minutes: int, builder):
+        """按 (类型, 周期, 窗口, 最新K线时间) 缓存聚合结果，出现新K线时丢弃旧时间的结果"""
+        latest_time = self.get_latest_time(period_type)
+        if latest_time is None:
+            return None, None
+
+        key = (kind, period_type, window_minutes, latest_time)
+        result = self._cache.get(key)
+        if result is not None:
+            return latest_time, result
+
+        frame = self.load_latest_frame(period_type, latest_time, window_minutes)
+        result = builder(frame)
+        with self._lock:
+            if self._cache_time.get(period_type) != latest_time:
+                self._cache = {k: v for k, v in self._cache.items() if k[1] != period_type}
+                self._cache_time[period_type] = latest_time
+            self._cache[key] = result
+        return latest_time, result
+
+    @staticmethod
+    def compute_breadth(frame: pd.DataFrame) -> Dict:
+        """市场宽度：按每只股票最新K线涨跌幅统计涨跌家数与成交量额"""
+        total = len(frame)
+        if total == 0:
+            return {}
+        pct = frame['pct_chg'].to_numpy(dtype=np.float64)
+        rising = int(np.count_nonzero(pct > 0))
+        falling = int(np.count_nonzero(pct < 0))
+        avg_pct = float(np.nanmean(pct)) if np.isfinite(pct).any() else 0.0
+        return {
+            'total_stocks': total,
+            'rising_stocks': rising,
+            'falling_stocks': falling,
+            'flat_stocks': total - rising - falling,
+            'rising_ratio': round(rising / total * 100, 2),
+            'total_volume': float(np.nansum(frame['volume'].to_numpy(dtype=np.float64))),
+            'total_amount': round(float(np.nansum(frame['amount'].to_numpy(dtype=np.float64))), 2),
+            'avg_pct_chg': round(avg_pct, 2)
+        }
+
+    @staticmethod
+    def compute_sectors(frame: pd.DataFrame) -> List[Dict]:
+        """行业板块表现：窗口涨跌幅等权平均、最新K线成交量额合计、涨跌家数，按平均涨跌幅降序"""
+        if frame.empty:
+            return []
+        frame = frame[frame['change_pct'].notna()]
+        if frame.empty:
+            return []
+
+        change = frame['change_pct']
+        grouped = frame.assign(
+            rising=(change > 0).astype(int),
+            falling=(change < 0).astype(int)
+        ).groupby('industry').agg(
+            avg_change_pct=('change_pct', 'mean'),
+            total_volume=('volume', 'sum'),
+            total_amount=('amount', 'sum'),
+            stock_count=('ts_code', 'size'),
+            rising_count=('rising', 'sum'),
+            falling_count=('falling', 'sum')
+        ).sort_values('avg_change_pct', ascending=False)
+
+        return [{
+            'sector_name': industry,
+            'avg_change_pct': float(row.avg_change_pct),
+            'total_volume': float(row.total_volume),
+            'total_amount': float(row.total_amount),
+            'stock_count': int(row.stock_count),
+            'rising_count': int(row.rising_count),
+            'falling_count': int(row.falling_count),
+            'rising_ratio': row.rising_count / row.stock_count * 100
+        } for industry, row in zip(grouped.index, grouped.itertuples(index=False))]
+
+    def get_market_breadth(self, period_type: str = '1min', window_minutes: int = 5):
+        """
+        市场宽度
+
+        Returns:
+            (最新K线时间, 统计字典)，没有数据时为 (None, None)
+        """
+        return self._cached('breadth', period_type, window_minutes, self.compute_breadth)
+
+    def get_sector_stats(self, period_type: str = '1min', window_minutes: int = 60):
+        """
+        行业板块表现
+
+        Returns:
+            (最新K线时间, 板块列表)，没有数据时为 (None, None)
+        """
+        return self._cached('sectors', period_type, window_minutes, self.compute_sectors)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_time.clear()
+
+
+_service: Optional[MarketAggregationService] = None
+_service_lock = threading.Lock()
+
+
+def get_market_aggregation_service() -> MarketAggregationService:
+    """获取全局市场聚合服务（各实时服务共享同一份缓存）"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = MarketAggregationService()
+    return _service
@@ -0,0 +1,517 @@
+"""
+最新行情快照缓存
+按股票在进程内存中维护最新K线、前收盘价、当日OHLCV、滚动平均成交量、前N根K线价格区间和股票名称，
+新K线入库时增量更新并镜像到Redis哈希；实时行情、WebSocket推送和实时价格接口按股票O(1)读取，
+读取时超过 max_age 秒未核对的快照按Redis镜像或数据库最新K线时间重新校验；
+全市场扫描可一次取出全部快照的列式数据
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+from app.utils.market_calendar import PERIOD_MINUTES
+
+logger = logging.getLogger(__name__)
+
+# 快照中的数值字段（Redis镜像中按字符串存储）
+FLOAT_FIELDS = [
+    'open', 'high', 'low', 'close', 'volume', 'amount', 'prev_close',
+    'day_open', 'day_high', 'day_low', 'day_volume', 'day_amount',
+    'avg_volume', 'volume_ratio', 'prior_high', 'prior_low', 'change', 'change_pct'
+]
+
+
+class MarketSnapshotStore:
+    """单个周期的最新行情快照"""
+
+    def __init__(self, period_type: str = '1min', redis_client=None, mirror: bool = True,
+                 key_prefix: str = 'market_snapshot', volume_window: int = 20, max_age: float = 5.0):
+        """
+        Args:
+            period_type: K线周期
+            redis_client: Redis客户端，默认使用应用的 redis_client
+            mirror: 是否镜像到Redis哈希（多进程共享）
+            key_prefix: Redis键前缀，键为 {prefix}:{period_type}:{ts_code}
+            volume_window: 计算平均成交量和前期价格区间的K线数
+            max_age: ensure_loaded 读取时快照的最长复用时间（秒），超过后重新核对是否有新K线
+        """
+        self.period_type = period_type
+        self.key_prefix = key_prefix
+        self.volume_window = volume_window
+        self.max_age = max_age
+        self.snapshots: Dict[str, Dict] = {}
+        self.names: Dict[str, str] = {}
+        self._volumes: Dict[str, deque] = {}
+        self._ranges: Dict[str, deque] = {}
+        self._checked: Dict[str, float] = {}
+        self.universe_time: Optional[datetime] = None
+        # 全市场增量同步的写入顺序水位（自增id）：本次与上一次同步时的最大id
+        self.universe_id: Optional[int] = None
+        self._previous_universe_id: Optional[int] = None
+        self._lock = threading.RLock()
+
+        self.mirror = mirror
+        self.redis = redis_client
+        if mirror and redis_client is None:
+            from app.extensions import redis_client as default_client
+            self.redis = default_client
+
+    def _key(self, ts_code: str) -> str:
+        return f'{self.key_prefix}:{self.period_type}:{ts_code}'
+
+    def _make_snapshot(self, ts_code: str, bar_time: datetime, open_price: float, high: float, low: float,
+                       close: float, volume: float, amount: float, prev_close: Optional[float], day: Dict,
+                       avg_volume: Optional[float], prior_high: Optional[float],
+                       prior_low: Optional[float]) -> Dict:
+        change = close - prev_close if prev_close else None
+        return {
+            'ts_code': ts_code,
+            'name': self.names.get(ts_code, ts_code),
+            'datetime': bar_time,
+            'trade_date': bar_time.date(),
+            'open': open_price,
+            'high': high,
+            'low': low,
+            'close': close,
+            'volume': volume,
+            'amount': amount,
+            'prev_close': prev_close,
+            **day,
+            'avg_volume': avg_volume,
+            'volume_ratio': volume / avg_volume if avg_volume else 1.0,
+            'prior_high': prior_high,
+            'prior_low': prior_low,
+            'change': change,
+            'change_pct': change / prev_close * 100 if prev_close else 0.0
+        }
+
+    def _apply_bar(self, ts_code: str, bar: Dict) -> Optional[Dict]:
+        """用一根K线更新快照，时间不晚于当前快照的K线被忽略"""
+        bar_time = pd.Timestamp(bar['datetime']).to_pydatetime()
+        snapshot = self.snapshots.get(ts_code)
+        if snapshot is not None and bar_time <= snapshot['datetime']:
+            return None
+
+        open_price, high, low, close = (float(bar[f]) for f in ('open', 'high', 'low', 'close'))
+        volume = float(bar.get('volume') or 0)
+        amount = float(bar.get('amount') or 0)
+
+        volumes = self._volumes.get(ts_code)
+        if volumes is None:
+            volumes = self._volumes[ts_code] = deque(maxlen=self.volume_window)
+        ranges = self._ranges.get(ts_code)
+        if ranges is None:
+            ranges = self._ranges[ts_code] = deque(maxlen=self.volume_window)
+        avg_volume = sum(volumes) / len(volumes) if volumes else None
+        prior_high = max(r[0] for r in ranges) if ranges else None
+        prior_low = min(r[1] for r in ranges) if ranges else None
+        volumes.append(volume)
+        ranges.append((high, low))
+
+        trade_date = bar_time.date()
+        if snapshot is None or snapshot['trade_date'] != trade_date:
+            # 新交易日：前收盘价取上一交易日最后一根K线的收盘价
+            prev_close = snapshot['close'] if snapshot is not None else None
+            day = {'day_open': open_price, 'day_high': high, 'day_low': low,
+                   'day_volume': volume, 'day_amount': amount}
+        else:
+            prev_close = snapshot['prev_close']
+            day = {'day_open': snapshot['day_open'],
+                   'day_high': max(snapshot['day_high'], high),
+                   'day_low': min(snapshot['day_low'], low),
+                   'day_volume': snapshot['day_volume'] + volume,
+                   'day_amount': snapshot['day_amount'] + amount}
+
+        snapshot = self._make_snapshot(ts_code, bar_time, open_price, high, low, close, volume, amount,
+                                       prev_close, day, avg_volume, prior_high, prior_low)
+        self.snapshots[ts_code] = snapshot
+        return snapshot
+
+    def _seed_stock(self, ts_code: str, times, trade_dates, o, h, l, c, v, a) -> Dict:
+        """
+        冷启动：由一只股票（尚无快照）按时间排序的最近两个交易日K线直接得到最终快照，
+        结果与逐根回放一致（累加顺序相同），但只对最后一根K线组装字典
+        """
+        last = len(c) - 1
+        t0 = int(np.searchsorted(trade_dates, trade_dates[last]))
+        window = self.volume_window
+        prior = slice(max(0, last - window), last)
+        prior_volumes = v[prior].tolist()
+
+        volumes = v[t0:].tolist()
+        day = {'day_open': float(o[t0]), 'day_high': max(h[t0:].tolist()), 'day_low': min(l[t0:].tolist()),
+               'day_volume': sum(volumes), 'day_amount': sum(a[t0:].tolist())}
+        self._volumes[ts_code] = deque(v[-window:].tolist(), maxlen=window)
+        self._ranges[ts_code] = deque(zip(h[-window:].tolist(), l[-window:].tolist()), maxlen=window)
+
+        snapshot = self._make_snapshot(
+            ts_code, pd.Timestamp(times[last]).to_pydatetime(), float(o[last]), float(h[last]), float(l[last]),
+            float(c[last]), float(v[last]), float(a[last]),
+            float(c[t0 - 1]) if t0 > 0 else None, day,
+            sum(prior_volumes) / len(prior_volumes) if prior_volumes else None,
+            max(h[prior].tolist()) if prior_volumes else None,
+            min(l[prior].tolist()) if prior_volumes else None
+        )
+        self.snapshots[ts_code] = snapshot
+        return snapshot
+
+    def update_bar(self, ts_code: str, bar: Dict) -> Optional[Dict]:
+        """新K线入库后更新单只股票的快照"""
+        with self._lock:
+            snapshot = self._apply_bar(ts_code, bar)
+            self._checked[ts_code] = time.monotonic()
+        if snapshot is not None:
+            self._mirror([snapshot])
+        return snapshot
+
+    def update_bars(self, bars: pd.DataFrame) -> int:
+        """
+        批量更新快照（需包含 ts_code/datetime/open/high/low/close/volume/amount 列）
+        每只股票只取最近两个交易日的K线：已有快照的逐根回放比快照新的K线，尚无快照的按数组直接生成，
+        历史数据批量入库时开销有界
+        """
+        if bars is None or bars.empty:
+            return 0
+        if 'period_type' in bars.columns:
+            bars = bars[bars['period_type'] == self.period_type]
+        if bars.empty:
+            return 0
+
+        bars = bars.assign(datetime=pd.to_datetime(bars['datetime'])).sort_values(['ts_code', 'datetime'])
+        trade_dates = bars['datetime'].dt.normalize()
+        # 每只股票最近两个交易日
+        ranks = trade_dates.groupby(bars['ts_code']).rank(method='dense', ascending=False)
+        bars = bars[ranks <= 2]
+
+        updated = []
+        with self._lock:
+            # 已有快照（且有本进程的成交量窗口）的股票逐根增量回放
+            known = bars['ts_code'].isin(list(self._volumes.keys()))
+            for row in bars[known].itertuples(index=False):
+                snapshot = self._apply_bar(row.ts_code, row._asdict())
+                if snapshot is not None:
+                    updated.append(snapshot)
+
+            # 尚无快照或快照来自Redis镜像的股票按数组切片直接生成快照（不早于已有快照时）
+            fresh = bars[~known]
+            if not fresh.empty:
+                codes = fresh['ts_code'].to_numpy()
+                times = fresh['datetime'].to_numpy()
+                trade_dates = fresh['datetime'].dt.normalize().to_numpy()
+                columns = [fresh[f].to_numpy(dtype=np.float64) for f in ('open', 'high', 'low', 'close')]
+                columns += [pd.to_numeric(fresh[f]).fillna(0).to_numpy(dtype=np.float64)
+                            for f in ('volume', 'amount')]
+                bounds = np.concatenate([[0], np.flatnonzero(codes[1:] != codes[:-1]) + 1, [len(codes)]])
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    current = self.snapshots.get(codes[start])
+                    if current is not None and pd.Timestamp(times[end - 1]).to_pydatetime() <= current['datetime']:
+                        continue
+                    updated.append(self._seed_stock(codes[start], times[start:end], trade_dates[start:end],
+                                                    *(column[start:end] for column in columns)))
+            checked_at = time.monotonic()
+            for ts_code in bars['ts_code'].unique():
+                self._checked[ts_code] = checked_at
+        # 同一只股票只镜像最终状态
+        latest = {s['ts_code']: s for s in updated}
+        self._mirror(list(latest.values()))
+        return len(latest)
+
+    def get(self, ts_code: str) -> Optional[Dict]:
+        """读取单只股票的快照"""
+        snapshot = self.snapshots.get(ts_code)
+        return dict(snapshot) if snapshot is not None else None
+
+    def get_many(self, ts_codes: List[str]) -> Dict[str, Dict]:
+        """批量读取快照，缺失的股票不返回"""
+        return {ts_code: dict(self.snapshots[ts_code]) for ts_code in ts_codes if ts_code in self.snapshots}
+
+    def to_frame(self, since: datetime = None) -> pd.DataFrame:
+        """全部快照的列式视图（全市场扫描用），since 指定时只保留K线时间不早于该时间的股票"""
+        with self._lock:
+            snapshots = list(self.snapshots.values())
+        frame = pd.DataFrame.from_records(snapshots)
+        if since is not None and not frame.empty:
+            frame = frame[frame['datetime'] >= since].reset_index(drop=True)
+        return frame
+
+    def ensure_loaded(self, ts_codes: List[str]) -> Dict[str, Dict]:
+        """
+        批量读取快照：内存中缺失或超过 max_age 秒未核对的股票先按Redis镜像（入库进程总会写入）刷新，
+        Redis中没有的再与数据库最新K线时间比较，有新K线时增量回放或重新加载
+        """
+        now = time.monotonic()
+        stale = [ts_code for ts_code in ts_codes if now - self._checked.get(ts_code, -np.inf) > self.max_age]
+        if stale:
+            remaining = stale
+            if self.mirror:
+                mirrored = self._read_redis(stale)
+                if mirrored is not None:
+                    self._apply_redis(mirrored)
+                    remaining = [ts_code for ts_code in stale if ts_code not in mirrored]
+            if remaining:
+                self._refresh_from_db(remaining)
+            with self._lock:
+                for ts_code in stale:
+                    self._checked[ts_code] = now
+        return self.get_many(ts_codes)
+
+    def _refresh_from_db(self, ts_codes: List[str]):
+        """尚无快照的股票直接加载；已有快照的与数据库中的最新K线时间比较（一次分组查询），只处理有新K线的"""
+        missing = [ts_code for ts_code in ts_codes if ts_code not in self.snapshots]
+        cached = [ts_code for ts_code in ts_codes if ts_code in self.snapshots]
+        latest = []
+        if cached:
+            try:
+                latest = db.session.query(StockMinuteData.ts_code, func.max(StockMinuteData.datetime)).filter(
+                    StockMinuteData.ts_code.in_(cached),
+                    StockMinuteData.period_type == self.period_type
+                ).group_by(StockMinuteData.ts_code).all()
+            except Exception as e:
+                logger.error(f"查询最新K线时间失败: {e}")
+
+        replay = {}
+        with self._lock:
+            for ts_code, latest_time in latest:
+                snapshot = self.snapshots[ts_code]
+                if pd.Timestamp(latest_time).to_pydatetime() > snapshot['datetime']:
+                    if ts_code in self._volumes:
+                        replay[ts_code] = snapshot['datetime']
+                    else:
+                        # 从Redis恢复的快照没有成交量窗口，重新加载以保证平均成交量等口径一致
+                        missing.append(ts_code)
+
+        if replay:
+            bars = pd.read_sql(
+                StockMinuteData.query.filter(
+                    StockMinuteData.ts_code.in_(list(replay)),
+                    StockMinuteData.period_type == self.period_type,
+                    StockMinuteData.datetime > min(replay.values())
+                ).with_entities(
+                    StockMinuteData.ts_code, StockMinuteData.datetime, StockMinuteData.open,
+                    StockMinuteData.high, StockMinuteData.low, StockMinuteData.close,
+                    StockMinuteData.volume, StockMinuteData.amount
+                ).statement,
+                db.engine
+            )
+            self.update_bars(bars)
+        if missing:
+            self.load_from_db(missing)
+
+    def _load_names(self, ts_codes: List[str]):
+        """一次查询补充股票名称"""
+        missing = [ts_code for ts_code in ts_codes if ts_code not in self.names]
+        if not missing:
+            return
+        rows = StockBasic.query.filter(StockBasic.ts_code.in_(missing)).with_entities(
+            StockBasic.ts_code, StockBasic.name).all()
+        self.names.update({row[0]: row[1] for row in rows})
+
+    def load_from_db(self, ts_codes: List[str], end_time: datetime = None, lookback_days: int = 10) -> int:
+        """
+        冷启动：一次查询读取最近 lookback_days 天的K线，每只股票取最近两个交易日生成快照
+        """
+        if not ts_codes:
+            return 0
+        try:
+            self._load_names(ts_codes)
+            end_time = end_time or datetime.now()
+            bars = pd.read_sql(
+                StockMinuteData.query.filter(
+                    StockMinuteData.ts_code.in_(ts_codes),
+                    StockMinuteData.period_type == self.period_type,
+                    StockMinuteData.datetime >= end_time - timedelta(days=lookback_days),
+                    StockMinuteData.datetime <= end_time
+                ).with_entities(
+                    StockMinuteData.ts_code, StockMinuteData.datetime, StockMinuteData.open,
+                    StockMinuteData.high, StockMinuteData.low, StockMinuteData.close,
+                    StockMinuteData.volume, StockMinuteData.amount
+                ).statement,
+                db.engine
+            )
+            return self.update_bars(bars)
+        except Exception as e:
+            logger.error(f"从数据库加载行情快照失败: {e}")
+            return 0
+
+    def sync_universe(self, active_hours: float = 1) -> int:
+        """
+        全市场快照与数据库对齐（全市场扫描用）
+        首次调用为最新K线前 active_hours 内有成交的全部股票生成快照，只读取当日K线和上一交易日最后
+        volume_window 根K线（足够得到前收盘价、平均成交量和前期价格区间）；之后按自增id（写入顺序）
+        读取新入库的K线增量回放（其他进程写入的数据），数据库没有新写入时只有一次取最大id的查询。
+        同步服务逐只股票写入，同一时间的K线可能在上次同步之后才入库，因此不能用K线时间作水位；
+        每次从上一次同步时的水位开始读取，覆盖并发事务晚提交的较小id，重复的K线由 _apply_bar 忽略
+
+        Returns:
+            更新的股票数
+        """
+        try:
+            max_id = db.session.query(func.max(StockMinuteData.id)).scalar()
+            if max_id is None or (self.universe_id is not None and max_id <= self.universe_id):
+                return 0
+
+            if self.universe_id is None:
+                latest_time = db.session.query(func.max(StockMinuteData.datetime)).filter(
+                    StockMinuteData.period_type == self.period_type
+                ).scalar()
+                if latest_time is None:
+                    return 0
+                day_start = datetime.combine(latest_time.date(), datetime.min.time())
+                prev_last = db.session.query(func.max(StockMinuteData.datetime)).filter(
+                    StockMinuteData.period_type == self.period_type,
+                    StockMinuteData.datetime < day_start
+                ).scalar()
+                start_time = day_start
+                if prev_last is not None:
+                    start_time = prev_last - timedelta(
+                        minutes=PERIOD_MINUTES.get(self.period_type, 1) * self.volume_window)
+                bars = self._read_bars(StockMinuteData.datetime >= start_time,
+                                       StockMinuteData.datetime <= latest_time)
+                last_times = bars.groupby('ts_code')['datetime'].transform('max')
+                bars = bars[last_times >= latest_time - timedelta(hours=active_hours)]
+                self.universe_time = latest_time
+            else:
+                bars = self._read_bars(StockMinuteData.id > self._previous_universe_id)
+                if not bars.empty:
+                    self.universe_time = max(self.universe_time, bars['datetime'].max().to_pydatetime())
+
+            self._load_names(list(bars['ts_code'].unique()))
+            updated = self.update_bars(bars)
+            self._previous_universe_id = self.universe_id if self.universe_id is not None else max_id
+            self.universe_id = max_id
+            return updated
+        except Exception as e:
+            logger.error(f"同步全市场行情快照失败: {e}")
+            return 0
+
+    def _read_bars(self, *filters) -> pd.DataFrame:
+        """一次查询读取全部股票满足条件的K线（按id排序即写入顺序，同一股票内时间递增）"""
+        bars = pd.read_sql(
+            StockMinuteData.query.filter(
+                StockMinuteData.period_type == self.period_type,
+                *filters
+            ).with_entities(
+                StockMinuteData.ts_code, StockMinuteData.datetime, StockMinuteData.open,
+                StockMinuteData.high, StockMinuteData.low, StockMinuteData.close,
+                StockMinuteData.volume, StockMinuteData.amount
+            ).statement,
+            db.engine
+        )
+        bars['datetime'] = pd.to_datetime(bars['datetime'])
+        return bars
+
+    def _mirror(self, snapshots: List[Dict]):
+        """镜像到Redis哈希，Redis不可用时关闭镜像，只保留进程内缓存"""
+        if not self.mirror or not snapshots:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for snapshot in snapshots:
+                mapping = {field: '' if snapshot[field] is None else repr(float(snapshot[field]))
+                           for field in FLOAT_FIELDS}
+                mapping.update({'ts_code': snapshot['ts_code'], 'name': snapshot['name'],
+                                'datetime': snapshot['datetime'].isoformat()})
+                pipe.hset(self._key(snapshot['ts_code']), mapping=mapping)
+            pipe.execute()
+        except Exception as e:
+            self.mirror = False
+            logger.warning(f"行情快照Redis镜像不可用，仅使用进程内缓存: {e}")
+
+    def load_from_redis(self, ts_codes: List[str]) -> int:
+        """从Redis镜像恢复快照（其他进程写入的数据）"""
+        if not self.mirror or not ts_codes:
+            return 0
+        return self._apply_redis(self._read_redis(ts_codes) or {})
+
+    def _read_redis(self, ts_codes: List[str]) -> Optional[Dict[str, Dict]]:
+        """读取Redis镜像中的快照，Redis不可用时返回 None"""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for ts_code in ts_codes:
+                pipe.hgetall(self._key(ts_code))
+            results = pipe.execute()
+        except Exception as e:
+            logger.warning(f"读取行情快照Redis镜像失败: {e}")
+            return None
+
+        mirrored = {}
+        for ts_code, data in zip(ts_codes, results):
+            if not data:
+                continue
+            data = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                    for k, v in data.items()}
+            snapshot = {field: float(data[field]) if data.get(field) else None for field in FLOAT_FIELDS}
+            snapshot.update({'ts_code': ts_code, 'name': data.get('name') or ts_code,
+                             'datetime': datetime.fromisoformat(data['datetime'])})
+            snapshot['trade_date'] = snapshot['datetime'].date()
+            mirrored[ts_code] = snapshot
+        return mirrored
+
+    def _apply_redis(self, mirrored: Dict[str, Dict]) -> int:
+        """用Redis镜像中更新的快照替换内存中的快照"""
+        loaded = 0
+        with self._lock:
+            for ts_code, snapshot in mirrored.items():
+                current = self.snapshots.get(ts_code)
+                if current is None or snapshot['datetime'] > current['datetime']:
+                    self.snapshots[ts_code] = snapshot
+                    self.names[ts_code] = snapshot['name']
+                    # 成交量窗口属于旧快照，之后的增量回放改为重新加载
+                    self._volumes.pop(ts_code, None)
+                    self._ranges.pop(ts_code, None)
+                    loaded += 1
+        return loaded
+
+    def clear(self):
+        with self._lock:
+            self.snapshots.clear()
+            self._volumes.clear()
+            self._ranges.clear()
+            self._checked.clear()
+            self.universe_time = None
+            self.universe_id = None
+            self._previous_universe_id = None
+
+
+_stores: Dict[str, MarketSnapshotStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(period_type: str = '1min') -> MarketSnapshotStore:
+    """获取指定周期的全局快照缓存"""
+    store = _stores.get(period_type)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(period_type)
+            if store is None:
+                store = _stores[period_type] = MarketSnapshotStore(period_type)
+    return store
+
+
+def update_market_snapshots(bars: pd.DataFrame):
+    """
+    新K线入库后更新快照缓存并镜像到Redis（入库路径总是调用，供其他进程读取）
+    进程内尚无快照的股票从数据库加载最近K线（已包含本次写入），保证前收盘价和平均成交量完整
+    """
+    if bars is None or bars.empty:
+        return
+    for period_type in bars['period_type'].unique() if 'period_type' in bars.columns else ['1min']:
+        store = get_snapshot_store(period_type)
+        try:
+            period_bars = bars[bars['period_type'] == period_type] if 'period_type' in bars.columns else bars
+            known = period_bars['ts_code'].isin(list(store._volumes.keys()))
+            store.update_bars(period_bars[known])
+            store.load_from_db(list(period_bars.loc[~known, 'ts_code'].unique()))
+        except Exception as e:
+            logger.warning(f"更新行情快照失败: {period_type}, 错误: {e}")
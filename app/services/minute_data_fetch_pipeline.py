@@ -0,0 +1,253 @@
+"""
+分钟数据并发抓取流水线
+多个工作进程各自登录Baostock并行抓取（共用一个跨进程令牌桶限速），主进程作为唯一写入方按提交顺序取回结果批量入库
+"""
+
+import importlib
+import logging
+import multiprocessing
+import time
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+from typing import List, Dict, Optional
+
+import pandas as pd
+
+from app.services.minute_data_sync_service import MinuteDataSyncService
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的同步服务（每个进程一个Baostock会话）和共享限速器
+_worker_service = None
+_worker_rate_limiter = None
+
+
+def _init_fetch_worker(bs_module_name: str, rate_limiter: 'TokenBucketRateLimiter' = None):
+    """工作进程初始化：导入Baostock模块并登录"""
+    global _worker_service, _worker_rate_limiter
+    _worker_rate_limiter = rate_limiter
+    bs_module = importlib.import_module(bs_module_name)
+    service = MinuteDataSyncService(bs_module=bs_module)
+    try:
+        service.login_baostock()
+    except Exception as e:
+        # 登录失败不抛出，避免进程池反复重建工作进程；该进程的任务均记为失败
+        logger.error(f"工作进程登录Baostock失败: {e}")
+        return
+    _worker_service = service
+    # 进程正常退出时登出
+    Finalize(None, service.logout_baostock, exitpriority=10)
+
+
+def _fetch_task(task: tuple) -> Dict:
+    """工作进程中抓取单只股票单个周期的数据"""
+    ts_code, period_type, start_date, end_date = task
+    start_time = time.perf_counter()
+    try:
+        if _worker_service is None:
+            raise RuntimeError('Baostock未登录')
+        # 在实际调用Baostock前取令牌，全部工作进程的请求合计不超过限速
+        if _worker_rate_limiter is not None:
+            _worker_rate_limiter.acquire()
+        df = _worker_service.get_stock_minute_data_bs(ts_code, start_date, end_date, period_type)
+        error = None
+    except Exception as e:
+        df = None
+        error = str(e)
+    return {
+        'ts_code': ts_code,
+        'period_type': period_type,
+        'data': df,
+        'error': error,
+        'seconds': time.perf_counter() - start_time
+    }
+
+
+class TokenBucketRateLimiter:
+    """
+    令牌桶限速器，按固定速率补充令牌，允许短时突发
+
+    令牌数和上次补充时间保存在共享内存中，作为进程池初始化参数传给工作进程后，多个进程共用同一个令牌桶
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数（即每秒请求数上限）
+            capacity: 令牌桶容量，默认等于 rate
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+        # [令牌数, 上次补充时间]，自带跨进程锁
+        self._state = multiprocessing.Array('d', [self.capacity, time.monotonic()])
+
+    def acquire(self, tokens: float = 1.0):
+        """获取令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._state.get_lock():
+                now = time.monotonic()
+                available = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate)
+                self._state[1] = now
+                if available >= tokens:
+                    self._state[0] = available - tokens
+                    return
+                self._state[0] = available
+                wait_seconds = (tokens - available) / self.rate
+            time.sleep(wait_seconds)
+
+
+class MinuteDataFetchPipeline:
+    """分钟数据并发抓取流水线"""
+
+    def __init__(self, max_workers: int = 4, requests_per_second: float = 10.0,
+                 burst: Optional[float] = None, flush_rows: int = 20000,
+                 progress_interval: int = 100, bs_module_name: str = 'baostock', task_timeout: float = 300.0):
+        """
+        Args:
+            max_workers: 抓取进程数，每个进程独立登录Baostock
+            requests_per_second: 全部工作进程合计的Baostock请求速率上限
+            burst: 允许的突发请求数
+            flush_rows: 写入方累计多少行后批量入库
+            progress_interval: 每完成多少个抓取任务输出一次进度
+            bs_module_name: Baostock模块名，测试时可替换为本地模拟模块
+            task_timeout: 等待单个任务结果的秒数，超时（如工作进程异常退出）记为失败
+        """
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucketRateLimiter(requests_per_second, burst)
+        self.flush_rows = flush_rows
+        self.progress_interval = progress_interval
+        self.bs_module_name = bs_module_name
+        self.task_timeout = task_timeout
+        self.writer = MinuteDataSyncService()
+
+    def _flush(self, buffer: List[pd.DataFrame], stats: Dict) -> int:
+        """将缓冲区数据批量写入数据库"""
+        if not buffer:
+            return 0
+        df = pd.concat(buffer, ignore_index=True)
+        result = self.writer.upsert_minute_dataframe(df)
+        stats['inserted'] += result['inserted']
+        stats['updated'] += result['updated']
+        stats['write_seconds'] += result['seconds']
+        buffer.clear()
+        return len(df)
+
+    def _log_progress(self, period_stats: Dict, done: int, total: int, started: float):
+        """输出各周期的进度与吞吐量"""
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        for period_type, stats in period_stats.items():
+            logger.info(
+                f"[{period_type}] 进度 {stats['done']}/{stats['total']} 只股票, "
+                f"{stats['rows']} 条记录, {stats['done'] / elapsed:.1f} 只/秒, "
+                f"{stats['rows'] / elapsed:.0f} 条/秒"
+            )
+        logger.info(f"总进度 {done}/{total}")
+
+    def run(self, stock_list: List[str], period_types: List[str] = None,
+            start_date: str = None, end_date: str = None) -> Dict:
+        """
+        并发抓取并写入多只股票、多个周期的分钟数据
+
+        Args:
+            stock_list: 股票代码列表
+            period_types: 周期类型列表，默认 ['5min']
+            start_date: 开始日期
+            end_date: 结束日期
+
+        Returns:
+            同步结果字典，包含各周期的成功数、失败数、记录数和吞吐量
+        """
+        period_types = period_types or ['5min']
+        tasks = [(ts_code, period_type, start_date, end_date)
+                 for period_type in period_types for ts_code in stock_list]
+        total = len(tasks)
+
+        period_stats = {
+            period_type: {'total': len(stock_list), 'done': 0, 'success': 0, 'failed': 0,
+                          'rows': 0, 'fetch_seconds': 0.0}
+            for period_type in period_types
+        }
+        write_stats = {'inserted': 0, 'updated': 0, 'write_seconds': 0.0}
+        failed_tasks = []
+
+        logger.info(f"开始并发同步 {len(stock_list)} 只股票, 周期: {period_types}, "
+                    f"进程数: {self.max_workers}, 限速: {self.rate_limiter.rate}/秒")
+        started = time.perf_counter()
+
+        buffer = []
+        buffered_rows = 0
+
+        with Pool(processes=self.max_workers, initializer=_init_fetch_worker,
+                  initargs=(self.bs_module_name, self.rate_limiter)) as pool:
+            # 一次提交全部任务（限速在工作进程内），保留 AsyncResult 以便检测丢失的任务
+            pending = [(task, pool.apply_async(_fetch_task, (task,))) for task in tasks]
+
+            # 主进程作为唯一写入方，按提交顺序取结果并批量入库
+            lost = 0
+            for done, (task, async_result) in enumerate(pending, start=1):
+                try:
+                    result = async_result.get(timeout=self.task_timeout)
+                except multiprocessing.TimeoutError:
+                    # 工作进程异常退出（OOM、Baostock连接崩溃）时任务不会返回
+                    lost += 1
+                    result = {'ts_code': task[0], 'period_type': task[1], 'data': None,
+                              'error': f'{self.task_timeout:g} 秒内未返回结果，工作进程可能已退出',
+                              'seconds': self.task_timeout}
+                except Exception as e:
+                    result = {'ts_code': task[0], 'period_type': task[1], 'data': None,
+                              'error': str(e), 'seconds': 0.0}
+                stats = period_stats[result['period_type']]
+                stats['done'] += 1
+                stats['fetch_seconds'] += result['seconds']
+
+                df = result['data']
+                if result['error']:
+                    stats['failed'] += 1
+                    failed_tasks.append({'ts_code': result['ts_code'], 'period_type': result['period_type'],
+                                         'error': result['error']})
+                elif df is None or df.empty:
+                    stats['failed'] += 1
+                else:
+                    stats['success'] += 1
+                    stats['rows'] += len(df)
+                    buffer.append(df)
+                    buffered_rows += len(df)
+
+                if buffered_rows >= self.flush_rows:
+                    self._flush(buffer, write_stats)
+                    buffered_rows = 0
+
+                if done % self.progress_interval == 0:
+                    self._log_progress(period_stats, done, total, started)
+
+            self._flush(buffer, write_stats)
+            if lost:
+                logger.error(f"{lost} 个抓取任务未返回结果，终止进程池")
+            else:
+                # 正常结束时等待工作进程退出（登出Baostock）；有任务丢失时由 with 语句终止进程池
+                pool.close()
+                pool.join()
+
+        elapsed = time.perf_counter() - started
+        for stats in period_stats.values():
+            stats['stocks_per_second'] = stats['done'] / elapsed if elapsed > 0 else 0.0
+            stats['rows_per_second'] = stats['rows'] / elapsed if elapsed > 0 else 0.0
+
+        total_rows = sum(stats['rows'] for stats in period_stats.values())
+        logger.info(f"并发同步完成, 耗时 {elapsed:.1f} 秒, 共 {total_rows} 条记录, "
+                    f"新增 {write_stats['inserted']}, 更新 {write_stats['updated']}")
+
+        return {
+            'success': True,
+            'message': '并发同步完成',
+            'total_stocks': len(stock_list),
+            'success_stocks': sum(stats['success'] for stats in period_stats.values()),
+            'failed_stocks': sum(stats['failed'] for stats in period_stats.values()),
+            'total_data_count': total_rows,
+            'inserted_count': write_stats['inserted'],
+            'updated_count': write_stats['updated'],
+            'write_seconds': write_stats['write_seconds'],
+            'elapsed_seconds': elapsed,
+            'period_stats': period_stats,
+            'failed_tasks': failed_tasks
+        }
@@ -11,9 +11,14 @@ import logging
 from typing import List, Dict, Optional
 from app.extensions import db
 from app.models.stock_minute_data import StockMinuteData
+from app.models.sync_state import SyncState
 from app.utils.db_utils import DatabaseUtils
-from sqlalchemy import text
+from app.utils.market_calendar import get_trade_dates, session_close, to_date
+from app.services.market_snapshot import update_market_snapshots
+from app.services.realtime_pipeline import publish_ingested_bars
+from sqlalchemy import text, select
 import time
+import weakref
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +34,24 @@ class MinuteDataSyncService:
         '60min': '60'
     }
     
-    def __init__(self):
+    # 写入数据库的字段
+    MINUTE_DATA_COLUMNS = [
+        'ts_code', 'datetime', 'period_type', 'open', 'high', 'low', 'close',
+        'volume', 'amount', 'pre_close', 'change', 'pct_chg'
+    ]
+    
+    # 唯一键
+    MINUTE_DATA_KEYS = ['ts_code', 'datetime', 'period_type']
+    
+    # 已确认建有唯一键的数据库引擎（未迁移的表每次写入时重新检查）
+    _unique_key_engines = weakref.WeakSet()
+    
+    def __init__(self, bs_module=None):
+        """
+        Args:
+            bs_module: Baostock模块，默认使用 baostock，测试时可传入本地模拟模块
+        """
+        self.bs = bs_module or bs
         self.bs_logged_in = False
         
     def __enter__(self):
@@ -44,7 +66,7 @@ class MinuteDataSyncService:
     def login_baostock(self):
         """登录Baostock"""
         try:
-            lg = bs.login()
+            lg = self.bs.login()
             if lg.error_code == '0':
                 self.bs_logged_in = True
                 logger.info("Baostock登录成功")
@@ -58,7 +80,7 @@ class MinuteDataSyncService:
     def logout_baostock(self):
         """登出Baostock"""
         if self.bs_logged_in:
-            bs.logout()
+            self.bs.logout()
             self.bs_logged_in = False
             logger.info("Baostock登出成功")
     
@@ -105,7 +127,7 @@ class MinuteDataSyncService:
                 actual_period = period_type
             
             # 查询历史K线数据
-            rs = bs.query_history_k_data_plus(
+            rs = self.bs.query_history_k_data_plus(
                 bs_code,
                 "date,time,code,open,high,low,close,volume,amount",
                 start_date=start_date, 
@@ -247,8 +269,160 @@ class MinuteDataSyncService:
             logger.error(f"计算技术指标字段异常: {e}")
             return df
     
+    def _stage_minute_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        整理待写入的分钟数据：只保留表字段，按唯一键去重
+        """
+        staged = df.reindex(columns=self.MINUTE_DATA_COLUMNS).copy()
+        staged['datetime'] = pd.to_datetime(staged['datetime'])
+        staged['volume'] = staged['volume'].fillna(0).astype('int64')
+        staged['amount'] = staged['amount'].fillna(0.0)
+        staged = staged.drop_duplicates(subset=self.MINUTE_DATA_KEYS, keep='last')
+        return staged.reset_index(drop=True)
+    
+    def _count_existing_keys(self, staged: pd.DataFrame) -> int:
+        """统计待写入数据中已存在于数据库的记录数（一次查询）"""
+        table = StockMinuteData.__table__
+        query = select(table.c.ts_code, table.c.datetime, table.c.period_type).where(
+            table.c.ts_code.in_(staged['ts_code'].unique().tolist()),
+            table.c.period_type.in_(staged['period_type'].unique().tolist()),
+            table.c.datetime >= staged['datetime'].min().to_pydatetime(),
+            table.c.datetime <= staged['datetime'].max().to_pydatetime()
+        )
+        existing = pd.read_sql(query, db.engine)
+        if existing.empty:
+            return 0
+        
+        existing['datetime'] = pd.to_datetime(existing['datetime'])
+        matched = staged[self.MINUTE_DATA_KEYS].merge(existing, on=self.MINUTE_DATA_KEYS, how='inner')
+        return len(matched)
+    
+    def has_minute_unique_key(self) -> bool:
+        """
+        分钟数据表是否建有 (ts_code, datetime, period_type) 唯一索引或唯一约束
+        
+        批量upsert依赖该唯一键：未执行 migrations/add_minute_data_unique_key.py 的旧表上
+        ON DUPLICATE KEY / ON CONFLICT 没有可命中的键，重复同步会插入重复K线
+        """
+        if db.engine in self._unique_key_engines:
+            return True
+        
+        try:
+            inspector = db.inspect(db.engine)
+            table = StockMinuteData.__tablename__
+            unique_columns = [idx['column_names'] for idx in inspector.get_indexes(table) if idx.get('unique')]
+            unique_columns += [uc['column_names'] for uc in inspector.get_unique_constraints(table)]
+        except Exception as e:
+            logger.error(f"检查分钟数据表唯一键失败: {e}")
+            return False
+        
+        if any(set(columns) == set(self.MINUTE_DATA_KEYS) for columns in unique_columns):
+            self._unique_key_engines.add(db.engine)
+            return True
+        return False
+    
+    def upsert_minute_dataframe(self, df: pd.DataFrame, chunk_size: int = 2000) -> Dict:
+        """
+        批量写入分钟数据（按 ts_code, datetime, period_type 唯一键插入或更新）
+        
+        每个数据块只执行一次存在性统计查询和一条upsert语句，不再逐条查询。
+        表上没有唯一键时回退为逐条查询写入，避免重复插入。
+        
+        Args:
+            df: 预处理后的分钟数据
+            chunk_size: 每批写入行数
+            
+        Returns:
+            {'inserted': 新增数, 'updated': 更新数, 'seconds': 耗时}
+        """
+        if df is None or df.empty:
+            return {'inserted': 0, 'updated': 0, 'seconds': 0.0}
+        
+        start_time = time.perf_counter()
+        staged = self._stage_minute_dataframe(df)
+        
+        if not self.has_minute_unique_key():
+            logger.error("分钟数据表缺少 (ts_code, datetime, period_type) 唯一键，批量upsert会插入重复数据，"
+                         "已回退为逐条写入，请执行 migrations/add_minute_data_unique_key.py")
+            write_result = self._write_minute_rows(staged)
+            return {'inserted': write_result['inserted'], 'updated': write_result['updated'],
+                    'seconds': time.perf_counter() - start_time}
+        
+        now = datetime.now()
+        staged['created_at'] = now
+        staged['updated_at'] = now
+        
+        inserted = 0
+        updated = 0
+        for offset in range(0, len(staged), chunk_size):
+            chunk = staged.iloc[offset:offset + chunk_size]
+            existing_count = self._count_existing_keys(chunk)
+            
+            DatabaseUtils.bulk_upsert_dataframe(
+                chunk, StockMinuteData,
+                key_columns=self.MINUTE_DATA_KEYS,
+                update_columns=[c for c in self.MINUTE_DATA_COLUMNS + ['updated_at']
+                                if c not in self.MINUTE_DATA_KEYS],
+                chunk_size=chunk_size
+            )
+            updated += existing_count
+            inserted += len(chunk) - existing_count
+        
+        # 入库后更新行情快照并镜像到Redis，发布到实时管道
+        update_market_snapshots(staged)
+        publish_ingested_bars(staged)
+        
+        return {'inserted': inserted, 'updated': updated, 'seconds': time.perf_counter() - start_time}
+    
+    def _write_minute_rows(self, df: pd.DataFrame) -> Dict:
+        """逐条查询并写入分钟数据（未建立唯一键的旧表使用）"""
+        # 转换为字典列表
+        data_list = df.to_dict('records')
+        
+        success_count = 0
+        error_count = 0
+        inserted = 0
+        
+        for data in data_list:
+            try:
+                # 检查是否已存在
+                existing = StockMinuteData.query.filter_by(
+                    ts_code=data['ts_code'],
+                    datetime=data['datetime'],
+                    period_type=data['period_type']
+                ).first()
+                
+                if existing:
+                    # 更新现有记录
+                    for key, value in data.items():
+                        if hasattr(existing, key):
+                            setattr(existing, key, value)
+                else:
+                    # 创建新记录
+                    minute_data = StockMinuteData(**data)
+                    db.session.add(minute_data)
+                    inserted += 1
+                
+                success_count += 1
+                
+            except Exception as e:
+                logger.error(f"插入数据失败: {data}, 错误: {e}")
+                error_count += 1
+                continue
+        
+        # 提交事务
+        db.session.commit()
+        
+        # 入库后更新行情快照并镜像到Redis，发布到实时管道
+        update_market_snapshots(df)
+        publish_ingested_bars(df)
+        
+        return {'success_count': success_count, 'error_count': error_count,
+                'inserted': inserted, 'updated': success_count - inserted}
+    
     def sync_single_stock_data(self, ts_code: str, period_type: str = '1min',
-                              start_date: str = None, end_date: str = None) -> Dict:
+                              start_date: str = None, end_date: str = None,
+                              write_mode: str = 'bulk') -> Dict:
         """
         同步单个股票的分钟数据
         
@@ -257,6 +431,7 @@ class MinuteDataSyncService:
             period_type: 周期类型
             start_date: 开始日期，默认为7天前
             end_date: 结束日期，默认为今天
+            write_mode: 写入方式，'bulk' 为批量upsert，'row' 为逐条查询写入
             
         Returns:
             同步结果字典
@@ -280,49 +455,26 @@ class MinuteDataSyncService:
                     'data_count': 0
                 }
             
-            # 转换为字典列表
-            data_list = df.to_dict('records')
-            
-            # 批量插入数据库
-            success_count = 0
-            error_count = 0
-            
-            for data in data_list:
-                try:
-                    # 检查是否已存在
-                    existing = StockMinuteData.query.filter_by(
-                        ts_code=data['ts_code'],
-                        datetime=data['datetime'],
-                        period_type=data['period_type']
-                    ).first()
-                    
-                    if existing:
-                        # 更新现有记录
-                        for key, value in data.items():
-                            if hasattr(existing, key):
-                                setattr(existing, key, value)
-                    else:
-                        # 创建新记录
-                        minute_data = StockMinuteData(**data)
-                        db.session.add(minute_data)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"插入数据失败: {data}, 错误: {e}")
-                    error_count += 1
-                    continue
-            
-            # 提交事务
-            db.session.commit()
-            
-            logger.info(f"同步{ts_code}的{period_type}数据完成，成功: {success_count}, 失败: {error_count}")
+            if write_mode == 'bulk':
+                write_result = self.upsert_minute_dataframe(df)
+                success_count = write_result['inserted'] + write_result['updated']
+                error_count = 0
+                logger.info(f"同步{ts_code}的{period_type}数据完成，新增: {write_result['inserted']}, "
+                            f"更新: {write_result['updated']}")
+            else:
+                write_result = self._write_minute_rows(df)
+                success_count = write_result['success_count']
+                error_count = write_result['error_count']
+                logger.info(f"同步{ts_code}的{period_type}数据完成，成功: {success_count}, 失败: {error_count}")
             
             return {
                 'success': True,
                 'message': f'同步完成',
                 'data_count': success_count,
                 'error_count': error_count,
+                'inserted_count': write_result.get('inserted'),
+                'updated_count': write_result.get('updated'),
+                'latest_datetime': pd.to_datetime(df['datetime']).max().to_pydatetime(),
                 'period_type': period_type,
                 'date_range': f'{start_date} 到 {end_date}'
             }
@@ -440,23 +592,226 @@ class MinuteDataSyncService:
                                   end_date: str = None) -> Dict:
         """
         同步单个股票的所有周期数据
+        
+        只从Baostock获取一次基础周期（5分钟，Baostock不支持1分钟）数据，
+        15/30/60分钟K线由入库的5分钟数据在本地按交易时段合成，网络请求由每个周期一次减少为一次
         """
-        results = {}
+        from app.services.bar_rollup import BarRollupEngine
         
-        for period_type in self.PERIOD_TYPES.keys():
-            try:
-                result = self.sync_single_stock_data(ts_code, period_type, start_date, end_date)
-                results[period_type] = result
-                
-                # 周期间休息
-                time.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"同步{ts_code}的{period_type}数据异常: {e}")
+        base_period = '5min'
+        results = {base_period: self.sync_single_stock_data(ts_code, base_period, start_date, end_date)}
+        if not results[base_period]['success']:
+            return results
+        
+        start_time = datetime.strptime(start_date, '%Y-%m-%d') if start_date else \
+            datetime.now() - timedelta(days=7)
+        end_time = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+        engine = BarRollupEngine(base_period, sync_service=self)
+        rollup = engine.rollup([ts_code], None, start_time, end_time)
+        for period_type in engine.target_periods():
+            if rollup['success']:
+                count = rollup['periods'].get(period_type, 0)
+                results[period_type] = {
+                    'success': True,
+                    'message': f'由{base_period}数据合成 {count} 条',
+                    'data_count': count,
+                    'period_type': period_type
+                }
+            else:
                 results[period_type] = {
                     'success': False,
-                    'message': f'异常: {str(e)}',
+                    'message': rollup['message'],
                     'data_count': 0
                 }
         
-        return results 
\ No newline at end of file
+        return results
+    
+    def plan_incremental_ranges(self, stock_list: List[str], watermarks: Dict[str, datetime],
+                                end_date: str = None, default_start: str = None) -> Dict:
+        """
+        根据高水位和交易日历计算每只股票需要补齐的日期范围
+        
+        Args:
+            stock_list: 股票代码列表
+            watermarks: {ts_code: 已同步的最新K线时间}
+            end_date: 同步截止日期，默认为今天
+            default_start: 无同步记录的股票的起始日期，默认为7天前
+            
+        Returns:
+            {'ranges': {ts_code: (start_date, end_date)}, 'skipped': [已是最新的股票], 'target_date': 最新交易日}
+        """
+        end = to_date(end_date or datetime.now())
+        default_start_date = to_date(default_start or (datetime.now() - timedelta(days=7)))
+        
+        earliest = min([default_start_date] + [to_date(w) for w in watermarks.values() if w])
+        trade_dates = get_trade_dates(earliest, end, self.bs if self.bs_logged_in else None)
+        if not trade_dates:
+            return {'ranges': {}, 'skipped': list(stock_list), 'target_date': None}
+        
+        target_date = trade_dates[-1]
+        target_close = session_close(target_date)
+        
+        ranges = {}
+        skipped = []
+        for ts_code in stock_list:
+            watermark = watermarks.get(ts_code)
+            if watermark is None:
+                start = default_start_date
+            elif watermark >= target_close:
+                # 已同步到最新交易日收盘，无需请求
+                skipped.append(ts_code)
+                continue
+            elif watermark >= session_close(watermark):
+                # 高水位所在交易日已完整，从下一个交易日开始补齐（自动跨越节假日和漏跑的日期）
+                later_dates = [d for d in trade_dates if d > watermark.date()]
+                if not later_dates:
+                    skipped.append(ts_code)
+                    continue
+                start = later_dates[0]
+            else:
+                # 高水位所在交易日数据不完整，重新获取当日
+                start = watermark.date()
+            
+            ranges[ts_code] = (start.strftime('%Y-%m-%d'), target_date.strftime('%Y-%m-%d'))
+        
+        return {'ranges': ranges, 'skipped': skipped, 'target_date': target_date}
+    
+    def sync_incremental(self, stock_list: List[str], period_type: str = '5min',
+                         end_date: str = None, default_start: str = None) -> Dict:
+        """
+        基于高水位的增量同步
+        
+        启动时一次查询加载所有股票的高水位，只请求缺失的日期范围，已是最新的股票不发起网络请求，
+        同步成功后批量更新高水位。
+        
+        Args:
+            stock_list: 股票代码列表
+            period_type: 周期类型
+            end_date: 同步截止日期，默认为今天
+            default_start: 无同步记录的股票的起始日期
+            
+        Returns:
+            同步结果字典
+        """
+        try:
+            # Baostock不支持1分钟数据，实际写入的是5分钟数据
+            stored_period = '5min' if period_type == '1min' else period_type
+            watermarks = SyncState.load_watermarks(stored_period)
+            plan = self.plan_incremental_ranges(stock_list, watermarks, end_date, default_start)
+            
+            logger.info(f"增量同步{period_type}数据: 需同步 {len(plan['ranges'])} 只, "
+                        f"已是最新 {len(plan['skipped'])} 只, 目标交易日 {plan['target_date']}")
+            
+            success_stocks = 0
+            failed_stocks = 0
+            total_data_count = 0
+            new_watermarks = {}
+            
+            for ts_code, (start, end) in plan['ranges'].items():
+                result = self.sync_single_stock_data(ts_code, period_type, start, end)
+                if result['success']:
+                    success_stocks += 1
+                    total_data_count += result['data_count']
+                    new_watermarks[ts_code] = result['latest_datetime']
+                else:
+                    failed_stocks += 1
+            
+            SyncState.save_watermarks(stored_period, new_watermarks)
+            
+            return {
+                'success': True,
+                'message': '增量同步完成',
+                'total_stocks': len(stock_list),
+                'skipped_stocks': len(plan['skipped']),
+                'success_stocks': success_stocks,
+                'failed_stocks': failed_stocks,
+                'total_data_count': total_data_count,
+                'target_date': plan['target_date'].isoformat() if plan['target_date'] else None,
+                'period_type': period_type
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"增量同步异常: {e}")
+            return {
+                'success': False,
+                'message': f'增量同步异常: {str(e)}',
+                'total_stocks': len(stock_list),
+                'success_stocks': 0,
+                'failed_stocks': len(stock_list)
+            }
+    
+    def backfill_gaps(self, gaps: List[Dict]) -> Dict:
+        """
+        按数据质量审计输出的缺口列表精确补齐缺失K线
+        
+        同一股票、同一周期的缺口合并为一次覆盖全部缺口日期的请求，返回数据只保留缺口内应有的K线时间，
+        已存在的K线不会被重写。Baostock不支持1分钟数据，1分钟缺口跳过。
+        
+        Args:
+            gaps: [{'ts_code', 'period_type', 'start', 'end'}]，start/end 为缺口内首末K线时间（datetime或ISO字符串）
+            
+        Returns:
+            同步结果字典
+        """
+        from app.utils.market_calendar import expected_bar_times
+        
+        try:
+            requested = {}
+            skipped = []
+            for gap in gaps:
+                period_type = gap.get('period_type', '5min')
+                if period_type == '1min':
+                    skipped.append(gap)
+                    continue
+                start, end = pd.Timestamp(gap['start']).to_pydatetime(), pd.Timestamp(gap['end']).to_pydatetime()
+                requested.setdefault((gap['ts_code'], period_type), []).append((start, end))
+            
+            calendar_bs = self.bs if self.bs_logged_in else None
+            success_stocks = 0
+            failed_stocks = 0
+            filled_bars = 0
+            missing_bars = 0
+            for (ts_code, period_type), ranges in requested.items():
+                first_day = min(start for start, _ in ranges).date()
+                last_day = max(end for _, end in ranges).date()
+                wanted = {t for day in get_trade_dates(first_day, last_day, calendar_bs)
+                          for t in expected_bar_times(day, period_type)
+                          if any(start <= t <= end for start, end in ranges)}
+                missing_bars += len(wanted)
+                if not wanted:
+                    continue
+                
+                df = self.get_stock_minute_data_bs(ts_code, first_day.strftime('%Y-%m-%d'),
+                                                   last_day.strftime('%Y-%m-%d'), period_type)
+                if df is None or df.empty:
+                    failed_stocks += 1
+                    continue
+                
+                df = df[pd.to_datetime(df['datetime']).isin(list(wanted))]
+                if not df.empty:
+                    write_result = self.upsert_minute_dataframe(df)
+                    filled_bars += write_result['inserted'] + write_result['updated']
+                success_stocks += 1
+            
+            logger.info(f"缺口补齐完成: {len(requested)} 个股票周期, 缺失 {missing_bars} 根, 补齐 {filled_bars} 根, "
+                        f"跳过1分钟缺口 {len(skipped)} 段")
+            return {
+                'success': True,
+                'message': '缺口补齐完成',
+                'requested_stocks': len(requested),
+                'success_stocks': success_stocks,
+                'failed_stocks': failed_stocks,
+                'missing_bars': missing_bars,
+                'filled_bars': filled_bars,
+                'skipped_gaps': len(skipped)
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"缺口补齐异常: {e}")
+            return {
+                'success': False,
+                'message': f'缺口补齐异常: {str(e)}',
+                'filled_bars': 0
+            }
@@ -250,7 +250,15 @@ class MLModelManager:
             return pd.DataFrame(), pd.Series()
     
     def _calculate_target_returns(self, feature_df: pd.DataFrame, target_type: str) -> pd.DataFrame:
-        """计算目标变量（未来收益率）"""
+        """
+        计算目标变量（未来收益率）
+        
+        一次性读取全部股票的行情，按股票分组 shift(-period) 得到未来收盘价，
+        再与特征的 (ts_code, trade_date) 关联；缺少未来价格的样本直接剔除。
+        行情读取到最后特征日之后的缓冲日期，缓冲区内未来交易日不足的股票（如长期停牌）
+        再补读缓冲日期之后的前 period 个交易日，结果与逐日期向后取第 period 个交易日一致。
+        """
+        empty_result = pd.DataFrame(columns=['ts_code', 'trade_date', 'target'])
         try:
             # 解析目标类型
             if target_type.startswith('return_'):
@@ -258,109 +266,80 @@ class MLModelManager:
             else:
                 period = 5  # 默认5日收益率
             
-            target_data = []
+            if feature_df.empty:
+                return empty_result
+            
+            feature_keys = feature_df[['ts_code', 'trade_date']].copy()
+            feature_keys['date_key'] = pd.to_datetime(feature_keys['trade_date'])
+            
+            # 一次性读取所有股票的价格数据，结束日期向后预留足够的交易日
+            start_date = feature_keys['date_key'].min().date()
+            end_date = (feature_keys['date_key'].max() + timedelta(days=period * 2 + 20)).date()
+            price_query = db.session.query(
+                StockDailyHistory.ts_code, StockDailyHistory.trade_date, StockDailyHistory.close
+            ).filter(
+                StockDailyHistory.ts_code.in_(feature_keys['ts_code'].unique().tolist()),
+                StockDailyHistory.trade_date >= start_date,
+                StockDailyHistory.trade_date <= end_date
+            )
+            price_data = pd.read_sql(price_query.statement, db.engine)
+            
+            if price_data.empty:
+                logger.warning("未找到行情数据，无法计算目标变量")
+                return empty_result
             
             # 按股票分组计算未来收益率
-            for ts_code in feature_df['ts_code'].unique():
-                stock_features = feature_df[feature_df['ts_code'] == ts_code].copy()
-                stock_features = stock_features.sort_values('trade_date')
-                
-                # 获取该股票的价格数据
-                price_query = StockDailyHistory.query.filter(
-                    StockDailyHistory.ts_code == ts_code
-                ).order_by(StockDailyHistory.trade_date)
-                
-                price_data = pd.read_sql(price_query.statement, db.engine)
-                
-                if price_data.empty:
-                    continue
-                
-                # 为每个特征日期计算目标收益率
-                for _, row in stock_features.iterrows():
-                    current_date = row['trade_date']
-                    
-                    # 找到当前日期的价格
-                    current_price_row = price_data[price_data['trade_date'] == current_date]
-                    if current_price_row.empty:
-                        continue
-                    
-                    current_price = current_price_row.iloc[0]['close']
-                    
-                    # 找到未来日期的价格
-                    future_prices = price_data[price_data['trade_date'] > current_date].head(period)
-                    
-                    if len(future_prices) >= period:
-                        future_price = future_prices.iloc[period-1]['close']
-                        # 计算收益率
-                        return_rate = (future_price - current_price) / current_price
-                        
-                        target_data.append({
-                            'ts_code': ts_code,
-                            'trade_date': current_date,
-                            'target': return_rate
-                        })
-                    else:
-                        # 如果没有足够的未来数据，使用模拟数据
-                        # 基于历史波动率生成合理的模拟收益率
-                        historical_returns = price_data['pct_chg'].dropna() / 100
-                        if len(historical_returns) > 0:
-                            mean_return = historical_returns.mean()
-                            std_return = historical_returns.std()
-                            # 生成符合历史分布的随机收益率
-                            simulated_return = np.random.normal(mean_return, std_return)
-                            target_data.append({
-                                'ts_code': ts_code,
-                                'trade_date': current_date,
-                                'target': simulated_return
-                            })
-            
-            if not target_data:
-                # 如果完全没有数据，生成基于特征的模拟目标变量
-                logger.warning("无法计算真实收益率，使用基于特征的模拟数据")
-                return self._generate_simulated_targets(feature_df)
-            
-            target_df = pd.DataFrame(target_data)
-            logger.info(f"计算目标变量完成: {len(target_df)} 条记录")
+            price_data = self._future_returns(price_data, period)
+            
+            # 缓冲区内未来交易日不足的股票补读缓冲日期之后的行情
+            feature_index = pd.MultiIndex.from_frame(feature_keys[['ts_code', 'date_key']])
+            short = price_data['target'].isna() & pd.MultiIndex.from_frame(
+                price_data[['ts_code', 'date_key']]).isin(feature_index)
+            short_codes = price_data.loc[short, 'ts_code'].unique().tolist()
+            if short_codes:
+                # 先一次查询找出缓冲日期之后仍有行情的股票（通常只有长期停牌后复牌的少数股票），
+                # 再逐只按日期取前 period 个交易日；不使用窗口函数，兼容 MySQL 5.7
+                resumed = [row[0] for row in db.session.query(StockDailyHistory.ts_code).filter(
+                    StockDailyHistory.ts_code.in_(short_codes),
+                    StockDailyHistory.trade_date > end_date
+                ).distinct()]
+                extra = [pd.read_sql(db.session.query(
+                    StockDailyHistory.ts_code, StockDailyHistory.trade_date, StockDailyHistory.close
+                ).filter(
+                    StockDailyHistory.ts_code == ts_code,
+                    StockDailyHistory.trade_date > end_date
+                ).order_by(StockDailyHistory.trade_date).limit(period).statement, db.engine) for ts_code in resumed]
+                if extra:
+                    price_data = self._future_returns(
+                        pd.concat([price_data[['ts_code', 'trade_date', 'close']], *extra], ignore_index=True),
+                        period
+                    )
+            
+            target_df = feature_keys.merge(
+                price_data[['ts_code', 'date_key', 'target']],
+                on=['ts_code', 'date_key'], how='inner'
+            )
+            target_df = target_df.replace([np.inf, -np.inf], np.nan).dropna(subset=['target'])
+            target_df = target_df[['ts_code', 'trade_date', 'target']].reset_index(drop=True)
+            
+            dropped = len(feature_keys) - len(target_df)
+            logger.info(f"计算目标变量完成: {len(target_df)} 条记录, 剔除缺少未来价格的样本 {dropped} 条")
             return target_df
             
         except Exception as e:
             logger.error(f"计算目标变量失败: {e}")
-            # 返回模拟数据作为备选
-            return self._generate_simulated_targets(feature_df)
+            return empty_result
     
-    def _generate_simulated_targets(self, feature_df: pd.DataFrame) -> pd.DataFrame:
-        """生成基于特征的模拟目标变量"""
-        try:
-            np.random.seed(42)  # 确保可重复性
-            
-            target_data = []
-            
-            for _, row in feature_df.iterrows():
-                # 基于特征值生成合理的模拟收益率
-                # 这里使用简单的线性组合 + 随机噪声
-                base_return = np.random.normal(0.001, 0.02)  # 基础收益率
-                
-                # 添加一些基于日期的趋势（模拟市场周期）
-                date_factor = hash(str(row['trade_date'])) % 100 / 1000
-                
-                # 添加基于股票的个体效应
-                stock_factor = hash(row['ts_code']) % 100 / 2000
-                
-                simulated_return = base_return + date_factor + stock_factor
-                
-                target_data.append({
-                    'ts_code': row['ts_code'],
-                    'trade_date': row['trade_date'],
-                    'target': simulated_return
-                })
-            
-            target_df = pd.DataFrame(target_data)
-            logger.info(f"生成模拟目标变量: {len(target_df)} 条记录")
-            return target_df
-            
-        except Exception as e:
-            logger.error(f"生成模拟目标变量失败: {e}")
-            return pd.DataFrame()
+    @staticmethod
+    def _future_returns(price_data: pd.DataFrame, period: int) -> pd.DataFrame:
+        """按股票分组计算 period 个交易日后的收益率（target 列）"""
+        price_data = price_data.copy()
+        price_data['date_key'] = pd.to_datetime(price_data['trade_date'])
+        price_data['close'] = price_data['close'].astype(float)
+        price_data = price_data.sort_values(['ts_code', 'date_key'])
+        future_close = price_data.groupby('ts_code')['close'].shift(-period)
+        price_data['target'] = future_close / price_data['close'] - 1
+        return price_data
     
     def train_model(self, model_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
         """训练模型"""
@@ -1,14 +1,12 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime
 from loguru import logger
-import cvxpy as cp
-from scipy.optimize import minimize
-from sklearn.covariance import LedoitWolf
 
-from app.extensions import db
-from app.models import StockDailyHistory, FactorValues
+from app.models import FactorValues
+from app.services.risk_model import FactorRiskModel, get_risk_model_service
+from app.services.risk_parity import solve_risk_parity
+from app.services.mean_variance import get_problem_cache
 
 
 class PortfolioOptimizer:
@@ -24,172 +22,249 @@ class PortfolioOptimizer:
         }
     
     def optimize_portfolio(self, expected_returns: pd.Series, 
-                          risk_model: pd.DataFrame = None,
+                          risk_model=None,
                           method: str = 'mean_variance',
-                          constraints: Dict[str, Any] = None) -> Dict[str, Any]:
-        """优化投资组合"""
+                          constraints: Dict[str, Any] = None,
+                          as_of_date=None,
+                          previous_weights: pd.Series = None) -> Dict[str, Any]:
+        """
+        优化投资组合
+        
+        Args:
+            expected_returns: 预期收益率
+            risk_model: FactorRiskModel 或稠密协方差DataFrame，默认按 as_of_date 取因子风险模型
+            method: 优化方法
+            constraints: 约束条件
+            as_of_date: 风险模型的时点日期（回测中传入调仓日，避免使用未来数据），默认为今天
+            previous_weights: 上一期权重，用于迭代求解的热启动
+        """
         try:
             if expected_returns.empty:
                 return {'error': '预期收益率数据为空'}
             
-            # 获取风险模型
-            if risk_model is None:
-                risk_model = self._estimate_risk_model(expected_returns.index.tolist())
+            risk_model = self._resolve_risk_model(expected_returns.index, risk_model, as_of_date)
             
             # 检查优化方法
             if method not in self.optimization_methods:
                 logger.warning(f"不支持的优化方法: {method}，使用等权重方法")
                 method = 'equal_weight'
             
-            # 执行优化
-            optimization_func = self.optimization_methods[method]
-            weights = optimization_func(expected_returns, risk_model, constraints)
-            
-            if weights is None or weights.empty:
-                return {'error': '优化失败'}
+            result = self._optimize_with_model(expected_returns, risk_model, method, constraints, previous_weights)
+            if 'error' not in result:
+                logger.info(f"组合优化完成: {method}, {result['total_stocks']} 只股票")
+            return result
             
-            # 应用约束条件
-            if constraints:
-                weights = self._apply_constraints(weights, constraints)
+        except Exception as e:
+            logger.error(f"组合优化失败: {method}, 错误: {e}")
+            return {'error': str(e)}
+    
+    def efficient_frontier(self, expected_returns: pd.Series, risk_aversions: List[float] = None,
+                           constraint_sets: List[Dict[str, Any]] = None, constraints: Dict[str, Any] = None,
+                           risk_model=None, method: str = 'mean_variance', as_of_date=None,
+                           max_workers: int = None) -> Dict[str, Any]:
+        """
+        有效前沿 / 多情景优化
+        
+        风险模型只取一次，风险厌恶系数和约束集合网格的各情景在进程池中复用同一个编译好的问题并行求解
+        
+        Args:
+            expected_returns: 预期收益率
+            risk_aversions: 风险厌恶系数网格
+            constraint_sets: 约束集合网格（与风险厌恶系数同时给出时取笛卡尔积）
+            constraints: 所有情景共用的基础约束
+            risk_model: 同 optimize_portfolio
+            method: 优化方法
+            as_of_date: 风险模型的时点日期
+            max_workers: 工作进程数，为1时串行
+            
+        Returns:
+            {'success', 'points': 按预期风险排序的 (收益, 波动, 权重), 'failed', 'risk_model_date', 'timing'}
+        """
+        try:
+            from app.services.efficient_frontier import EfficientFrontierRunner, build_scenarios
             
-            # 计算组合统计
-            portfolio_stats = self._calculate_portfolio_stats(weights, expected_returns, risk_model)
+            if expected_returns.empty:
+                return {'error': '预期收益率数据为空'}
+            if method not in self.optimization_methods:
+                return {'error': f'不支持的优化方法: {method}'}
             
-            result = {
-                'success': True,
-                'method': method,
-                'weights': weights.to_dict(),
-                'portfolio_stats': portfolio_stats,
-                'total_stocks': int(len(weights)),
-                'non_zero_weights': int((weights > 0.001).sum())
-            }
-            
-            logger.info(f"组合优化完成: {method}, {len(weights)} 只股票")
-            return result
+            scenarios = build_scenarios(constraints, risk_aversions, constraint_sets)
+            run = EfficientFrontierRunner(self, max_workers).run(expected_returns, scenarios, risk_model,
+                                                                 method, as_of_date)
+            return {'success': True, 'method': method, **run}
             
         except Exception as e:
-            logger.error(f"组合优化失败: {method}, 错误: {e}")
+            logger.error(f"有效前沿求解失败: {e}")
             return {'error': str(e)}
     
+    def _resolve_risk_model(self, ts_codes, risk_model=None, as_of_date=None) -> FactorRiskModel:
+        """统一为低秩加对角形式的风险模型，按给定股票顺序排列；未提供时按 as_of_date 取因子风险模型"""
+        if risk_model is None:
+            risk_model = self._estimate_risk_model(list(ts_codes), as_of_date=as_of_date)
+        elif isinstance(risk_model, pd.DataFrame):
+            risk_model = FactorRiskModel.from_covariance(risk_model)
+        return risk_model.subset(ts_codes)
+    
+    def _optimize_with_model(self, expected_returns: pd.Series, risk_model: FactorRiskModel, method: str,
+                             constraints: Dict[str, Any] = None,
+                             previous_weights: pd.Series = None) -> Dict[str, Any]:
+        """用已对齐的风险模型求解一次并计算组合统计"""
+        # 执行优化
+        optimization_func = self.optimization_methods[method]
+        weights = optimization_func(expected_returns, risk_model, constraints, previous_weights)
+        
+        if weights is None or weights.empty:
+            return {'error': '优化失败'}
+        
+        # 应用约束条件
+        if constraints:
+            weights = self._apply_constraints(weights, constraints)
+        
+        # 计算组合统计
+        portfolio_stats = self._calculate_portfolio_stats(weights, expected_returns, risk_model, previous_weights)
+        
+        return {
+            'success': True,
+            'method': method,
+            'weights': weights.to_dict(),
+            'portfolio_stats': portfolio_stats,
+            'total_stocks': int(len(weights)),
+            'non_zero_weights': int((weights > 0.001).sum())
+        }
+    
+    def optimize_batch(self, universes: Dict[Any, Any], method: str = 'risk_parity',
+                       constraints: Dict[str, Any] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        按日期顺序批量优化
+        
+        每个日期使用该日时点的风险模型，并以上一日期的优化结果热启动（风险平价等迭代求解方法收敛更快）
+        
+        Args:
+            universes: {日期: 预期收益率Series 或 股票代码列表}，股票代码列表按等预期收益处理
+            method: 优化方法
+            constraints: 约束条件
+            
+        Returns:
+            {日期: optimize_portfolio 的结果}
+        """
+        results = {}
+        previous_weights = None
+        for trade_date in sorted(universes, key=pd.Timestamp):
+            expected_returns = universes[trade_date]
+            if not isinstance(expected_returns, pd.Series):
+                expected_returns = pd.Series(1.0, index=list(expected_returns))
+            
+            result = self.optimize_portfolio(expected_returns, method=method, constraints=constraints,
+                                             as_of_date=trade_date, previous_weights=previous_weights)
+            if result.get('success'):
+                previous_weights = pd.Series(result['weights'])
+            results[str(trade_date)] = result
+        
+        logger.info(f"批量组合优化完成: {method}, {len(results)} 个日期")
+        return results
+    
     def _mean_variance_optimization(self, expected_returns: pd.Series, 
-                                   risk_model: pd.DataFrame,
-                                   constraints: Dict[str, Any] = None) -> pd.Series:
-        """均值-方差优化"""
+                                   risk_model: FactorRiskModel,
+                                   constraints: Dict[str, Any] = None,
+                                   previous_weights: pd.Series = None) -> pd.Series:
+        """
+        均值-方差优化
+        
+        使用按 (股票数, 因子数, 换手率约束形式) 缓存的参数化问题，重复调仓只更新参数并热启动。
+        constraints 支持 risk_aversion、max_weight、min_weight、max_concentration，以及相对 previous_weights 的
+        turnover_penalty（单位换手率的惩罚）和 max_turnover（换手率上限，换手率 = ½Σ|Δw|）
+        """
         try:
+            constraints = constraints or {}
             n = len(expected_returns)
             
             # 风险厌恶系数
-            risk_aversion = constraints.get('risk_aversion', 1.0) if constraints else 1.0
-            
-            # 定义优化变量
-            w = cp.Variable(n)
-            
-            # 目标函数：最大化 expected_return - 0.5 * risk_aversion * variance
-            portfolio_return = expected_returns.values @ w
-            portfolio_variance = cp.quad_form(w, risk_model.values)
-            objective = cp.Maximize(portfolio_return - 0.5 * risk_aversion * portfolio_variance)
-            
-            # 约束条件
-            constraints_list = [
-                cp.sum(w) == 1,  # 权重和为1
-                w >= 0  # 不允许做空
-            ]
-            
-            # 添加额外约束
-            if constraints:
-                # 最大权重约束
-                if 'max_weight' in constraints:
-                    max_weight = constraints['max_weight']
-                    constraints_list.append(w <= max_weight)
-                
-                # 最小权重约束
-                if 'min_weight' in constraints:
-                    min_weight = constraints['min_weight']
-                    constraints_list.append(w >= min_weight)
-                
-                # 最大集中度约束
-                if 'max_concentration' in constraints:
-                    max_conc = constraints['max_concentration']
-                    constraints_list.append(cp.norm(w, 'inf') <= max_conc)
-            
-            # 求解优化问题
-            problem = cp.Problem(objective, constraints_list)
-            problem.solve(solver=cp.ECOS)
+            risk_aversion = constraints.get('risk_aversion', 1.0)
+            
+            # 权重上下界（不允许做空；集中度约束在多头组合下等价于上界）
+            upper = min(constraints.get('max_weight', 1.0), constraints.get('max_concentration', 1.0))
+            lower = max(constraints.get('min_weight', 0.0), 0.0)
+            
+            # 换手率项：上一期权重对齐到当前股票，已移出股票的权重必须全部卖出
+            turnover_penalty, max_turnover = self._turnover_terms(constraints, previous_weights)
+            previous = exit_weight = None
+            if previous_weights is not None and (turnover_penalty or max_turnover is not None):
+                previous = previous_weights.reindex(expected_returns.index).fillna(0).to_numpy(dtype=np.float64)
+                exit_weight = float(previous_weights.drop(expected_returns.index, errors='ignore').abs().sum())
+            
+            problem = get_problem_cache().get(
+                n, risk_model.loadings.shape[1],
+                turnover_penalty=previous is not None and turnover_penalty > 0,
+                turnover_limit=previous is not None and max_turnover is not None
+            )
+            values, status = problem.solve(
+                expected_returns.to_numpy(dtype=np.float64),
+                risk_model.loadings,
+                risk_model.specific_var,
+                risk_aversion=risk_aversion,
+                lower=np.full(n, lower),
+                upper=np.full(n, upper),
+                previous=previous,
+                penalty=turnover_penalty,
+                trade_budget=None if max_turnover is None or previous is None else 2 * max_turnover - exit_weight
+            )
             
-            if problem.status not in ["infeasible", "unbounded"]:
-                weights = pd.Series(w.value, index=expected_returns.index)
+            if values is not None:
+                weights = pd.Series(values, index=expected_returns.index)
                 # 清理极小的权重
                 weights[weights < 1e-6] = 0
                 # 重新归一化
                 weights = weights / weights.sum()
                 return weights
             else:
-                logger.warning(f"均值-方差优化失败: {problem.status}")
+                logger.warning(f"均值-方差优化失败: {status}")
                 return None
                 
         except Exception as e:
             logger.error(f"均值-方差优化失败: {e}")
             return None
     
+    @staticmethod
+    def _turnover_terms(constraints: Dict[str, Any], previous_weights: pd.Series = None) -> Tuple[float, Optional[float]]:
+        """(换手率惩罚, 换手率上限)；没有上一期权重时两项都不生效"""
+        if not constraints or previous_weights is None or previous_weights.empty:
+            return 0.0, None
+        return float(constraints.get('turnover_penalty', 0.0)), constraints.get('max_turnover')
+    
+    @staticmethod
+    def uses_previous_weights(method: str, constraints: Dict[str, Any] = None) -> bool:
+        """优化结果是否依赖上一期权重（带换手率项的均值-方差优化）"""
+        return method == 'mean_variance' and bool(constraints) and \
+            ('turnover_penalty' in constraints or 'max_turnover' in constraints)
+    
     def _risk_parity_optimization(self, expected_returns: pd.Series, 
-                                 risk_model: pd.DataFrame,
-                                 constraints: Dict[str, Any] = None) -> pd.Series:
-        """风险平价优化"""
+                                 risk_model: FactorRiskModel,
+                                 constraints: Dict[str, Any] = None,
+                                 previous_weights: pd.Series = None) -> pd.Series:
+        """风险平价优化（等风险贡献，以上一期权重热启动）"""
         try:
-            n = len(expected_returns)
+            initial_weights = None
+            if previous_weights is not None:
+                initial_weights = previous_weights.reindex(expected_returns.index).to_numpy(dtype=np.float64)
             
-            def risk_parity_objective(weights):
-                """风险平价目标函数"""
-                weights = np.array(weights)
-                portfolio_var = np.dot(weights, np.dot(risk_model.values, weights))
-                
-                # 计算边际风险贡献
-                marginal_contrib = np.dot(risk_model.values, weights)
-                risk_contrib = weights * marginal_contrib
-                
-                # 目标：最小化风险贡献的方差
-                target_contrib = portfolio_var / n  # 等风险贡献
-                return np.sum((risk_contrib - target_contrib) ** 2)
-            
-            # 约束条件
-            constraints_list = [
-                {'type': 'eq', 'fun': lambda w: np.sum(w) - 1}  # 权重和为1
-            ]
-            
-            # 边界条件
-            bounds = [(0, 1) for _ in range(n)]  # 权重在0-1之间
-            
-            # 初始权重
-            x0 = np.ones(n) / n
-            
-            # 求解
-            result = minimize(
-                risk_parity_objective,
-                x0,
-                method='SLSQP',
-                bounds=bounds,
-                constraints=constraints_list,
-                options={'maxiter': 1000}
-            )
-            
-            if result.success:
-                weights = pd.Series(result.x, index=expected_returns.index)
-                # 清理极小的权重
-                weights[weights < 1e-6] = 0
-                # 重新归一化
-                weights = weights / weights.sum()
-                return weights
-            else:
-                logger.warning(f"风险平价优化失败: {result.message}")
+            weights, info = solve_risk_parity(risk_model, initial_weights=initial_weights)
+            if not info['converged']:
+                logger.warning(f"风险平价优化未收敛: {info}")
                 return None
-                
+            
+            weights = pd.Series(weights, index=expected_returns.index)
+            # 清理极小的权重
+            weights[weights < 1e-6] = 0
+            return weights / weights.sum()
+            
         except Exception as e:
             logger.error(f"风险平价优化失败: {e}")
             return None
     
     def _equal_weight_optimization(self, expected_returns: pd.Series, 
-                                  risk_model: pd.DataFrame,
-                                  constraints: Dict[str, Any] = None) -> pd.Series:
+                                  risk_model: FactorRiskModel,
+                                  constraints: Dict[str, Any] = None,
+                                  previous_weights: pd.Series = None) -> pd.Series:
         """等权重优化"""
         try:
             n = len(expected_returns)
@@ -201,8 +276,9 @@ class PortfolioOptimizer:
             return None
     
     def _factor_neutral_optimization(self, expected_returns: pd.Series, 
-                                    risk_model: pd.DataFrame,
-                                    constraints: Dict[str, Any] = None) -> pd.Series:
+                                    risk_model: FactorRiskModel,
+                                    constraints: Dict[str, Any] = None,
+                                    previous_weights: pd.Series = None) -> pd.Series:
         """因子中性优化"""
         try:
             # TODO: 实现因子中性优化
@@ -215,8 +291,9 @@ class PortfolioOptimizer:
             return None
     
     def _black_litterman_optimization(self, expected_returns: pd.Series, 
-                                     risk_model: pd.DataFrame,
-                                     constraints: Dict[str, Any] = None) -> pd.Series:
+                                     risk_model: FactorRiskModel,
+                                     constraints: Dict[str, Any] = None,
+                                     previous_weights: pd.Series = None) -> pd.Series:
         """Black-Litterman优化"""
         try:
             # TODO: 实现Black-Litterman模型
@@ -228,76 +305,21 @@ class PortfolioOptimizer:
             logger.error(f"Black-Litterman优化失败: {e}")
             return None
     
-    def _estimate_risk_model(self, ts_codes: List[str], 
-                            lookback_days: int = 252) -> pd.DataFrame:
-        """估计风险模型（协方差矩阵）"""
+    def _estimate_risk_model(self, ts_codes: List[str], as_of_date=None) -> FactorRiskModel:
+        """
+        取 as_of_date 时点的因子风险模型（按日期持久化，每个日期只估计一次）
+        
+        模型中没有的股票取平均因子暴露和中位数特异方差；没有任何历史数据时退化为单位对角阵
+        """
         try:
-            # 获取历史价格数据
-            end_date = datetime.now().date()
-            start_date = end_date - pd.Timedelta(days=lookback_days + 50)
-            
-            price_query = StockDailyHistory.query.filter(
-                StockDailyHistory.ts_code.in_(ts_codes),
-                StockDailyHistory.trade_date >= start_date,
-                StockDailyHistory.trade_date <= end_date
-            ).order_by(StockDailyHistory.ts_code, StockDailyHistory.trade_date)
-            
-            price_data = pd.read_sql(price_query.statement, db.engine)
-            
-            if price_data.empty:
-                # 如果没有数据，使用单位矩阵
-                return pd.DataFrame(np.eye(len(ts_codes)), index=ts_codes, columns=ts_codes)
-            
-            # 透视表：日期为行，股票为列
-            price_pivot = price_data.pivot_table(
-                index='trade_date',
-                columns='ts_code',
-                values='close',
-                aggfunc='first'
-            )
-            
-            # 计算收益率
-            returns = price_pivot.pct_change().dropna()
-            
-            # 只保留有足够数据的股票
-            min_observations = min(60, len(returns) // 2)
-            valid_stocks = returns.columns[returns.count() >= min_observations]
-            returns = returns[valid_stocks]
-            
-            if returns.empty or len(returns.columns) < 2:
-                # 如果数据不足，使用单位矩阵
-                return pd.DataFrame(np.eye(len(ts_codes)), index=ts_codes, columns=ts_codes)
-            
-            # 使用Ledoit-Wolf收缩估计器
-            lw = LedoitWolf()
-            cov_matrix = lw.fit(returns.fillna(0)).covariance_
-            
-            # 转换为DataFrame
-            risk_model = pd.DataFrame(cov_matrix, index=returns.columns, columns=returns.columns)
-            
-            # 确保包含所有股票（缺失的用0填充）
-            for ts_code in ts_codes:
-                if ts_code not in risk_model.index:
-                    # 添加缺失股票，与其他股票协方差为0，方差为市场平均方差
-                    avg_var = np.diag(risk_model).mean()
-                    
-                    # 扩展矩阵
-                    new_row = pd.Series(0, index=risk_model.columns, name=ts_code)
-                    new_col = pd.Series(0, index=list(risk_model.index) + [ts_code], name=ts_code)
-                    new_col[ts_code] = avg_var
-                    
-                    risk_model = pd.concat([risk_model, new_row.to_frame().T])
-                    risk_model[ts_code] = new_col
-            
-            # 重新排序以匹配输入顺序
-            risk_model = risk_model.reindex(index=ts_codes, columns=ts_codes, fill_value=0)
-            
-            return risk_model
+            model = get_risk_model_service().get_risk_model(as_of_date, ts_codes)
+            if model is None:
+                return FactorRiskModel.diagonal(ts_codes)
+            return model
             
         except Exception as e:
             logger.error(f"估计风险模型失败: {e}")
-            # 返回单位矩阵作为备选
-            return pd.DataFrame(np.eye(len(ts_codes)), index=ts_codes, columns=ts_codes)
+            return FactorRiskModel.diagonal(ts_codes)
     
     def _apply_constraints(self, weights: pd.Series, constraints: Dict[str, Any]) -> pd.Series:
         """应用约束条件"""
@@ -343,20 +365,23 @@ class PortfolioOptimizer:
     
     def _calculate_portfolio_stats(self, weights: pd.Series, 
                                   expected_returns: pd.Series,
-                                  risk_model: pd.DataFrame) -> Dict[str, float]:
+                                  risk_model: FactorRiskModel,
+                                  previous_weights: pd.Series = None) -> Dict[str, float]:
         """计算组合统计指标"""
         try:
+            turnover = self.calculate_turnover(weights, previous_weights) if previous_weights is not None else 0.0
+            
             # 确保索引一致
             common_index = weights.index.intersection(expected_returns.index)
             weights = weights[common_index]
             expected_returns = expected_returns[common_index]
-            risk_model = risk_model.loc[common_index, common_index]
+            risk_model = risk_model.subset(common_index)
             
             # 组合预期收益率
             portfolio_return = np.dot(weights.values, expected_returns.values)
             
             # 组合风险（标准差）
-            portfolio_variance = np.dot(weights.values, np.dot(risk_model.values, weights.values))
+            portfolio_variance = risk_model.portfolio_variance(weights.values)
             portfolio_risk = np.sqrt(portfolio_variance)
             
             # 夏普比率（假设无风险利率为3%）
@@ -377,7 +402,7 @@ class PortfolioOptimizer:
                 'effective_stocks': float(effective_stocks),
                 'max_weight': float(weights.max()),
                 'min_weight': float(weights[weights > 0].min()) if (weights > 0).any() else 0.0,
-                'turnover': 0.0  # 需要与前期权重比较计算
+                'turnover': float(turnover)
             }
             
             return stats
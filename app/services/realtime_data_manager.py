@@ -10,8 +10,10 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 import logging
 from app.models.stock_minute_data import StockMinuteData
-from app.extensions import db
 from app.services.minute_data_sync_service import MinuteDataSyncService
+from app.services.bar_rollup import BarRollupEngine, ROLLUP_PERIODS
+from app.services.market_aggregation import get_market_aggregation_service
+from app.services.market_snapshot import get_snapshot_store
 
 # 可选导入tushare
 try:
@@ -173,14 +175,15 @@ class RealtimeDataManager:
                     result = sync_service.sync_all_periods_for_stock(ts_code, start_date, end_date)
                 return result
             else:
-                # 使用原有方式
-                results = {}
-                period_types = ['1min', '5min', '15min', '30min', '60min']
-                
-                for period_type in period_types:
-                    result = self.sync_minute_data(ts_code, start_date, end_date, period_type, False)
-                    results[period_type] = result
-                
+                # 使用原有方式：只获取1分钟数据，其他周期在本地合成
+                result = self.sync_minute_data(ts_code, start_date, end_date, '1min', False)
+                results = {'1min': result}
+                for period_type, count in result.get('rollup', {}).items():
+                    results[period_type] = {
+                        'success': True,
+                        'message': f'由1分钟数据合成 {count} 条',
+                        'data_count': count
+                    }
                 return results
                 
         except Exception as e:
@@ -223,8 +226,9 @@ class RealtimeDataManager:
             StockMinuteData.bulk_insert(data_list)
             
             # 如果是1分钟数据，生成其他周期数据
+            rollup = {}
             if period_type == '1min':
-                self._generate_aggregated_data(ts_code, start_date_legacy, end_date_legacy)
+                rollup = self._generate_aggregated_data(ts_code, start_date_legacy, end_date_legacy)
             
             logger.info(f"成功同步 {len(data_list)} 条 {ts_code} 的{period_type}数据")
             
@@ -235,7 +239,8 @@ class RealtimeDataManager:
                 'ts_code': ts_code,
                 'start_date': start_date,
                 'end_date': end_date,
-                'period_type': period_type
+                'period_type': period_type,
+                'rollup': rollup
             }
             
         except Exception as e:
@@ -371,108 +376,52 @@ class RealtimeDataManager:
     def aggregate_data(self, ts_code: str, source_period: str = '1min', target_period: str = '5min', 
                       start_date: str = None, end_date: str = None) -> Dict:
         """
-        数据聚合：将小周期数据聚合为大周期数据
+        数据聚合：将小周期数据聚合为大周期数据（按交易时段切分，不跨越午间休市）
         
         Args:
             ts_code: 股票代码
             source_period: 源周期
             target_period: 目标周期
-            start_date: 开始日期
-            end_date: 结束日期
+            start_date: 开始日期 (YYYYMMDD)，不指定时从目标周期的高水位增量合成
+            end_date: 结束日期 (YYYYMMDD)
             
         Returns:
             聚合结果
         """
         try:
-            # 设置默认日期范围
-            if not end_date:
-                end_date = datetime.now()
-            else:
-                end_date = datetime.strptime(end_date, '%Y%m%d')
-            
-            if not start_date:
-                start_date = end_date - timedelta(days=7)
-            else:
-                start_date = datetime.strptime(start_date, '%Y%m%d')
+            start_time = datetime.strptime(start_date, '%Y%m%d') if start_date else None
+            end_time = datetime.strptime(end_date, '%Y%m%d') + timedelta(days=1) if end_date else None
             
-            # 获取源数据
-            source_data = StockMinuteData.get_data_by_time_range(
-                ts_code, start_date, end_date, source_period
-            )
-            
-            if not source_data:
+            engine = BarRollupEngine(source_period, sync_service=self.minute_sync_service)
+            if target_period not in engine.target_periods([target_period]):
                 return {
                     'success': False,
-                    'message': f'没有找到 {ts_code} 的 {source_period} 数据',
+                    'message': f'不支持的目标周期: {target_period}',
                     'data_count': 0
                 }
             
-            # 转换为DataFrame
-            df = pd.DataFrame([data.to_dict() for data in source_data])
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            df.set_index('datetime', inplace=True)
-            
-            # 确定聚合频率
-            freq_map = {
-                '5min': '5T',
-                '15min': '15T',
-                '30min': '30T',
-                '60min': '60T'
-            }
+            result = engine.rollup([ts_code], [target_period], start_time, end_time)
+            if not result['success']:
+                return {
+                    'success': False,
+                    'message': result['message'],
+                    'data_count': 0
+                }
             
-            if target_period not in freq_map:
+            if result['source_bars'] == 0:
                 return {
                     'success': False,
-                    'message': f'不支持的目标周期: {target_period}',
+                    'message': f'没有找到 {ts_code} 的 {source_period} 数据',
                     'data_count': 0
                 }
             
-            freq = freq_map[target_period]
-            
-            # 执行聚合
-            agg_data = df.resample(freq).agg({
-                'open': 'first',
-                'high': 'max',
-                'low': 'min',
-                'close': 'last',
-                'volume': 'sum',
-                'amount': 'sum'
-            }).dropna()
-            
-            # 计算技术指标
-            agg_data['pre_close'] = agg_data['close'].shift(1)
-            agg_data['change'] = agg_data['close'] - agg_data['pre_close']
-            agg_data['pct_chg'] = (agg_data['change'] / agg_data['pre_close'] * 100).fillna(0)
-            
-            # 转换为模型格式
-            aggregated_list = []
-            for dt, row in agg_data.iterrows():
-                if pd.notna(row['open']):  # 确保数据有效
-                    aggregated_list.append({
-                        'ts_code': ts_code,
-                        'datetime': dt.to_pydatetime(),
-                        'period_type': target_period,
-                        'open': row['open'],
-                        'high': row['high'],
-                        'low': row['low'],
-                        'close': row['close'],
-                        'volume': int(row['volume']),
-                        'amount': row['amount'],
-                        'pre_close': row['pre_close'] if pd.notna(row['pre_close']) else row['open'],
-                        'change': row['change'] if pd.notna(row['change']) else 0,
-                        'pct_chg': row['pct_chg'] if pd.notna(row['pct_chg']) else 0
-                    })
-            
-            # 批量插入聚合数据
-            if aggregated_list:
-                StockMinuteData.bulk_insert(aggregated_list)
-            
-            logger.info(f"成功聚合 {len(aggregated_list)} 条 {target_period} 数据")
+            data_count = result['periods'][target_period]
+            logger.info(f"成功聚合 {data_count} 条 {target_period} 数据")
             
             return {
                 'success': True,
-                'message': f'成功聚合 {len(aggregated_list)} 条 {target_period} 数据',
-                'data_count': len(aggregated_list),
+                'message': f'成功聚合 {data_count} 条 {target_period} 数据',
+                'data_count': data_count,
                 'source_period': source_period,
                 'target_period': target_period
             }
@@ -485,19 +434,21 @@ class RealtimeDataManager:
                 'data_count': 0
             }
     
-    def _generate_aggregated_data(self, ts_code: str, start_date: str, end_date: str):
-        """生成所有周期的聚合数据"""
-        periods = ['5min', '15min', '30min', '60min']
-        
-        for period in periods:
-            try:
-                result = self.aggregate_data(ts_code, '1min', period, start_date, end_date)
-                if result['success']:
-                    logger.info(f"生成 {period} 聚合数据成功: {result['data_count']} 条")
-                else:
-                    logger.warning(f"生成 {period} 聚合数据失败: {result['message']}")
-            except Exception as e:
-                logger.error(f"生成 {period} 聚合数据异常: {str(e)}")
+    def _generate_aggregated_data(self, ts_code: str, start_date: str, end_date: str) -> Dict[str, int]:
+        """一次读取1分钟数据合成所有周期的聚合数据，返回 {周期: 合成条数}"""
+        try:
+            engine = BarRollupEngine('1min', sync_service=self.minute_sync_service)
+            result = engine.rollup([ts_code], ROLLUP_PERIODS,
+                                   datetime.strptime(start_date, '%Y%m%d'),
+                                   datetime.strptime(end_date, '%Y%m%d') + timedelta(days=1))
+            if result['success']:
+                logger.info(f"生成聚合数据成功: {result['periods']}")
+            else:
+                logger.warning(f"生成聚合数据失败: {result['message']}")
+            return result['periods']
+        except Exception as e:
+            logger.error(f"生成聚合数据异常: {str(e)}")
+            return {}
     
     def check_data_quality(self, ts_code: str, period_type: str = '1min', hours: int = 24) -> Dict:
         """
@@ -534,12 +485,9 @@ class RealtimeDataManager:
             实时价格信息
         """
         try:
-            latest_data = StockMinuteData.query.filter_by(
-                ts_code=ts_code,
-                period_type='1min'
-            ).order_by(StockMinuteData.datetime.desc()).first()
+            snapshot = get_snapshot_store('1min').ensure_loaded([ts_code]).get(ts_code)
             
-            if not latest_data:
+            if not snapshot:
                 return {
                     'success': False,
                     'message': f'未找到 {ts_code} 的实时数据',
@@ -550,16 +498,23 @@ class RealtimeDataManager:
                 'success': True,
                 'message': '获取成功',
                 'data': {
-                    'ts_code': latest_data.ts_code,
-                    'current_price': latest_data.close,
-                    'change': latest_data.change,
-                    'pct_chg': latest_data.pct_chg,
-                    'volume': latest_data.volume,
-                    'amount': latest_data.amount,
-                    'update_time': latest_data.datetime.isoformat(),
-                    'open': latest_data.open,
-                    'high': latest_data.high,
-                    'low': latest_data.low
+                    'ts_code': ts_code,
+                    'name': snapshot['name'],
+                    'current_price': snapshot['close'],
+                    'prev_close': snapshot['prev_close'],
+                    'change': snapshot['change'],
+                    'pct_chg': snapshot['change_pct'],
+                    'volume': snapshot['volume'],
+                    'amount': snapshot['amount'],
+                    'update_time': snapshot['datetime'].isoformat(),
+                    'open': snapshot['open'],
+                    'high': snapshot['high'],
+                    'low': snapshot['low'],
+                    'day_open': snapshot['day_open'],
+                    'day_high': snapshot['day_high'],
+                    'day_low': snapshot['day_low'],
+                    'day_volume': snapshot['day_volume'],
+                    'day_amount': snapshot['day_amount']
                 }
             }
             
@@ -579,10 +534,8 @@ class RealtimeDataManager:
             市场概览数据
         """
         try:
-            # 获取所有股票的最新数据
-            latest_time = db.session.query(
-                db.func.max(StockMinuteData.datetime)
-            ).filter_by(period_type='1min').scalar()
+            # 一次分组查询取每只股票最近5分钟内的最新K线，按最新K线时间缓存
+            latest_time, breadth = get_market_aggregation_service().get_market_breadth('1min', window_minutes=5)
             
             if not latest_time:
                 return {
@@ -591,44 +544,19 @@ class RealtimeDataManager:
                     'data': None
                 }
             
-            # 获取最新时间的所有股票数据
-            latest_data = StockMinuteData.query.filter_by(
-                period_type='1min'
-            ).filter(
-                StockMinuteData.datetime >= latest_time - timedelta(minutes=5)
-            ).all()
-            
-            if not latest_data:
+            if not breadth:
                 return {
                     'success': False,
                     'message': '没有找到最新市场数据',
                     'data': None
                 }
             
-            # 统计市场数据
-            total_stocks = len(latest_data)
-            rising_stocks = len([d for d in latest_data if d.pct_chg > 0])
-            falling_stocks = len([d for d in latest_data if d.pct_chg < 0])
-            flat_stocks = total_stocks - rising_stocks - falling_stocks
-            
-            total_volume = sum([d.volume for d in latest_data])
-            total_amount = sum([d.amount for d in latest_data])
-            
-            avg_pct_chg = np.mean([d.pct_chg for d in latest_data if d.pct_chg is not None])
-            
             return {
                 'success': True,
                 'message': '获取成功',
                 'data': {
                     'update_time': latest_time.isoformat(),
-                    'total_stocks': total_stocks,
-                    'rising_stocks': rising_stocks,
-                    'falling_stocks': falling_stocks,
-                    'flat_stocks': flat_stocks,
-                    'rising_ratio': round(rising_stocks / total_stocks * 100, 2) if total_stocks > 0 else 0,
-                    'total_volume': total_volume,
-                    'total_amount': round(total_amount, 2),
-                    'avg_pct_chg': round(avg_pct_chg, 2) if not np.isnan(avg_pct_chg) else 0
+                    **breadth
                 }
             }
             
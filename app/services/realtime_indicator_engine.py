@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple, Any
 from app.extensions import db
 from loguru import logger
+import copy
 import json
 import math
 
@@ -17,6 +18,20 @@ from app.models.realtime_indicator import RealtimeIndicator
 
 logger = logger.bind(name=__name__)
 
+# 默认参数配置
+DEFAULT_INDICATOR_PARAMS = {
+    'MA': {'periods': [5, 10, 20, 30, 60]},
+    'EMA': {'periods': [12, 26]},
+    'MACD': {'fast': 12, 'slow': 26, 'signal': 9},
+    'RSI': {'period': 14},
+    'KDJ': {'k_period': 9, 'd_period': 3, 'j_period': 3},
+    'BOLL': {'period': 20, 'std_dev': 2},
+    'CCI': {'period': 14},
+    'WR': {'period': 14},
+    'ATR': {'period': 14},
+    'OBV': {}
+}
+
 
 class RealtimeIndicatorEngine:
     """实时技术指标计算引擎"""
@@ -37,18 +52,10 @@ class RealtimeIndicatorEngine:
         }
         
         # 默认参数配置
-        self.default_params = {
-            'MA': {'periods': [5, 10, 20, 30, 60]},
-            'EMA': {'periods': [12, 26]},
-            'MACD': {'fast': 12, 'slow': 26, 'signal': 9},
-            'RSI': {'period': 14},
-            'KDJ': {'k_period': 9, 'd_period': 3, 'j_period': 3},
-            'BOLL': {'period': 20, 'std_dev': 2},
-            'CCI': {'period': 14},
-            'WR': {'period': 14},
-            'ATR': {'period': 14},
-            'OBV': {}
-        }
+        self.default_params = copy.deepcopy(DEFAULT_INDICATOR_PARAMS)
+        
+        # 流式增量计算引擎（延迟初始化）
+        self.streaming_engine = None
     
     def _clean_nan_values(self, value):
         """清理NaN值，将NaN转换为None"""
@@ -83,9 +90,6 @@ class RealtimeIndicatorEngine:
     
     def _clean_results_for_json(self, results: Dict) -> Dict:
         """清理结果中的NaN值，确保JSON序列化安全"""
-        import json
-        import math
-        
         logger.info(f"开始清理JSON结果，原始结果类型: {type(results)}")
         
         def is_nan_value(value):
@@ -327,6 +331,28 @@ class RealtimeIndicatorEngine:
             logger.error(f"计算指标失败: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def calculate_indicators_incremental(self, ts_code: str, period_type: str,
+                                         indicators: List[str] = None) -> Dict:
+        """
+        流式增量计算指标：只处理上次计算之后的新K线并追加写入，不删除已有指标数据
+        
+        Args:
+            ts_code: 股票代码
+            period_type: 周期类型
+            indicators: 要计算的指标列表，None表示计算所有支持的指标
+        
+        Returns:
+            计算结果字典
+        """
+        from app.services.streaming_indicators import StreamingIndicatorEngine
+        
+        # 指标集合变化（包括从子集改为全部）时重建引擎，状态从快照恢复
+        wanted = set(indicators) if indicators else None
+        if self.streaming_engine is None or self.streaming_engine.indicators != wanted:
+            self.streaming_engine = StreamingIndicatorEngine(self.default_params, indicators)
+        
+        return self.streaming_engine.process_new_bars(ts_code, period_type, save_snapshot=True)
+    
     def _calculate_ma(self, df: pd.DataFrame) -> Dict:
         """计算移动平均线"""
         results = {}
@@ -387,7 +413,7 @@ class RealtimeIndicatorEngine:
         return {'MACD': macd_values}
     
     def _calculate_rsi(self, df: pd.DataFrame) -> Dict:
-        """计算RSI指标"""
+        """计算RSI指标（Wilder平滑）"""
         period = self.default_params['RSI']['period']
         
         if len(df) < period + 1:
@@ -400,9 +426,15 @@ class RealtimeIndicatorEngine:
         gain = delta.where(delta > 0, 0)
         loss = -delta.where(delta < 0, 0)
         
-        # 计算平均收益和损失
-        avg_gain = gain.rolling(window=period).mean()
-        avg_loss = loss.rolling(window=period).mean()
+        # 计算平均收益和损失：前period个变化的均值作为初值，之后按 (n-1)/n 递推
+        def wilder_average(series: pd.Series) -> pd.Series:
+            seeded = pd.Series(np.nan, index=series.index)
+            seeded.iloc[period] = series.iloc[1:period + 1].mean()
+            seeded.iloc[period + 1:] = series.iloc[period + 1:].to_numpy()
+            return seeded.ewm(alpha=1 / period, adjust=False).mean()
+        
+        avg_gain = wilder_average(gain)
+        avg_loss = wilder_average(loss)
         
         # 计算RSI
         rs = avg_gain / avg_loss
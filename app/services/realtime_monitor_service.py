@@ -6,13 +6,14 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Tuple
 import logging
-from sqlalchemy import func, desc, asc
+from sqlalchemy import func
 
 from app.models.stock_minute_data import StockMinuteData
-from app.models.stock_basic import StockBasic
 from app.models.realtime_indicator import RealtimeIndicator
+from app.services.market_aggregation import get_market_aggregation_service
+from app.services.market_snapshot import get_snapshot_store
 
 logger = logging.getLogger(__name__)
 
@@ -21,41 +22,8 @@ class RealtimeMonitorService:
     """实时监控服务"""
     
     def __init__(self):
-        self.sector_mapping = self._initialize_sector_mapping()
-    
-    def _initialize_sector_mapping(self):
-        """初始化板块映射"""
-        return {
-            '银行': ['000001.SZ', '600000.SH', '600036.SH', '601988.SH'],
-            '房地产': ['000002.SZ', '600048.SH', '000069.SZ', '600383.SH'],
-            '钢铁': ['600019.SH', '000898.SZ', '600581.SH', '000709.SZ'],
-            '煤炭': ['600188.SH', '601088.SH', '000983.SZ', '600123.SH'],
-            '有色金属': ['600362.SH', '000831.SZ', '002460.SZ', '600111.SH'],
-            '石油石化': ['600028.SH', '000656.SZ', '600688.SH', '000301.SZ'],
-            '电力': ['600886.SH', '000027.SZ', '600795.SH', '000875.SZ'],
-            '汽车': ['600104.SH', '000625.SZ', '002594.SZ', '600066.SH'],
-            '机械': ['000157.SZ', '002008.SZ', '600031.SH', '000528.SZ'],
-            '电子': ['000725.SZ', '002415.SZ', '600584.SH', '000021.SZ'],
-            '医药': ['000858.SZ', '600276.SH', '000423.SZ', '600867.SH'],
-            '食品饮料': ['000568.SZ', '600519.SH', '000596.SZ', '600887.SH'],
-            '纺织服装': ['600177.SH', '002029.SZ', '000902.SZ', '600398.SH'],
-            '轻工制造': ['000488.SZ', '002572.SZ', '600978.SH', '000726.SZ'],
-            '商贸零售': ['600694.SH', '000759.SZ', '002024.SZ', '600361.SH'],
-            '交通运输': ['600026.SH', '000089.SZ', '600115.SH', '000039.SZ'],
-            '休闲服务': ['000978.SZ', '600138.SH', '000430.SZ', '600258.SH'],
-            '综合': ['600643.SH', '000039.SZ', '600663.SH', '000042.SZ'],
-            '建筑材料': ['000401.SZ', '600585.SH', '000877.SZ', '600801.SH'],
-            '建筑装饰': ['000090.SZ', '002271.SZ', '600170.SH', '000065.SZ'],
-            '电气设备': ['000400.SZ', '002202.SZ', '600406.SH', '000012.SZ'],
-            '国防军工': ['000768.SZ', '002013.SZ', '600150.SH', '000099.SZ'],
-            '计算机': ['000977.SZ', '002405.SZ', '600588.SH', '000034.SZ'],
-            '传媒': ['000156.SZ', '002027.SZ', '600633.SH', '000917.SZ'],
-            '通信': ['000063.SZ', '002415.SZ', '600050.SH', '000070.SZ'],
-            '公用事业': ['000826.SZ', '600008.SH', '000939.SZ', '600874.SH'],
-            '农林牧渔': ['000876.SZ', '002714.SZ', '600598.SH', '000735.SZ'],
-            '化工': ['000792.SZ', '002648.SZ', '600309.SH', '000059.SZ'],
-            '非银金融': ['000166.SZ', '002736.SZ', '600030.SH', '000776.SZ']
-        }
+        # 行业板块归属取自 StockBasic.industry，由聚合服务按最新K线时间缓存
+        self.aggregation_service = get_market_aggregation_service()
     
     def get_realtime_quotes(self, stock_codes: List[str] = None, 
                            period_type: str = '1min', limit: int = 50) -> Dict:
@@ -65,52 +33,34 @@ class RealtimeMonitorService:
             if not stock_codes:
                 stock_codes = self._get_active_stocks(limit)
             
-            # 获取最新价格数据
-            end_time = datetime.now()
-            start_time = end_time - timedelta(hours=1)  # 最近1小时
+            # 从行情快照批量读取最新价格、前收盘价、成交量比和名称
+            start_time = datetime.now() - timedelta(hours=1)  # 最近1小时
+            snapshots = get_snapshot_store(period_type).ensure_loaded(stock_codes)
             
             quotes = []
             for ts_code in stock_codes:
-                try:
-                    # 获取最新数据
-                    latest_data = StockMinuteData.query.filter(
-                        StockMinuteData.ts_code == ts_code,
-                        StockMinuteData.period_type == period_type,
-                        StockMinuteData.datetime >= start_time
-                    ).order_by(desc(StockMinuteData.datetime)).first()
-                    
-                    if not latest_data:
-                        continue
-                    
-                    # 获取前一交易日收盘价（用于计算涨跌幅）
-                    prev_close = self._get_previous_close(ts_code, latest_data.datetime, period_type)
-                    
-                    # 计算涨跌幅
-                    change_pct = 0.0
-                    if prev_close and prev_close > 0:
-                        change_pct = (latest_data.close - prev_close) / prev_close * 100
-                    
-                    # 计算成交量比
-                    volume_ratio = self._calculate_volume_ratio(ts_code, latest_data.datetime, period_type)
-                    
-                    quotes.append({
-                        'ts_code': ts_code,
-                        'name': self._get_stock_name(ts_code),
-                        'current_price': latest_data.close,
-                        'open_price': latest_data.open,
-                        'high_price': latest_data.high,
-                        'low_price': latest_data.low,
-                        'volume': latest_data.volume,
-                        'amount': latest_data.amount,
-                        'change_pct': change_pct,
-                        'volume_ratio': volume_ratio,
-                        'update_time': latest_data.datetime.isoformat(),
-                        'turnover_rate': self._calculate_turnover_rate(ts_code, latest_data.volume)
-                    })
-                    
-                except Exception as e:
-                    logger.error(f"获取 {ts_code} 行情数据失败: {str(e)}")
+                snapshot = snapshots.get(ts_code)
+                if not snapshot or snapshot['datetime'] < start_time:
                     continue
+                
+                quotes.append({
+                    'ts_code': ts_code,
+                    'name': snapshot['name'],
+                    'current_price': snapshot['close'],
+                    'open_price': snapshot['open'],
+                    'high_price': snapshot['high'],
+                    'low_price': snapshot['low'],
+                    'volume': snapshot['volume'],
+                    'amount': snapshot['amount'],
+                    'prev_close': snapshot['prev_close'],
+                    'change_pct': snapshot['change_pct'],
+                    'volume_ratio': snapshot['volume_ratio'],
+                    'day_high': snapshot['day_high'],
+                    'day_low': snapshot['day_low'],
+                    'day_volume': snapshot['day_volume'],
+                    'update_time': snapshot['datetime'].isoformat(),
+                    'turnover_rate': self._calculate_turnover_rate(ts_code, snapshot['volume'])
+                })
             
             return {
                 'success': True,
@@ -129,62 +79,11 @@ class RealtimeMonitorService:
     def get_sector_performance(self, period_hours: int = 1) -> Dict:
         """获取板块表现"""
         try:
-            end_time = datetime.now()
-            start_time = end_time - timedelta(hours=period_hours)
-            
-            sector_performance = []
-            
-            for sector_name, stock_codes in self.sector_mapping.items():
-                try:
-                    sector_changes = []
-                    sector_volumes = []
-                    sector_amounts = []
-                    
-                    for ts_code in stock_codes:
-                        # 获取最新数据
-                        latest_data = StockMinuteData.query.filter(
-                            StockMinuteData.ts_code == ts_code,
-                            StockMinuteData.datetime >= start_time
-                        ).order_by(desc(StockMinuteData.datetime)).first()
-                        
-                        if not latest_data:
-                            continue
-                        
-                        # 计算涨跌幅
-                        prev_close = self._get_previous_close(ts_code, latest_data.datetime, '1min')
-                        if prev_close and prev_close > 0:
-                            change_pct = (latest_data.close - prev_close) / prev_close * 100
-                            sector_changes.append(change_pct)
-                            sector_volumes.append(latest_data.volume)
-                            sector_amounts.append(latest_data.amount)
-                    
-                    if sector_changes:
-                        # 计算板块平均涨跌幅（等权重）
-                        avg_change = np.mean(sector_changes)
-                        total_volume = sum(sector_volumes)
-                        total_amount = sum(sector_amounts)
-                        
-                        # 计算上涨股票数量
-                        rising_count = sum(1 for change in sector_changes if change > 0)
-                        falling_count = sum(1 for change in sector_changes if change < 0)
-                        
-                        sector_performance.append({
-                            'sector_name': sector_name,
-                            'avg_change_pct': avg_change,
-                            'total_volume': total_volume,
-                            'total_amount': total_amount,
-                            'stock_count': len(sector_changes),
-                            'rising_count': rising_count,
-                            'falling_count': falling_count,
-                            'rising_ratio': rising_count / len(sector_changes) * 100 if sector_changes else 0
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"计算板块 {sector_name} 表现失败: {str(e)}")
-                    continue
-            
-            # 按涨跌幅排序
-            sector_performance.sort(key=lambda x: x['avg_change_pct'], reverse=True)
+            # 一次分组查询取窗口内每只股票的最新K线和行业，按行业向量化聚合（已按平均涨跌幅降序）
+            _, sector_performance = self.aggregation_service.get_sector_stats(
+                '1min', window_minutes=int(period_hours * 60)
+            )
+            sector_performance = sector_performance or []
             
             return {
                 'success': True,
@@ -201,143 +100,131 @@ class RealtimeMonitorService:
             logger.error(f"获取板块表现失败: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def _scan_universe(self, period_hours: int = 1) -> pd.DataFrame:
+        """
+        全市场扫描：从行情快照取出最新K线前 period_hours 内有成交的全部股票的列式数据，
+        向量化计算突破标志和异动评分（涨跌幅相对前一交易日收盘价，成交量比和价格区间取前20根K线）
+        """
+        store = get_snapshot_store('1min')
+        store.sync_universe(active_hours=period_hours)
+        frame = store.to_frame()
+        if frame.empty:
+            return frame
+        
+        prev_close = pd.to_numeric(frame['prev_close'])
+        frame = frame[(frame['datetime'] >= frame['datetime'].max() - timedelta(hours=period_hours)) &
+                      (prev_close > 0)].reset_index(drop=True)
+        
+        # 价格突破：最新K线高于前期最高价1%或低于前期最低价1%
+        prior_high = pd.to_numeric(frame['prior_high']).to_numpy(dtype=np.float64)
+        prior_low = pd.to_numeric(frame['prior_low']).to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            breakout = ((frame['high'].to_numpy() > prior_high * 1.01) |
+                        (frame['low'].to_numpy() < prior_low * 0.99))
+        
+        return frame.assign(
+            breakout=breakout,
+            anomaly_score=self._calculate_anomaly_score(frame['change_pct'].to_numpy(dtype=np.float64),
+                                                        frame['volume_ratio'].to_numpy(dtype=np.float64))
+        )
+    
     def detect_anomalies(self, change_threshold: float = 5.0, 
                         volume_threshold: float = 3.0, 
-                        period_hours: int = 1) -> Dict:
+                        period_hours: int = 1, top_k: int = 50) -> Dict:
         """检测异动股票"""
         try:
-            end_time = datetime.now()
-            start_time = end_time - timedelta(hours=period_hours)
-            
-            # 获取所有活跃股票
-            active_stocks = self._get_active_stocks(200)
+            scan = self._scan_universe(period_hours)
             
             anomalies = []
-            
-            for ts_code in active_stocks:
-                try:
-                    # 获取最新数据
-                    latest_data = StockMinuteData.query.filter(
-                        StockMinuteData.ts_code == ts_code,
-                        StockMinuteData.datetime >= start_time
-                    ).order_by(desc(StockMinuteData.datetime)).first()
-                    
-                    if not latest_data:
-                        continue
-                    
-                    # 计算涨跌幅
-                    prev_close = self._get_previous_close(ts_code, latest_data.datetime, '1min')
-                    if not prev_close or prev_close <= 0:
-                        continue
-                    
-                    change_pct = (latest_data.close - prev_close) / prev_close * 100
-                    
-                    # 计算成交量比
-                    volume_ratio = self._calculate_volume_ratio(ts_code, latest_data.datetime, '1min')
-                    
-                    # 检测异动条件
-                    anomaly_types = []
-                    
-                    # 价格异动
-                    if abs(change_pct) >= change_threshold:
-                        if change_pct > 0:
-                            anomaly_types.append('急涨')
-                        else:
-                            anomaly_types.append('急跌')
-                    
-                    # 成交量异动
-                    if volume_ratio >= volume_threshold:
-                        anomaly_types.append('放量')
-                    
-                    # 价格突破（简单判断）
-                    if self._check_price_breakout(ts_code, latest_data):
-                        anomaly_types.append('突破')
-                    
-                    if anomaly_types:
-                        anomalies.append({
-                            'ts_code': ts_code,
-                            'name': self._get_stock_name(ts_code),
-                            'current_price': latest_data.close,
-                            'change_pct': change_pct,
-                            'volume_ratio': volume_ratio,
-                            'anomaly_types': anomaly_types,
-                            'anomaly_score': self._calculate_anomaly_score(change_pct, volume_ratio),
-                            'update_time': latest_data.datetime.isoformat()
-                        })
-                        
-                except Exception as e:
-                    logger.error(f"检测 {ts_code} 异动失败: {str(e)}")
-                    continue
-            
-            # 按异动评分排序
-            anomalies.sort(key=lambda x: x['anomaly_score'], reverse=True)
+            total_count = 0
+            if not scan.empty:
+                change_pct = scan['change_pct'].to_numpy()
+                surge = change_pct >= change_threshold
+                plunge = change_pct <= -change_threshold
+                volume_spike = scan['volume_ratio'].to_numpy() >= volume_threshold
+                breakout = scan['breakout'].to_numpy()
+                
+                flagged = np.flatnonzero(surge | plunge | volume_spike | breakout)
+                total_count = len(flagged)
+                
+                # 按评分降序（同分保持原顺序）只为前 top_k 只股票组装结果
+                scores = scan['anomaly_score'].to_numpy()[flagged]
+                flagged = flagged[np.argsort(-scores, kind='stable')[:top_k]]
+                
+                type_masks = [('急涨', surge), ('急跌', plunge), ('放量', volume_spike), ('突破', breakout)]
+                for i in flagged:
+                    row = scan.iloc[i]
+                    anomalies.append({
+                        'ts_code': row['ts_code'],
+                        'name': row['name'],
+                        'current_price': float(row['close']),
+                        'change_pct': float(row['change_pct']),
+                        'volume_ratio': float(row['volume_ratio']),
+                        'anomaly_types': [name for name, mask in type_masks if mask[i]],
+                        'anomaly_score': float(row['anomaly_score']),
+                        'update_time': row['datetime'].isoformat()
+                    })
             
             return {
                 'success': True,
                 'data': {
-                    'anomalies': anomalies[:50],  # 返回前50个异动股票
-                    'total_count': len(anomalies),
+                    'anomalies': anomalies,
+                    'total_count': total_count,
                     'change_threshold': change_threshold,
                     'volume_threshold': volume_threshold,
                     'period_hours': period_hours,
                     'update_time': datetime.now().isoformat()
                 },
-                'message': f'检测到 {len(anomalies)} 只异动股票'
+                'message': f'检测到 {total_count} 只异动股票'
             }
             
         except Exception as e:
             logger.error(f"检测异动股票失败: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def get_top_movers(self, limit: int = 10, period_hours: int = 1) -> Dict:
+        """获取涨幅和跌幅居前的股票"""
+        try:
+            scan = self._scan_universe(period_hours)
+            columns = ['ts_code', 'name', 'close', 'change_pct', 'volume_ratio']
+            
+            def _records(frame):
+                return [{
+                    'ts_code': row.ts_code,
+                    'name': row.name,
+                    'current_price': float(row.close),
+                    'change_pct': float(row.change_pct),
+                    'volume_ratio': float(row.volume_ratio)
+                } for row in frame[columns].itertuples(index=False)]
+            
+            gainers = _records(scan.nlargest(limit, 'change_pct')) if not scan.empty else []
+            losers = _records(scan.nsmallest(limit, 'change_pct')) if not scan.empty else []
+            
+            return {
+                'success': True,
+                'data': {
+                    'gainers': gainers,
+                    'losers': losers,
+                    'update_time': datetime.now().isoformat()
+                },
+                'message': f'成功获取涨跌幅前 {limit} 的股票'
+            }
+            
+        except Exception as e:
+            logger.error(f"获取涨跌幅排行失败: {str(e)}")
+            return {'success': False, 'message': str(e)}
+    
     def get_market_sentiment(self, period_hours: int = 1) -> Dict:
         """获取市场情绪指标"""
         try:
-            end_time = datetime.now()
-            start_time = end_time - timedelta(hours=period_hours)
-            
-            # 获取所有活跃股票的数据
-            active_stocks = self._get_active_stocks(500)
-            
-            rising_stocks = 0
-            falling_stocks = 0
-            unchanged_stocks = 0
-            total_volume = 0
-            total_amount = 0
-            changes = []
-            
-            for ts_code in active_stocks:
-                try:
-                    # 获取最新数据
-                    latest_data = StockMinuteData.query.filter(
-                        StockMinuteData.ts_code == ts_code,
-                        StockMinuteData.datetime >= start_time
-                    ).order_by(desc(StockMinuteData.datetime)).first()
-                    
-                    if not latest_data:
-                        continue
-                    
-                    # 计算涨跌幅
-                    prev_close = self._get_previous_close(ts_code, latest_data.datetime, '1min')
-                    if not prev_close or prev_close <= 0:
-                        continue
-                    
-                    change_pct = (latest_data.close - prev_close) / prev_close * 100
-                    changes.append(change_pct)
-                    
-                    # 统计涨跌家数
-                    if change_pct > 0.1:
-                        rising_stocks += 1
-                    elif change_pct < -0.1:
-                        falling_stocks += 1
-                    else:
-                        unchanged_stocks += 1
-                    
-                    total_volume += latest_data.volume
-                    total_amount += latest_data.amount
-                    
-                except Exception as e:
-                    logger.error(f"处理 {ts_code} 市场情绪数据失败: {str(e)}")
-                    continue
+            scan = self._scan_universe(period_hours)
+            
+            changes = scan['change_pct'].to_numpy() if not scan.empty else np.array([])
+            rising_stocks = int(np.count_nonzero(changes > 0.1))
+            falling_stocks = int(np.count_nonzero(changes < -0.1))
+            unchanged_stocks = len(changes) - rising_stocks - falling_stocks
+            total_volume = float(scan['volume'].sum()) if not scan.empty else 0
+            total_amount = float(scan['amount'].sum()) if not scan.empty else 0
             
             total_stocks = rising_stocks + falling_stocks + unchanged_stocks
             
@@ -352,8 +239,8 @@ class RealtimeMonitorService:
             falling_ratio = falling_stocks / total_stocks * 100
             
             # 计算市场强度指标
-            avg_change = np.mean(changes) if changes else 0
-            change_std = np.std(changes) if changes else 0
+            avg_change = float(np.mean(changes))
+            change_std = float(np.std(changes))
             
             # 计算情绪评分 (0-100)
             sentiment_score = min(100, max(0, 50 + avg_change * 5 + (rising_ratio - 50)))
@@ -464,58 +351,6 @@ class RealtimeMonitorService:
             # 返回默认股票列表
             return ['000001.SZ', '000002.SZ', '600000.SH', '600036.SH', '000858.SZ']
     
-    def _get_previous_close(self, ts_code: str, current_time: datetime, period_type: str) -> Optional[float]:
-        """获取前一交易日收盘价"""
-        try:
-            # 简化处理：获取当前时间前1小时的数据作为基准
-            prev_time = current_time - timedelta(hours=1)
-            
-            prev_data = StockMinuteData.query.filter(
-                StockMinuteData.ts_code == ts_code,
-                StockMinuteData.period_type == period_type,
-                StockMinuteData.datetime <= prev_time
-            ).order_by(desc(StockMinuteData.datetime)).first()
-            
-            return prev_data.close if prev_data else None
-            
-        except Exception as e:
-            logger.error(f"获取 {ts_code} 前收盘价失败: {str(e)}")
-            return None
-    
-    def _calculate_volume_ratio(self, ts_code: str, current_time: datetime, period_type: str) -> float:
-        """计算成交量比"""
-        try:
-            # 获取最近20个周期的平均成交量
-            start_time = current_time - timedelta(hours=20)
-            
-            avg_volume = StockMinuteData.query.filter(
-                StockMinuteData.ts_code == ts_code,
-                StockMinuteData.period_type == period_type,
-                StockMinuteData.datetime >= start_time,
-                StockMinuteData.datetime < current_time
-            ).with_entities(
-                func.avg(StockMinuteData.volume)
-            ).scalar()
-            
-            if not avg_volume or avg_volume == 0:
-                return 1.0
-            
-            # 获取当前成交量
-            current_data = StockMinuteData.query.filter(
-                StockMinuteData.ts_code == ts_code,
-                StockMinuteData.period_type == period_type,
-                StockMinuteData.datetime == current_time
-            ).first()
-            
-            if not current_data:
-                return 1.0
-            
-            return current_data.volume / avg_volume
-            
-        except Exception as e:
-            logger.error(f"计算 {ts_code} 成交量比失败: {str(e)}")
-            return 1.0
-    
     def _calculate_turnover_rate(self, ts_code: str, volume: float) -> float:
         """计算换手率（简化版本）"""
         try:
@@ -527,47 +362,12 @@ class RealtimeMonitorService:
             logger.error(f"计算 {ts_code} 换手率失败: {str(e)}")
             return 0.0
     
-    def _get_stock_name(self, ts_code: str) -> str:
-        """获取股票名称"""
-        try:
-            stock_basic = StockBasic.query.filter_by(ts_code=ts_code).first()
-            return stock_basic.name if stock_basic else ts_code
-        except Exception as e:
-            logger.error(f"获取 {ts_code} 股票名称失败: {str(e)}")
-            return ts_code
-    
-    def _check_price_breakout(self, ts_code: str, latest_data) -> bool:
-        """检查价格突破（简化版本）"""
-        try:
-            # 获取最近20个周期的最高价和最低价
-            start_time = latest_data.datetime - timedelta(hours=20)
-            
-            price_data = StockMinuteData.query.filter(
-                StockMinuteData.ts_code == ts_code,
-                StockMinuteData.datetime >= start_time,
-                StockMinuteData.datetime < latest_data.datetime
-            ).with_entities(
-                func.max(StockMinuteData.high).label('max_high'),
-                func.min(StockMinuteData.low).label('min_low')
-            ).first()
-            
-            if not price_data or not price_data.max_high or not price_data.min_low:
-                return False
-            
-            # 检查是否突破最高价或最低价
-            return (latest_data.high > price_data.max_high * 1.01 or 
-                   latest_data.low < price_data.min_low * 0.99)
-            
-        except Exception as e:
-            logger.error(f"检查 {ts_code} 价格突破失败: {str(e)}")
-            return False
-    
-    def _calculate_anomaly_score(self, change_pct: float, volume_ratio: float) -> float:
-        """计算异动评分"""
+    def _calculate_anomaly_score(self, change_pct, volume_ratio):
+        """计算异动评分（标量或整列数组）"""
         try:
             # 综合价格变动和成交量变动计算异动评分
-            price_score = min(50, abs(change_pct) * 5)  # 价格变动评分
-            volume_score = min(50, (volume_ratio - 1) * 10)  # 成交量变动评分
+            price_score = np.minimum(50, np.abs(change_pct) * 5)  # 价格变动评分
+            volume_score = np.minimum(50, (np.asarray(volume_ratio) - 1) * 10)  # 成交量变动评分
             
             return price_score + volume_score
             
@@ -0,0 +1,614 @@
+"""
+事件驱动的实时处理管道
+新K线进入后依次触发：增量指标更新 → 该股票的交易策略 → 持有该股票的持仓风险检查 → 定向WebSocket推送，
+各阶段通过事件总线衔接，记录每个阶段及端到端的延迟分布。
+分钟数据同步服务入库后调用 publish_ingested_bars 把新K线发布到已注册的事件总线。
+事件总线有进程内实现和基于Redis Streams的多进程实现，FakeBarFeed 用于本地测试。
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_left
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.models.stock_minute_data import StockMinuteData
+from app.models.trading_signal import TradingSignal
+from app.utils.market_calendar import MORNING_OPEN, MORNING_CLOSE, AFTERNOON_OPEN, AFTERNOON_CLOSE
+
+logger = logging.getLogger(__name__)
+
+# 事件主题
+BAR_TOPIC = 'bar'
+INDICATOR_TOPIC = 'indicators'
+SIGNAL_TOPIC = 'signals'
+RISK_TOPIC = 'risk'
+
+# 管道阶段（按执行顺序）
+STAGES = ['indicator', 'signal', 'risk', 'push']
+
+# 延迟直方图的桶上界（毫秒）
+DEFAULT_LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图（线程安全）"""
+
+    def __init__(self, buckets_ms=DEFAULT_LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        """记录一次耗时（秒）"""
+        ms = max(seconds, 0.0) * 1000
+        with self._lock:
+            self.counts[bisect_left(self.buckets_ms, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """分位数估计（毫秒），取所在桶的上界，不超过观测到的最大值"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            target = q * self.count
+            cumulative = 0
+            for i, bucket_count in enumerate(self.counts):
+                cumulative += bucket_count
+                if cumulative >= target:
+                    upper = self.buckets_ms[i] if i < len(self.buckets_ms) else self.max_ms
+                    return min(upper, self.max_ms)
+            return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        """直方图摘要"""
+        labels = [f'<={b}ms' for b in self.buckets_ms] + [f'>{self.buckets_ms[-1]}ms']
+        with self._lock:
+            count, total_ms, max_ms = self.count, self.total_ms, self.max_ms
+            buckets = dict(zip(labels, self.counts))
+        return {
+            'count': count,
+            'mean_ms': round(total_ms / count, 3) if count else 0.0,
+            'max_ms': round(max_ms, 3),
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': buckets
+        }
+
+
+def bar_event(ts_code: str, period_type: str, bar: Dict) -> Dict:
+    """构造管道入口的K线事件（可JSON序列化）"""
+    return {
+        'ts_code': ts_code,
+        'period_type': period_type,
+        'bar': {
+            'datetime': pd.Timestamp(bar['datetime']).isoformat(),
+            'open': float(bar['open']),
+            'high': float(bar['high']),
+            'low': float(bar['low']),
+            'close': float(bar['close']),
+            'volume': float(bar.get('volume') or 0),
+            'amount': float(bar.get('amount') or 0)
+        },
+        'ingested_at': time.time()
+    }
+
+
+def _json_default(value):
+    """事件序列化：日期转ISO字符串，NumPy标量转Python数值"""
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+class _EventBusBase:
+    """事件总线公共部分：订阅、分发和后台消费线程"""
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Callable[[Dict], None]]] = {}
+        self.is_running = False
+        self.worker = None
+        self.processed_events = 0
+        self.failed_events = 0
+
+    def subscribe(self, topic: str, handler: Callable[[Dict], None]):
+        """订阅主题"""
+        self.handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, event: Dict):
+        raise NotImplementedError
+
+    def process_pending(self, max_events: int = None, timeout: float = 0) -> int:
+        """在当前线程处理待消费的事件，返回处理数量"""
+        raise NotImplementedError
+
+    def _dispatch(self, topic: str, event: Dict):
+        for handler in self.handlers.get(topic, []):
+            try:
+                handler(event)
+            except Exception as e:
+                self.failed_events += 1
+                logger.error(f"处理事件失败: {topic}, {event.get('ts_code')}, 错误: {e}")
+        self.processed_events += 1
+
+    def start(self, app=None):
+        """启动后台消费线程，app 用于在线程中推入应用上下文"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.worker = threading.Thread(target=self._run, args=(app,), daemon=True)
+        self.worker.start()
+
+    def stop(self, timeout: float = 5):
+        """停止后台消费线程"""
+        self.is_running = False
+        if self.worker:
+            self.worker.join(timeout=timeout)
+            self.worker = None
+
+    def _run(self, app):
+        context = app.app_context() if app is not None else None
+        if context is not None:
+            context.push()
+        try:
+            while self.is_running:
+                try:
+                    self.process_pending(timeout=0.5)
+                except Exception as e:
+                    logger.error(f"事件消费循环错误: {e}")
+                    time.sleep(1)
+        finally:
+            if context is not None:
+                context.pop()
+
+
+class InProcessEventBus(_EventBusBase):
+    """进程内事件总线，事件按发布顺序由单个消费线程处理"""
+
+    def __init__(self, max_queue_size: int = 100000):
+        super().__init__()
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize()
+
+    def publish(self, topic: str, event: Dict):
+        self.queue.put((topic, event))
+
+    def process_pending(self, max_events: int = None, timeout: float = 0) -> int:
+        processed = 0
+        while max_events is None or processed < max_events:
+            try:
+                if timeout and processed == 0:
+                    topic, event = self.queue.get(timeout=timeout)
+                else:
+                    topic, event = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(topic, event)
+            processed += 1
+        return processed
+
+
+class RedisStreamEventBus(_EventBusBase):
+    """
+    基于Redis Streams的事件总线，用于多进程部署
+    事件按 ts_code 的哈希分区，每个主题每个分区一个Stream，处理完成后XACK。
+    管道的指标状态和K线历史保存在进程内，同一只股票的事件必须由同一个进程处理：
+    每个分区只分配给一个消费进程（assigned_partitions），不要让多个进程消费同一分区
+    """
+
+    def __init__(self, redis_client=None, stream_prefix: str = 'realtime_pipeline',
+                 group: str = 'pipeline', consumer: str = None, maxlen: int = 100000, batch_size: int = 100,
+                 partitions: int = 1, assigned_partitions: List[int] = None):
+        """
+        Args:
+            partitions: 分区数，所有生产和消费进程必须一致
+            assigned_partitions: 本进程消费的分区，默认全部（单消费进程）；只发布不消费的进程无需设置
+        """
+        super().__init__()
+        if redis_client is None:
+            from app.extensions import redis_client as default_client
+            redis_client = default_client
+        self.redis = redis_client
+        self.stream_prefix = stream_prefix
+        self.group = group
+        self.consumer = consumer or f'consumer-{uuid.uuid4().hex[:8]}'
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.partitions = max(int(partitions), 1)
+        self.assigned_partitions = (list(range(self.partitions)) if assigned_partitions is None
+                                    else sorted(set(assigned_partitions)))
+        if any(p < 0 or p >= self.partitions for p in self.assigned_partitions):
+            raise ValueError(f"分区编号超出范围: {self.assigned_partitions}, 分区数 {self.partitions}")
+        self._stream_topics: Dict[str, str] = {}
+
+    def partition_of(self, ts_code: str) -> int:
+        """股票所属分区（稳定哈希，各进程一致）"""
+        return zlib.crc32(ts_code.encode('utf-8')) % self.partitions
+
+    def _stream(self, topic: str, partition: int = 0) -> str:
+        if self.partitions == 1:
+            return f'{self.stream_prefix}:{topic}'
+        return f'{self.stream_prefix}:{topic}:{partition}'
+
+    def _ensure_group(self, stream: str):
+        try:
+            self.redis.xgroup_create(stream, self.group, id='0', mkstream=True)
+        except Exception as e:
+            # 消费组已存在
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def subscribe(self, topic: str, handler: Callable[[Dict], None]):
+        super().subscribe(topic, handler)
+        for partition in self.assigned_partitions:
+            stream = self._stream(topic, partition)
+            if stream not in self._stream_topics:
+                self._ensure_group(stream)
+                self._stream_topics[stream] = topic
+
+    @property
+    def pending(self) -> int:
+        total = 0
+        for stream in self._stream_topics:
+            for info in self.redis.xinfo_groups(stream):
+                if info.get('name') == self.group:
+                    total += (info.get('lag') or 0) + (info.get('pending') or 0)
+        return total
+
+    def publish(self, topic: str, event: Dict):
+        self.redis.xadd(self._stream(topic, self.partition_of(event['ts_code'])),
+                        {'payload': json.dumps(event, default=_json_default)},
+                        maxlen=self.maxlen, approximate=True)
+
+    def process_pending(self, max_events: int = None, timeout: float = 0) -> int:
+        if not self._stream_topics:
+            return 0
+        streams = {stream: '>' for stream in self._stream_topics}
+        count = self.batch_size if max_events is None else min(self.batch_size, max_events)
+        processed = 0
+        while max_events is None or processed < max_events:
+            block = int(timeout * 1000) if timeout and processed == 0 else None
+            response = self.redis.xreadgroup(self.group, self.consumer, streams, count=count, block=block)
+            if not response:
+                break
+            for stream, messages in response:
+                stream = stream.decode() if isinstance(stream, bytes) else stream
+                topic = self._stream_topics[stream]
+                for message_id, fields in messages:
+                    payload = fields.get('payload', fields.get(b'payload'))
+                    self._dispatch(topic, json.loads(payload))
+                    self.redis.xack(stream, self.group, message_id)
+                    processed += 1
+        return processed
+
+
+# 入库路径发布新K线的事件总线：管道启动时注册自己的总线；独立的入库进程配置
+# REALTIME_PIPELINE_PARTITIONS 后发布到Redis Streams，由各消费进程按分区处理
+_ingest_buses: List[_EventBusBase] = []
+_ingest_lock = threading.Lock()
+_stream_publisher: Optional[RedisStreamEventBus] = None
+
+
+def register_ingest_bus(bus: _EventBusBase):
+    """注册接收入库K线的事件总线"""
+    with _ingest_lock:
+        if bus not in _ingest_buses:
+            _ingest_buses.append(bus)
+
+
+def unregister_ingest_bus(bus: _EventBusBase):
+    with _ingest_lock:
+        if bus in _ingest_buses:
+            _ingest_buses.remove(bus)
+
+
+def _get_ingest_buses() -> List[_EventBusBase]:
+    """已注册的总线；没有注册Redis总线且配置了分区数时加上Redis Streams发布端"""
+    global _stream_publisher
+    with _ingest_lock:
+        buses = list(_ingest_buses)
+    if any(isinstance(bus, RedisStreamEventBus) for bus in buses):
+        return buses
+    try:
+        from flask import current_app
+        partitions = int(current_app.config.get('REALTIME_PIPELINE_PARTITIONS') or 0)
+    except RuntimeError:
+        partitions = 0
+    if partitions > 0:
+        if _stream_publisher is None or _stream_publisher.partitions != partitions:
+            _stream_publisher = RedisStreamEventBus(partitions=partitions, assigned_partitions=[])
+        buses.append(_stream_publisher)
+    return buses
+
+
+def publish_ingested_bars(bars: pd.DataFrame) -> int:
+    """
+    新K线入库后发布到实时管道（分钟数据同步服务的入库路径调用）
+    按时间顺序逐根发布，同一股票的事件保持时间顺序；发布失败只记录日志，不影响入库
+
+    Returns:
+        发布的K线数
+    """
+    if bars is None or bars.empty:
+        return 0
+    buses = _get_ingest_buses()
+    if not buses:
+        return 0
+    bars = bars.sort_values(['datetime', 'ts_code'])
+    if 'period_type' not in bars.columns:
+        bars = bars.assign(period_type='1min')
+    events = [bar_event(record['ts_code'], record['period_type'], record) for record in bars.to_dict('records')]
+    for bus in buses:
+        try:
+            for event in events:
+                bus.publish(BAR_TOPIC, dict(event))
+        except Exception as e:
+            logger.error(f"发布入库K线到实时管道失败: {e}")
+    return len(events)
+
+
+def broadcast_pipeline_event(event: Dict):
+    """默认推送：按股票房间定向推送行情、指标、信号，以及该股票持仓的风险预警"""
+    from app.websocket.websocket_events import (
+        broadcast_market_data, broadcast_indicators, broadcast_signals, broadcast_risk_alert
+    )
+
+    ts_code = event['ts_code']
+    broadcast_market_data(ts_code, event['bar'])
+    if event.get('indicators'):
+        broadcast_indicators(ts_code, event['indicators'])
+    if event.get('signals'):
+        broadcast_signals(ts_code, event['signals'])
+        broadcast_signals('all', {'ts_code': ts_code, 'signals': event['signals']})
+    for alert in event.get('alerts', []):
+        broadcast_risk_alert(alert)
+
+
+class RealtimePipeline:
+    """
+    K线 → 指标 → 信号 → 风险 → 推送 的事件驱动管道
+    每个阶段只处理触发事件的那只股票
+    """
+
+    def __init__(self, bus=None, streaming_engine=None, signal_engine=None, risk_manager=None,
+                 emitter: Callable[[Dict], None] = None, strategies: List[str] = None,
+                 history_size: int = 240, min_signal_bars: int = 50, persist_signals: bool = True):
+        """
+        Args:
+            bus: 事件总线，默认进程内总线
+            streaming_engine: 流式指标引擎
+            signal_engine: 交易信号引擎（只使用其策略函数）
+            risk_manager: 风险管理服务
+            emitter: 推送函数，接收完整事件，默认按股票房间广播
+            strategies: 启用的策略，默认全部
+            history_size: 每只股票保留的K线和指标条数，供策略使用
+            min_signal_bars: 运行策略所需的最少K线数
+            persist_signals: 是否将生成的信号写入数据库
+        """
+        if streaming_engine is None:
+            from app.services.streaming_indicators import StreamingIndicatorEngine
+            streaming_engine = StreamingIndicatorEngine()
+        if signal_engine is None:
+            from app.services.realtime_trading_signal_engine import RealtimeTradingSignalEngine
+            signal_engine = RealtimeTradingSignalEngine()
+        if risk_manager is None:
+            from app.services.realtime_risk_manager import RealtimeRiskManager
+            risk_manager = RealtimeRiskManager()
+
+        self.bus = bus or InProcessEventBus()
+        self.streaming_engine = streaming_engine
+        self.signal_engine = signal_engine
+        self.risk_manager = risk_manager
+        self.emitter = emitter or broadcast_pipeline_event
+        self.strategies = strategies
+        self.history_size = history_size
+        self.min_signal_bars = min_signal_bars
+        self.persist_signals = persist_signals
+
+        self.latency = {stage: LatencyHistogram() for stage in STAGES + ['end_to_end']}
+        self.price_history: Dict[tuple, deque] = {}
+        self.indicator_history: Dict[tuple, Dict[str, deque]] = {}
+
+        self.bus.subscribe(BAR_TOPIC, self._on_bar)
+        self.bus.subscribe(INDICATOR_TOPIC, self._on_indicators)
+        self.bus.subscribe(SIGNAL_TOPIC, self._on_signals)
+        self.bus.subscribe(RISK_TOPIC, self._on_risk)
+
+    def publish_bar(self, ts_code: str, period_type: str, bar: Dict):
+        """发布一根新K线，作为管道入口"""
+        self.bus.publish(BAR_TOPIC, bar_event(ts_code, period_type, bar))
+
+    def publish_bars(self, bars: pd.DataFrame, period_type: str = None):
+        """按时间顺序发布一批K线（需包含 ts_code 和 datetime 列）"""
+        bars = bars.sort_values(['datetime', 'ts_code'])
+        for record in bars.to_dict('records'):
+            self.publish_bar(record['ts_code'], period_type or record.get('period_type', '1min'), record)
+        return len(bars)
+
+    def warm_up(self, ts_codes: List[str], period_type: str = '1min', end_time: datetime = None) -> int:
+        """
+        一次查询读取最近的K线，预热指标状态和策略所需的历史，不产生推送
+        已通过 streaming_engine.load_snapshots 恢复状态的股票只补充历史窗口
+        """
+        end_time = end_time or datetime.now()
+        rows = StockMinuteData.query.filter(
+            StockMinuteData.ts_code.in_(ts_codes),
+            StockMinuteData.period_type == period_type,
+            StockMinuteData.datetime >= end_time - timedelta(days=7),
+            StockMinuteData.datetime <= end_time
+        ).order_by(StockMinuteData.ts_code, StockMinuteData.datetime).all()
+
+        bars_by_stock: Dict[str, List] = {}
+        for row in rows:
+            bars_by_stock.setdefault(row.ts_code, []).append(row)
+
+        for ts_code, stock_bars in bars_by_stock.items():
+            for row in stock_bars[-self.history_size:]:
+                bar = {'datetime': row.datetime, 'open': row.open, 'high': row.high, 'low': row.low,
+                       'close': row.close, 'volume': row.volume, 'amount': row.amount}
+                self._update_indicators(ts_code, period_type, bar)
+        return len(rows)
+
+    def _update_indicators(self, ts_code: str, period_type: str, bar: Dict) -> Dict[str, List]:
+        """更新一只股票的指标状态和历史窗口，返回 {指标名: [值...]}"""
+        key = (ts_code, period_type)
+        rows = self.streaming_engine.update(ts_code, period_type, bar)
+
+        history = self.price_history.get(key)
+        if history is None:
+            history = self.price_history[key] = deque(maxlen=self.history_size)
+        history.append(bar)
+
+        indicator_history = self.indicator_history.setdefault(key, {})
+        indicators = {}
+        for row in rows:
+            values = [row[f'value{i}'] for i in range(1, 5)]
+            name_history = indicator_history.get(row['indicator_name'])
+            if name_history is None:
+                name_history = indicator_history[row['indicator_name']] = deque(maxlen=self.history_size)
+            name_history.append({'datetime': row['datetime'], 'value1': values[0], 'value2': values[1],
+                                 'value3': values[2], 'value4': values[3]})
+            indicators[row['indicator_name']] = [v for v in values if v is not None]
+        return indicators
+
+    def _on_bar(self, event: Dict):
+        """阶段1：增量更新该股票的指标"""
+        started = time.perf_counter()
+        bar = dict(event['bar'], datetime=pd.Timestamp(event['bar']['datetime']).to_pydatetime())
+        event['indicators'] = self._update_indicators(event['ts_code'], event['period_type'], bar)
+        self.latency['indicator'].observe(time.perf_counter() - started)
+        self.bus.publish(INDICATOR_TOPIC, event)
+
+    def _on_indicators(self, event: Dict):
+        """阶段2：只对该股票运行交易策略"""
+        started = time.perf_counter()
+        key = (event['ts_code'], event['period_type'])
+        history = self.price_history.get(key) or []
+        signals = []
+        if len(history) >= self.min_signal_bars:
+            df = pd.DataFrame(list(history))
+            df['datetime'] = pd.to_datetime(df['datetime'])
+            indicators_data = {name: list(values) for name, values in self.indicator_history.get(key, {}).items()}
+            signals = self.signal_engine.evaluate_strategies(
+                df, indicators_data, event['ts_code'], event['period_type'], self.strategies
+            )
+            if signals and self.persist_signals:
+                success, message = TradingSignal.batch_insert(signals)
+                if not success:
+                    logger.error(f"保存信号失败: {message}")
+        event['signals'] = json.loads(json.dumps(signals, default=_json_default))
+        self.latency['signal'].observe(time.perf_counter() - started)
+        self.bus.publish(SIGNAL_TOPIC, event)
+
+    def _on_signals(self, event: Dict):
+        """阶段3：检查持有该股票的持仓"""
+        started = time.perf_counter()
+        result = self.risk_manager.check_stock_positions(event['ts_code'], event['bar']['close'])
+        event['alerts'] = json.loads(json.dumps(result['alerts'], default=_json_default))
+        self.latency['risk'].observe(time.perf_counter() - started)
+        self.bus.publish(RISK_TOPIC, event)
+
+    def _on_risk(self, event: Dict):
+        """阶段4：定向推送"""
+        started = time.perf_counter()
+        try:
+            self.emitter(event)
+        finally:
+            finished = time.perf_counter()
+            self.latency['push'].observe(finished - started)
+            self.latency['end_to_end'].observe(time.time() - event['ingested_at'])
+
+    def get_latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段和端到端的延迟分布"""
+        return {stage: histogram.snapshot() for stage, histogram in self.latency.items()}
+
+    def start(self, app=None):
+        """启动总线的后台消费线程，并接收入库路径发布的新K线"""
+        register_ingest_bus(self.bus)
+        self.bus.start(app)
+
+    def stop(self):
+        unregister_ingest_bus(self.bus)
+        self.bus.stop()
+
+
+class FakeBarFeed:
+    """本地模拟行情源：按交易时段生成随机游走的分钟K线并发布到管道，用于测试"""
+
+    def __init__(self, ts_codes: List[str], start: datetime = None, period_minutes: int = 1,
+                 base_price: float = 10.0, volatility: float = 0.002, seed: int = 0):
+        self.ts_codes = list(ts_codes)
+        self.current = start or datetime.combine(date.today(), MORNING_OPEN)
+        self.period_minutes = period_minutes
+        self.volatility = volatility
+        self.rng = np.random.default_rng(seed)
+        self.prices = {ts_code: base_price for ts_code in self.ts_codes}
+
+    def _advance(self):
+        """前进一个周期，跳过午间休市、收盘后时间和周末"""
+        step = timedelta(minutes=self.period_minutes)
+        self.current += step
+        clock = self.current.time()
+        if MORNING_CLOSE < clock <= AFTERNOON_OPEN:
+            self.current = datetime.combine(self.current.date(), AFTERNOON_OPEN) + step
+        elif clock > AFTERNOON_CLOSE:
+            next_day = self.current.date() + timedelta(days=1)
+            while next_day.weekday() >= 5:
+                next_day += timedelta(days=1)
+            self.current = datetime.combine(next_day, MORNING_OPEN) + step
+
+    def next_bars(self) -> List[Dict]:
+        """生成所有股票的下一根K线"""
+        self._advance()
+        bars = []
+        for ts_code in self.ts_codes:
+            open_price = self.prices[ts_code]
+            close = open_price * (1 + self.rng.normal(0, self.volatility))
+            high = max(open_price, close) * (1 + abs(self.rng.normal(0, self.volatility / 2)))
+            low = min(open_price, close) * (1 - abs(self.rng.normal(0, self.volatility / 2)))
+            volume = float(self.rng.integers(1000, 100000))
+            self.prices[ts_code] = close
+            bars.append({'ts_code': ts_code, 'datetime': self.current, 'open': open_price, 'high': high,
+                         'low': low, 'close': close, 'volume': volume, 'amount': volume * close})
+        return bars
+
+    def run(self, pipeline: RealtimePipeline, n_bars: int, period_type: str = '1min',
+            interval: float = 0, drain: bool = True) -> int:
+        """
+        发布 n_bars 个周期的K线
+
+        Args:
+            interval: 每个周期之间的等待秒数
+            drain: 是否在当前线程同步处理事件（未启动后台消费线程时使用）
+        """
+        published = 0
+        for _ in range(n_bars):
+            for bar in self.next_bars():
+                pipeline.publish_bar(bar['ts_code'], period_type, bar)
+                published += 1
+            if drain:
+                while pipeline.bus.process_pending():
+                    pass
+            if interval:
+                time.sleep(interval)
+        return published
@@ -32,6 +32,7 @@ class RealtimeRiskManager:
             'correlation_limit': 0.80,  # 相关性限制
             'drawdown_limit': 0.15  # 最大回撤限制
         }
+        self.price_query_batch = 500  # 价格查询每批股票数
     
     def calculate_portfolio_risk(self, portfolio_id: str, period_days: int = 252) -> Dict:
         """计算投资组合风险指标"""
@@ -114,10 +115,11 @@ class RealtimeRiskManager:
             
             risk_positions = []
             alerts = []
+            current_prices = self._get_current_prices([position.ts_code for position in positions])
             
             for position in positions:
                 # 更新当前价格
-                current_price = self._get_current_price(position.ts_code)
+                current_price = current_prices.get(position.ts_code)
                 if current_price:
                     position.update_market_data(current_price)
                 
@@ -149,6 +151,36 @@ class RealtimeRiskManager:
             logger.error(f"监控持仓风险失败: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def check_stock_positions(self, ts_code: str, current_price: float) -> Dict:
+        """
+        单只股票价格更新后，只检查持有该股票的持仓（事件驱动推送使用）
+        
+        Returns:
+            {'position_risks': [...], 'alerts': [...]}，预警中带 portfolio_id
+        """
+        try:
+            positions = PortfolioPosition.query.filter_by(ts_code=ts_code, is_active=True).all()
+            
+            position_risks = []
+            alerts = []
+            for position in positions:
+                if current_price:
+                    position.update_market_data(current_price)
+                
+                position_risk = self._analyze_position_risk(position)
+                position_risk['portfolio_id'] = position.portfolio_id
+                position_risks.append(position_risk)
+                
+                for alert in self._check_position_alerts(position):
+                    alert['portfolio_id'] = position.portfolio_id
+                    alerts.append(alert)
+            
+            return {'position_risks': position_risks, 'alerts': alerts}
+            
+        except Exception as e:
+            logger.error(f"检查 {ts_code} 持仓风险失败: {str(e)}")
+            return {'position_risks': [], 'alerts': []}
+    
     def manage_stop_loss_take_profit(self, portfolio_id: str, 
                                    stop_loss_method: str = 'percentage',
                                    stop_loss_value: float = 0.10,
@@ -331,45 +363,47 @@ class RealtimeRiskManager:
             return {'success': False, 'message': str(e)}
     
     def _get_price_data(self, stock_codes: List[str], start_date: datetime, end_date: datetime) -> pd.DataFrame:
-        """获取价格数据"""
+        """
+        获取价格数据：按批一次查询全部持仓的60分钟收盘价，取每日最后一根作为日收盘价
+
+        Returns:
+            日期为索引、股票为列的收盘价宽表（前向填充缺失值）
+        """
         try:
-            # 查询分钟数据，聚合为日数据
-            price_data = []
-            
-            for ts_code in stock_codes:
-                data = StockMinuteData.query.filter(
-                    StockMinuteData.ts_code == ts_code,
+            frames = []
+            for offset in range(0, len(stock_codes), self.price_query_batch):
+                batch = stock_codes[offset:offset + self.price_query_batch]
+                query = db.session.query(
+                    StockMinuteData.ts_code, StockMinuteData.datetime, StockMinuteData.close
+                ).filter(
+                    StockMinuteData.ts_code.in_(batch),
                     StockMinuteData.period_type == '60min',  # 使用小时数据
                     StockMinuteData.datetime >= start_date,
                     StockMinuteData.datetime <= end_date
-                ).order_by(StockMinuteData.datetime).all()
-                
-                if data:
-                    df = pd.DataFrame([{
-                        'datetime': d.datetime,
-                        'close': d.close,
-                        'ts_code': d.ts_code
-                    } for d in data])
-                    
-                    # 按日期聚合
-                    df['date'] = df['datetime'].dt.date
-                    daily_data = df.groupby('date')['close'].last().reset_index()
-                    daily_data['ts_code'] = ts_code
-                    price_data.append(daily_data)
-            
-            if price_data:
-                # 合并所有股票数据
-                all_data = pd.concat(price_data, ignore_index=True)
-                # 透视表，日期为索引，股票为列
-                pivot_data = all_data.pivot(index='date', columns='ts_code', values='close')
-                return pivot_data.fillna(method='ffill')
+                )
+                frames.append(pd.read_sql(query.statement, db.engine))
             
-            return pd.DataFrame()
+            all_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            if all_data.empty:
+                return pd.DataFrame()
+            
+            all_data['datetime'] = pd.to_datetime(all_data['datetime'])
+            all_data['date'] = all_data['datetime'].dt.date
+            # 按日期聚合：每只股票每天最后一根K线的收盘价
+            daily_data = all_data.sort_values('datetime').drop_duplicates(['ts_code', 'date'], keep='last')
+            # 透视表，日期为索引，股票为列
+            pivot_data = daily_data.pivot(index='date', columns='ts_code', values='close')
+            return pivot_data.ffill()
             
         except Exception as e:
             logger.error(f"获取价格数据失败: {str(e)}")
             return pd.DataFrame()
     
+    def _portfolio_returns(self, returns: pd.DataFrame, weights: Dict) -> pd.Series:
+        """组合收益率 R @ w（权重按收益率列对齐，无价格数据的持仓不计入）"""
+        weight_vector = pd.Series(weights, dtype=float).reindex(returns.columns).fillna(0.0).values
+        return pd.Series(returns.values @ weight_vector, index=returns.index)
+    
     def _get_portfolio_weights(self, positions: List[PortfolioPosition]) -> Dict[str, float]:
         """获取组合权重"""
         total_value = sum(pos.market_value or 0 for pos in positions)
@@ -386,10 +420,7 @@ class RealtimeRiskManager:
         """计算风险指标"""
         try:
             # 组合收益率
-            portfolio_returns = pd.Series(0, index=returns.index)
-            for ts_code, weight in weights.items():
-                if ts_code in returns.columns:
-                    portfolio_returns += returns[ts_code] * weight
+            portfolio_returns = self._portfolio_returns(returns, weights)
             
             # 基础统计
             annual_return = portfolio_returns.mean() * 252
@@ -426,10 +457,7 @@ class RealtimeRiskManager:
         """计算VaR和CVaR"""
         try:
             # 组合收益率
-            portfolio_returns = pd.Series(0, index=returns.index)
-            for ts_code, weight in weights.items():
-                if ts_code in returns.columns:
-                    portfolio_returns += returns[ts_code] * weight
+            portfolio_returns = self._portfolio_returns(returns, weights)
             
             var_metrics = {}
             
@@ -454,25 +482,25 @@ class RealtimeRiskManager:
         try:
             corr_matrix = returns.corr()
             
+            pair_values = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)]
+            
             # 计算平均相关性
-            avg_correlation = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)].mean()
-            
-            # 找出高相关性股票对
-            high_corr_pairs = []
-            for i in range(len(corr_matrix.columns)):
-                for j in range(i+1, len(corr_matrix.columns)):
-                    corr_value = corr_matrix.iloc[i, j]
-                    if abs(corr_value) > self.risk_thresholds['correlation_limit']:
-                        high_corr_pairs.append({
-                            'stock1': corr_matrix.columns[i],
-                            'stock2': corr_matrix.columns[j],
-                            'correlation': corr_value
-                        })
+            avg_correlation = pair_values.mean()
+            
+            # 找出高相关性股票对（上三角掩码，不含对角线）
+            values = corr_matrix.values
+            upper = np.triu(np.ones(values.shape, dtype=bool), k=1)
+            rows, cols = np.nonzero(upper & (np.abs(values) > self.risk_thresholds['correlation_limit']))
+            columns = corr_matrix.columns
+            high_corr_pairs = [
+                {'stock1': columns[i], 'stock2': columns[j], 'correlation': values[i, j]}
+                for i, j in zip(rows, cols)
+            ]
             
             return {
                 'average_correlation': avg_correlation,
-                'max_correlation': corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)].max(),
-                'min_correlation': corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)].min(),
+                'max_correlation': pair_values.max(),
+                'min_correlation': pair_values.min(),
                 'high_correlation_pairs': high_corr_pairs,
                 'correlation_matrix': corr_matrix.to_dict()
             }
@@ -489,10 +517,7 @@ class RealtimeRiskManager:
             market_returns = returns.mean(axis=1)
             
             # 组合收益率
-            portfolio_returns = pd.Series(0, index=returns.index)
-            for ts_code, weight in weights.items():
-                if ts_code in returns.columns:
-                    portfolio_returns += returns[ts_code] * weight
+            portfolio_returns = self._portfolio_returns(returns, weights)
             
             # 计算Beta
             covariance = np.cov(portfolio_returns, market_returns)[0, 1]
@@ -550,6 +575,27 @@ class RealtimeRiskManager:
             logger.error(f"获取 {ts_code} 当前价格失败: {str(e)}")
             return None
     
+    def _get_current_prices(self, stock_codes: List[str]) -> Dict[str, float]:
+        """批量获取当前价格（每只股票最新一根K线的收盘价）"""
+        try:
+            prices = {}
+            for offset in range(0, len(stock_codes), self.price_query_batch):
+                batch = stock_codes[offset:offset + self.price_query_batch]
+                latest = db.session.query(
+                    StockMinuteData.ts_code,
+                    func.max(StockMinuteData.datetime).label('datetime')
+                ).filter(StockMinuteData.ts_code.in_(batch)).group_by(StockMinuteData.ts_code).subquery()
+                rows = db.session.query(StockMinuteData.ts_code, StockMinuteData.close).join(
+                    latest,
+                    (StockMinuteData.ts_code == latest.c.ts_code) & (StockMinuteData.datetime == latest.c.datetime)
+                ).all()
+                prices.update({ts_code: close for ts_code, close in rows})
+            return prices
+            
+        except Exception as e:
+            logger.error(f"批量获取当前价格失败: {str(e)}")
+            return {}
+    
     def _analyze_position_risk(self, position: PortfolioPosition) -> Dict:
         """分析单个持仓风险"""
         try:
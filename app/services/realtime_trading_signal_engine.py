@@ -12,6 +12,7 @@ import logging
 
 from app.models.trading_signal import TradingSignal
 from app.models.realtime_indicator import RealtimeIndicator
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide, WIDE_INDICATOR_COLUMNS
 from app.models.stock_minute_data import StockMinuteData
 from app.services.realtime_indicator_engine import RealtimeIndicatorEngine
 
@@ -81,16 +82,7 @@ class RealtimeTradingSignalEngine:
                 strategies = list(self.strategies.keys())
             
             # 生成信号
-            signals = []
-            for strategy_name in strategies:
-                if strategy_name in self.strategies:
-                    try:
-                        strategy_signals = self.strategies[strategy_name](
-                            df, indicators_data, ts_code, period_type
-                        )
-                        signals.extend(strategy_signals)
-                    except Exception as e:
-                        logger.error(f"策略 {strategy_name} 生成信号失败: {str(e)}")
+            signals = self.evaluate_strategies(df, indicators_data, ts_code, period_type, strategies)
             
             # 保存信号到数据库
             if signals:
@@ -114,18 +106,57 @@ class RealtimeTradingSignalEngine:
             logger.error(f"生成交易信号失败: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def evaluate_strategies(self, df: pd.DataFrame, indicators_data: Dict, ts_code: str,
+                            period_type: str, strategies: List[str] = None) -> List[Dict]:
+        """
+        对已准备好的价格和指标数据运行策略，不访问数据库
+        
+        Args:
+            df: 按时间升序的K线 DataFrame
+            indicators_data: {指标名: [{'datetime', 'value1'..'value4'}]}
+            strategies: 策略列表，默认全部
+        """
+        signals = []
+        for strategy_name in strategies or list(self.strategies.keys()):
+            if strategy_name in self.strategies:
+                try:
+                    strategy_signals = self.strategies[strategy_name](
+                        df, indicators_data, ts_code, period_type
+                    )
+                    signals.extend(strategy_signals)
+                except Exception as e:
+                    logger.error(f"策略 {strategy_name} 生成信号失败: {str(e)}")
+        return signals
+    
     def _get_indicators_data(self, ts_code: str, period_type: str, 
                            start_time: datetime, end_time: datetime) -> Dict:
-        """获取技术指标数据"""
-        indicators = RealtimeIndicator.query.filter(
+        """
+        获取技术指标数据
+        宽表一次范围读取；实时引擎仍写入长表，长表中比宽表最新时间更新的指标接在宽表数据之后，
+        宽表没有数据时全部读取长表
+        """
+        indicators_dict = {}
+        long_start = start_time
+        try:
+            arrays = RealtimeIndicatorWide.read_arrays(ts_code, period_type, start_time, end_time)
+            if len(arrays['datetime']) > 0:
+                indicators_dict = self._indicators_from_wide(arrays)
+                long_start = pd.Timestamp(arrays['datetime'][-1]).to_pydatetime()
+        except Exception as e:
+            logger.warning(f"读取指标宽表失败，改为读取长表: {str(e)}")
+        
+        query = RealtimeIndicator.query.filter(
             RealtimeIndicator.ts_code == ts_code,
             RealtimeIndicator.period_type == period_type,
-            RealtimeIndicator.datetime >= start_time,
             RealtimeIndicator.datetime <= end_time
-        ).order_by(RealtimeIndicator.datetime.asc()).all()
+        )
+        if indicators_dict:
+            query = query.filter(RealtimeIndicator.datetime > long_start)
+        else:
+            query = query.filter(RealtimeIndicator.datetime >= long_start)
+        indicators = query.order_by(RealtimeIndicator.datetime.asc()).all()
         
         # 按指标名称分组
-        indicators_dict = {}
         for indicator in indicators:
             if indicator.indicator_name not in indicators_dict:
                 indicators_dict[indicator.indicator_name] = []
@@ -140,6 +171,27 @@ class RealtimeTradingSignalEngine:
         
         return indicators_dict
     
+    def _indicators_from_wide(self, arrays: Dict[str, np.ndarray]) -> Dict:
+        """将宽表数组转换为与长表相同的 {指标名: [{'datetime', 'value1'..'value4'}]} 结构"""
+        datetimes = pd.to_datetime(arrays['datetime']).to_pydatetime()
+        indicators_dict = {}
+        for name, columns in WIDE_INDICATOR_COLUMNS.items():
+            values = [arrays[column] for column in columns]
+            present = np.flatnonzero(~np.isnan(values[0]))
+            if len(present) == 0:
+                continue
+            # NaN 转为 None，与长表中的空值一致
+            columns_values = [np.where(np.isnan(v), None, v.astype(np.float64)).tolist() for v in values]
+            columns_values += [[None] * len(values[0])] * (4 - len(columns_values))
+            indicators_dict[name] = [{
+                'datetime': datetimes[i],
+                'value1': columns_values[0][i],
+                'value2': columns_values[1][i],
+                'value3': columns_values[2][i],
+                'value4': columns_values[3][i]
+            } for i in present]
+        return indicators_dict
+    
     def _ma_crossover_strategy(self, df: pd.DataFrame, indicators: Dict, 
                               ts_code: str, period_type: str) -> List[Dict]:
         """移动平均线交叉策略"""
@@ -0,0 +1,411 @@
+"""
+结构化因子风险模型
+协方差分解为 Σ = B F Bᵀ + diag(D)：B 为行业哑变量和风格因子（规模、动量、波动率、短期反转）暴露，
+F 为逐日截面回归得到的因子收益的协方差，D 为回归残差的特异方差。
+每个估计日只使用该日及之前的数据（时点一致），估计结果按日期持久化到 risk_model_snapshot，
+组合优化按日期时点查询，并直接使用低秩加对角形式，内存和求解耗时随股票数线性增长
+"""
+
+import io
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import StockBasic, StockDailyHistory
+from app.models.risk_model_snapshot import RiskModelSnapshot
+from app.services.market_aggregation import UNKNOWN_INDUSTRY
+from app.utils.columnar_store import read_daily_table
+from app.utils.market_calendar import to_date
+
+STYLE_FACTORS = ['size', 'momentum', 'volatility', 'reversal']
+
+# 短期反转和波动率的窗口（交易日）
+REVERSAL_WINDOW = 21
+VOLATILITY_WINDOW = 60
+
+
+class FactorRiskModel:
+    """低秩加对角协方差 Σ = B F Bᵀ + diag(D)"""
+
+    def __init__(self, trade_date, ts_codes, factor_names: List[str], exposures: np.ndarray,
+                 factor_cov: np.ndarray, specific_var: np.ndarray):
+        """
+        Args:
+            trade_date: 估计日期
+            ts_codes: 股票代码 (N)
+            factor_names: 因子名称 (K)
+            exposures: 因子暴露 B (N, K)
+            factor_cov: 因子协方差 F (K, K)
+            specific_var: 特异方差 D (N)
+        """
+        self.trade_date = trade_date
+        self.ts_codes = pd.Index(ts_codes)
+        self.factor_names = list(factor_names)
+        self.exposures = np.asarray(exposures, dtype=np.float64).reshape(len(self.ts_codes), len(self.factor_names))
+        self.factor_cov = np.asarray(factor_cov, dtype=np.float64).reshape(len(self.factor_names),
+                                                                          len(self.factor_names))
+        self.specific_var = np.asarray(specific_var, dtype=np.float64)
+        self._loadings = None
+
+    @classmethod
+    def diagonal(cls, ts_codes, variance: float = 1.0, trade_date=None) -> 'FactorRiskModel':
+        """没有可用数据时的退化模型：只有特异方差"""
+        return cls(trade_date, ts_codes, [], np.zeros((len(ts_codes), 0)), np.zeros((0, 0)),
+                   np.full(len(ts_codes), variance))
+
+    @classmethod
+    def from_covariance(cls, covariance: pd.DataFrame, trade_date=None) -> 'FactorRiskModel':
+        """由稠密协方差矩阵构造（B 为单位矩阵、D 为0），兼容调用方直接传入的协方差"""
+        codes = list(covariance.index)
+        return cls(trade_date, codes, codes, np.eye(len(codes)), covariance.to_numpy(dtype=np.float64),
+                   np.zeros(len(codes)))
+
+    def __len__(self):
+        return len(self.ts_codes)
+
+    @property
+    def loadings(self) -> np.ndarray:
+        """因子载荷 L = B·F^½ (N, K)，满足 B F Bᵀ = L Lᵀ"""
+        if self._loadings is None:
+            if self.factor_cov.size == 0:
+                self._loadings = np.zeros((len(self.ts_codes), 0))
+            else:
+                values, vectors = np.linalg.eigh((self.factor_cov + self.factor_cov.T) / 2)
+                self._loadings = self.exposures @ (vectors * np.sqrt(np.clip(values, 0, None)))
+        return self._loadings
+
+    def subset(self, ts_codes) -> 'FactorRiskModel':
+        """按给定股票顺序取子模型；模型中没有的股票取平均暴露，特异方差取中位数"""
+        ts_codes = list(ts_codes)
+        positions = self.ts_codes.get_indexer(ts_codes)
+        missing = positions < 0
+        take = np.where(missing, 0, positions)
+        exposures = self.exposures[take] if len(self.ts_codes) else np.zeros((len(ts_codes), len(self.factor_names)))
+        specific = self.specific_var[take] if len(self.ts_codes) else np.ones(len(ts_codes))
+        if missing.any() and len(self.ts_codes):
+            exposures[missing] = self.exposures.mean(axis=0)
+            specific[missing] = np.median(self.specific_var)
+        return FactorRiskModel(self.trade_date, ts_codes, self.factor_names, exposures, self.factor_cov, specific)
+
+    def covariance(self) -> np.ndarray:
+        """稠密协方差矩阵 (N, N)，只用于小规模组合或兼容旧接口"""
+        loadings = self.loadings
+        return loadings @ loadings.T + np.diag(self.specific_var)
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.covariance(), index=self.ts_codes, columns=self.ts_codes)
+
+    def dot(self, weights: np.ndarray) -> np.ndarray:
+        """Σ·w（支持 (N,) 或 (N, M)），复杂度 O(N·K)"""
+        weights = np.asarray(weights, dtype=np.float64)
+        specific = self.specific_var if weights.ndim == 1 else self.specific_var[:, None]
+        return self.loadings @ (self.loadings.T @ weights) + specific * weights
+
+    def portfolio_variance(self, weights: np.ndarray) -> float:
+        """wᵀ Σ w"""
+        weights = np.asarray(weights, dtype=np.float64)
+        factor_part = self.loadings.T @ weights
+        return float(factor_part @ factor_part + np.sum(self.specific_var * weights ** 2))
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            ts_codes=np.array(list(self.ts_codes), dtype=str),
+            factor_names=np.array(self.factor_names, dtype=str),
+            exposures=self.exposures,
+            factor_cov=self.factor_cov,
+            specific_var=self.specific_var
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes, trade_date=None) -> 'FactorRiskModel':
+        arrays = np.load(io.BytesIO(payload), allow_pickle=False)
+        return cls(trade_date, arrays['ts_codes'].tolist(), arrays['factor_names'].tolist(),
+                   arrays['exposures'], arrays['factor_cov'], arrays['specific_var'])
+
+
+def _standardize(values: np.ndarray) -> np.ndarray:
+    """截面标准化并截断到 ±3，缺失为0"""
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if finite.sum() < 2:
+        return np.zeros_like(values)
+    std = values[finite].std()
+    if std == 0:
+        return np.zeros_like(values)
+    scored = np.clip((values - values[finite].mean()) / std, -3, 3)
+    return np.where(finite, scored, 0.0)
+
+
+class RiskModelService:
+    """因子风险模型的估计、持久化与按日期时点查询"""
+
+    def __init__(self, model_name: str = 'default', lookback_days: int = 252, halflife: float = 90,
+                 specific_shrinkage: float = 20, cache_size: int = 16):
+        """
+        Args:
+            model_name: 模型名称（快照表主键的一部分）
+            lookback_days: 估计窗口（交易日）
+            halflife: 因子协方差和特异方差的指数加权半衰期（交易日）
+            specific_shrinkage: 特异方差向截面中位数收缩的先验观测数
+            cache_size: 进程内缓存的模型个数
+        """
+        self.model_name = model_name
+        self.lookback_days = lookback_days
+        self.halflife = halflife
+        self.specific_shrinkage = specific_shrinkage
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def effective_date(self, as_of) -> Optional[date]:
+        """as_of 当日或之前最近的交易日"""
+        value = db.session.query(func.max(StockDailyHistory.trade_date)).filter(
+            StockDailyHistory.trade_date <= to_date(as_of)
+        ).scalar()
+        return to_date(value) if value is not None else None
+
+    def _load_returns(self, end: date, ts_codes: List[str] = None):
+        """读取 end 及之前 lookback_days+1 个交易日的收盘价，返回 (股票代码, 日收益率矩阵 (T, N))"""
+        start = end - timedelta(days=int(self.lookback_days * 1.6) + 10)
+        prices = read_daily_table('stock_daily_history', start, end, ts_codes,
+                                  columns=['ts_code', 'trade_date', 'close'])
+        if prices.empty:
+            return pd.Index([]), np.empty((0, 0))
+
+        price_dates = pd.to_datetime(prices['trade_date'])
+        dates = pd.DatetimeIndex(price_dates.unique()).sort_values()
+        codes = pd.Index(prices['ts_code'].unique()).sort_values()
+        close = np.full((len(dates), len(codes)), np.nan)
+        close[dates.get_indexer(price_dates), codes.get_indexer(prices['ts_code'])] = \
+            pd.to_numeric(prices['close'], errors='coerce').to_numpy(dtype=np.float64)
+        close = close[-(self.lookback_days + 1):]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = close[1:] / close[:-1] - 1
+        returns[~np.isfinite(returns)] = np.nan
+        return codes, returns
+
+    def _load_industries(self, ts_codes: pd.Index) -> np.ndarray:
+        rows = db.session.query(StockBasic.ts_code, StockBasic.industry).filter(
+            StockBasic.ts_code.in_(list(ts_codes))
+        ).all()
+        industry = dict(rows)
+        return np.array([industry.get(code) or UNKNOWN_INDUSTRY for code in ts_codes], dtype=object)
+
+    def _load_size(self, ts_codes: pd.Index, end: date) -> np.ndarray:
+        """end 当日或之前最近一期的对数总市值，没有数据时为NaN"""
+        try:
+            basic = read_daily_table('stock_daily_basic', end - timedelta(days=20), end, list(ts_codes),
+                                     columns=['ts_code', 'trade_date', 'total_mv'])
+        except Exception as e:
+            logger.warning(f"读取市值数据失败，规模因子置零: {e}")
+            return np.full(len(ts_codes), np.nan)
+        if basic.empty:
+            return np.full(len(ts_codes), np.nan)
+        latest = basic.sort_values('trade_date').groupby('ts_code')['total_mv'].last()
+        total_mv = pd.to_numeric(latest.reindex(ts_codes), errors='coerce').to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total_mv > 0, np.log(total_mv), np.nan)
+
+    def _exposures(self, ts_codes: pd.Index, returns: np.ndarray, end: date):
+        """行业哑变量 + 标准化风格暴露 (N, K)"""
+        industries = self._load_industries(ts_codes)
+        industry_names = sorted(set(industries))
+        industry_exposure = (industries[:, None] == np.array(industry_names, dtype=object)[None, :]).astype(np.float64)
+
+        log_returns = np.log1p(np.nan_to_num(returns, nan=0.0))
+        styles = {
+            'size': self._load_size(ts_codes, end),
+            'momentum': log_returns[:-REVERSAL_WINDOW].sum(axis=0) if len(returns) > REVERSAL_WINDOW
+            else np.zeros(len(ts_codes)),
+            'volatility': np.nanstd(returns[-VOLATILITY_WINDOW:], axis=0),
+            'reversal': log_returns[-REVERSAL_WINDOW:].sum(axis=0)
+        }
+        style_exposure = np.column_stack([_standardize(styles[name]) for name in STYLE_FACTORS])
+        return (np.hstack([industry_exposure, style_exposure]),
+                [f'industry:{name}' for name in industry_names] + STYLE_FACTORS)
+
+    @staticmethod
+    def _factor_returns(returns: np.ndarray, exposures: np.ndarray):
+        """逐日截面最小二乘：r_t = B f_t + e_t，返回因子收益 (T, K) 和残差 (T, N)"""
+        n_days, n_factors = len(returns), exposures.shape[1]
+        gram = exposures.T @ exposures
+        ridge = 1e-8 * max(np.trace(gram) / max(n_factors, 1), 1.0) * np.eye(n_factors)
+        factor_returns = np.full((n_days, n_factors), np.nan)
+
+        complete = ~np.isnan(returns).any(axis=1)
+        if complete.any():
+            # 当日全部股票都有收益率时共用同一个投影矩阵
+            factor_returns[complete] = np.linalg.solve(gram + ridge, exposures.T @ returns[complete].T).T
+        for t in np.flatnonzero(~complete):
+            mask = ~np.isnan(returns[t])
+            if mask.sum() <= n_factors:
+                continue
+            observed = exposures[mask]
+            factor_returns[t] = np.linalg.solve(observed.T @ observed + ridge, observed.T @ returns[t, mask])
+
+        residuals = returns - np.nan_to_num(factor_returns) @ exposures.T
+        residuals[np.isnan(factor_returns).any(axis=1)] = np.nan
+        return factor_returns, residuals
+
+    def _decay_weights(self, n_days: int) -> np.ndarray:
+        return 0.5 ** (np.arange(n_days)[::-1] / self.halflife)
+
+    def estimate(self, trade_date, ts_codes: List[str] = None) -> Optional[FactorRiskModel]:
+        """
+        用 trade_date 及之前 lookback_days 个交易日的数据估计风险模型
+
+        Args:
+            trade_date: 估计日期
+            ts_codes: 股票范围，默认全市场
+
+        Returns:
+            FactorRiskModel，数据不足时返回 None
+        """
+        end = to_date(trade_date)
+        codes, returns = self._load_returns(end, ts_codes)
+        if len(codes) < 2 or len(returns) < 2:
+            return None
+
+        observations = (~np.isnan(returns)).sum(axis=0)
+        valid = observations >= max(2, min(60, len(returns) // 2))
+        if valid.sum() < 2:
+            return None
+        codes, returns, observations = codes[valid], returns[:, valid], observations[valid]
+
+        exposures, factor_names = self._exposures(codes, returns, end)
+        factor_returns, residuals = self._factor_returns(returns, exposures)
+        weights = self._decay_weights(len(returns))
+
+        usable = ~np.isnan(factor_returns).any(axis=1)
+        if usable.sum() < 2:
+            return None
+        day_weights = weights[usable] / weights[usable].sum()
+        deviation = factor_returns[usable] - day_weights @ factor_returns[usable]
+        factor_cov = (deviation * day_weights[:, None]).T @ deviation
+
+        observed = ~np.isnan(residuals)
+        stock_weights = weights[:, None] * observed
+        specific_var = (stock_weights * np.nan_to_num(residuals) ** 2).sum(axis=0) / \
+            np.maximum(stock_weights.sum(axis=0), 1e-12)
+        # 观测少的股票向截面中位数收缩
+        median = float(np.median(specific_var))
+        specific_var = (observations * specific_var + self.specific_shrinkage * median) / \
+            (observations + self.specific_shrinkage)
+        specific_var = np.maximum(specific_var, 0.1 * median if median > 0 else 1e-8)
+
+        logger.info(f"风险模型估计完成: {end}, {len(codes)} 只股票, {len(factor_names)} 个因子, "
+                    f"{len(returns)} 个交易日")
+        return FactorRiskModel(end, codes, factor_names, exposures, factor_cov, specific_var)
+
+    def save(self, model: FactorRiskModel):
+        """写入（覆盖）当日快照"""
+        db.session.merge(RiskModelSnapshot(
+            trade_date=to_date(model.trade_date),
+            model_name=self.model_name,
+            n_stocks=len(model.ts_codes),
+            n_factors=len(model.factor_names),
+            payload=model.to_bytes(),
+            created_at=datetime.now()
+        ))
+        db.session.commit()
+
+    def load_as_of(self, as_of) -> Optional[FactorRiskModel]:
+        """as_of 当日或之前最近的快照"""
+        snapshot = RiskModelSnapshot.query.filter(
+            RiskModelSnapshot.model_name == self.model_name,
+            RiskModelSnapshot.trade_date <= to_date(as_of)
+        ).order_by(RiskModelSnapshot.trade_date.desc()).first()
+        if snapshot is None:
+            return None
+        return FactorRiskModel.from_bytes(snapshot.payload, to_date(snapshot.trade_date))
+
+    def _remember(self, key, model):
+        with self._lock:
+            self._cache[key] = model
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get_risk_model(self, as_of=None, ts_codes: List[str] = None, max_age_days: int = 0,
+                       persist: bool = True) -> Optional[FactorRiskModel]:
+        """
+        按日期时点取风险模型
+
+        优先使用 as_of 之前最近的快照：快照日期与 as_of 之前最近交易日相差不超过 max_age_days 天时直接使用，
+        否则只用该交易日及之前的数据重新估计并持久化。
+        进程内缓存按 as_of 之前最近的交易日（而不是 as_of 本身）区分，当日行情入库后同一个 as_of
+        会落到新的交易日并重新取模型
+
+        Args:
+            as_of: 查询日期，默认为今天
+            ts_codes: 需要的股票（按该顺序返回子模型），默认返回全部
+            max_age_days: 可接受的快照滞后天数
+            persist: 新估计的模型是否写入快照表
+
+        Returns:
+            FactorRiskModel，没有任何可用数据时返回 None
+        """
+        as_of = to_date(as_of or datetime.now())
+        effective = self.effective_date(as_of)
+        key = (effective, max_age_days)
+        model = self._cache.get(key) if effective is not None else None
+        if model is None:
+            model = self._resolve(as_of, effective, max_age_days, persist)
+            if model is not None and effective is not None:
+                self._remember(key, model)
+        if model is None or ts_codes is None:
+            return model
+        return model.subset(ts_codes)
+
+    def _resolve(self, as_of: date, effective: Optional[date], max_age_days: int,
+                 persist: bool) -> Optional[FactorRiskModel]:
+        snapshot = None
+        try:
+            snapshot = self.load_as_of(as_of)
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"读取风险模型快照失败: {e}")
+
+        if effective is None:
+            return snapshot
+        if snapshot is not None and (effective - snapshot.trade_date).days <= max_age_days:
+            return snapshot
+
+        model = self.estimate(effective)
+        if model is None:
+            return snapshot
+        if persist:
+            try:
+                self.save(model)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"保存风险模型快照失败: {e}")
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_service: Optional[RiskModelService] = None
+_service_lock = threading.Lock()
+
+
+def get_risk_model_service() -> RiskModelService:
+    """获取全局风险模型服务（进程内共享模型缓存）"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RiskModelService()
+    return _service
@@ -6,6 +6,7 @@ from loguru import logger
 
 from app.extensions import db
 from app.models import FactorValues, MLPredictions, StockBasic
+from app.utils.columnar_store import read_daily_table
 
 
 class StockScoringEngine:
@@ -18,22 +19,19 @@ class StockScoringEngine:
             'ml_ensemble': self._ml_ensemble_scoring,
             'rank_ic': self._rank_ic_scoring
         }
+        # 股票基本信息缓存 {ts_code: info}，查询过但不存在的股票记为 None
+        self.stock_info_cache = {}
     
     def calculate_factor_scores(self, trade_date: str, factor_list: List[str] = None,
                                ts_codes: List[str] = None) -> pd.DataFrame:
         """计算因子分数"""
         try:
-            # 构建查询
-            query = FactorValues.query.filter(FactorValues.trade_date == trade_date)
-            
-            if factor_list:
-                query = query.filter(FactorValues.factor_id.in_(factor_list))
-            
-            if ts_codes:
-                query = query.filter(FactorValues.ts_code.in_(ts_codes))
-            
-            # 获取因子数据
-            factor_data = pd.read_sql(query.statement, db.engine)
+            # 获取因子数据（优先读取本地列式缓存）
+            factor_data = read_daily_table(
+                'factor_values', trade_date, trade_date, ts_codes,
+                columns=['ts_code', 'factor_id', 'z_score'],
+                filters={'factor_id': factor_list}
+            )
             
             if factor_data.empty:
                 logger.warning(f"未找到因子数据: {trade_date}")
@@ -213,21 +211,23 @@ class StockScoringEngine:
             return scores
     
     def _get_stock_info(self, ts_codes: List[str]) -> Dict[str, Dict[str, Any]]:
-        """获取股票基本信息"""
+        """获取股票基本信息（只查询缓存中没有的股票）"""
         try:
-            stocks = StockBasic.query.filter(StockBasic.ts_code.in_(ts_codes)).all()
-            
-            stock_info = {}
-            for stock in stocks:
-                stock_info[stock.ts_code] = {
-                    'symbol': stock.symbol,
-                    'name': stock.name,
-                    'area': stock.area,
-                    'industry': stock.industry,
-                    'list_date': stock.list_date.isoformat() if stock.list_date else None
-                }
+            missing_codes = [ts_code for ts_code in ts_codes if ts_code not in self.stock_info_cache]
+            if missing_codes:
+                stocks = StockBasic.query.filter(StockBasic.ts_code.in_(missing_codes)).all()
+                self.stock_info_cache.update({ts_code: None for ts_code in missing_codes})
+                for stock in stocks:
+                    self.stock_info_cache[stock.ts_code] = {
+                        'symbol': stock.symbol,
+                        'name': stock.name,
+                        'area': stock.area,
+                        'industry': stock.industry,
+                        'list_date': stock.list_date.isoformat() if stock.list_date else None
+                    }
             
-            return stock_info
+            return {ts_code: self.stock_info_cache[ts_code] for ts_code in ts_codes
+                    if self.stock_info_cache.get(ts_code) is not None}
             
         except Exception as e:
             logger.error(f"获取股票信息失败: {e}")
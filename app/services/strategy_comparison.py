@@ -0,0 +1,223 @@
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+from typing import List, Dict, Any, Optional
+
+from flask import Flask, current_app
+from loguru import logger
+
+from app.extensions import db
+from app.services.backtest_engine import BacktestEngine
+from app.services.backtest_panel import BacktestPricePanel
+
+
+# 工作进程内的回测引擎（挂载只读内存映射面板，进程内跨任务复用缓存）
+_worker_engine: Optional[BacktestEngine] = None
+_worker_context = None
+
+
+def _init_compare_worker(app_config: Dict[str, Any], panel_dir: str, panel_meta: Dict,
+                         stock_info: Dict, trade_days: Dict):
+    """工作进程初始化：建立独立的数据库连接，以内存映射方式打开共享面板"""
+    global _worker_engine, _worker_context
+    app = Flask(__name__)
+    app.config.update(app_config)
+    db.init_app(app)
+    _worker_context = app.app_context()
+    _worker_context.push()
+
+    engine = BacktestEngine()
+    engine.panel = BacktestPricePanel.open_arrays(panel_dir, panel_meta)
+    engine._get_scoring_engine().stock_info_cache = stock_info
+    engine.trade_day_cache = trade_days
+    _worker_engine = engine
+
+
+def _plan_selection(engine: BacktestEngine, selection_config: Dict[str, Any],
+                    optimization_configs: Dict[str, Dict], trade_dates: List) -> Dict:
+    """计算一种选股配置在各再平衡日的选股结果，以及该选股下各优化配置的目标权重"""
+    started = time.perf_counter()
+    selections = {}
+    weights = {opt_key: {} for opt_key in optimization_configs}
+    previous = {}
+    for trade_date in trade_dates:
+        selected = engine._get_stock_selection(selection_config, trade_date)
+        selections[str(trade_date)] = selected
+        if not selected:
+            continue
+        for opt_key, optimization_config in optimization_configs.items():
+            if engine.path_dependent(optimization_config):
+                # 依赖上一期权重的配置由各策略按自己的调仓序列计算
+                continue
+            previous[opt_key] = engine._get_target_weights(selected, optimization_config, trade_date,
+                                                           previous.get(opt_key))
+            weights[opt_key][str(trade_date)] = previous[opt_key]
+    return {
+        'selection_key': engine.selection_key(selection_config),
+        'selections': selections,
+        'weights': weights,
+        'seconds': time.perf_counter() - started
+    }
+
+
+def _plan_task(task: tuple) -> Dict:
+    """工作进程中计算一种选股配置的选股和权重"""
+    selection_config, optimization_configs, trade_dates = task
+    return _plan_selection(_worker_engine, selection_config, optimization_configs, trade_dates)
+
+
+def _run_strategy(engine: BacktestEngine, strategy: Dict[str, Any], start_date: str, end_date: str) -> Dict:
+    started = time.perf_counter()
+    result = engine.run_backtest(
+        strategy['config'], start_date, end_date,
+        strategy.get('initial_capital', 1000000.0),
+        strategy.get('rebalance_frequency', 'monthly')
+    )
+    return {'result': result, 'seconds': time.perf_counter() - started}
+
+
+def _strategy_task(task: tuple) -> Dict:
+    """工作进程中用预先计算的选股和权重回测单个策略"""
+    strategy, start_date, end_date, selection_cache, weight_cache = task
+    _worker_engine.selection_cache.update(selection_cache)
+    _worker_engine.weight_cache.update(weight_cache)
+    return _run_strategy(_worker_engine, strategy, start_date, end_date)
+
+
+class StrategyComparisonRunner:
+    """
+    多策略并行回测
+
+    主进程一次加载覆盖全部策略因子的价格/因子面板，写成 .npy 文件后由工作进程以只读内存映射方式共享；
+    第一阶段按选股配置分组并行计算每个再平衡日的选股和目标权重，同一 (选股配置, 日期) 只计算一次；
+    第二阶段把策略分发到进程池，用缓存的选股和权重完成再平衡模拟。总耗时接近最慢的单个策略而不是全部策略之和。
+    """
+
+    def __init__(self, engine: BacktestEngine = None, max_workers: int = None):
+        """
+        Args:
+            engine: 主进程使用的回测引擎，默认新建；运行期间占用其面板和缓存，不能与其他回测共享
+            max_workers: 工作进程数，默认为策略数与CPU核数中的较小值，不超过CPU核数；
+                         为1时在当前进程内串行（仍共享缓存）
+        """
+        self.engine = engine or BacktestEngine()
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _strategy_name(strategy: Dict[str, Any], index: int) -> str:
+        return strategy.get('name', f'Strategy_{index + 1}')
+
+    def _can_fork_database(self) -> bool:
+        """内存数据库无法被工作进程访问"""
+        url = db.engine.url
+        return not (url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:'))
+
+    def _load_shared_state(self, strategies: List[Dict[str, Any]], start_date: str, end_date: str) -> Dict:
+        """加载共享面板、股票信息和交易日，并按选股配置分组各策略的再平衡日与优化配置"""
+        engine = self.engine
+        engine.reset_caches()
+
+        factor_list = []
+        for strategy in strategies:
+            config = strategy['config']
+            if config.get('selection_method', 'factor_based') != 'ml_based':
+                factor_list.extend(f for f in config.get('factor_list', []) if f not in factor_list)
+        engine.panel = BacktestPricePanel.load(start_date, end_date, factor_list)
+        engine._get_scoring_engine()._get_stock_info(list(engine.panel.ts_codes))
+
+        groups = {}
+        for strategy in strategies:
+            config = strategy['config']
+            trade_dates = engine._generate_trade_dates(start_date, end_date,
+                                                       strategy.get('rebalance_frequency', 'monthly'))
+            group = groups.setdefault(engine.selection_key(config),
+                                      {'config': config, 'dates': set(), 'optimizations': {}})
+            group['dates'].update(trade_dates)
+            optimization_config = config.get('optimization', {})
+            group['optimizations'][engine.optimization_key(optimization_config)] = optimization_config
+        return groups
+
+    def _run_serial(self, strategies: List[Dict[str, Any]], start_date: str, end_date: str) -> List[Dict]:
+        return [_run_strategy(self.engine, strategy, start_date, end_date) for strategy in strategies]
+
+    def _run_parallel(self, strategies: List[Dict[str, Any]], start_date: str, end_date: str,
+                      groups: Dict, workers: int) -> List[Dict]:
+        engine = self.engine
+        app_config = {
+            'SQLALCHEMY_DATABASE_URI': db.engine.url.render_as_string(hide_password=False),
+            'SQLALCHEMY_ENGINE_OPTIONS': current_app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}),
+            'SQLALCHEMY_TRACK_MODIFICATIONS': False
+        }
+        with tempfile.TemporaryDirectory(prefix='backtest_panel_') as panel_dir:
+            panel_meta = engine.panel.save_arrays(panel_dir)
+            initargs = (app_config, panel_dir, panel_meta,
+                        engine._get_scoring_engine().stock_info_cache, engine.trade_day_cache)
+            with Pool(processes=workers, initializer=_init_compare_worker, initargs=initargs) as pool:
+                # 第一阶段：每种选股配置一个任务
+                plan_tasks = [(group['config'], group['optimizations'], sorted(group['dates']))
+                              for group in groups.values()]
+                plans = {plan['selection_key']: plan for plan in pool.map(_plan_task, plan_tasks, chunksize=1)}
+
+                # 第二阶段：每个策略一个任务，只携带自身选股配置和优化配置的缓存
+                strategy_tasks = []
+                for strategy in strategies:
+                    config = strategy['config']
+                    selection_key = engine.selection_key(config)
+                    opt_key = engine.optimization_key(config.get('optimization', {}))
+                    plan = plans[selection_key]
+                    selection_cache = {(selection_key, d): s for d, s in plan['selections'].items()}
+                    weight_cache = {(selection_key, opt_key, d): w for d, w in plan['weights'][opt_key].items()}
+                    strategy_tasks.append((strategy, start_date, end_date, selection_cache, weight_cache))
+                outcomes = pool.map(_strategy_task, strategy_tasks, chunksize=1)
+                pool.close()
+                pool.join()
+
+        for strategy, outcome in zip(strategies, outcomes):
+            # 策略耗时包含其选股配置的计算时间
+            outcome['seconds'] += plans[engine.selection_key(strategy['config'])]['seconds']
+        return outcomes
+
+    def run(self, strategies: List[Dict[str, Any]], start_date: str, end_date: str) -> Dict[str, Any]:
+        """
+        回测全部策略
+
+        Returns:
+            {'strategies': [{'strategy_name', 'result', 'wall_time'}], 'failed': [策略名],
+             'timing': {'total_seconds', 'strategy_seconds_sum', 'workers', 'selection_groups'}}
+        """
+        started = time.perf_counter()
+        workers = max(1, min(self.max_workers or len(strategies), os.cpu_count() or 1))
+        try:
+            groups = self._load_shared_state(strategies, start_date, end_date)
+            if workers > 1 and len(strategies) > 1 and self._can_fork_database():
+                outcomes = self._run_parallel(strategies, start_date, end_date, groups, workers)
+            else:
+                workers = 1
+                outcomes = self._run_serial(strategies, start_date, end_date)
+        finally:
+            self.engine.panel = None
+            self.engine.reset_caches()
+
+        results = []
+        failed = []
+        for i, (strategy, outcome) in enumerate(zip(strategies, outcomes)):
+            name = self._strategy_name(strategy, i)
+            if outcome['result'].get('success'):
+                results.append({'strategy_name': name, 'result': outcome['result'], 'wall_time': outcome['seconds']})
+            else:
+                failed.append(name)
+
+        total_seconds = time.perf_counter() - started
+        logger.info(f"策略比较完成: {len(strategies)} 个策略, {len(groups)} 种选股配置, {workers} 个进程, "
+                    f"耗时 {total_seconds:.2f} 秒")
+        return {
+            'strategies': results,
+            'failed': failed,
+            'timing': {
+                'total_seconds': total_seconds,
+                'strategy_seconds_sum': sum(outcome['seconds'] for outcome in outcomes),
+                'workers': workers,
+                'selection_groups': len(groups)
+            }
+        }
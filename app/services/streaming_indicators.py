@@ -0,0 +1,490 @@
+"""
+流式增量技术指标
+为每个 (ts_code, period_type) 维护指标的运行状态，每根新K线以O(1)代价更新，只产出新K线对应的指标行；
+状态支持快照与恢复，重启后无需全量重算
+"""
+
+import json
+import math
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from loguru import logger
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.indicator_stream_state import IndicatorStreamState
+
+logger = logger.bind(name=__name__)
+
+NAN = float('nan')
+
+
+def _ratio(numerator: float, denominator: float) -> float:
+    """除法，分母为0时与pandas一致：0/0为NaN，非0/0为±inf"""
+    if denominator == 0:
+        if numerator == 0 or math.isnan(numerator):
+            return NAN
+        return math.copysign(math.inf, numerator)
+    return numerator / denominator
+
+
+class _AdjustedEMA:
+    """与 pandas ewm(span, adjust=True).mean() 一致的递推EMA"""
+
+    def __init__(self, span: int = None, alpha: float = None):
+        self.alpha = alpha if alpha is not None else 2.0 / (span + 1)
+        self.numerator = 0.0
+        self.denominator = 0.0
+
+    def update(self, value: float) -> float:
+        decay = 1.0 - self.alpha
+        self.numerator = value + decay * self.numerator
+        self.denominator = 1.0 + decay * self.denominator
+        return self.numerator / self.denominator
+
+    def to_dict(self) -> Dict:
+        return {'alpha': self.alpha, 'numerator': self.numerator, 'denominator': self.denominator}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> '_AdjustedEMA':
+        ema = cls(alpha=data['alpha'])
+        ema.numerator = data['numerator']
+        ema.denominator = data['denominator']
+        return ema
+
+
+class _RollingWindow:
+    """固定长度滑动窗口，维护窗口和"""
+
+    def __init__(self, size: int, values: List[float] = None, total: float = None):
+        self.size = size
+        self.values = deque(values or [], maxlen=size)
+        self.total = total if total is not None else sum(self.values)
+
+    def push(self, value: float):
+        if len(self.values) == self.size:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.size
+
+    def mean(self) -> float:
+        return self.total / self.size if self.full else NAN
+
+    def std(self) -> float:
+        """样本标准差（ddof=1），窗口长度固定，按窗口重新计算以避免累计误差"""
+        if not self.full:
+            return NAN
+        mean = sum(self.values) / self.size
+        return math.sqrt(sum((v - mean) ** 2 for v in self.values) / (self.size - 1))
+
+    def mean_abs_deviation(self) -> float:
+        if not self.full:
+            return NAN
+        mean = sum(self.values) / self.size
+        return sum(abs(v - mean) for v in self.values) / self.size
+
+    def to_dict(self) -> Dict:
+        return {'size': self.size, 'values': list(self.values), 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> '_RollingWindow':
+        return cls(data['size'], data['values'], data.get('total'))
+
+
+class _RollingExtreme:
+    """单调队列维护的滑动窗口最大/最小值，均摊O(1)"""
+
+    def __init__(self, size: int, mode: str, items: List[Tuple[int, float]] = None, count: int = 0):
+        self.size = size
+        self.mode = mode
+        self.items = deque(tuple(item) for item in (items or []))
+        self.count = count
+
+    def push(self, value: float) -> float:
+        if self.mode == 'max':
+            while self.items and self.items[-1][1] <= value:
+                self.items.pop()
+        else:
+            while self.items and self.items[-1][1] >= value:
+                self.items.pop()
+        self.items.append((self.count, value))
+        self.count += 1
+        while self.items[0][0] <= self.count - 1 - self.size:
+            self.items.popleft()
+        return self.items[0][1] if self.count >= self.size else NAN
+
+    def to_dict(self) -> Dict:
+        return {'size': self.size, 'mode': self.mode, 'items': [list(item) for item in self.items],
+                'count': self.count}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> '_RollingExtreme':
+        return cls(data['size'], data['mode'], data['items'], data['count'])
+
+
+class StreamingIndicatorState:
+    """
+    单只股票单个周期的指标运行状态
+
+    输出口径与 RealtimeIndicatorEngine 的批量计算一致：MA/BOLL/CCI/WR/ATR 为滑动窗口，
+    EMA/MACD 与 pandas ewm(adjust=True) 一致，RSI 为Wilder平滑，KDJ 以50为初值递推。
+    """
+
+    def __init__(self, params: Dict):
+        self.params = params
+        self.bar_count = 0
+        self.last_datetime = None
+        self.prev_close = None
+
+        self.ma_windows = {p: _RollingWindow(p) for p in params['MA']['periods']}
+        self.emas = {p: _AdjustedEMA(p) for p in params['EMA']['periods']}
+
+        macd = params['MACD']
+        self.macd_fast = _AdjustedEMA(macd['fast'])
+        self.macd_slow = _AdjustedEMA(macd['slow'])
+        self.macd_signal = _AdjustedEMA(macd['signal'])
+
+        self.rsi_period = params['RSI']['period']
+        self.rsi_seed_gain = 0.0
+        self.rsi_seed_loss = 0.0
+        self.rsi_avg_gain = None
+        self.rsi_avg_loss = None
+
+        k_period = params['KDJ']['k_period']
+        self.kdj_high = _RollingExtreme(k_period, 'max')
+        self.kdj_low = _RollingExtreme(k_period, 'min')
+        self.kdj_k = 50.0
+        self.kdj_d = 50.0
+
+        self.boll_window = _RollingWindow(params['BOLL']['period'])
+        self.cci_window = _RollingWindow(params['CCI']['period'])
+
+        wr_period = params['WR']['period']
+        self.wr_high = _RollingExtreme(wr_period, 'max')
+        self.wr_low = _RollingExtreme(wr_period, 'min')
+
+        self.atr_window = _RollingWindow(params['ATR']['period'])
+        self.obv = 0.0
+
+    def update(self, bar: Dict) -> Dict[str, Tuple]:
+        """
+        用一根新K线更新状态
+
+        Args:
+            bar: 包含 datetime/high/low/close/volume 的K线
+
+        Returns:
+            {指标名: 值元组}，窗口未满的指标不返回
+        """
+        high, low, close = float(bar['high']), float(bar['low']), float(bar['close'])
+        volume = float(bar.get('volume') or 0)
+        index = self.bar_count
+        prev_close = self.prev_close
+        outputs = {}
+
+        # MA / EMA
+        for period, window in self.ma_windows.items():
+            window.push(close)
+            if window.full:
+                outputs[f'MA{period}'] = (window.mean(),)
+        for period, ema in self.emas.items():
+            value = ema.update(close)
+            if index >= period - 1:
+                outputs[f'EMA{period}'] = (value,)
+
+        # MACD
+        macd_line = self.macd_fast.update(close) - self.macd_slow.update(close)
+        signal_line = self.macd_signal.update(macd_line)
+        if index >= self.params['MACD']['slow'] - 1:
+            outputs['MACD'] = (macd_line, signal_line, macd_line - signal_line)
+
+        # RSI（Wilder平滑：前period个变化取均值作为初值，之后按 (n-1)/n 递推）
+        if prev_close is not None:
+            delta = close - prev_close
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            period = self.rsi_period
+            if self.rsi_avg_gain is None:
+                self.rsi_seed_gain += gain
+                self.rsi_seed_loss += loss
+                if index == period:
+                    self.rsi_avg_gain = self.rsi_seed_gain / period
+                    self.rsi_avg_loss = self.rsi_seed_loss / period
+            else:
+                self.rsi_avg_gain = (self.rsi_avg_gain * (period - 1) + gain) / period
+                self.rsi_avg_loss = (self.rsi_avg_loss * (period - 1) + loss) / period
+            if self.rsi_avg_gain is not None:
+                rs = _ratio(self.rsi_avg_gain, self.rsi_avg_loss)
+                outputs['RSI'] = (100 - 100 / (1 + rs),)
+
+        # KDJ
+        highest = self.kdj_high.push(high)
+        lowest = self.kdj_low.push(low)
+        if not math.isnan(highest):
+            rsv = _ratio(close - lowest, highest - lowest) * 100
+            if not math.isnan(rsv):
+                self.kdj_k = (2 / 3) * self.kdj_k + (1 / 3) * rsv
+                self.kdj_d = (2 / 3) * self.kdj_d + (1 / 3) * self.kdj_k
+                outputs['KDJ'] = (self.kdj_k, self.kdj_d, 3 * self.kdj_k - 2 * self.kdj_d)
+
+        # BOLL
+        self.boll_window.push(close)
+        if self.boll_window.full:
+            middle = self.boll_window.mean()
+            width = self.boll_window.std() * self.params['BOLL']['std_dev']
+            outputs['BOLL'] = (middle + width, middle, middle - width)
+
+        # CCI
+        typical_price = (high + low + close) / 3
+        self.cci_window.push(typical_price)
+        if self.cci_window.full:
+            outputs['CCI'] = (_ratio(typical_price - self.cci_window.mean(),
+                                     0.015 * self.cci_window.mean_abs_deviation()),)
+
+        # WR
+        wr_highest = self.wr_high.push(high)
+        wr_lowest = self.wr_low.push(low)
+        if not math.isnan(wr_highest):
+            outputs['WR'] = (_ratio(wr_highest - close, wr_highest - wr_lowest) * (-100),)
+
+        # ATR
+        true_range = high - low
+        if prev_close is not None:
+            true_range = max(true_range, abs(high - prev_close), abs(low - prev_close))
+        self.atr_window.push(true_range)
+        if self.atr_window.full:
+            outputs['ATR'] = (self.atr_window.mean(),)
+
+        # OBV
+        if prev_close is not None:
+            if close > prev_close:
+                self.obv += volume
+            elif close < prev_close:
+                self.obv -= volume
+        outputs['OBV'] = (self.obv,)
+
+        self.prev_close = close
+        self.bar_count += 1
+        self.last_datetime = pd.Timestamp(bar['datetime']).to_pydatetime()
+        return outputs
+
+    def to_dict(self) -> Dict:
+        """导出可JSON序列化的状态快照"""
+        return {
+            'params': self.params,
+            'bar_count': self.bar_count,
+            'last_datetime': self.last_datetime.isoformat() if self.last_datetime else None,
+            'prev_close': self.prev_close,
+            'ma_windows': {str(p): w.to_dict() for p, w in self.ma_windows.items()},
+            'emas': {str(p): e.to_dict() for p, e in self.emas.items()},
+            'macd': [self.macd_fast.to_dict(), self.macd_slow.to_dict(), self.macd_signal.to_dict()],
+            'rsi': [self.rsi_seed_gain, self.rsi_seed_loss, self.rsi_avg_gain, self.rsi_avg_loss],
+            'kdj': [self.kdj_high.to_dict(), self.kdj_low.to_dict(), self.kdj_k, self.kdj_d],
+            'boll': self.boll_window.to_dict(),
+            'cci': self.cci_window.to_dict(),
+            'wr': [self.wr_high.to_dict(), self.wr_low.to_dict()],
+            'atr': self.atr_window.to_dict(),
+            'obv': self.obv
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'StreamingIndicatorState':
+        """从快照恢复状态"""
+        state = cls(data['params'])
+        state.bar_count = data['bar_count']
+        state.last_datetime = datetime.fromisoformat(data['last_datetime']) if data['last_datetime'] else None
+        state.prev_close = data['prev_close']
+        state.ma_windows = {int(p): _RollingWindow.from_dict(w) for p, w in data['ma_windows'].items()}
+        state.emas = {int(p): _AdjustedEMA.from_dict(e) for p, e in data['emas'].items()}
+        state.macd_fast, state.macd_slow, state.macd_signal = [_AdjustedEMA.from_dict(e) for e in data['macd']]
+        state.rsi_seed_gain, state.rsi_seed_loss, state.rsi_avg_gain, state.rsi_avg_loss = data['rsi']
+        state.kdj_high = _RollingExtreme.from_dict(data['kdj'][0])
+        state.kdj_low = _RollingExtreme.from_dict(data['kdj'][1])
+        state.kdj_k, state.kdj_d = data['kdj'][2], data['kdj'][3]
+        state.boll_window = _RollingWindow.from_dict(data['boll'])
+        state.cci_window = _RollingWindow.from_dict(data['cci'])
+        state.wr_high = _RollingExtreme.from_dict(data['wr'][0])
+        state.wr_low = _RollingExtreme.from_dict(data['wr'][1])
+        state.atr_window = _RollingWindow.from_dict(data['atr'])
+        state.obv = data['obv']
+        return state
+
+
+class StreamingIndicatorEngine:
+    """流式增量指标引擎，管理多只股票多个周期的指标状态"""
+
+    def __init__(self, params: Dict = None, indicators: List[str] = None):
+        """
+        Args:
+            params: 指标参数，默认与 RealtimeIndicatorEngine 相同
+            indicators: 需要输出的指标（MA、EMA、MACD...），默认全部
+        """
+        from app.services.realtime_indicator_engine import DEFAULT_INDICATOR_PARAMS
+        self.params = params or DEFAULT_INDICATOR_PARAMS
+        self.indicators = set(indicators) if indicators else None
+        self.states: Dict[Tuple[str, str], StreamingIndicatorState] = {}
+
+    def _wanted(self, name: str) -> bool:
+        """输出名（如MA5、EMA12）是否属于需要的指标"""
+        if self.indicators is None:
+            return True
+        return name.rstrip('0123456789') in self.indicators
+
+    def get_state(self, ts_code: str, period_type: str) -> Optional[StreamingIndicatorState]:
+        return self.states.get((ts_code, period_type))
+
+    def update(self, ts_code: str, period_type: str, bar: Dict) -> List[Dict]:
+        """
+        处理一根新K线，返回该K线产出的指标行（RealtimeIndicator 格式）
+        时间不晚于已处理K线的重复数据会被忽略
+        """
+        key = (ts_code, period_type)
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = StreamingIndicatorState(self.params)
+
+        bar_time = pd.Timestamp(bar['datetime']).to_pydatetime()
+        if state.last_datetime is not None and bar_time <= state.last_datetime:
+            return []
+
+        rows = []
+        for name, values in state.update(bar).items():
+            if not self._wanted(name):
+                continue
+            values = [None if v is None or math.isnan(v) or math.isinf(v) else float(v) for v in values]
+            values += [None] * (4 - len(values))
+            rows.append({
+                'ts_code': ts_code,
+                'datetime': bar_time,
+                'period_type': period_type,
+                'indicator_name': name,
+                'value1': values[0],
+                'value2': values[1],
+                'value3': values[2],
+                'value4': values[3]
+            })
+        return rows
+
+    def update_many(self, ts_code: str, period_type: str, bars: pd.DataFrame) -> List[Dict]:
+        """按时间顺序处理多根K线"""
+        rows = []
+        for bar in bars.sort_values('datetime').to_dict('records'):
+            rows.extend(self.update(ts_code, period_type, bar))
+        return rows
+
+    def process_new_bars(self, ts_code: str, period_type: str, warmup_days: int = 30,
+                         save_snapshot: bool = False) -> Dict:
+        """
+        读取上次处理之后的新K线，增量更新状态并追加写入指标行
+
+        首次处理且无快照时，用最近 warmup_days 天的K线预热状态，
+        只写入晚于库中已有指标时间的行，不删除任何已有数据。
+        save_snapshot 为 True 时状态快照与指标行在同一事务中提交，避免快照落后于已写入的指标
+        导致重启后重复追加；写入失败时丢弃内存中的状态，下次从快照恢复重算。
+        """
+        try:
+            state = self.get_state(ts_code, period_type)
+            if state is None:
+                self.load_snapshots([ts_code], period_type)
+                state = self.get_state(ts_code, period_type)
+
+            if state is not None and state.last_datetime is not None:
+                start_time = state.last_datetime
+                stored_until = state.last_datetime
+            else:
+                start_time = datetime.now() - timedelta(days=warmup_days)
+                stored_until = db.session.query(func.max(RealtimeIndicator.datetime)).filter(
+                    RealtimeIndicator.ts_code == ts_code,
+                    RealtimeIndicator.period_type == period_type
+                ).scalar()
+
+            query = db.session.query(
+                StockMinuteData.datetime, StockMinuteData.high, StockMinuteData.low,
+                StockMinuteData.close, StockMinuteData.volume
+            ).filter(
+                StockMinuteData.ts_code == ts_code,
+                StockMinuteData.period_type == period_type,
+                StockMinuteData.datetime > start_time
+            ).order_by(StockMinuteData.datetime)
+            bars = pd.read_sql(query.statement, db.engine)
+            if bars.empty:
+                return {'success': True, 'new_bars': 0, 'stored_records': 0}
+
+            bars['datetime'] = pd.to_datetime(bars['datetime'])
+            rows = self.update_many(ts_code, period_type, bars)
+            if stored_until is not None:
+                rows = [row for row in rows if row['datetime'] > stored_until]
+
+            if save_snapshot:
+                try:
+                    if rows:
+                        db.session.bulk_insert_mappings(RealtimeIndicator, rows)
+                    db.session.merge(IndicatorStreamState(**self._snapshot_record(ts_code, period_type)))
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.states.pop((ts_code, period_type), None)
+                    logger.error(f"追加指标数据失败: {ts_code} {period_type}, 错误: {str(e)}")
+                    return {'success': False, 'message': str(e)}
+            elif rows:
+                success, message = RealtimeIndicator.batch_insert(rows)
+                if not success:
+                    logger.error(f"追加指标数据失败: {message}")
+                    return {'success': False, 'message': message}
+
+            return {'success': True, 'new_bars': len(bars), 'stored_records': len(rows),
+                    'last_datetime': self.get_state(ts_code, period_type).last_datetime.isoformat()}
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"增量计算指标失败: {ts_code} {period_type}, 错误: {str(e)}")
+            return {'success': False, 'message': str(e)}
+
+    def snapshot(self, keys: List[Tuple[str, str]] = None) -> Dict[str, Dict]:
+        """导出状态快照 {"ts_code|period_type": state}"""
+        keys = keys or list(self.states.keys())
+        return {f'{ts_code}|{period_type}': self.states[(ts_code, period_type)].to_dict()
+                for ts_code, period_type in keys if (ts_code, period_type) in self.states}
+
+    def restore(self, snapshots: Dict[str, Dict]):
+        """从快照恢复状态"""
+        for key, data in snapshots.items():
+            ts_code, period_type = key.split('|', 1)
+            self.states[(ts_code, period_type)] = StreamingIndicatorState.from_dict(data)
+
+    def _snapshot_record(self, ts_code: str, period_type: str) -> Dict:
+        """一只股票的状态快照行（indicator_stream_state 表结构）"""
+        state = self.states[(ts_code, period_type)]
+        return {
+            'ts_code': ts_code,
+            'period_type': period_type,
+            'last_datetime': state.last_datetime,
+            'state': json.dumps(state.to_dict()),
+            'updated_at': datetime.now()
+        }
+
+    def save_snapshots(self, keys: List[Tuple[str, str]] = None) -> int:
+        """将状态快照持久化到 indicator_stream_state 表"""
+        keys = keys or list(self.states.keys())
+        records = [self._snapshot_record(ts_code, period_type)
+                   for ts_code, period_type in keys if (ts_code, period_type) in self.states]
+        return IndicatorStreamState.save_states(records)
+
+    def load_snapshots(self, ts_codes: List[str] = None, period_type: str = None) -> int:
+        """从 indicator_stream_state 表恢复状态，参数不一致的快照会被忽略"""
+        loaded = 0
+        for record in IndicatorStreamState.load_states(ts_codes, period_type):
+            data = json.loads(record.state)
+            if data.get('params') != json.loads(json.dumps(self.params)):
+                continue
+            self.states[(record.ts_code, record.period_type)] = StreamingIndicatorState.from_dict(data)
+            loaded += 1
+        return loaded
@@ -1,14 +1,16 @@
 """
 WebSocket推送服务
-提供定时数据推送和事件触发推送功能
+提供定时数据推送和事件触发推送功能；事件驱动模式下行情、指标、信号和风险预警由实时管道按K线定向推送
 """
 
 import logging
 import threading
 import time
+from contextlib import nullcontext
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import json
+import pandas as pd
 
 from app.extensions import db
 from app.models.stock_minute_data import StockMinuteData
@@ -20,6 +22,8 @@ from app.services.realtime_indicator_engine import RealtimeIndicatorEngine
 from app.services.realtime_trading_signal_engine import RealtimeTradingSignalEngine
 from app.services.realtime_monitor_service import RealtimeMonitorService
 from app.services.realtime_risk_manager import RealtimeRiskManager
+from app.services.realtime_pipeline import RealtimePipeline, InProcessEventBus, broadcast_pipeline_event
+from app.services.market_snapshot import get_snapshot_store
 from app.websocket.websocket_events import (
     broadcast_market_data, broadcast_indicators, broadcast_signals,
     broadcast_monitor_data, broadcast_risk_alert, broadcast_portfolio_update,
@@ -28,6 +32,10 @@ from app.websocket.websocket_events import (
 
 logger = logging.getLogger(__name__)
 
+# 事件驱动模式下由实时管道推送、不再定时轮询的数据类型；
+# 行情只由管道推送到个股房间，全局房间仍定时推送活跃股票概览（管道不向全局房间转发每根K线）
+EVENT_DRIVEN_TYPES = {'indicators', 'signals', 'risk_alerts'}
+
 
 class WebSocketPushService:
     """WebSocket推送服务"""
@@ -57,13 +65,38 @@ class WebSocketPushService:
         
         # 缓存上次推送时间
         self.last_push_times = {}
+        
+        # 事件驱动管道（event 模式下创建），启动时用最近K线预热的活跃股票数
+        self.pipeline = None
+        self.warm_up_limit = 500
     
-    def start_push_service(self):
-        """启动推送服务"""
+    def start_push_service(self, mode: str = 'polling', bus=None, app=None):
+        """
+        启动推送服务
+        
+        Args:
+            mode: 'polling' 全部定时轮询；'event' 行情/指标/信号/风险预警由实时管道按新K线推送，
+                  其余数据类型仍定时推送
+            bus: event 模式使用的事件总线，默认进程内总线；多进程部署传入
+                 RedisStreamEventBus(partitions=N, assigned_partitions=[本进程的分区])，
+                 分区数与入库进程的 REALTIME_PIPELINE_PARTITIONS 一致
+            app: Flask应用，用于管道消费线程的应用上下文
+        """
         if self.is_running:
             logger.warning("推送服务已在运行")
             return
         
+        if mode == 'event':
+            self.pipeline = RealtimePipeline(
+                bus=bus or InProcessEventBus(),
+                signal_engine=self.signal_engine,
+                risk_manager=self.risk_manager,
+                emitter=self._push_pipeline_event
+            )
+            self._warm_up_pipeline(app)
+            self.pipeline.start(app)
+            logger.info("实时事件管道已启动")
+        
         self.is_running = True
         self.push_thread = threading.Thread(target=self._push_loop, daemon=True)
         self.push_thread.start()
@@ -74,8 +107,48 @@ class WebSocketPushService:
         self.is_running = False
         if self.push_thread:
             self.push_thread.join(timeout=5)
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
         logger.info("WebSocket推送服务已停止")
     
+    def publish_bars(self, bars, period_type: str = '1min') -> int:
+        """发布不经过分钟数据入库的K线到实时管道（仅 event 模式有效，入库路径会自动发布）"""
+        if not self.pipeline:
+            return 0
+        if isinstance(bars, dict):
+            bars = [bars]
+        bars = pd.DataFrame(bars)
+        get_snapshot_store(period_type).update_bars(bars)
+        return self.pipeline.publish_bars(bars, period_type)
+    
+    def _warm_up_pipeline(self, app=None):
+        """用活跃股票最近的K线预热管道的指标状态和信号历史，启动后的第一根新K线即有指标和信号"""
+        try:
+            with app.app_context() if app is not None else nullcontext():
+                ts_codes = self.monitor_service._get_active_stocks(limit=self.warm_up_limit)
+                bus = self.pipeline.bus
+                if hasattr(bus, 'partition_of'):
+                    # 分区部署时只预热本进程消费的股票
+                    assigned = set(bus.assigned_partitions)
+                    ts_codes = [ts_code for ts_code in ts_codes if bus.partition_of(ts_code) in assigned]
+                bars = self.pipeline.warm_up(ts_codes) if ts_codes else 0
+            logger.info(f"实时事件管道预热完成: {len(ts_codes)} 只股票, {bars} 根K线")
+        except Exception as e:
+            logger.error(f"实时事件管道预热失败: {e}")
+    
+    def _push_pipeline_event(self, event: Dict):
+        """实时管道的推送阶段：只推送到触发事件的股票房间"""
+        bar = dict(event['bar'], ts_code=event['ts_code'])
+        snapshot = get_snapshot_store(event['period_type']).get(event['ts_code'])
+        if snapshot and snapshot['datetime'].isoformat() == bar['datetime']:
+            bar.update(name=snapshot['name'], prev_close=snapshot['prev_close'],
+                       change_pct=round(snapshot['change_pct'], 2))
+        else:
+            bar['change_pct'] = self._calculate_change_pct(bar)
+        broadcast_pipeline_event(dict(event, bar=bar))
+        self.last_push_times['pipeline'] = datetime.now()
+    
     def _push_loop(self):
         """推送循环"""
         while self.is_running:
@@ -86,6 +159,8 @@ class WebSocketPushService:
                 for data_type, config in self.push_config.items():
                     if not config['enabled']:
                         continue
+                    if self.pipeline and data_type in EVENT_DRIVEN_TYPES:
+                        continue
                     
                     last_push = self.last_push_times.get(data_type)
                     if (not last_push or 
@@ -105,7 +180,8 @@ class WebSocketPushService:
         """推送指定类型的数据"""
         try:
             if data_type == 'market_data':
-                self._push_market_data()
+                # 事件驱动模式下个股房间由管道推送，这里只推送全局房间
+                self._push_market_data(stock_rooms=self.pipeline is None)
             elif data_type == 'indicators':
                 self._push_indicators()
             elif data_type == 'signals':
@@ -122,34 +198,37 @@ class WebSocketPushService:
         except Exception as e:
             logger.error(f"推送{data_type}数据失败: {e}")
     
-    def _push_market_data(self):
-        """推送市场数据"""
+    def _push_market_data(self, stock_rooms: bool = True):
+        """推送市场数据（活跃股票到全局房间，stock_rooms 为 True 时同时推送到个股房间）"""
         try:
-            # 获取活跃股票列表
-            active_stocks = self.data_manager.get_active_stocks()
+            # 获取活跃股票列表，从行情快照批量读取最新数据
+            active_stocks = self.monitor_service._get_active_stocks(limit=20)  # 限制推送数量
+            snapshots = get_snapshot_store('1min').ensure_loaded(active_stocks)
             
-            for stock in active_stocks[:20]:  # 限制推送数量
-                ts_code = stock['ts_code']
+            for ts_code in active_stocks:
+                snapshot = snapshots.get(ts_code)
+                if not snapshot:
+                    continue
                 
-                # 获取最新数据
-                latest_data = self.data_manager.get_latest_data(ts_code, '1min', 1)
-                if latest_data:
-                    market_data = {
-                        'ts_code': ts_code,
-                        'datetime': latest_data[0]['datetime'],
-                        'open': latest_data[0]['open'],
-                        'high': latest_data[0]['high'],
-                        'low': latest_data[0]['low'],
-                        'close': latest_data[0]['close'],
-                        'volume': latest_data[0]['volume'],
-                        'amount': latest_data[0]['amount'],
-                        'change_pct': self._calculate_change_pct(latest_data[0])
-                    }
-                    
+                market_data = {
+                    'ts_code': ts_code,
+                    'name': snapshot['name'],
+                    'datetime': snapshot['datetime'].isoformat(),
+                    'open': snapshot['open'],
+                    'high': snapshot['high'],
+                    'low': snapshot['low'],
+                    'close': snapshot['close'],
+                    'volume': snapshot['volume'],
+                    'amount': snapshot['amount'],
+                    'prev_close': snapshot['prev_close'],
+                    'change_pct': round(snapshot['change_pct'], 2)
+                }
+                
+                if stock_rooms:
                     broadcast_market_data(ts_code, market_data)
-                    broadcast_market_data('all', market_data)  # 广播到全局房间
+                broadcast_market_data('all', market_data)  # 广播到全局房间
             
-            logger.debug(f"推送市场数据完成，股票数量: {len(active_stocks)}")
+            logger.debug(f"推送市场数据完成，股票数量: {len(snapshots)}")
             
         except Exception as e:
             logger.error(f"推送市场数据失败: {e}")
@@ -232,12 +311,12 @@ class WebSocketPushService:
         try:
             # 获取监控数据
             monitor_data = {
-                'market_overview': self.monitor_service.get_market_overview(),
+                'market_overview': self.data_manager.get_market_overview(),
                 'top_movers': self.monitor_service.get_top_movers(limit=10),
                 'anomalies': self.monitor_service.detect_anomalies(
                     change_threshold=5.0, volume_threshold=3.0
                 ),
-                'sentiment': self.monitor_service.calculate_market_sentiment(period_hours=1)
+                'sentiment': self.monitor_service.get_market_sentiment(period_hours=1)
             }
             
             broadcast_monitor_data(monitor_data)
@@ -372,6 +451,8 @@ class WebSocketPushService:
         """获取推送状态"""
         return {
             'is_running': self.is_running,
+            'mode': 'event' if self.pipeline else 'polling',
+            'pipeline_latency': self.pipeline.get_latency_stats() if self.pipeline else None,
             'push_interval': self.push_interval,
             'push_config': self.push_config,
             'last_push_times': {
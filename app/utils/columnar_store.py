@@ -0,0 +1,381 @@
+"""
+日线面板数据的本地列式缓存
+将 stock_daily_history、stock_daily_basic、factor_values 按年/月分区写成Parquet文件，
+读取时按日期范围裁剪分区，并下推股票代码、列投影和过滤条件；每日同步后追加新分区。
+数据库写入后通过 invalidate_daily_table 使对应月份失效，读取前再用 COUNT/MAX 核对缓存与数据库一致
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+import pandas as pd
+from loguru import logger
+from sqlalchemy import Numeric, func
+
+from app.extensions import db
+from app.models import StockDailyHistory, StockDailyBasic, FactorValues
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    pa = None
+    pq = None
+
+
+# 缓存的数据表：表名 -> (模型, 日期字段)
+COLUMNAR_TABLES = {
+    'stock_daily_history': (StockDailyHistory, 'trade_date'),
+    'stock_daily_basic': (StockDailyBasic, 'trade_date'),
+    'factor_values': (FactorValues, 'trade_date'),
+}
+
+DEFAULT_STORE_DIR = os.getenv('COLUMNAR_STORE_DIR', os.path.join('data', 'columnar'))
+
+MANIFEST_FILE = '_manifest.json'
+
+
+def _to_date(value) -> date:
+    """将字符串或datetime统一转换为date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _month_bounds(year: int, month: int) -> tuple:
+    """月份的第一天和最后一天"""
+    first = date(year, month, 1)
+    last = (date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)) - timedelta(days=1)
+    return first, last
+
+
+def _month_key(year: int, month: int) -> str:
+    return f'{year}-{month:02d}'
+
+
+def _partition_rows(entry) -> int:
+    """分区清单项的行数（兼容旧版清单只记录行数的格式）"""
+    return int(entry['rows']) if isinstance(entry, dict) else int(entry)
+
+
+def _is_stale(entry) -> bool:
+    return isinstance(entry, dict) and entry.get('stale', False)
+
+
+def _month_range(start: date, end: date) -> List[tuple]:
+    """区间覆盖的 (年, 月) 列表"""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class ColumnarStore:
+    """按年/月分区的Parquet列式存储"""
+
+    def __init__(self, root: str = None):
+        self.root = root or DEFAULT_STORE_DIR
+
+    @property
+    def available(self) -> bool:
+        return PYARROW_AVAILABLE
+
+    def _table_dir(self, table: str) -> str:
+        return os.path.join(self.root, table)
+
+    def _partition_path(self, table: str, year: int, month: int) -> str:
+        return os.path.join(self._table_dir(table), f'year={year}', f'month={month:02d}', 'data.parquet')
+
+    def load_manifest(self, table: str) -> Dict[str, Any]:
+        """读取表的分区清单"""
+        path = os.path.join(self._table_dir(table), MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, table: str, manifest: Dict[str, Any]):
+        os.makedirs(self._table_dir(table), exist_ok=True)
+        path = os.path.join(self._table_dir(table), MANIFEST_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def covers(self, table: str, start_date, end_date, verify: bool = True) -> bool:
+        """
+        缓存是否完整覆盖给定日期范围：范围内每个月份都已导出且未失效；
+        verify 时再用一次 COUNT/MAX 聚合核对这些月份在数据库中的行数和最新日期，
+        捕获绕过 invalidate 的写入（外部导入脚本、历史回补等）
+        """
+        if not self.available:
+            return False
+        partitions = self.load_manifest(table).get('partitions', {})
+        months = _month_range(_to_date(start_date), _to_date(end_date))
+        keys = [_month_key(year, month) for year, month in months]
+        if not keys or any(key not in partitions or _is_stale(partitions[key]) for key in keys):
+            return False
+        if not verify:
+            return True
+
+        model, date_field = COLUMNAR_TABLES[table]
+        date_column = getattr(model, date_field)
+        db_rows, db_max = db.session.query(func.count(), func.max(date_column)).filter(
+            date_column >= _month_bounds(*months[0])[0],
+            date_column <= _month_bounds(*months[-1])[1]
+        ).one()
+        cached_rows = sum(_partition_rows(partitions[key]) for key in keys)
+        entries = [partitions[key] for key in keys if isinstance(partitions[key], dict)]
+        cached_max = max((_to_date(e['max_date']) for e in entries if e.get('max_date')), default=None)
+        # 旧版清单没有逐月的最新日期，只核对行数
+        max_mismatch = len(entries) == len(keys) and (_to_date(db_max) if db_max else None) != cached_max
+        if db_rows != cached_rows or max_mismatch:
+            logger.info(f"列式缓存与数据库不一致，回退到数据库: {table} {keys[0]}~{keys[-1]}, "
+                        f"缓存 {cached_rows} 行, 数据库 {db_rows} 行")
+            return False
+        return True
+
+    def invalidate(self, table: str, dates) -> int:
+        """
+        数据库写入后将覆盖这些日期的月份分区标记为失效（读取回退到数据库，下次 refresh 时重建）
+
+        Returns:
+            失效的分区数
+        """
+        partitions = self.load_manifest(table).get('partitions', {})
+        if not partitions:
+            return 0
+        written = pd.to_datetime(pd.Series(list(dates)).drop_duplicates(), errors='coerce').dropna()
+        stale = sorted(key for key in {_month_key(d.year, d.month) for d in written}
+                       if key in partitions and not _is_stale(partitions[key]))
+        if stale:
+            for key in stale:
+                entry = partitions[key]
+                partitions[key] = dict(entry, stale=True) if isinstance(entry, dict) else {'rows': entry, 'stale': True}
+            self._save_manifest(table, self._manifest(table, partitions))
+            logger.info(f"列式缓存分区失效: {table}, {stale}")
+        return len(stale)
+
+    def _manifest(self, table: str, partitions: Dict[str, Any]) -> Dict[str, Any]:
+        """由分区清单生成表清单，min_date/max_date 为缓存数据中实际的最早/最晚日期"""
+        entries = [entry for entry in partitions.values() if isinstance(entry, dict)]
+        min_dates = [entry['min_date'] for entry in entries if entry.get('min_date')]
+        max_dates = [entry['max_date'] for entry in entries if entry.get('max_date')]
+        return {
+            'table': table,
+            'min_date': min(min_dates) if min_dates else None,
+            'max_date': max(max_dates) if max_dates else None,
+            'partitions': dict(sorted(partitions.items())),
+            'updated_at': datetime.now().isoformat()
+        }
+
+    def _normalize_frame(self, table: str, df: pd.DataFrame) -> pd.DataFrame:
+        """统一列类型：DECIMAL转为float64，日期列转为date"""
+        model, date_field = COLUMNAR_TABLES[table]
+        df = df.copy()
+        for column in model.__table__.columns:
+            if column.name not in df.columns:
+                continue
+            if isinstance(column.type, Numeric):
+                df[column.name] = pd.to_numeric(df[column.name], errors='coerce').astype('float64')
+        df[date_field] = pd.to_datetime(df[date_field]).dt.date
+        return df
+
+    def write_partition(self, table: str, year: int, month: int, df: pd.DataFrame) -> int:
+        """整体写入（覆盖）一个月的分区，先写临时文件再原子替换"""
+        path = self._partition_path(table, year, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _, date_field = COLUMNAR_TABLES[table]
+
+        df = self._normalize_frame(table, df).sort_values(['ts_code', date_field]).reset_index(drop=True)
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = path + '.tmp'
+        pq.write_table(arrow_table, tmp_path, compression='zstd', row_group_size=100000)
+        os.replace(tmp_path, path)
+        return len(df)
+
+    def _query_month(self, table: str, start: date, end: date) -> pd.DataFrame:
+        """从数据库读取一段日期的全部行"""
+        model, date_field = COLUMNAR_TABLES[table]
+        date_column = getattr(model, date_field)
+        query = model.query.filter(date_column >= start, date_column <= end)
+        return pd.read_sql(query.statement, db.engine)
+
+    def export_range(self, table: str, start_date, end_date) -> Dict[str, Any]:
+        """
+        将数据库中一段日期的数据按月导出为分区（已存在的分区会被覆盖）
+
+        Returns:
+            {'partitions': 写入的分区数, 'rows': 写入行数}
+        """
+        return self._export_months(table, _month_range(_to_date(start_date), _to_date(end_date)))
+
+    def _export_months(self, table: str, months: List[tuple]) -> Dict[str, Any]:
+        """按整月从数据库重建分区，清单记录每个月实际的行数和日期范围（无数据的月份也记录为已覆盖）"""
+        if not self.available:
+            raise RuntimeError('pyarrow未安装，无法使用列式缓存')
+
+        _, date_field = COLUMNAR_TABLES[table]
+        partitions = self.load_manifest(table).get('partitions', {})
+        written_rows = 0
+        written_partitions = 0
+
+        for year, month in months:
+            # 分区总是按整月重建，保证与数据库一致
+            df = self._query_month(table, *_month_bounds(year, month))
+            entry = {'rows': 0, 'min_date': None, 'max_date': None}
+            if not df.empty:
+                rows = self.write_partition(table, year, month, df)
+                trade_dates = pd.to_datetime(df[date_field])
+                entry = {'rows': rows, 'min_date': trade_dates.min().date().isoformat(),
+                         'max_date': trade_dates.max().date().isoformat()}
+                written_rows += rows
+                written_partitions += 1
+            partitions[_month_key(year, month)] = entry
+
+        self._save_manifest(table, self._manifest(table, partitions))
+
+        logger.info(f"列式缓存导出完成: {table}, {written_partitions} 个分区, {written_rows} 行")
+        return {'partitions': written_partitions, 'rows': written_rows}
+
+    def refresh(self, tables: List[str] = None, initial_start: str = None) -> Dict[str, Dict[str, Any]]:
+        """
+        每日同步后刷新缓存：重建已失效的月份和最后一个已缓存月份，并追加之后的新分区
+
+        Args:
+            tables: 需要刷新的表，默认全部
+            initial_start: 表尚未缓存时的导出起始日期，默认为当年1月1日
+        """
+        results = {}
+        today = date.today()
+        for table in tables or list(COLUMNAR_TABLES.keys()):
+            try:
+                partitions = self.load_manifest(table).get('partitions', {})
+                if partitions:
+                    cached = sorted(partitions)
+                    first = _to_date(f'{cached[0]}-01')
+                    last = _to_date(f'{cached[-1]}-01')
+                    # 失效或缺失的月份，以及最后一个已缓存月份到当前月份
+                    months = [(y, m) for y, m in _month_range(first, last)[:-1]
+                              if _month_key(y, m) not in partitions or _is_stale(partitions[_month_key(y, m)])]
+                    months += _month_range(last, today)
+                else:
+                    start = _to_date(initial_start) if initial_start else date(today.year, 1, 1)
+                    months = _month_range(start, today)
+                results[table] = self._export_months(table, months)
+            except Exception as e:
+                logger.error(f"刷新列式缓存失败: {table}, 错误: {e}")
+                results[table] = {'error': str(e)}
+        return results
+
+    def read(self, table: str, start_date=None, end_date=None, ts_codes: List[str] = None,
+             columns: List[str] = None, filters: Dict[str, List[Any]] = None) -> pd.DataFrame:
+        """
+        读取缓存数据
+
+        Args:
+            table: 表名
+            start_date: 开始日期（含），用于裁剪分区和行过滤
+            end_date: 结束日期（含）
+            ts_codes: 股票代码列表
+            columns: 需要的列，默认全部
+            filters: 其他等值过滤条件 {列名: 取值列表}
+
+        Returns:
+            DataFrame，日期列为date类型
+        """
+        manifest = self.load_manifest(table)
+        partitions = manifest.get('partitions', {})
+        if not partitions or not manifest.get('min_date'):
+            return pd.DataFrame(columns=columns or [])
+
+        _, date_field = COLUMNAR_TABLES[table]
+        start = _to_date(start_date) if start_date else _to_date(manifest['min_date'])
+        end = _to_date(end_date) if end_date else _to_date(manifest['max_date'])
+
+        row_filters = [(date_field, '>=', start), (date_field, '<=', end)]
+        if ts_codes:
+            row_filters.append(('ts_code', 'in', list(ts_codes)))
+        for column, values in (filters or {}).items():
+            if values:
+                row_filters.append((column, 'in', list(values)))
+
+        read_columns = None
+        if columns:
+            # 过滤用到的列需要一并读取
+            read_columns = list(dict.fromkeys(list(columns) + [f[0] for f in row_filters]))
+
+        tables = []
+        for year, month in _month_range(start, end):
+            path = self._partition_path(table, year, month)
+            # 已失效的分区不再读取
+            key = _month_key(year, month)
+            if key not in partitions or _is_stale(partitions[key]) or not os.path.exists(path):
+                continue
+            tables.append(pq.read_table(path, columns=read_columns, filters=row_filters, memory_map=True))
+
+        if not tables:
+            return pd.DataFrame(columns=columns or [])
+
+        df = pa.concat_tables(tables, promote_options='default').to_pandas()
+        if 'ts_code' in df.columns and date_field in df.columns:
+            df = df.sort_values(['ts_code', date_field], kind='stable').reset_index(drop=True)
+        if columns:
+            df = df[columns]
+        return df
+
+
+_default_store = None
+
+
+def get_columnar_store() -> ColumnarStore:
+    """获取默认的列式缓存实例"""
+    global _default_store
+    if _default_store is None:
+        _default_store = ColumnarStore()
+    return _default_store
+
+
+def read_daily_table(table: str, start_date, end_date, ts_codes: List[str] = None,
+                     columns: List[str] = None, filters: Dict[str, List[Any]] = None) -> pd.DataFrame:
+    """
+    读取日线面板数据：缓存完整覆盖日期范围且与数据库一致时读本地Parquet，否则回退到数据库查询
+    参数含义同 ColumnarStore.read
+    """
+    store = get_columnar_store()
+    if store.covers(table, start_date, end_date):
+        try:
+            return store.read(table, start_date, end_date, ts_codes, columns, filters)
+        except Exception as e:
+            logger.warning(f"读取列式缓存失败，回退到数据库: {table}, 错误: {e}")
+
+    model, date_field = COLUMNAR_TABLES[table]
+    date_column = getattr(model, date_field)
+    entities = [getattr(model, c) for c in columns] if columns else [model]
+    query = db.session.query(*entities).filter(date_column >= start_date, date_column <= end_date)
+    if ts_codes:
+        query = query.filter(model.ts_code.in_(ts_codes))
+    for column, values in (filters or {}).items():
+        if values:
+            query = query.filter(getattr(model, column).in_(values))
+    query = query.order_by(model.ts_code, date_column)
+    return pd.read_sql(query.statement, db.engine)
+
+
+def invalidate_daily_table(table: str, dates):
+    """数据库写入日线数据后使列式缓存中对应月份失效（缓存不可用或未初始化时忽略）"""
+    store = get_columnar_store()
+    if table not in COLUMNAR_TABLES or not store.available:
+        return
+    try:
+        store.invalidate(table, dates)
+    except Exception as e:
+        logger.warning(f"列式缓存失效处理失败: {table}, 错误: {e}")
@@ -3,9 +3,12 @@
 适配Flask-SQLAlchemy系统，支持MySQL和SQLite双数据库
 """
 
+import time
+from contextlib import nullcontext
 import tushare as ts
 import pymysql
-from sqlalchemy import create_engine, text
+import pandas as pd
+from sqlalchemy import create_engine, text, Date, DateTime
 from app.extensions import db
 from config import Config
 import logging
@@ -135,3 +138,131 @@ class DatabaseUtils:
         except Exception as e:
             logger.error(f"创建分钟数据表失败: {e}")
             return False
+
+    @classmethod
+    def _build_upsert_sql(cls, dialect, table_name, columns, key_columns, update_columns):
+        """
+        按数据库方言生成批量写入语句
+        :return: 可直接用于 executemany 的SQL字符串
+        """
+        preparer = dialect.identifier_preparer
+        quoted_table = preparer.quote(table_name)
+        quoted_columns = ', '.join(preparer.quote(c) for c in columns)
+        placeholder = '?' if dialect.paramstyle == 'qmark' else '%s'
+        placeholders = ', '.join([placeholder] * len(columns))
+
+        if dialect.name == 'mysql':
+            # PyMySQL 的 executemany 会把 INSERT ... VALUES 改写为多行 VALUES
+            updates = ', '.join(f"{preparer.quote(c)} = VALUES({preparer.quote(c)})" for c in update_columns)
+            sql = f"INSERT INTO {quoted_table} ({quoted_columns}) VALUES ({placeholders})"
+            if updates:
+                sql += f" ON DUPLICATE KEY UPDATE {updates}"
+            return sql
+
+        if dialect.name in ('sqlite', 'postgresql'):
+            # SQLite 3.24+ 与 PostgreSQL 语法相同；只更新 update_columns，不像 INSERT OR REPLACE 那样
+            # 删除重插（会重置 created_at、未传入的字段和自增 id）
+            conflict = ', '.join(preparer.quote(c) for c in key_columns)
+            updates = ', '.join(f"{preparer.quote(c)} = excluded.{preparer.quote(c)}" for c in update_columns)
+            action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+            return (f"INSERT INTO {quoted_table} ({quoted_columns}) VALUES ({placeholders}) "
+                    f"ON CONFLICT ({conflict}) {action}")
+
+        raise ValueError(f"不支持的数据库类型: {dialect.name}")
+
+    @classmethod
+    def _frame_to_rows(cls, frame, table, columns, dialect=None):
+        """将DataFrame分块转换为DBAPI参数元组，空值转为None，日期列按字段类型转换"""
+        converted = {}
+        for column in columns:
+            series = frame[column]
+            column_type = table.c[column].type
+            if isinstance(column_type, DateTime):
+                series = pd.Series(list(pd.to_datetime(series).dt.to_pydatetime()), index=frame.index, dtype=object)
+            elif isinstance(column_type, Date):
+                series = pd.to_datetime(series).dt.date
+            values = series.astype(object).where(series.notna(), None).tolist()
+
+            # 日期字段使用方言自身的绑定格式（如SQLite的字符串存储格式）
+            processor = None
+            if dialect is not None and isinstance(column_type, (Date, DateTime)):
+                processor = column_type.dialect_impl(dialect).bind_processor(dialect)
+            if processor is not None:
+                values = [processor(v) if v is not None else None for v in values]
+            converted[column] = values
+
+        return list(zip(*(converted[c] for c in columns)))
+
+    @classmethod
+    def bulk_upsert_dataframe(cls, df, table, key_columns, update_columns=None,
+                              chunk_size=5000, engine=None):
+        """
+        按主键批量写入DataFrame（存在则更新）
+        MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE，SQLite / PostgreSQL 使用 ON CONFLICT DO UPDATE，
+        冲突时只更新 update_columns；按块流式写入，不创建ORM对象
+        :param df: 待写入数据，列名与表字段一致
+        :param table: SQLAlchemy Table 或 ORM 模型
+        :param key_columns: 唯一键字段
+        :param update_columns: 冲突时更新的字段，默认除唯一键外的全部字段
+        :param chunk_size: 每批写入行数
+        :return: {'rows_written': 写入行数, 'seconds': 耗时, 'chunks': 批次数}
+        """
+        table = getattr(table, '__table__', table)
+        engine = engine or db.engine
+        start_time = time.perf_counter()
+
+        if df is None or df.empty:
+            return {'rows_written': 0, 'seconds': 0.0, 'chunks': 0}
+
+        columns = [c for c in df.columns if c in table.c]
+        if update_columns is None:
+            update_columns = [c for c in columns if c not in key_columns]
+
+        rows_written = 0
+        chunks = 0
+        with engine.begin() as conn:
+            sql = cls._build_upsert_sql(conn.dialect, table.name, columns, key_columns, update_columns)
+            for offset in range(0, len(df), chunk_size):
+                chunk = df.iloc[offset:offset + chunk_size]
+                conn.exec_driver_sql(sql, cls._frame_to_rows(chunk, table, columns, conn.dialect))
+                rows_written += len(chunk)
+                chunks += 1
+
+        seconds = time.perf_counter() - start_time
+        logger.info(f"批量写入 {table.name}: {rows_written} 行, {chunks} 批, 耗时 {seconds:.2f} 秒")
+        return {'rows_written': rows_written, 'seconds': seconds, 'chunks': chunks}
+
+    @classmethod
+    def bulk_insert_dataframe(cls, df, table, chunk_size=20000, engine=None, connection=None):
+        """
+        批量追加写入DataFrame（纯INSERT，不处理主键冲突），用于自增主键的明细表
+        :param df: 待写入数据，列名与表字段一致
+        :param table: SQLAlchemy Table 或 ORM 模型
+        :param chunk_size: 每批写入行数
+        :param connection: 已开启事务的连接，传入时在该事务中写入、不单独提交
+        :return: {'rows_written': 写入行数, 'seconds': 耗时, 'chunks': 批次数}
+        """
+        table = getattr(table, '__table__', table)
+        engine = engine or db.engine
+        start_time = time.perf_counter()
+
+        if df is None or df.empty:
+            return {'rows_written': 0, 'seconds': 0.0, 'chunks': 0}
+
+        columns = [c for c in df.columns if c in table.c]
+        rows_written = 0
+        chunks = 0
+        with (nullcontext(connection) if connection is not None else engine.begin()) as conn:
+            preparer = conn.dialect.identifier_preparer
+            placeholder = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+            sql = (f"INSERT INTO {preparer.quote(table.name)} ({', '.join(preparer.quote(c) for c in columns)}) "
+                   f"VALUES ({', '.join([placeholder] * len(columns))})")
+            for offset in range(0, len(df), chunk_size):
+                chunk = df.iloc[offset:offset + chunk_size]
+                conn.exec_driver_sql(sql, cls._frame_to_rows(chunk, table, columns, conn.dialect))
+                rows_written += len(chunk)
+                chunks += 1
+
+        seconds = time.perf_counter() - start_time
+        logger.info(f"批量追加 {table.name}: {rows_written} 行, {chunks} 批, 耗时 {seconds:.2f} 秒")
+        return {'rows_written': rows_written, 'seconds': seconds, 'chunks': chunks}
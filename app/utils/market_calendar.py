@@ -0,0 +1,127 @@
+"""
+A股交易日历与交易时段工具
+交易日优先读取 stock_trade_calendar 表，缺失时使用Baostock交易日查询，最后退化为工作日
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import List, Union
+import logging
+
+from sqlalchemy import text
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+# 交易时段（上午 9:30-11:30，下午 13:00-15:00）
+MORNING_OPEN = time(9, 30)
+MORNING_CLOSE = time(11, 30)
+AFTERNOON_OPEN = time(13, 0)
+AFTERNOON_CLOSE = time(15, 0)
+SESSIONS = ((MORNING_OPEN, MORNING_CLOSE), (AFTERNOON_OPEN, AFTERNOON_CLOSE))
+
+# 每个交易日的交易分钟数
+TRADING_MINUTES_PER_DAY = 240
+
+# 周期类型对应的分钟数
+PERIOD_MINUTES = {
+    '1min': 1,
+    '5min': 5,
+    '15min': 15,
+    '30min': 30,
+    '60min': 60
+}
+
+DateLike = Union[str, date, datetime]
+
+
+def to_date(value: DateLike) -> date:
+    """将字符串或datetime统一转换为date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _trade_dates_from_db(start: date, end: date) -> List[date]:
+    """从 stock_trade_calendar 表读取交易日"""
+    result = db.session.execute(text(
+        "SELECT cal_date FROM stock_trade_calendar "
+        "WHERE is_open = 1 AND cal_date >= :start AND cal_date <= :end ORDER BY cal_date"
+    ), {'start': start, 'end': end})
+    return [to_date(row[0]) for row in result.fetchall()]
+
+
+def _trade_dates_from_baostock(start: date, end: date, bs_module) -> List[date]:
+    """通过Baostock查询交易日（需已登录）"""
+    rs = bs_module.query_trade_dates(start_date=start.strftime('%Y-%m-%d'), end_date=end.strftime('%Y-%m-%d'))
+    dates = []
+    while (rs.error_code == '0') & rs.next():
+        row = rs.get_row_data()
+        if row[1] == '1':
+            dates.append(to_date(row[0]))
+    return dates
+
+
+def get_trade_dates(start_date: DateLike, end_date: DateLike, bs_module=None) -> List[date]:
+    """
+    获取区间内的交易日列表
+
+    Args:
+        start_date: 开始日期
+        end_date: 结束日期
+        bs_module: 已登录的Baostock模块，交易日历表缺失时使用
+
+    Returns:
+        升序排列的交易日
+    """
+    start, end = to_date(start_date), to_date(end_date)
+    if start > end:
+        return []
+
+    try:
+        dates = _trade_dates_from_db(start, end)
+        if dates:
+            return dates
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"读取交易日历表失败: {e}")
+
+    if bs_module is not None:
+        try:
+            dates = _trade_dates_from_baostock(start, end, bs_module)
+            if dates:
+                return dates
+        except Exception as e:
+            logger.warning(f"通过Baostock查询交易日失败: {e}")
+
+    logger.warning("交易日历不可用，按工作日估算交易日")
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)
+            if (start + timedelta(days=i)).weekday() < 5]
+
+
+def session_close(trade_date: DateLike) -> datetime:
+    """交易日的收盘时间"""
+    return datetime.combine(to_date(trade_date), AFTERNOON_CLOSE)
+
+
+def expected_bar_times(trade_date: DateLike, period_type: str) -> List[datetime]:
+    """
+    交易日内按周期应有的K线结束时间（与Baostock时间戳口径一致，如5分钟首根为9:35）
+    """
+    minutes = PERIOD_MINUTES[period_type]
+    day = to_date(trade_date)
+    bars = []
+    for open_time, close_time in SESSIONS:
+        current = datetime.combine(day, open_time) + timedelta(minutes=minutes)
+        session_end = datetime.combine(day, close_time)
+        while current <= session_end:
+            bars.append(current)
+            current += timedelta(minutes=minutes)
+    return bars
+
+
+def bars_per_day(period_type: str) -> int:
+    """每个交易日应有的K线数量"""
+    return TRADING_MINUTES_PER_DAY // PERIOD_MINUTES[period_type]
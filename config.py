@@ -54,6 +54,12 @@ class Config:
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
     
+    # 实时管道Redis Streams分区数（按股票代码哈希分区），0 表示入库进程不发布到Redis Streams
+    REALTIME_PIPELINE_PARTITIONS = int(os.getenv('REALTIME_PIPELINE_PARTITIONS', 0))
+    
+    # 有效前沿接口单次请求允许的最大情景数（风险厌恶系数数 × 约束集合数）
+    FRONTIER_MAX_SCENARIOS = int(os.getenv('FRONTIER_MAX_SCENARIOS', 200))
+    
     # 日志配置
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE = os.getenv('LOG_FILE', 'logs/stock_analysis.log')
@@ -2,8 +2,9 @@ import os
 import logging
 from datetime import datetime, timedelta
 from app import create_app
-from app.services.realtime_data_manager import RealtimeDataManager
+from app.services.minute_data_sync_service import MinuteDataSyncService
 from app.models.stock_basic import StockBasic
+from app.utils.columnar_store import COLUMNAR_TABLES, get_columnar_store
 
 # --- 配置日志 ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,8 +19,6 @@ def main():
         period_type = os.getenv("PERIOD_TYPE", "1min")
         logger.info(f"使用的数据周期类型: {period_type}")
 
-        data_manager = RealtimeDataManager()
-        
         stock_basics = StockBasic.query.all()
         if not stock_basics:
             logger.warning("数据库中没有找到股票基本信息，任务终止。请先导入历史数据。")
@@ -28,22 +27,29 @@ def main():
         ts_codes = [stock.ts_code for stock in stock_basics]
         logger.info(f"将为 {len(ts_codes)} 只股票更新数据。")
 
-        # 每日更新只获取最近一天的数据
+        # 按高水位增量更新：只获取每只股票缺失的交易日，漏跑的日期会自动补齐
         end_date = datetime.now().strftime("%Y-%m-%d")
-        start_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-        logger.info(f"数据更新范围: {start_date} 到 {end_date}")
+        default_start = (datetime.now() - timedelta(days=int(os.getenv("DEFAULT_LOOKBACK_DAYS", "7")))).strftime("%Y-%m-%d")
+        logger.info(f"数据更新截止日期: {end_date}, 无同步记录的股票从 {default_start} 开始")
 
         try:
-            update_result = data_manager.sync_multiple_stocks_data(
-                ts_codes,
-                period_type=period_type,
-                start_date=start_date,
-                end_date=end_date,
-                use_baostock=True
-            )
+            with MinuteDataSyncService() as sync_service:
+                update_result = sync_service.sync_incremental(
+                    ts_codes,
+                    period_type=period_type,
+                    end_date=end_date,
+                    default_start=default_start
+                )
             logger.info(f"数据同步操作完成: {update_result}")
         except Exception as e:
             logger.error(f"数据同步过程中发生严重错误: {e}", exc_info=True)
+
+        # 追加日线数据的列式缓存分区（仅在已初始化缓存时刷新）
+        store = get_columnar_store()
+        cached_tables = [table for table in COLUMNAR_TABLES if store.available and store.load_manifest(table)]
+        if cached_tables:
+            refresh_result = store.refresh(cached_tables)
+            logger.info(f"列式缓存刷新完成: {refresh_result}")
         
         logger.info("--- 每日数据更新任务执行完毕 ---")
 
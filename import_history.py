@@ -3,7 +3,7 @@ import logging
 from datetime import datetime, timedelta
 from app import create_app
 from app.extensions import db
-from app.services.realtime_data_manager import RealtimeDataManager
+from app.services.minute_data_fetch_pipeline import MinuteDataFetchPipeline
 from app.models.stock_basic import StockBasic
 import baostock as bs
 
@@ -17,8 +17,6 @@ def main():
     with app.app_context():
         logger.info("--- 开始执行历史数据导入任务 ---")
 
-        data_manager = RealtimeDataManager()
-
         # 1. 获取所有A股列表并存入stock_basic表
         logger.info("正在从Baostock获取所有A股列表...")
         lg = bs.login()
@@ -67,13 +65,18 @@ def main():
         start_date = "2020-01-01"
         logger.info(f"历史数据导入范围: {start_date} 到 {end_date}")
 
+        # 多进程并发抓取，单一写入方批量入库
+        pipeline = MinuteDataFetchPipeline(
+            max_workers=int(os.getenv("SYNC_WORKERS", 4)),
+            requests_per_second=float(os.getenv("SYNC_RATE_LIMIT", 10))
+        )
+
         try:
-            update_result = data_manager.sync_multiple_stocks_data(
+            update_result = pipeline.run(
                 all_ts_codes,
-                period_type="1min",
+                period_types=["1min"],
                 start_date=start_date,
-                end_date=end_date,
-                use_baostock=True
+                end_date=end_date
             )
             logger.info(f"历史数据导入操作完成: {update_result}")
         except Exception as e:
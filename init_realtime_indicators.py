@@ -12,6 +12,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app, db
 from app.models.realtime_indicator import RealtimeIndicator
+from app.models.indicator_stream_state import IndicatorStreamState
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide
 
 def init_realtime_indicators_db():
     """初始化实时技术指标数据库"""
@@ -49,6 +51,13 @@ def init_realtime_indicators_db():
                 print("❌ 技术指标数据表创建失败")
                 return False
             
+            # 流式指标状态快照表和宽表
+            for model in (IndicatorStreamState, RealtimeIndicatorWide):
+                if model.__tablename__ not in tables:
+                    print(f"❌ {model.__tablename__} 数据表创建失败")
+                    return False
+                print(f"✅ {model.__tablename__} 数据表创建成功")
+            
             print("\n🎉 实时技术指标数据库初始化完成!")
             print("\n📝 使用说明:")
             print("1. 运行 python test_realtime_indicators.py 进行功能测试")
@@ -0,0 +1,75 @@
+"""
+为分钟数据表添加 (ts_code, datetime, period_type) 唯一索引的迁移脚本
+批量upsert写入依赖该唯一键，执行前会先清理重复记录（保留id最大的一条）
+"""
+
+from sqlalchemy import text
+
+from app import create_app
+from app.extensions import db
+
+INDEX_NAME = 'idx_ts_code_datetime_period'
+
+
+def remove_duplicates():
+    """删除重复的分钟数据，保留最新写入的记录"""
+    if db.engine.dialect.name == 'mysql':
+        sql = """
+            DELETE t1 FROM stock_minute_data t1
+            JOIN stock_minute_data t2
+              ON t1.ts_code = t2.ts_code
+             AND t1.datetime = t2.datetime
+             AND t1.period_type = t2.period_type
+             AND t1.id < t2.id
+        """
+    else:
+        sql = """
+            DELETE FROM stock_minute_data
+            WHERE id NOT IN (
+                SELECT MAX(id) FROM stock_minute_data
+                GROUP BY ts_code, datetime, period_type
+            )
+        """
+    result = db.session.execute(text(sql))
+    db.session.commit()
+    return result.rowcount
+
+
+def add_unique_key():
+    """重建唯一索引"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            inspector = db.inspect(db.engine)
+            indexes = {idx['name']: idx for idx in inspector.get_indexes('stock_minute_data')}
+            
+            if INDEX_NAME in indexes and indexes[INDEX_NAME].get('unique'):
+                print("唯一索引已存在，无需迁移")
+                return
+            
+            print("清理重复记录...")
+            removed = remove_duplicates()
+            print(f"删除重复记录 {removed} 条")
+            
+            if INDEX_NAME in indexes:
+                print("删除旧的非唯一索引...")
+                if db.engine.dialect.name == 'mysql':
+                    db.session.execute(text(f"DROP INDEX {INDEX_NAME} ON stock_minute_data"))
+                else:
+                    db.session.execute(text(f"DROP INDEX {INDEX_NAME}"))
+            
+            print("创建唯一索引...")
+            db.session.execute(text(
+                f"CREATE UNIQUE INDEX {INDEX_NAME} ON stock_minute_data (ts_code, datetime, period_type)"
+            ))
+            db.session.commit()
+            print("迁移完成！")
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"迁移失败: {e}")
+
+
+if __name__ == "__main__":
+    add_unique_key()
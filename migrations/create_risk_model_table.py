@@ -0,0 +1,33 @@
+"""
+创建因子风险模型快照表的迁移脚本
+建表后可选地为最近一个交易日估计并保存一份风险模型
+"""
+
+from app import create_app
+from app.extensions import db
+from app.models.risk_model_snapshot import RiskModelSnapshot
+from app.services.risk_model import get_risk_model_service
+
+
+def create_table(estimate_latest=True):
+    """创建风险模型快照表"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            print("创建风险模型快照表...")
+            RiskModelSnapshot.__table__.create(db.engine, checkfirst=True)
+            
+            if estimate_latest:
+                model = get_risk_model_service().get_risk_model()
+                if model is not None:
+                    print(f"已保存 {model.trade_date} 的风险模型: {len(model)} 只股票, {len(model.factor_names)} 个因子")
+            
+            print("风险模型快照表创建完成！")
+            
+        except Exception as e:
+            print(f"创建风险模型快照表失败: {e}")
+
+
+if __name__ == '__main__':
+    create_table()
@@ -0,0 +1,31 @@
+"""
+创建数据同步高水位表的迁移脚本
+建表后用一次分组查询从分钟数据表初始化各股票的高水位
+"""
+
+from app import create_app
+from app.extensions import db
+from app.models.sync_state import SyncState
+
+
+def create_table(period_types=('5min', '15min', '30min', '60min')):
+    """创建同步状态表并初始化高水位"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            print("创建同步状态表...")
+            SyncState.__table__.create(db.engine, checkfirst=True)
+            
+            for period_type in period_types:
+                watermarks = SyncState.load_watermarks(period_type)
+                print(f"{period_type}: 已初始化 {len(watermarks)} 只股票的高水位")
+            
+            print("同步状态表创建完成！")
+            
+        except Exception as e:
+            print(f"创建同步状态表失败: {e}")
+
+
+if __name__ == '__main__':
+    create_table()
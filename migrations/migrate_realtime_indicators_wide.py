@@ -0,0 +1,46 @@
+"""
+将实时技术指标从长表迁移到宽表的脚本
+realtime_indicators 中每根K线约十行 (指标名, value1..value4)，迁移后 realtime_indicators_wide 中每根K线一行
+"""
+
+import argparse
+
+from sqlalchemy import func
+
+from app import create_app
+from app.extensions import db
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide
+
+
+def migrate(period_types=None, batch_size=200, start_time=None):
+    """创建宽表并迁移长表数据"""
+    app = create_app()
+    
+    with app.app_context():
+        try:
+            print("创建实时指标宽表...")
+            RealtimeIndicatorWide.__table__.create(db.engine, checkfirst=True)
+            
+            print("迁移长表数据...")
+            result = RealtimeIndicatorWide.migrate_from_long(
+                period_types=period_types, batch_size=batch_size, start_time=start_time
+            )
+            wide_total = db.session.query(func.count()).select_from(RealtimeIndicatorWide).scalar()
+            long_total = RealtimeIndicator.query.count()
+            print(f"读取长表 {result['long_rows']} 行，写入宽表 {result['wide_rows']} 行")
+            print(f"当前长表共 {long_total} 行，宽表共 {wide_total} 行")
+            print("实时指标宽表迁移完成！")
+            
+        except Exception as e:
+            print(f"迁移实时指标宽表失败: {e}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='迁移实时技术指标到宽表')
+    parser.add_argument('--period-types', nargs='*', help='需要迁移的周期，默认全部')
+    parser.add_argument('--batch-size', type=int, default=200, help='每批迁移的股票数')
+    parser.add_argument('--start-time', help='只迁移该时间之后的数据，如 2024-01-01')
+    args = parser.parse_args()
+    
+    migrate(args.period_types, args.batch_size, args.start_time)
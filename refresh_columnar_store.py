@@ -0,0 +1,36 @@
+"""
+刷新日线数据的本地列式缓存
+首次运行时从 --start 开始全量导出，之后每次只重建最后一个月并追加新分区，建议在每日数据同步后执行
+用法: python refresh_columnar_store.py [--tables stock_daily_history factor_values] [--start 2020-01-01]
+"""
+
+import argparse
+import logging
+
+from app import create_app
+from app.utils.columnar_store import COLUMNAR_TABLES, get_columnar_store
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='刷新日线数据的本地列式缓存')
+    parser.add_argument('--tables', nargs='*', choices=list(COLUMNAR_TABLES.keys()), help='需要刷新的表，默认全部')
+    parser.add_argument('--start', help='表尚未缓存时的导出起始日期 (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        store = get_columnar_store()
+        if not store.available:
+            logger.error("pyarrow未安装，无法生成列式缓存")
+            return
+
+        results = store.refresh(args.tables, initial_start=args.start)
+        for table, result in results.items():
+            logger.info(f"{table}: {result}")
+
+
+if __name__ == "__main__":
+    main()
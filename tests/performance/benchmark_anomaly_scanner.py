@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全市场异动扫描延迟
+在SQLite临时库中生成 股票数 × 两个交易日 的合成1分钟数据，测量 detect_anomalies 和 get_market_sentiment
+首次调用（全市场快照冷启动）、稳态扫描（快照列式数据上向量化计算）以及新K线入库后增量对齐的耗时
+
+用法: python tests/performance/benchmark_anomaly_scanner.py --stocks 5000 --bars 240
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+from app.extensions import db
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+from app.services.realtime_monitor_service import RealtimeMonitorService
+
+
+def make_bars(n_stocks: int, n_bars: int, seed: int = 0, start: datetime = datetime(2024, 3, 4, 9, 31)) -> pd.DataFrame:
+    """生成一个交易日内的合成1分钟K线"""
+    rng = np.random.default_rng(seed)
+    times = [start + timedelta(minutes=i) for i in range(n_bars)]
+    close = 10 * np.exp(rng.normal(0, 0.003, (n_stocks, n_bars)).cumsum(axis=1))
+    pre_close = np.concatenate([close[:, :1], close[:, :-1]], axis=1)
+    spread = rng.uniform(0, 0.02, (n_stocks, n_bars))
+    return pd.DataFrame({
+        'ts_code': np.repeat([f'{i:06d}.SZ' for i in range(n_stocks)], n_bars),
+        'period_type': '1min',
+        'datetime': np.tile(times, n_stocks),
+        'open': pre_close.ravel(),
+        'high': (close + spread).ravel(),
+        'low': (close - spread).ravel(),
+        'close': close.ravel(),
+        'volume': rng.integers(100, 10000, n_stocks * n_bars),
+        'amount': (close * 1000).ravel(),
+        'pre_close': pre_close.ravel(),
+        'pct_chg': ((close / pre_close - 1) * 100).ravel()
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='全市场异动扫描延迟')
+    parser.add_argument('--stocks', type=int, default=5000, help='股票数量')
+    parser.add_argument('--bars', type=int, default=240, help='每只股票的K线数量')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, StockBasic.__table__])
+            bars = pd.concat([make_bars(args.stocks, args.bars),
+                              make_bars(args.stocks, args.bars, seed=1, start=datetime(2024, 3, 5, 9, 31))])
+            bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False, chunksize=50000)
+            industries = ['银行', '医药', '电子', '汽车', '化工']
+            pd.DataFrame({
+                'ts_code': [f'{i:06d}.SZ' for i in range(args.stocks)],
+                'name': [f'股票{i}' for i in range(args.stocks)],
+                'industry': [industries[i % len(industries)] for i in range(args.stocks)]
+            }).to_sql('stock_basic', db.engine, if_exists='append', index=False)
+            print(f"数据规模: {args.stocks} 只股票 × {args.bars} 根K线 × 2 个交易日 = {len(bars):,} 根K线")
+
+            monitor = RealtimeMonitorService()
+            start = time.perf_counter()
+            result = monitor.detect_anomalies(change_threshold=3.0, volume_threshold=3.0)
+            cold = time.perf_counter() - start
+            print(f"异动扫描(首次，含全市场快照冷启动): {cold * 1000:.0f} 毫秒, 异动 {result['data']['total_count']} 只, "
+                  f"返回前 {len(result['data']['anomalies'])} 只")
+
+            start = time.perf_counter()
+            monitor.detect_anomalies(change_threshold=3.0, volume_threshold=3.0)
+            warm = time.perf_counter() - start
+            print(f"异动扫描(稳态): {warm * 1000:.1f} 毫秒")
+
+            start = time.perf_counter()
+            sentiment = monitor.get_market_sentiment()
+            print(f"市场情绪(稳态): {(time.perf_counter() - start) * 1000:.1f} 毫秒, "
+                  f"涉及 {sentiment['data']['total_stocks']} 只股票")
+
+            # 其他进程写入一根新K线后增量对齐
+            make_bars(args.stocks, 1, seed=2, start=datetime(2024, 3, 5, 9, 31) + timedelta(minutes=args.bars)).to_sql(
+                'stock_minute_data', db.engine, if_exists='append', index=False)
+            start = time.perf_counter()
+            monitor.detect_anomalies(change_threshold=3.0, volume_threshold=3.0)
+            print(f"异动扫描(新K线入库后增量对齐): {(time.perf_counter() - start) * 1000:.0f} 毫秒")
+
+
+if __name__ == '__main__':
+    main()
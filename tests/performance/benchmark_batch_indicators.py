@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量指标引擎吞吐量对比
+在SQLite临时库中生成 股票数 × K线数 的合成分钟数据，对比逐只股票的 calculate_indicators
+与 BatchIndicatorEngine 的吞吐量（根K线/秒，含读取、计算和写入），
+以及长表与宽表两种存储格式的写入和读取耗时
+
+用法: python tests/performance/benchmark_batch_indicators.py --stocks 500 --bars 480
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide
+from app.services.realtime_indicator_engine import RealtimeIndicatorEngine
+from app.services.batch_indicator_engine import BatchIndicatorEngine
+from app.services.realtime_trading_signal_engine import RealtimeTradingSignalEngine
+
+
+def make_bars(n_stocks: int, n_bars: int, seed: int = 0) -> pd.DataFrame:
+    """生成截止到当前时间的合成5分钟K线"""
+    rng = np.random.default_rng(seed)
+    end = datetime.now().replace(second=0, microsecond=0)
+    times = [end - timedelta(minutes=5 * (n_bars - i)) for i in range(n_bars)]
+    close = 10 * np.exp(rng.normal(0, 0.002, (n_stocks, n_bars)).cumsum(axis=1))
+    spread = rng.uniform(0, 0.02, (n_stocks, n_bars))
+    return pd.DataFrame({
+        'ts_code': np.repeat([f'{i:06d}.SZ' for i in range(n_stocks)], n_bars),
+        'period_type': '5min',
+        'datetime': np.tile(times, n_stocks),
+        'open': close.ravel(),
+        'high': (close + spread).ravel(),
+        'low': (close - spread).ravel(),
+        'close': close.ravel(),
+        'volume': rng.integers(100, 10000, n_stocks * n_bars).astype(float),
+        'amount': (close * 1000).ravel()
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量指标引擎吞吐量对比')
+    parser.add_argument('--stocks', type=int, default=500, help='股票数量')
+    parser.add_argument('--bars', type=int, default=480, help='每只股票的K线数量')
+    parser.add_argument('--legacy-stocks', type=int, default=50,
+                        help='逐只股票路径只在前N只股票上运行并按股票数线性外推')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+        
+        with app.app_context():
+            db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, RealtimeIndicator.__table__,
+                                                           RealtimeIndicatorWide.__table__])
+            bars = make_bars(args.stocks, args.bars)
+            bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False, chunksize=50000)
+            lookback_days = args.bars * 5 // (24 * 60) + 2
+            ts_codes = sorted(bars['ts_code'].unique())
+            print(f"数据规模: {args.stocks} 只股票 × {args.bars} 根K线 = {len(bars):,} 根K线")
+            
+            legacy_stocks = min(args.legacy_stocks, args.stocks)
+            engine = RealtimeIndicatorEngine()
+            start = time.perf_counter()
+            for ts_code in ts_codes[:legacy_stocks]:
+                engine.calculate_indicators(ts_code, '5min', lookback_days=lookback_days)
+            legacy_seconds = (time.perf_counter() - start) * args.stocks / legacy_stocks
+            legacy_rate = len(bars) / legacy_seconds
+            suffix = '' if legacy_stocks == args.stocks else f'（由 {legacy_stocks} 只股票外推）'
+            print(f"逐只股票路径: {legacy_seconds:.2f} 秒, {legacy_rate:,.0f} 根K线/秒{suffix}")
+            
+            result = BatchIndicatorEngine().calculate(ts_codes, ['5min'], lookback_days=lookback_days)
+            print(f"批量引擎: {result['elapsed_seconds']:.2f} 秒, {result['bars_per_second']:,.0f} 根K线/秒 "
+                  f"(读取 {result['load_seconds']:.2f} 秒, 计算 {result['compute_seconds']:.2f} 秒, "
+                  f"写入 {result['store_seconds']:.2f} 秒, {result['stored_records']:,} 条指标)")
+            print(f"加速比: {result['bars_per_second'] / legacy_rate:.1f}x")
+            
+            wide = BatchIndicatorEngine().calculate(ts_codes, ['5min'], lookback_days=lookback_days, layout='wide')
+            print(f"批量引擎(宽表): {wide['elapsed_seconds']:.2f} 秒, {wide['bars_per_second']:,.0f} 根K线/秒 "
+                  f"(写入 {wide['store_seconds']:.2f} 秒, {wide['stored_records']:,} 行)")
+            
+            # 信号生成读取：长表逐行取ORM对象再按指标分组 vs 宽表一次范围读取为数组
+            signal_engine = RealtimeTradingSignalEngine()
+            start_time, end_time = datetime(2000, 1, 1), datetime(2100, 1, 1)
+            read_codes = ts_codes[:min(50, len(ts_codes))]
+            start = time.perf_counter()
+            for ts_code in read_codes:
+                RealtimeIndicator.query.filter(
+                    RealtimeIndicator.ts_code == ts_code, RealtimeIndicator.period_type == '5min',
+                    RealtimeIndicator.datetime >= start_time, RealtimeIndicator.datetime <= end_time
+                ).order_by(RealtimeIndicator.datetime.asc()).all()
+            long_read = time.perf_counter() - start
+            start = time.perf_counter()
+            for ts_code in read_codes:
+                signal_engine._indicators_from_wide(
+                    RealtimeIndicatorWide.read_arrays(ts_code, '5min', start_time, end_time))
+            wide_read = time.perf_counter() - start
+            print(f"读取 {len(read_codes)} 只股票的全部指标: 长表 {long_read:.2f} 秒, 宽表 {wide_read:.2f} 秒 "
+                  f"({long_read / wide_read:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+有效前沿耗时
+在SQLite临时库中生成 股票数 × 交易日 的合成价格，对比逐个风险厌恶系数调用 optimize_portfolio
+（每次都取风险模型、新建问题，相当于分析师逐个请求 /portfolio/optimize）与一次 efficient_frontier 的耗时
+
+用法: python tests/performance/benchmark_efficient_frontier.py --stocks 500 --points 40 --workers 4
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from loguru import logger
+
+from app.extensions import db
+from app.models import StockDailyHistory, StockDailyBasic, StockBasic, RiskModelSnapshot
+from app.services.mean_variance import get_problem_cache
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import get_risk_model_service
+
+
+def seed(n_stocks: int, n_days: int):
+    rng = np.random.default_rng(0)
+    codes = [f'{i:06d}.SZ' for i in range(n_stocks)]
+    days = pd.bdate_range('2023-01-02', periods=n_days).date
+    close = rng.uniform(5, 50, n_stocks) * np.exp(rng.normal(0, 0.02, (n_days, n_stocks)).cumsum(axis=0))
+    db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, StockDailyBasic.__table__,
+                                                   StockBasic.__table__, RiskModelSnapshot.__table__])
+    pd.DataFrame({
+        'ts_code': np.tile(codes, n_days),
+        'trade_date': np.repeat(days, n_stocks),
+        'close': close.ravel().round(4)
+    }).to_sql('stock_daily_history', db.engine, if_exists='append', index=False, chunksize=50000)
+    pd.DataFrame({
+        'ts_code': codes,
+        'name': codes,
+        'industry': [f'行业{i % 28}' for i in range(n_stocks)]
+    }).to_sql('stock_basic', db.engine, if_exists='append', index=False)
+    return pd.Series(rng.normal(0.001, 0.002, n_stocks), index=codes), str(days[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='有效前沿耗时')
+    parser.add_argument('--stocks', type=int, default=500, help='股票数量')
+    parser.add_argument('--days', type=int, default=300, help='交易日数量')
+    parser.add_argument('--points', type=int, default=40, help='风险厌恶系数个数')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='工作进程数')
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            expected_returns, as_of_date = seed(args.stocks, args.days)
+            risk_aversions = list(np.geomspace(1, 1000, args.points))
+            constraints = {'max_weight': 0.05}
+            optimizer = PortfolioOptimizer()
+            print(f"{args.stocks} 只股票, {args.points} 个风险厌恶系数")
+
+            def reset():
+                """清空风险模型快照和进程内缓存，使风险模型重新估计、问题重新编译"""
+                get_risk_model_service().clear()
+                db.session.query(RiskModelSnapshot).delete()
+                db.session.commit()
+                get_problem_cache().clear()
+
+            started = time.perf_counter()
+            for risk_aversion in risk_aversions:
+                # 逐个请求
+                reset()
+                optimizer.optimize_portfolio(expected_returns, method='mean_variance',
+                                             constraints=dict(constraints, risk_aversion=risk_aversion),
+                                             as_of_date=as_of_date)
+            print(f"逐个调用 optimize_portfolio: {time.perf_counter() - started:.2f} 秒")
+
+            for workers in sorted({1, args.workers}):
+                reset()
+                started = time.perf_counter()
+                result = optimizer.efficient_frontier(expected_returns, risk_aversions, constraints=constraints,
+                                                      as_of_date=as_of_date, max_workers=workers)
+                print(f"efficient_frontier({workers} 个进程): {time.perf_counter() - started:.2f} 秒, "
+                      f"{len(result['points'])} 个点, 求解合计 {result['timing']['solve_seconds_sum']:.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+均值-方差重复调仓耗时
+模拟一段回测中同规模股票池的逐期调仓（预期收益和风险模型每期小幅变化），对比每次新建 cp.Problem 与
+复用缓存的参数化问题（只更新参数并热启动）的总耗时，并给出带换手率上限时的耗时
+
+用法: python tests/performance/benchmark_mean_variance.py --stocks 300 --rebalances 50
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import time
+
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from app.services.mean_variance import get_problem_cache, _solver
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import FactorRiskModel, STYLE_FACTORS
+
+
+def make_models(n_stocks: int, n_industries: int, rebalances: int):
+    rng = np.random.default_rng(0)
+    codes = [f'{i:06d}.SZ' for i in range(n_stocks)]
+    exposures = np.hstack([np.eye(n_industries)[rng.integers(0, n_industries, n_stocks)],
+                           rng.normal(size=(n_stocks, len(STYLE_FACTORS)))])
+    names = [f'F{k}' for k in range(exposures.shape[1])]
+    base_cov = np.cov(rng.normal(0, 0.01, (252, len(names))), rowvar=False)
+    specific = rng.uniform(1e-4, 9e-4, n_stocks)
+    for _ in range(rebalances):
+        exposures[:, n_industries:] += rng.normal(0, 0.05, (n_stocks, len(STYLE_FACTORS)))
+        yield (pd.Series(rng.normal(0, 0.002, n_stocks), index=codes),
+               FactorRiskModel(None, codes, names, exposures.copy(), base_cov * rng.uniform(0.9, 1.1), specific))
+
+
+def fresh_problem(expected_returns: pd.Series, model: FactorRiskModel, risk_aversion: float, max_weight: float):
+    """原实现：每次新建变量和问题"""
+    w = cp.Variable(len(expected_returns))
+    variance = cp.sum_squares(model.loadings.T @ w) + cp.sum(cp.multiply(model.specific_var, cp.square(w)))
+    problem = cp.Problem(cp.Maximize(expected_returns.values @ w - 0.5 * risk_aversion * variance),
+                         [cp.sum(w) == 1, w >= 0, w <= max_weight])
+    problem.solve(solver=_solver())
+    return w.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='均值-方差重复调仓耗时')
+    parser.add_argument('--stocks', type=int, default=300, help='股票数量')
+    parser.add_argument('--industries', type=int, default=30, help='行业数量')
+    parser.add_argument('--rebalances', type=int, default=50, help='调仓次数')
+    args = parser.parse_args()
+    logger.remove()
+
+    risk_aversion, max_weight = 4.0, 0.02
+    upper = np.full(args.stocks, max_weight)
+    print(f"{args.stocks} 只股票, {args.rebalances} 次调仓, 求解器 {_solver()}")
+
+    started = time.perf_counter()
+    for expected_returns, model in make_models(args.stocks, args.industries, args.rebalances):
+        fresh_problem(expected_returns, model, risk_aversion, max_weight)
+    print(f"每次新建问题: {time.perf_counter() - started:.2f} 秒")
+
+    cache = get_problem_cache()
+    for label, max_turnover in [('缓存参数化问题', None), ('缓存参数化问题 + 换手率上限0.2', 0.2)]:
+        cache.clear()
+        previous = None
+        started = time.perf_counter()
+        for expected_returns, model in make_models(args.stocks, args.industries, args.rebalances):
+            problem = cache.get(args.stocks, model.loadings.shape[1],
+                                turnover_limit=max_turnover is not None and previous is not None)
+            previous, status = problem.solve(expected_returns.values, model.loadings, model.specific_var,
+                                             risk_aversion, upper=upper, previous=previous,
+                                             trade_budget=None if max_turnover is None else 2 * max_turnover)
+        print(f"{label}: {time.perf_counter() - started:.2f} 秒, {cache.stats()}")
+
+    # 经 PortfolioOptimizer 的完整调用（含风险模型子集、约束和组合统计）
+    cache.clear()
+    optimizer = PortfolioOptimizer()
+    previous = None
+    turnovers = []
+    started = time.perf_counter()
+    for expected_returns, model in make_models(args.stocks, args.industries, args.rebalances):
+        result = optimizer.optimize_portfolio(expected_returns, model, 'mean_variance',
+                                              {'risk_aversion': risk_aversion, 'max_weight': max_weight,
+                                               'max_turnover': 0.2}, previous_weights=previous)
+        previous = pd.Series(result['weights'])
+        turnovers.append(result['portfolio_stats']['turnover'])
+    print(f"optimize_portfolio(换手率上限0.2): {time.perf_counter() - started:.2f} 秒, "
+          f"平均换手率 {np.mean(turnovers[1:]):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+组合实时风险计算耗时
+在SQLite临时库中生成 持仓数 × 交易日 × 4根 的60分钟K线，对比原实现（逐只股票查询、逐只累加组合收益、
+双重循环找高相关股票对）与批量查询 + 矩阵运算的 calculate_portfolio_risk 耗时
+
+用法: python tests/performance/benchmark_realtime_risk.py --holdings 500 --days 280
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import logging
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models.portfolio_position import PortfolioPosition
+from app.models.risk_alert import RiskAlert
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+from app.services.realtime_risk_manager import RealtimeRiskManager
+
+
+class LegacyRiskManager(RealtimeRiskManager):
+    """原实现：逐只股票查询ORM对象，逐只累加组合收益，双重循环找高相关股票对"""
+
+    def _get_price_data(self, stock_codes, start_date, end_date):
+        price_data = []
+        for ts_code in stock_codes:
+            data = StockMinuteData.query.filter(
+                StockMinuteData.ts_code == ts_code,
+                StockMinuteData.period_type == '60min',
+                StockMinuteData.datetime >= start_date,
+                StockMinuteData.datetime <= end_date
+            ).order_by(StockMinuteData.datetime).all()
+            if data:
+                df = pd.DataFrame([{'datetime': d.datetime, 'close': d.close, 'ts_code': d.ts_code} for d in data])
+                df['date'] = df['datetime'].dt.date
+                daily_data = df.groupby('date')['close'].last().reset_index()
+                daily_data['ts_code'] = ts_code
+                price_data.append(daily_data)
+        if not price_data:
+            return pd.DataFrame()
+        all_data = pd.concat(price_data, ignore_index=True)
+        return all_data.pivot(index='date', columns='ts_code', values='close').ffill()
+
+    def _portfolio_returns(self, returns, weights):
+        portfolio_returns = pd.Series(0, index=returns.index)
+        for ts_code, weight in weights.items():
+            if ts_code in returns.columns:
+                portfolio_returns += returns[ts_code] * weight
+        return portfolio_returns
+
+    def _calculate_correlation_matrix(self, returns):
+        corr_matrix = returns.corr()
+        pair_values = corr_matrix.values[np.triu_indices_from(corr_matrix.values, k=1)]
+        high_corr_pairs = []
+        for i in range(len(corr_matrix.columns)):
+            for j in range(i + 1, len(corr_matrix.columns)):
+                corr_value = corr_matrix.iloc[i, j]
+                if abs(corr_value) > self.risk_thresholds['correlation_limit']:
+                    high_corr_pairs.append({'stock1': corr_matrix.columns[i], 'stock2': corr_matrix.columns[j],
+                                            'correlation': corr_value})
+        return {
+            'average_correlation': pair_values.mean(),
+            'max_correlation': pair_values.max(),
+            'min_correlation': pair_values.min(),
+            'high_correlation_pairs': high_corr_pairs,
+            'correlation_matrix': corr_matrix.to_dict()
+        }
+
+
+def seed(n_holdings: int, n_days: int):
+    rng = np.random.default_rng(0)
+    codes = [f'{i:06d}.SZ' for i in range(n_holdings)]
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    times = [day + timedelta(hours=hour) for day in pd.date_range(end=today, periods=n_days).to_pydatetime()
+             for hour in (10, 11, 14, 15)]
+    # 行业共同因子使同行业股票相关性较高
+    industry = rng.integers(0, 30, n_holdings)
+    steps = rng.normal(0, 0.01, (len(times), 30))[:, industry] + rng.normal(0, 0.004, (len(times), n_holdings))
+    close = rng.uniform(5, 50, n_holdings) * np.exp(steps.cumsum(axis=0))
+    db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, PortfolioPosition.__table__,
+                                                   RiskAlert.__table__, StockBasic.__table__])
+    pd.DataFrame({
+        'ts_code': np.tile(codes, len(times)),
+        'datetime': np.repeat(times, n_holdings),
+        'period_type': '60min',
+        'open': close.ravel(), 'high': close.ravel(), 'low': close.ravel(), 'close': close.ravel(),
+        'volume': 100, 'amount': 0.0
+    }).to_sql('stock_minute_data', db.engine, if_exists='append', index=False, chunksize=50000)
+    db.session.add_all([PortfolioPosition(portfolio_id='BENCH', ts_code=code, position_size=100, avg_cost=10,
+                                          market_value=float(rng.uniform(1e4, 1e5)), weight=100 / n_holdings,
+                                          sector=f'行业{industry[i]}')
+                        for i, code in enumerate(codes)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='组合实时风险计算耗时')
+    parser.add_argument('--holdings', type=int, default=500, help='持仓数量')
+    parser.add_argument('--days', type=int, default=280, help='自然日数量')
+    parser.add_argument('--period-days', type=int, default=252, help='风险计算区间天数')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            seed(args.holdings, args.days)
+            print(f"{args.holdings} 只持仓, {args.days} 天 × 4 根60分钟K线")
+
+            results = {}
+            for label, manager in [('原实现', LegacyRiskManager()), ('批量查询 + 矩阵运算', RealtimeRiskManager())]:
+                statements = []
+                listener = lambda *a: statements.append(a[2])
+                event.listen(db.engine, 'before_cursor_execute', listener)
+                started = time.perf_counter()
+                result = manager.calculate_portfolio_risk('BENCH', period_days=args.period_days)
+                elapsed = time.perf_counter() - started
+                event.remove(db.engine, 'before_cursor_execute', listener)
+                assert result['success'], result['message']
+                results[label] = result['data']
+                print(f"{label}: {elapsed:.2f} 秒, {len(statements)} 次查询, "
+                      f"{len(result['data']['correlation_metrics']['high_correlation_pairs'])} 对高相关股票")
+
+            legacy, vectorized = results.values()
+            assert legacy['correlation_metrics']['high_correlation_pairs'] == \
+                vectorized['correlation_metrics']['high_correlation_pairs']
+            assert np.isclose(legacy['var_metrics']['var_95'], vectorized['var_metrics']['var_95'])
+            assert np.isclose(legacy['beta_metrics']['portfolio_beta'], vectorized['beta_metrics']['portfolio_beta'])
+
+
+if __name__ == '__main__':
+    main()
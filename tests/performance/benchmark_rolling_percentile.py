@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+滚动分位数内核性能对比
+在 股票数 × 交易日 的合成估值面板上，对比原 rolling().apply(percentileofscore) 实现与向量化内核
+
+用法: python tests/performance/benchmark_rolling_percentile.py --stocks 5000 --days 1000
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from app.services.factor_engine import rolling_percentile_rank
+
+
+def make_panel(n_stocks: int, n_days: int, seed: int = 0) -> pd.DataFrame:
+    """生成合成PE面板（长表，按股票、日期排序）"""
+    rng = np.random.default_rng(seed)
+    pe = 20 * np.exp(rng.normal(0, 0.02, (n_stocks, n_days)).cumsum(axis=1))
+    return pd.DataFrame({
+        'ts_code': np.repeat([f'{i:06d}.SZ' for i in range(n_stocks)], n_days),
+        'pe_ttm': np.round(pe.ravel(), 2),
+    })
+
+
+def legacy_percentile(df: pd.DataFrame) -> np.ndarray:
+    """原实现：逐股票 rolling(252).apply(percentileofscore)"""
+    result = []
+    for ts_code in df['ts_code'].unique():
+        stock_data = df[df['ts_code'] == ts_code]
+        result.append(stock_data['pe_ttm'].rolling(252, min_periods=20).apply(
+            lambda x: stats.percentileofscore(x, x.iloc[-1]) / 100
+        ).to_numpy())
+    return np.concatenate(result)
+
+
+def kernel_percentile(df: pd.DataFrame) -> np.ndarray:
+    """向量化内核：全部股票一次计算"""
+    group_ids = pd.factorize(df['ts_code'])[0]
+    return rolling_percentile_rank(df['pe_ttm'].to_numpy(), group_ids, window=252, min_periods=20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='滚动分位数内核性能对比')
+    parser.add_argument('--stocks', type=int, default=5000, help='股票数量')
+    parser.add_argument('--days', type=int, default=1000, help='交易日数量')
+    parser.add_argument('--legacy-stocks', type=int, default=None,
+                        help='原实现只在前N只股票上运行并按股票数线性外推，默认全部')
+    args = parser.parse_args()
+    
+    df = make_panel(args.stocks, args.days)
+    print(f"面板规模: {args.stocks} 只股票 × {args.days} 个交易日 = {len(df):,} 个数据点")
+    
+    start = time.perf_counter()
+    fast = kernel_percentile(df)
+    kernel_seconds = time.perf_counter() - start
+    print(f"向量化内核: {kernel_seconds:.2f} 秒")
+    
+    legacy_stocks = min(args.legacy_stocks or args.stocks, args.stocks)
+    legacy_df = df.iloc[:legacy_stocks * args.days]
+    start = time.perf_counter()
+    slow = legacy_percentile(legacy_df)
+    legacy_seconds = (time.perf_counter() - start) * args.stocks / legacy_stocks
+    suffix = '' if legacy_stocks == args.stocks else f'（由 {legacy_stocks} 只股票外推）'
+    print(f"原实现: {legacy_seconds:.2f} 秒{suffix}")
+    
+    matched = np.allclose(fast[:len(slow)], slow, equal_nan=True)
+    print(f"结果一致: {'✅' if matched else '❌'}")
+    print(f"加速比: {legacy_seconds / kernel_seconds:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
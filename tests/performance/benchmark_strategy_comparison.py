@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多策略比较耗时
+在SQLite临时库中生成 股票数 × 交易日 的合成价格和因子数据，构造若干策略变体（选股因子组合、持仓数、
+调仓频率、交易成本不同），对比逐个策略单独回测的总耗时与 compare_strategies 并行比较的耗时
+
+用法: python tests/performance/benchmark_strategy_comparison.py --stocks 1000 --days 250 --strategies 20 --workers 8
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import argparse
+import itertools
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from loguru import logger
+
+from app.extensions import db
+from app.models import StockDailyHistory, FactorValues, StockBasic
+from app.services.backtest_engine import BacktestEngine
+
+FACTORS = ['momentum_20d', 'pe_ttm', 'roe', 'volatility_20d']
+
+
+def seed(n_stocks: int, n_days: int):
+    rng = np.random.default_rng(0)
+    codes = [f'{i:06d}.SZ' for i in range(n_stocks)]
+    days = pd.bdate_range('2023-01-02', periods=n_days).date
+    close = rng.uniform(5, 50, n_stocks) * np.exp(rng.normal(0, 0.02, (n_days, n_stocks)).cumsum(axis=0))
+    db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, FactorValues.__table__,
+                                                   StockBasic.__table__])
+    pd.DataFrame({
+        'ts_code': np.tile(codes, n_days),
+        'trade_date': np.repeat(days, n_stocks),
+        'close': close.ravel().round(2)
+    }).to_sql('stock_daily_history', db.engine, if_exists='append', index=False, chunksize=50000)
+    pd.DataFrame({
+        'ts_code': np.tile(codes, n_days * len(FACTORS)),
+        'trade_date': np.tile(np.repeat(days, n_stocks), len(FACTORS)),
+        'factor_id': np.repeat(FACTORS, n_days * n_stocks),
+        'z_score': rng.normal(size=n_days * n_stocks * len(FACTORS)).round(4)
+    }).to_sql('factor_values', db.engine, if_exists='append', index=False, chunksize=50000)
+    return str(days[0]), str(days[-1])
+
+
+def make_strategies(count: int):
+    """因子组合 × 持仓数 × 调仓频率 × 交易成本 的前 count 个组合"""
+    grid = itertools.product(
+        [FACTORS[:2], FACTORS[1:3], FACTORS],
+        [20, 50],
+        ['daily', 'weekly'],
+        [0.001, 0.002]
+    )
+    return [{
+        'name': f'S{i:02d}',
+        'config': {'selection_method': 'factor_based', 'factor_list': factors, 'top_n': top_n,
+                   'transaction_cost': cost},
+        'rebalance_frequency': frequency
+    } for i, (factors, top_n, frequency, cost) in zip(range(count), grid)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='多策略比较耗时')
+    parser.add_argument('--stocks', type=int, default=1000, help='股票数量')
+    parser.add_argument('--days', type=int, default=250, help='交易日数量')
+    parser.add_argument('--strategies', type=int, default=20, help='策略变体数量')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='工作进程数')
+    args = parser.parse_args()
+    logger.remove()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+
+        with app.app_context():
+            start_date, end_date = seed(args.stocks, args.days)
+            strategies = make_strategies(args.strategies)
+            print(f"数据规模: {args.stocks} 只股票 × {args.days} 个交易日 × {len(FACTORS)} 个因子, "
+                  f"{len(strategies)} 个策略变体")
+
+            started = time.perf_counter()
+            slowest = 0.0
+            for strategy in strategies:
+                strategy_started = time.perf_counter()
+                BacktestEngine().run_backtest(strategy['config'], start_date, end_date,
+                                              rebalance_frequency=strategy['rebalance_frequency'])
+                slowest = max(slowest, time.perf_counter() - strategy_started)
+            serial = time.perf_counter() - started
+            print(f"逐个策略单独回测: 总计 {serial:.2f} 秒, 最慢单个策略 {slowest:.2f} 秒")
+
+            for workers in (1, args.workers):
+                started = time.perf_counter()
+                result = BacktestEngine().compare_strategies(strategies, start_date, end_date, max_workers=workers)
+                elapsed = time.perf_counter() - started
+                timing = result['timing']
+                print(f"compare_strategies({workers} 个进程): {elapsed:.2f} 秒, "
+                      f"{timing['selection_groups']} 种选股配置, "
+                      f"最慢策略 {max(r['wall_time'] for r in result['strategies']):.2f} 秒")
+
+
+if __name__ == '__main__':
+    main()
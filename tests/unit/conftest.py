@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+单元测试公共夹具
+提供使用SQLite库的Flask测试应用，各测试文件按需建表和造数
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from flask import Flask
+
+from app.extensions import db
+
+
+@pytest.fixture
+def make_app():
+    """返回测试应用工厂，默认使用SQLite内存库，需要跨进程共享数据时可传入文件库地址"""
+    def factory(database_uri='sqlite://'):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+        return app
+    return factory
+
+
+@pytest.fixture
+def app(make_app):
+    """使用SQLite内存库的测试应用"""
+    return make_app()
@@ -0,0 +1,84 @@
+"""
+本地模拟的Baostock模块
+提供 login / logout / query_trade_dates / query_history_k_data_plus 接口，返回确定性的5分钟K线，供离线测试使用
+"""
+
+import os
+from datetime import datetime, timedelta
+
+# A股5分钟K线的结束时间
+_SESSION_TIMES = (
+    [datetime(2000, 1, 1, 9, 35) + timedelta(minutes=5 * i) for i in range(24)] +
+    [datetime(2000, 1, 1, 13, 5) + timedelta(minutes=5 * i) for i in range(24)]
+)
+
+
+# 已发起的K线查询记录 [(code, start_date, end_date)]
+history_queries = []
+
+
+class _Result:
+    def __init__(self, error_code='0', error_msg='success', fields=None, rows=None):
+        self.error_code = error_code
+        self.error_msg = error_msg
+        self.fields = fields or []
+        self._rows = rows or []
+        self._index = -1
+
+    def next(self):
+        self._index += 1
+        return self._index < len(self._rows)
+
+    def get_row_data(self):
+        return self._rows[self._index]
+
+
+def login():
+    return _Result()
+
+
+def logout():
+    return _Result()
+
+
+def query_trade_dates(start_date=None, end_date=None):
+    """工作日均视为交易日"""
+    rows = []
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    last_day = datetime.strptime(end_date, '%Y-%m-%d')
+    while day <= last_day:
+        rows.append([day.strftime('%Y-%m-%d'), '1' if day.weekday() < 5 else '0'])
+        day += timedelta(days=1)
+    return _Result(fields=['calendar_date', 'is_trading_day'], rows=rows)
+
+
+def query_history_k_data_plus(code, fields, start_date=None, end_date=None, frequency='d', adjustflag='3'):
+    """按交易日生成每只股票48根5分钟K线，代码以 .999999 结尾时返回错误，以 .999998 结尾时进程直接退出"""
+    history_queries.append((code, start_date, end_date))
+    if code.endswith('999999'):
+        return _Result(error_code='10004011', error_msg='fake error')
+    if code.endswith('999998'):
+        # 模拟工作进程崩溃（OOM、连接段错误），不返回任何结果
+        os._exit(1)
+
+    field_list = fields.split(',')
+    rows = []
+    day = datetime.strptime(start_date, '%Y-%m-%d')
+    last_day = datetime.strptime(end_date, '%Y-%m-%d')
+    price = 10.0
+    while day <= last_day:
+        if day.weekday() < 5:
+            for bar_time in _SESSION_TIMES:
+                ts = day.replace(hour=bar_time.hour, minute=bar_time.minute)
+                price += 0.01
+                values = {
+                    'date': ts.strftime('%Y-%m-%d'),
+                    'time': ts.strftime('%Y%m%d%H%M%S') + '000',
+                    'code': code,
+                    'open': f'{price:.2f}', 'high': f'{price + 0.05:.2f}',
+                    'low': f'{price - 0.05:.2f}', 'close': f'{price:.2f}',
+                    'volume': '1000', 'amount': f'{price * 1000:.2f}',
+                }
+                rows.append([values[f] for f in field_list])
+        day += timedelta(days=1)
+    return _Result(fields=field_list, rows=rows)
@@ -0,0 +1,82 @@
+"""
+本地模拟的Redis客户端
+提供 Streams（xgroup_create / xadd / xreadgroup / xack / xinfo_groups）、哈希（hset / hgetall）
+和 pipeline 接口（decode_responses=True 语义），供离线测试使用
+"""
+
+from collections import defaultdict
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = defaultdict(dict)
+        self.commands = []
+        self.streams = defaultdict(list)        # stream -> [(id, fields)]
+        self.groups = defaultdict(dict)         # stream -> {group: 最后投递位置}
+        self.pending = defaultdict(set)         # (stream, group) -> {id}
+        self._sequence = 0
+
+    def xgroup_create(self, name, groupname, id='$', mkstream=False):
+        if groupname in self.groups[name]:
+            raise Exception('BUSYGROUP Consumer Group name already exists')
+        self.groups[name][groupname] = 0 if id == '0' else len(self.streams[name])
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        self._sequence += 1
+        message_id = f'{self._sequence}-0'
+        self.streams[name].append((message_id, dict(fields)))
+        return message_id
+
+    def xreadgroup(self, groupname, consumername, streams, count=None, block=None):
+        response = []
+        for name in streams:
+            position = self.groups[name][groupname]
+            messages = self.streams[name][position:position + count if count else None]
+            if messages:
+                self.groups[name][groupname] = position + len(messages)
+                self.pending[(name, groupname)].update(m[0] for m in messages)
+                response.append([name, messages])
+        return response
+
+    def xack(self, name, groupname, *ids):
+        self.pending[(name, groupname)].difference_update(ids)
+        return len(ids)
+
+    def xinfo_groups(self, name):
+        return [{'name': group, 'pending': len(self.pending[(name, group)]),
+                 'lag': len(self.streams[name]) - position}
+                for group, position in self.groups[name].items()]
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        self.commands.append(('hset', name))
+        values = dict(mapping or {})
+        if key is not None:
+            values[key] = value
+        self.hashes[name].update({k: str(v) for k, v in values.items()})
+        return len(values)
+
+    def hgetall(self, name):
+        self.commands.append(('hgetall', name))
+        return dict(self.hashes.get(name, {}))
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.calls.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        results = [method(*args, **kwargs) for method, args, kwargs in self.calls]
+        self.calls = []
+        return results
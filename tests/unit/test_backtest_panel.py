@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+回测内存面板测试
+使用SQLite内存数据库，验证预加载模式与逐日查询模式结果一致，且回测循环内不再访问数据库，
+以及回测接口每个请求使用独立的引擎，不会复用进行中请求的面板
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import date, timedelta
+
+import numpy as np
+from sqlalchemy import event
+
+from app.api.ml_factor_api import ml_factor_bp, get_backtest_engine
+from app.extensions import db
+from app.models import StockDailyHistory, FactorValues, StockBasic
+from app.services.backtest_engine import BacktestEngine
+from app.services.backtest_panel import BacktestPricePanel
+
+
+def _seed(n_stocks=20, n_days=30):
+    rng = np.random.default_rng(7)
+    codes = [f'{600000 + i}.SH' for i in range(n_stocks)]
+    day = date(2024, 1, 1)
+    close = rng.uniform(5, 50, n_stocks)
+    for _ in range(n_days):
+        if day.weekday() < 5:
+            close = close * (1 + rng.normal(0, 0.02, n_stocks))
+            for j, ts_code in enumerate(codes):
+                # 第一只股票在1月10日停牌
+                if j == 0 and day == date(2024, 1, 10):
+                    continue
+                db.session.add(StockDailyHistory(ts_code=ts_code, trade_date=day, close=round(close[j], 2)))
+                for factor_id in ('momentum_20d', 'pe_ttm'):
+                    db.session.add(FactorValues(ts_code=ts_code, trade_date=day, factor_id=factor_id,
+                                                z_score=round(float(rng.normal()), 4)))
+        day += timedelta(days=1)
+    db.session.commit()
+    return codes
+
+
+def test_panel_matches_per_date_queries(app):
+    """预加载面板与逐日查询的回测结果一致，且查询次数与交易日数量无关"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, FactorValues.__table__,
+                                                       StockBasic.__table__])
+        _seed()
+        
+        config = {'selection_method': 'factor_based', 'factor_list': ['momentum_20d', 'pe_ttm'], 'top_n': 5}
+        legacy = BacktestEngine().run_backtest(config, '2024-01-01', '2024-01-30',
+                                               rebalance_frequency='daily', preload=False)
+        engine = BacktestEngine()
+        
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            fast = engine.run_backtest(config, '2024-01-01', '2024-01-30', rebalance_frequency='daily')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        
+        assert fast['success'] and legacy['success']
+        assert len(fast['portfolio_values']) == len(legacy['portfolio_values']) == 22
+        assert fast['daily_positions'] == legacy['daily_positions']
+        assert np.allclose([v['total_value'] for v in fast['portfolio_values']],
+                           [v['total_value'] for v in legacy['portfolio_values']])
+        # 交易日列表 + 价格 + 因子 + 股票信息，共4次查询
+        assert len(statements) == 4
+        print(f"✅ 预加载回测 {len(fast['portfolio_values'])} 个交易日, {len(statements)} 次查询")
+
+
+def test_panel_slices(app):
+    """按日期切片取价格，停牌股票不返回价格"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, FactorValues.__table__])
+        codes = _seed(n_stocks=3, n_days=12)
+        
+        panel = BacktestPricePanel.load('2024-01-01', '2024-01-12', ['pe_ttm'])
+        assert panel.prices.shape == (10, 3)
+        assert panel.factor_cube.shape == (1, 10, 3)
+        
+        prices = panel.get_prices('2024-01-10', codes)
+        assert codes[0] not in prices and len(prices) == 2
+        assert panel.get_prices('2024-01-06', codes) == {}
+        
+        scores = panel.get_factor_scores(date(2024, 1, 11), ['pe_ttm', 'unknown'])
+        assert list(scores.columns) == ['pe_ttm'] and len(scores) == 3
+
+
+def test_backtest_endpoint_does_not_share_panel(app):
+    """另一个请求的引擎持有不同区间和因子的面板时，回测接口的结果不受影响"""
+    app.register_blueprint(ml_factor_bp)
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, FactorValues.__table__,
+                                                       StockBasic.__table__])
+        _seed()
+        config = {'selection_method': 'factor_based', 'factor_list': ['momentum_20d', 'pe_ttm'], 'top_n': 5}
+        expected = BacktestEngine().run_backtest(config, '2024-01-01', '2024-01-30', rebalance_frequency='weekly')
+
+        # 模拟进行中的请求
+        other = get_backtest_engine()
+        other.panel = BacktestPricePanel.load('2024-01-01', '2024-01-05', ['pe_ttm'])
+
+        response = app.test_client().post('/api/ml-factor/backtest/run', json={
+            'strategy_config': config, 'start_date': '2024-01-01', 'end_date': '2024-01-30',
+            'rebalance_frequency': 'weekly'
+        })
+        result = response.get_json()
+        assert response.status_code == 200 and result['success']
+        assert result['daily_positions'] == expected['daily_positions'] and len(result['daily_positions']) == 5
+        assert np.allclose([v['total_value'] for v in result['portfolio_values']],
+                           [v['total_value'] for v in expected['portfolio_values']])
+        assert other.panel is not None
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多周期K线合成测试
+验证按交易时段切分（不跨越午间休市）、与逐只股票逐根计算一致、基于高水位的增量合成，
+以及多周期同步只发起一次网络请求
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import fake_baostock
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.sync_state import SyncState
+from app.services.bar_rollup import BarRollupEngine, session_bucket_end
+from app.services.minute_data_sync_service import MinuteDataSyncService
+from app.utils.market_calendar import expected_bar_times
+
+
+def _minute_bars(ts_codes, days, seed=0):
+    """每个交易日240根1分钟K线（9:31-11:30、13:01-15:00）"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for ts_code in ts_codes:
+        times = [t for day in days for t in expected_bar_times(day, '1min')]
+        close = 10 + np.cumsum(rng.normal(0, 0.02, len(times)))
+        frames.append(pd.DataFrame({
+            'ts_code': ts_code,
+            'period_type': '1min',
+            'datetime': times,
+            'open': close - 0.01,
+            'high': close + rng.uniform(0, 0.05, len(times)),
+            'low': close - rng.uniform(0, 0.05, len(times)),
+            'close': close,
+            'volume': rng.integers(100, 1000, len(times)),
+            'amount': close * 1000
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _reference(bars, minutes):
+    """逐只股票、逐根目标K线按结束时间收集源K线"""
+    rows = []
+    for ts_code, group in bars.groupby('ts_code'):
+        for day in sorted(group['datetime'].dt.date.unique()):
+            for end in expected_bar_times(day, f'{minutes}min'):
+                members = group[(group['datetime'] > end - timedelta(minutes=minutes)) & (group['datetime'] <= end)]
+                if members.empty:
+                    continue
+                rows.append({'ts_code': ts_code, 'datetime': end, 'open': members['open'].iloc[0],
+                             'high': members['high'].max(), 'low': members['low'].min(),
+                             'close': members['close'].iloc[-1], 'volume': members['volume'].sum()})
+    return pd.DataFrame(rows)
+
+
+def test_session_boundaries():
+    times = pd.Series(pd.to_datetime(['2024-03-04 09:30', '2024-03-04 09:31', '2024-03-04 10:30',
+                                      '2024-03-04 10:31', '2024-03-04 11:30', '2024-03-04 13:00',
+                                      '2024-03-04 13:01', '2024-03-04 15:00']))
+    labels = session_bucket_end(times, 60).dt.strftime('%H:%M').tolist()
+    assert labels == ['10:30', '10:30', '10:30', '11:30', '11:30', '14:00', '14:00', '15:00']
+    assert session_bucket_end(times, 30).dt.strftime('%H:%M').tolist()[4:6] == ['11:30', '13:30']
+
+
+def test_rollup_frame_matches_reference():
+    bars = _minute_bars(['000001.SZ', '600000.SH'], [datetime(2024, 3, 4).date(), datetime(2024, 3, 5).date()])
+    engine = BarRollupEngine('1min', sync_service=object())
+    for period, minutes in [('5min', 5), ('15min', 15), ('30min', 30), ('60min', 60)]:
+        rolled = engine.rollup_frame(bars, period)
+        assert len(rolled) == 2 * 2 * 240 // minutes
+        assert rolled['datetime'].isin(
+            [t for d in (datetime(2024, 3, 4), datetime(2024, 3, 5)) for t in expected_bar_times(d, period)]).all()
+
+        reference = _reference(bars, minutes)
+        merged = rolled.merge(reference, on=['ts_code', 'datetime'], suffixes=('', '_ref'))
+        assert len(merged) == len(reference)
+        for column in ['open', 'high', 'low', 'close', 'volume']:
+            np.testing.assert_allclose(merged[column], merged[f'{column}_ref'])
+
+        # 前收盘价连续：每根K线的前收盘价等于同一股票上一根K线的收盘价
+        for _, group in rolled.groupby('ts_code'):
+            np.testing.assert_allclose(group['pre_close'].iloc[1:], group['close'].iloc[:-1])
+
+    # 最后一根未收盘的K线默认不输出
+    partial = bars[bars['datetime'] < datetime(2024, 3, 5, 10, 3)]
+    rolled = engine.rollup_frame(partial, '5min')
+    assert rolled['datetime'].max() == datetime(2024, 3, 5, 10, 0)
+    assert engine.rollup_frame(partial, '5min', include_partial=True)['datetime'].max() == datetime(2024, 3, 5, 10, 5)
+
+
+def test_incremental_rollup_from_watermark(app):
+    """先合成上午数据，再写入下午数据增量合成，结果与一次性合成一致且只读取高水位之后的K线"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, SyncState.__table__])
+        day = datetime(2024, 3, 4).date()
+        bars = _minute_bars(['000001.SZ', '000002.SZ', '600000.SH'], [day])
+        noon = datetime(2024, 3, 4, 11, 30)
+        bars[bars['datetime'] <= noon].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+
+        engine = BarRollupEngine('1min', batch_size=2)
+        first = engine.rollup()
+        assert first['success'] and first['periods'] == {'5min': 72, '15min': 24, '30min': 12, '60min': 6}
+        assert SyncState.load_watermarks('60min') == {c: noon for c in ['000001.SZ', '000002.SZ', '600000.SH']}
+
+        bars[bars['datetime'] > noon].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        second = engine.rollup()
+        assert second['periods'] == {'5min': 72, '15min': 24, '30min': 12, '60min': 6}
+        assert second['source_bars'] == 3 * 120
+
+        # 没有新K线时不写入
+        assert sum(engine.rollup()['periods'].values()) == 0
+
+        stored = pd.read_sql(
+            StockMinuteData.query.filter(StockMinuteData.period_type == '30min').order_by(
+                StockMinuteData.ts_code, StockMinuteData.datetime).statement, db.engine)
+        expected = engine.rollup_frame(bars, '30min')
+        np.testing.assert_allclose(stored['close'], expected['close'])
+        np.testing.assert_allclose(stored['pre_close'], expected['pre_close'])
+        assert stored['volume'].tolist() == expected['volume'].tolist()
+
+
+def test_all_periods_sync_fetches_once(app):
+    """多周期同步只请求一次5分钟数据，15/30/60分钟由本地合成"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, SyncState.__table__])
+        fake_baostock.history_queries.clear()
+        with MinuteDataSyncService(bs_module=fake_baostock) as service:
+            results = service.sync_all_periods_for_stock('000001.SZ', '2024-03-04', '2024-03-05')
+
+        assert len(fake_baostock.history_queries) == 1
+        assert {p: r['data_count'] for p, r in results.items()} == {
+            '5min': 96, '15min': 32, '30min': 16, '60min': 8}
+        sixty = StockMinuteData.query.filter_by(period_type='60min').order_by(StockMinuteData.datetime).all()
+        assert [bar.datetime.strftime('%H:%M') for bar in sixty[:4]] == ['10:30', '11:30', '14:00', '15:00']
+        assert sixty[0].volume == 12 * 1000
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+全市场批量指标引擎测试
+验证面板计算与逐只股票流式计算结果一致（含长度不同的股票），一次查询、一次写入的入库流程，
+以及只重算部分指标时不删除、不覆盖其他指标
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide
+from app.services.batch_indicator_engine import BatchIndicatorEngine, BarPanel
+from app.services.streaming_indicators import StreamingIndicatorEngine
+
+
+def _make_bars(codes, lengths, start, seed=11):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for ts_code, n in zip(codes, lengths):
+        close = 10 + np.cumsum(rng.normal(0, 0.05, n))
+        frames.append(pd.DataFrame({
+            'ts_code': ts_code,
+            'period_type': '5min',
+            'datetime': [start + timedelta(minutes=5 * i) for i in range(n)],
+            'open': close,
+            'high': close + rng.uniform(0, 0.1, n),
+            'low': close - rng.uniform(0, 0.1, n),
+            'close': close,
+            'volume': rng.integers(100, 1000, n).astype(float),
+            'amount': close * 1000
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _as_dict(records):
+    return {(r['ts_code'], pd.Timestamp(r['datetime']), r['indicator_name']):
+            [r[f'value{k}'] for k in range(1, 5) if r[f'value{k}'] is not None] for r in records}
+
+
+def test_panel_matches_streaming():
+    """面板计算与逐只股票流式计算结果一致"""
+    bars = _make_bars(['000001.SZ', '000002.SZ', '600000.SH', '600001.SH'], [150, 90, 30, 1],
+                      datetime(2024, 1, 2, 9, 35))
+    engine = BatchIndicatorEngine()
+    panel = BarPanel.from_frame(bars.sort_values(['ts_code', 'datetime']))
+    batch = _as_dict(engine.to_records(panel, engine.compute_panel(panel), '5min').to_dict('records'))
+    
+    streaming = StreamingIndicatorEngine()
+    expected = []
+    for ts_code, group in bars.groupby('ts_code'):
+        expected.extend(streaming.update_many(ts_code, '5min', group))
+    expected = _as_dict(expected)
+    
+    # 只有一根K线时批量引擎不输出OBV
+    expected = {k: v for k, v in expected.items() if not (k[0] == '600001.SH' and k[2] == 'OBV')}
+    assert set(batch) == set(expected)
+    for key, values in expected.items():
+        assert np.allclose(batch[key], values, rtol=1e-9, atol=1e-9), key
+
+
+def test_calculate_one_query_one_insert(app):
+    """多只股票、多个周期一次读取并一次写入"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, RealtimeIndicator.__table__])
+        end_time = datetime(2024, 1, 5, 15, 0)
+        bars = _make_bars(['000001.SZ', '000002.SZ'], [60, 40], datetime(2024, 1, 4, 9, 35))
+        bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        bars.assign(period_type='15min').iloc[::3].to_sql('stock_minute_data', db.engine,
+                                                         if_exists='append', index=False)
+        
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = BatchIndicatorEngine().calculate(['000001.SZ', '000002.SZ'], ['5min', '15min'],
+                                                      ['MACD', 'RSI', 'OBV'], lookback_days=3, end_time=end_time)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        
+        assert result['success']
+        assert result['total_bars'] == 100 + 34
+        assert result['stored_records'] == RealtimeIndicator.query.count() > 0
+        # 读取、删除旧指标、批量插入各一次
+        assert len(statements) == 3
+        
+        # 写入失败时删除一并回滚，旧指标保留
+        stored = RealtimeIndicator.query.count()
+        engine = BatchIndicatorEngine()
+        broken = engine.to_records
+        engine.to_records = lambda *args: broken(*args).assign(indicator_name=None)
+        result = engine.calculate(['000001.SZ', '000002.SZ'], ['5min', '15min'], ['MACD', 'RSI', 'OBV'],
+                                  lookback_days=3, end_time=end_time)
+        assert not result['success']
+        assert RealtimeIndicator.query.count() == stored
+
+
+def test_subset_recompute_keeps_other_indicators(app):
+    """只重算MA时其他指标的行（长表）和列（宽表）不变，截止时间之后的MA也不被删除"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, RealtimeIndicator.__table__,
+                                                       RealtimeIndicatorWide.__table__])
+        codes = ['000001.SZ', '000002.SZ']
+        end_time = datetime(2024, 1, 5, 15, 0)
+        bars = _make_bars(codes, [80, 70], datetime(2024, 1, 4, 9, 35))
+        bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        engine = BatchIndicatorEngine()
+
+        def counts():
+            return dict(db.session.query(RealtimeIndicator.indicator_name, db.func.count())
+                        .group_by(RealtimeIndicator.indicator_name).all())
+
+        assert engine.calculate(codes, ['5min'], lookback_days=3, end_time=end_time)['success']
+        full = counts()
+        assert len(full) == 15
+        assert engine.calculate(codes, ['5min'], ['MA'], lookback_days=3, end_time=end_time)['success']
+        assert counts() == full
+        cutoff = datetime(2024, 1, 4, 12, 0)
+        assert engine.calculate(codes, ['5min'], ['MA'], lookback_days=3, end_time=cutoff)['success']
+        assert counts() == full
+
+        def wide_frame():
+            return pd.read_sql(db.session.query(RealtimeIndicatorWide).statement, db.engine) \
+                .sort_values(['ts_code', 'datetime']).reset_index(drop=True)
+
+        assert engine.calculate(codes, ['5min'], lookback_days=3, end_time=end_time, layout='wide')['success']
+        before = wide_frame()
+        assert before['rsi'].notna().sum() > 0
+        assert engine.calculate(codes, ['5min'], ['MA'], lookback_days=3, end_time=end_time, layout='wide')['success']
+        pd.testing.assert_frame_equal(wide_frame(), before)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量写入测试
+使用SQLite内存数据库验证因子值按主键批量写入与覆盖，以及分钟数据表缺少唯一键时不会重复插入
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from app.extensions import db
+from app.models import FactorValues
+from app.models.stock_minute_data import StockMinuteData
+from app.services.factor_engine import FactorEngine
+from app.services.minute_data_sync_service import MinuteDataSyncService
+
+
+def _make_engine():
+    """构造不依赖因子定义表的因子引擎"""
+    engine = FactorEngine.__new__(FactorEngine)
+    engine.compute_mode = 'panel'
+    engine.factor_definitions = {}
+    engine._init_builtin_factors()
+    return engine
+
+
+def test_bulk_upsert_factor_values(app):
+    """重复写入同一主键时覆盖原值"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[FactorValues.__table__])
+        engine = _make_engine()
+        
+        df = pd.DataFrame({
+            'ts_code': [f'{i:06d}.SZ' for i in range(25)],
+            'trade_date': pd.Timestamp('2024-05-06'),
+            'factor_id': 'momentum_5d',
+            'factor_value': np.linspace(-0.1, 0.1, 25),
+            'z_score': np.nan,
+        })
+        first = engine.bulk_upsert_factor_values(df, chunk_size=10)
+        assert first['success'] and first['rows_written'] == 25
+        
+        df['factor_value'] = 0.5
+        second = engine.bulk_upsert_factor_values(df.iloc[:5], chunk_size=10)
+        assert second['rows_written'] == 5
+        
+        assert FactorValues.query.count() == 25
+        updated = FactorValues.query.filter_by(ts_code='000000.SZ').one()
+        assert float(updated.factor_value) == 0.5
+        assert updated.z_score is None
+        print(f"✅ 批量写入 {first['rows_written']} 行, 耗时 {first['seconds']:.3f} 秒")
+
+
+def test_upsert_minute_dataframe_counts(app):
+    """分钟数据批量写入应正确统计新增与更新数量"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__])
+        service = MinuteDataSyncService()
+        
+        df = pd.DataFrame({
+            'ts_code': '000001.SZ',
+            'datetime': pd.date_range('2024-01-02 09:35', periods=48, freq='5min'),
+            'period_type': '5min',
+            'open': 10.0, 'high': 10.2, 'low': 9.9, 'close': 10.1,
+            'volume': 1000, 'amount': 10100.0,
+            'pre_close': 10.0, 'change': 0.1, 'pct_chg': 1.0,
+        })
+        first = service.upsert_minute_dataframe(df.iloc[:30], chunk_size=20)
+        assert first['inserted'] == 30 and first['updated'] == 0
+        before = {(r.datetime, r.id, r.created_at) for r in StockMinuteData.query.all()}
+        
+        df['close'] = 10.5
+        second = service.upsert_minute_dataframe(df, chunk_size=20)
+        assert second['inserted'] == 18 and second['updated'] == 30
+        
+        assert StockMinuteData.query.count() == 48
+        assert StockMinuteData.query.filter_by(close=10.5).count() == 48
+        # 冲突时原地更新：自增id和创建时间保持不变
+        after = {(r.datetime, r.id, r.created_at) for r in StockMinuteData.query.all()}
+        assert before <= after
+        print(f"✅ 分钟数据新增 {second['inserted']} 条, 更新 {second['updated']} 条")
+
+
+def test_upsert_minute_dataframe_without_unique_key(app):
+    """未迁移的旧表（唯一索引不存在）回退为逐条写入，重复同步不产生重复K线"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__])
+        db.session.execute(text('DROP INDEX idx_ts_code_datetime_period'))
+        db.session.execute(text('CREATE INDEX idx_ts_code_datetime_period '
+                                'ON stock_minute_data (ts_code, datetime, period_type)'))
+        db.session.commit()
+        service = MinuteDataSyncService()
+        assert not service.has_minute_unique_key()
+        
+        df = pd.DataFrame({
+            'ts_code': '000001.SZ',
+            'datetime': pd.date_range('2024-01-02 09:35', periods=12, freq='5min'),
+            'period_type': '5min',
+            'open': 10.0, 'high': 10.2, 'low': 9.9, 'close': 10.1,
+            'volume': 1000, 'amount': 10100.0,
+        })
+        first = service.upsert_minute_dataframe(df)
+        df['close'] = 10.5
+        second = service.upsert_minute_dataframe(df)
+        
+        assert (first['inserted'], first['updated']) == (12, 0)
+        assert (second['inserted'], second['updated']) == (0, 12)
+        assert StockMinuteData.query.count() == 12
+        assert StockMinuteData.query.filter_by(close=10.5).count() == 12
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日线列式缓存测试
+使用SQLite内存数据库和临时目录，验证分区导出、条件下推读取、增量刷新，以及数据库写入后缓存不会返回过期数据
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import date, timedelta
+
+import pandas as pd
+
+from app.extensions import db
+from app.models import StockDailyHistory, FactorValues
+from app.services.factor_engine import FactorEngine
+from app.utils import columnar_store
+from app.utils.columnar_store import ColumnarStore, read_daily_table
+
+
+def _add_history(start, days, codes):
+    for i in range(days):
+        trade_date = start + timedelta(days=i)
+        for j, ts_code in enumerate(codes):
+            db.session.add(StockDailyHistory(ts_code=ts_code, trade_date=trade_date,
+                                             close=10 + i + j, vol=100 * (i + 1)))
+    db.session.commit()
+
+
+def test_export_read_and_refresh(app, tmp_path):
+    """按月分区导出后读取结果与数据库一致，刷新时只追加新月份"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__])
+        codes = ['000001.SZ', '000002.SZ', '600000.SH']
+        _add_history(date(2024, 1, 1), 60, codes)
+        
+        store = ColumnarStore(root=str(tmp_path))
+        result = store.export_range('stock_daily_history', '2024-01-01', '2024-02-29')
+        assert result['partitions'] == 2 and result['rows'] == 60 * 3
+        assert store.covers('stock_daily_history', '2024-01-10', '2024-02-20')
+        assert not store.covers('stock_daily_history', '2024-01-10', '2024-03-05')
+        
+        # 日期范围 + 股票代码 + 列投影下推
+        df = store.read('stock_daily_history', '2024-01-25', '2024-02-05', ['000002.SZ', '600000.SH'],
+                        columns=['ts_code', 'trade_date', 'close'])
+        assert list(df.columns) == ['ts_code', 'trade_date', 'close']
+        assert len(df) == 12 * 2
+        
+        expected = pd.read_sql(
+            StockDailyHistory.query.filter(
+                StockDailyHistory.ts_code.in_(['000002.SZ', '600000.SH']),
+                StockDailyHistory.trade_date >= date(2024, 1, 25),
+                StockDailyHistory.trade_date <= date(2024, 2, 5)
+            ).order_by(StockDailyHistory.ts_code, StockDailyHistory.trade_date).statement, db.engine)
+        assert df['close'].tolist() == expected['close'].astype(float).tolist()
+        assert df['trade_date'].tolist() == pd.to_datetime(expected['trade_date']).dt.date.tolist()
+        
+        # 追加三月数据后刷新：重建二月并新增三月分区
+        _add_history(date(2024, 2, 29) + timedelta(days=1), 10, codes)
+        store.export_range('stock_daily_history', '2024-02-01', '2024-03-10')
+        manifest = store.load_manifest('stock_daily_history')
+        assert {key: entry['rows'] for key, entry in manifest['partitions'].items()} == \
+            {'2024-01': 93, '2024-02': 87, '2024-03': 30}
+        assert manifest['min_date'] == '2024-01-01' and manifest['max_date'] == '2024-03-10'
+        
+        df = store.read('stock_daily_history', '2024-03-01', '2024-03-10', ['000001.SZ'])
+        assert len(df) == 10
+        print(f"✅ 列式缓存分区: {manifest['partitions']}")
+
+
+def test_writes_are_not_shadowed_by_cache(app, tmp_path, monkeypatch):
+    """缓存导出后数据库写入新日期、回补历史月份或更新因子值，读取都能拿到数据库中的最新数据"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, FactorValues.__table__])
+        store = ColumnarStore(root=str(tmp_path))
+        monkeypatch.setattr(columnar_store, '_default_store', store)
+        codes = ['000001.SZ', '000002.SZ']
+        _add_history(date(2024, 4, 1), 37, codes)
+
+        # 导出到 05-07（refresh 使用当天作为截止日期），清单记录数据中实际的最新日期
+        store.export_range('stock_daily_history', '2024-04-01', '2024-05-07')
+        assert store.load_manifest('stock_daily_history')['max_date'] == '2024-05-07'
+        assert store.covers('stock_daily_history', '2024-04-01', '2024-05-31')
+
+        # 其他进程写入当天数据（未调用 invalidate），COUNT/MAX 核对发现不一致后回退到数据库
+        _add_history(date(2024, 5, 8), 1, codes)
+        assert not store.covers('stock_daily_history', '2024-05-01', '2024-05-08')
+        assert len(read_daily_table('stock_daily_history', '2024-05-08', '2024-05-08')) == 2
+        assert store.covers('stock_daily_history', '2024-04-01', '2024-04-30')
+
+        # 回补已缓存的历史月份同样被发现，refresh 后重新命中缓存
+        db.session.add(StockDailyHistory(ts_code='600000.SH', trade_date=date(2024, 4, 15), close=8))
+        db.session.commit()
+        assert not store.covers('stock_daily_history', '2024-04-01', '2024-04-30')
+        store.export_range('stock_daily_history', '2024-04-01', '2024-05-31')
+        assert store.covers('stock_daily_history', '2024-04-01', '2024-05-31')
+        assert len(store.read('stock_daily_history', '2024-04-15', '2024-04-15')) == 3
+
+        # 因子值：保存后对应月份失效，覆盖写入（行数不变）也不会读到旧值
+        engine = FactorEngine()
+        engine.save_factor_values(pd.DataFrame({
+            'ts_code': codes, 'trade_date': [date(2024, 5, 6)] * 2, 'factor_id': 'momentum_5d',
+            'factor_value': [0.1, 0.2]
+        }))
+        store.export_range('factor_values', '2024-05-01', '2024-05-07')
+        assert store.covers('factor_values', '2024-05-01', '2024-05-07')
+        engine.save_factor_values(pd.DataFrame({
+            'ts_code': codes, 'trade_date': [date(2024, 5, 7)] * 2, 'factor_id': 'momentum_5d',
+            'factor_value': [0.3, 0.4]
+        }))
+        engine.save_factor_values(pd.DataFrame({
+            'ts_code': ['000001.SZ'], 'trade_date': [date(2024, 5, 6)], 'factor_id': 'momentum_5d',
+            'factor_value': [0.5]
+        }))
+        assert store.load_manifest('factor_values')['partitions']['2024-05']['stale']
+        df = read_daily_table('factor_values', '2024-05-06', '2024-05-07')
+        assert len(df) == 4
+        assert df.set_index(['ts_code', 'trade_date'])['factor_value'].astype(float).to_dict()[
+            ('000001.SZ', date(2024, 5, 6))] == 0.5
+
+        # refresh 重建失效的月份
+        store.refresh(['factor_values'])
+        assert store.covers('factor_values', '2024-05-01', '2024-05-07')
+        cached = store.read('factor_values', '2024-05-06', '2024-05-07')
+        assert sorted(cached['factor_value'].tolist()) == [0.2, 0.3, 0.4, 0.5]
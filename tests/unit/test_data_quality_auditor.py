@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分钟数据质量审计测试
+验证按交易时段生成的K线网格、全市场只用一次分组计数查询、只对不达标股票读取明细，
+以及缺口列表交给同步服务后只补齐缺失的K线
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, time
+
+import pandas as pd
+from sqlalchemy import event
+
+import fake_baostock
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.sync_state import SyncState
+from app.services.data_quality_auditor import MinuteDataAuditor
+from app.services.minute_data_sync_service import MinuteDataSyncService
+from app.utils.market_calendar import expected_bar_times
+
+DAYS = [datetime(2024, 3, 4).date(), datetime(2024, 3, 5).date()]
+START, END = datetime(2024, 3, 4), datetime(2024, 3, 5, 23, 59)
+
+
+def _bars(ts_code, times):
+    return pd.DataFrame({
+        'ts_code': ts_code, 'period_type': '5min', 'datetime': times,
+        'open': 10.0, 'high': 10.1, 'low': 9.9, 'close': 10.0, 'volume': 1000, 'amount': 10000.0
+    })
+
+
+def _seed():
+    """000001 完整；000002 缺 3/4 10:05-10:15 和 3/5 收盘3根；600000 有一根重复和一根午休K线"""
+    grid = [t for day in DAYS for t in expected_bar_times(day, '5min')]
+    holes = {datetime(2024, 3, 4, 10, 5), datetime(2024, 3, 4, 10, 10), datetime(2024, 3, 4, 10, 15),
+             datetime(2024, 3, 5, 14, 50), datetime(2024, 3, 5, 14, 55), datetime(2024, 3, 5, 15, 0)}
+    frames = [
+        _bars('000001.SZ', grid),
+        _bars('000002.SZ', [t for t in grid if t not in holes]),
+        _bars('600000.SH', grid + [datetime(2024, 3, 4, 12, 0)])
+    ]
+    pd.concat(frames).to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+    # 唯一键之外的重复写入（模拟旧数据表没有唯一约束时的重复行）
+    db.session.execute(StockMinuteData.__table__.insert().values(
+        ts_code='600000.SH', period_type='5min', datetime=datetime(2024, 3, 4, 9, 35),
+        open=10.0, high=10.1, low=9.9, close=10.0, volume=1000, amount=10000.0))
+    db.session.commit()
+
+
+def _create_tables():
+    # 去掉唯一约束以便写入重复行
+    table = StockMinuteData.__table__.to_metadata(db.MetaData())
+    for constraint in [c for c in table.constraints if c.__class__.__name__ == 'UniqueConstraint']:
+        table.constraints.remove(constraint)
+    for index in [i for i in table.indexes if i.unique]:
+        table.indexes.remove(index)
+    table.create(bind=db.engine)
+    SyncState.__table__.create(bind=db.engine)
+
+
+def test_expected_grid_follows_sessions(app):
+    with app.app_context():
+        auditor = MinuteDataAuditor()
+        grid = auditor.expected_grid(datetime(2024, 3, 8, 11, 0), datetime(2024, 3, 11, 9, 50), '5min')
+        # 周五 11:00-11:30、13:05-15:00，周末跳过，周一 9:35-9:50
+        assert len(grid) == 7 + 24 + 4
+        assert grid[0] == datetime(2024, 3, 8, 11, 0) and grid[-1] == datetime(2024, 3, 11, 9, 50)
+        assert datetime(2024, 3, 8, 12, 0) not in grid
+        assert list(auditor.expected_grid(START, END, '60min').strftime('%H:%M')[:4]) == \
+            ['10:30', '11:30', '14:00', '15:00']
+
+
+def test_audit_counts_once_and_drills_down_failed_only(app):
+    with app.app_context():
+        _create_tables()
+        _seed()
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        result = MinuteDataAuditor().audit('5min', START, END)
+
+        minute_queries = [s for s in statements if 'stock_minute_data' in s]
+        assert len(minute_queries) == 2
+        assert 'GROUP BY' in minute_queries[0]
+        assert "'000001.SZ'" not in minute_queries[1] and minute_queries[1].count('?') >= 2
+
+        assert result['expected_bars'] == 96
+        assert (result['total_stocks'], result['failed_stocks']) == (3, 2)
+        stocks = {s['ts_code']: s for s in result['stocks']}
+        assert stocks['000001.SZ']['status'] == 'ok' and 'gaps' not in stocks['000001.SZ']
+        assert stocks['000002.SZ']['missing_count'] == 6
+        assert stocks['000002.SZ']['completeness'] == round(90 / 96 * 100, 2)
+        assert stocks['600000.SH']['duplicate_count'] == 1
+        assert stocks['600000.SH']['missing_count'] == 0
+        assert stocks['600000.SH']['duplicate_times'] == ['2024-03-04T09:35:00']
+        assert stocks['600000.SH']['off_grid_times'] == ['2024-03-04T12:00:00']
+
+        assert [(g['ts_code'], g['start'], g['end'], g['missing_bars']) for g in result['gaps']] == [
+            ('000002.SZ', datetime(2024, 3, 4, 10, 5), datetime(2024, 3, 4, 10, 15), 3),
+            ('000002.SZ', datetime(2024, 3, 5, 14, 50), datetime(2024, 3, 5, 15, 0), 3)
+        ]
+
+        # 指定股票时，区间内没有数据的股票整段缺失
+        missing = MinuteDataAuditor().audit('5min', START, END, ts_codes=['000001.SZ', '300001.SZ'])
+        assert missing['gaps'] == [{'ts_code': '300001.SZ', 'period_type': '5min', 'start': datetime(2024, 3, 4, 9, 35),
+                                    'end': datetime(2024, 3, 5, 15, 0), 'missing_bars': 96}]
+
+
+def test_backfill_fills_exactly_the_gaps(app):
+    with app.app_context():
+        _create_tables()
+        _seed()
+        gaps = MinuteDataAuditor().audit('5min', START, END, ts_codes=['000002.SZ'])['gaps']
+
+        fake_baostock.history_queries.clear()
+        with MinuteDataSyncService(bs_module=fake_baostock) as service:
+            result = service.backfill_gaps(gaps + [{'ts_code': '000001.SZ', 'period_type': '1min',
+                                                    'start': '2024-03-04T09:31:00', 'end': '2024-03-04T09:40:00'}])
+
+        assert fake_baostock.history_queries == [('sz.000002', '2024-03-04', '2024-03-05')]
+        assert result['success'] and result['filled_bars'] == 6 and result['skipped_gaps'] == 1
+        assert StockMinuteData.query.filter_by(ts_code='000002.SZ').count() == 96
+
+        # 补齐后复查通过，原有K线未被重写
+        after = MinuteDataAuditor().audit('5min', START, END, ts_codes=['000002.SZ'])
+        assert after['failed_stocks'] == 0 and after['gaps'] == []
+        kept = StockMinuteData.query.filter_by(ts_code='000002.SZ', datetime=datetime(2024, 3, 4, 9, 35)).one()
+        assert kept.close == 10.0
+
+
+def test_check_stock_uses_trading_sessions(app):
+    """跨午休和隔夜的24小时窗口只统计交易时段内的K线"""
+    with app.app_context():
+        _create_tables()
+        _seed()
+        auditor = MinuteDataAuditor()
+        end_time = datetime(2024, 3, 5, 11, 0)
+        result = auditor.check_stock('000002.SZ', '5min', hours=24, end_time=end_time)
+        # 3/4 11:00-15:00 共31根 + 3/5 9:35-11:00 共18根，缺口都不在窗口内
+        assert result['expected_count'] == 31 + 18
+        assert result['missing_count'] == 0
+        assert result['status'] == 'ok' and result['completeness'] == 100.0
+
+        result = auditor.check_stock('000002.SZ', '5min', hours=48, end_time=end_time)
+        assert result['missing_count'] == 3 and result['gaps'][0]['start'] == '2024-03-04T10:05:00'
+        assert auditor.check_stock('300001.SZ', '5min', end_time=end_time)['status'] == 'no_data'
+
+
+def test_off_grid_bars_do_not_mask_missing_bars(app):
+    """缺一根网格K线、多一根午休K线时去重后总数恰好等于网格数，仍应判定缺失；分段查询结果相同"""
+    with app.app_context():
+        _create_tables()
+        grid = [t for day in DAYS for t in expected_bar_times(day, '5min')]
+        hole = datetime(2024, 3, 5, 10, 0)
+        _bars('000003.SZ', [t for t in grid if t != hole] + [datetime(2024, 3, 4, 12, 0)]) \
+            .to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+
+        for auditor in [MinuteDataAuditor(), MinuteDataAuditor(grid_chunk_size=7)]:
+            for drill_down in [True, False]:
+                result = auditor.audit('5min', START, END, drill_down=drill_down)
+                stock = result['stocks'][0]
+                assert result['failed_stocks'] == 1 and stock['status'] == 'incomplete'
+                assert (stock['data_count'], stock['missing_count']) == (95, 1)
+                assert stock['completeness'] == round(95 / 96 * 100, 2)
+                assert stock['earliest_time'] == '2024-03-04T09:35:00'
+                assert stock['latest_time'] == '2024-03-05T15:00:00'
+            assert result['gaps'] == []
+            assert auditor.audit('5min', START, END)['gaps'] == [
+                {'ts_code': '000003.SZ', 'period_type': '5min', 'start': hole, 'end': hole, 'missing_bars': 1}]
+
+
+def test_session_open_auction_bars_are_valid(app):
+    """Tushare口径的1分钟线带 9:30、13:00 集合竞价K线：不算非交易时段K线，无需读取明细"""
+    with app.app_context():
+        _create_tables()
+        grid = [t for day in DAYS for t in expected_bar_times(day, '1min')]
+        auctions = [datetime.combine(day, t) for day in DAYS for t in (time(9, 30), time(13, 0))]
+        frames = [_bars('000001.SZ', grid + auctions),
+                  _bars('000002.SZ', grid + auctions + [datetime(2024, 3, 4, 12, 0)])]
+        pd.concat(frames).assign(period_type='1min').to_sql('stock_minute_data', db.engine, if_exists='append',
+                                                            index=False)
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        result = MinuteDataAuditor().audit('1min', START, END)
+
+        stocks = {s['ts_code']: s for s in result['stocks']}
+        assert result['expected_bars'] == 480 and result['failed_stocks'] == 1
+        assert stocks['000001.SZ']['status'] == 'ok' and stocks['000001.SZ']['completeness'] == 100.0
+        assert stocks['000002.SZ']['off_grid_times'] == ['2024-03-04T12:00:00']
+        # 分组计数一次，只读取 000002.SZ 的明细
+        assert len([s for s in statements if 'stock_minute_data' in s]) == 2
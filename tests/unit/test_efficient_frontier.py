@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+有效前沿 / 多情景优化测试
+验证情景网格、串行与进程池求解结果一致、同结构情景复用一个编译好的问题，以及接口的NDJSON流式返回
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import json
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+
+from app.api.ml_factor_api import ml_factor_bp
+from app.services.efficient_frontier import build_scenarios
+from app.services.mean_variance import get_problem_cache
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import FactorRiskModel
+
+RISK_AVERSIONS = [10.0, 40.0, 160.0, 640.0]
+
+
+def _inputs(n_stocks=40, seed=0):
+    rng = np.random.default_rng(seed)
+    exposures = np.hstack([np.eye(4)[rng.integers(0, 4, n_stocks)], rng.normal(size=(n_stocks, 2))])
+    factor_cov = np.cov(rng.normal(0, 0.01, (250, exposures.shape[1])), rowvar=False)
+    codes = [f'{600000 + i}.SH' for i in range(n_stocks)]
+    model = FactorRiskModel(None, codes, [f'F{k}' for k in range(exposures.shape[1])], exposures, factor_cov,
+                            rng.uniform(1e-4, 9e-4, n_stocks))
+    return pd.Series(rng.normal(0.001, 0.002, n_stocks), index=codes), model
+
+
+def test_build_scenarios():
+    scenarios = build_scenarios({'max_weight': 0.1}, [1.0, 4.0], [{}, {'max_weight': 0.05, 'min_weight': 0.001}])
+    assert scenarios == [
+        {'max_weight': 0.1, 'risk_aversion': 1.0},
+        {'max_weight': 0.1, 'risk_aversion': 4.0},
+        {'max_weight': 0.05, 'min_weight': 0.001, 'risk_aversion': 1.0},
+        {'max_weight': 0.05, 'min_weight': 0.001, 'risk_aversion': 4.0}
+    ]
+    assert build_scenarios(None, None, [{'max_weight': 0.2}]) == [{'max_weight': 0.2}]
+
+
+def test_frontier_serial_matches_parallel(monkeypatch):
+    # 工作进程数不超过CPU核数，单核环境下也按两个进程运行
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    expected_returns, model = _inputs()
+    optimizer = PortfolioOptimizer()
+    get_problem_cache().clear()
+
+    serial = optimizer.efficient_frontier(expected_returns, RISK_AVERSIONS, constraints={'max_weight': 0.2},
+                                          risk_model=model, max_workers=1)
+    # 同结构的情景只编译一次问题
+    assert get_problem_cache().stats()['misses'] == 1
+    parallel = optimizer.efficient_frontier(expected_returns, RISK_AVERSIONS, constraints={'max_weight': 0.2},
+                                            risk_model=model, max_workers=2)
+
+    assert serial['success'] and parallel['timing']['workers'] == 2
+    assert [p['index'] for p in serial['points']] == [3, 2, 1, 0]
+    risks = [p['expected_risk'] for p in serial['points']]
+    returns = [p['expected_return'] for p in serial['points']]
+    assert risks == sorted(risks) and returns == sorted(returns)
+    for a, b in zip(serial['points'], parallel['points']):
+        assert a['index'] == b['index'] and np.isclose(a['expected_risk'], b['expected_risk'], rtol=1e-5)
+        assert np.isclose(sum(a['weights'].values()), 1.0)
+
+
+def test_zero_risk_aversion():
+    """γ = 0 只最大化预期收益：权重按上界依次分配给预期收益最高的股票，前沿网格包含 γ = 0 时同样求解"""
+    expected_returns, model = _inputs()
+    optimizer = PortfolioOptimizer()
+    result = optimizer.optimize_portfolio(expected_returns, model, 'mean_variance',
+                                          {'risk_aversion': 0.0, 'max_weight': 0.25})
+    weights = pd.Series(result['weights']).reindex(expected_returns.index)
+    top = expected_returns.nlargest(4).index
+    assert np.allclose(weights[top], 0.25, atol=1e-5)
+    assert np.isclose(weights.drop(top).sum(), 0.0, atol=1e-5)
+
+    frontier = optimizer.efficient_frontier(expected_returns, [0.0] + RISK_AVERSIONS, constraints={'max_weight': 0.25},
+                                            risk_model=model, max_workers=1)
+    assert frontier['success'] and not frontier['failed'] and len(frontier['points']) == 5
+    assert frontier['points'][-1]['index'] == 0
+    assert frontier['points'][-1]['expected_return'] == max(p['expected_return'] for p in frontier['points'])
+
+
+def test_frontier_endpoint_streams_points():
+    expected_returns, model = _inputs(n_stocks=12)
+    app = Flask(__name__)
+    app.register_blueprint(ml_factor_bp)
+    client = app.test_client()
+    payload = {
+        'expected_returns': expected_returns.to_dict(),
+        'risk_model': model.to_frame().to_dict(),
+        'risk_aversions': RISK_AVERSIONS,
+        'constraint_sets': [{'max_weight': 0.3}, {'max_weight': 0.01}],
+        'max_workers': 1
+    }
+
+    response = client.post('/api/ml-factor/portfolio/frontier', json=payload)
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[0]['event'] == 'start' and events[0]['scenarios'] == 8
+    points = [e for e in events if e['event'] == 'point']
+    assert sorted(p['index'] for p in points) == list(range(8))
+    # max_weight 0.01 × 12 只股票不可行
+    assert sum(p['success'] for p in points) == 4
+    assert events[-1] == {**events[-1], 'event': 'done', 'succeeded': 4, 'failed': 4}
+
+    response = client.post('/api/ml-factor/portfolio/frontier', json={**payload, 'stream': False})
+    result = response.get_json()
+    assert result['success'] and len(result['points']) == 4 and len(result['failed']) == 4
+
+    response = client.post('/api/ml-factor/portfolio/frontier', json={'expected_returns': payload['expected_returns']})
+    assert response.status_code == 400
+
+    # 情景网格超过上限、工作进程数不是整数时拒绝；工作进程数不超过CPU核数
+    app.config['FRONTIER_MAX_SCENARIOS'] = 7
+    response = client.post('/api/ml-factor/portfolio/frontier', json=payload)
+    assert response.status_code == 400 and '上限' in response.get_json()['error']
+    app.config['FRONTIER_MAX_SCENARIOS'] = 8
+    response = client.post('/api/ml-factor/portfolio/frontier', json={**payload, 'max_workers': 'many'})
+    assert response.status_code == 400
+    response = client.post('/api/ml-factor/portfolio/frontier', json={**payload, 'max_workers': 10000})
+    start = json.loads(response.get_data(as_text=True).splitlines()[0])
+    assert start['workers'] <= (os.cpu_count() or 1)
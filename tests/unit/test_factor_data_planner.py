@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+因子数据加载计划器测试
+使用SQLite内存数据库验证每张表只读取一次
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import date, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models import StockDailyHistory, StockDailyBasic
+from app.services import factor_data_planner
+from app.services.factor_data_planner import FactorDataPlanner
+
+
+def test_planner_loads_each_table_once(app):
+    """多个因子共享同一张表时只查询一次"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, StockDailyBasic.__table__])
+        start = date(2024, 1, 1)
+        for i in range(30):
+            trade_date = start + timedelta(days=i)
+            db.session.add(StockDailyHistory(ts_code='000001.SZ', trade_date=trade_date, close=10 + i, vol=100))
+            db.session.add(StockDailyBasic(ts_code='000001.SZ', trade_date=trade_date, pe_ttm=10, pb=1, ps_ttm=2))
+        db.session.commit()
+        
+        calls = []
+        original = factor_data_planner.load_source_table
+        
+        def counting_load(key, ts_codes, date_range):
+            calls.append(key)
+            return original(key, ts_codes, date_range)
+        
+        factor_data_planner.load_source_table = counting_load
+        try:
+            planner = FactorDataPlanner(['000001.SZ'],
+                                        ['momentum_1d', 'volatility_20d', 'pe_percentile', 'pb_percentile'],
+                                        '2024-01-30', '2024-01-30')
+            planner.load()
+            momentum_data = planner.get_data('momentum_1d')
+            pe_data = planner.get_data('pe_percentile')
+        finally:
+            factor_data_planner.load_source_table = original
+        
+        assert sorted(calls) == ['basic', 'history']
+        assert len(momentum_data['history']) == 30
+        # 基本面数据按因子自身的日期范围切片
+        assert len(pe_data['basic']) == 1
+        
+        report = planner.get_load_report()
+        assert report['per_table']['history']['rows'] == 30
+        assert report['per_table']['history']['bytes'] > 0
+        assert report['queries_saved'] == 2
+        print(f"✅ 数据加载报告: {report['total_rows']} 行, {report['total_bytes']} 字节")
+
+
+if __name__ == '__main__':
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+面板模式技术因子测试
+使用合成行情数据验证面板模式与逐股票计算结果一致
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from scipy import stats
+
+from app.services.factor_engine import FactorEngine, rolling_percentile_rank
+
+
+def _make_engine():
+    """构造不依赖数据库的因子引擎"""
+    engine = FactorEngine.__new__(FactorEngine)
+    engine.compute_mode = 'panel'
+    engine.factor_definitions = {}
+    engine._init_builtin_factors()
+    return engine
+
+
+def _make_history(n_stocks=20, n_days=80, seed=0):
+    """生成合成日线行情"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2024-01-01', periods=n_days)
+    codes = [f'{i:06d}.SZ' for i in range(n_stocks)]
+    index = pd.MultiIndex.from_product([codes, dates], names=['ts_code', 'trade_date'])
+    history = pd.DataFrame({
+        'close': 10 * np.exp(rng.normal(0, 0.02, len(index)).cumsum()),
+        'vol': rng.integers(100, 10000, len(index)),
+    }, index=index).reset_index()
+    return history
+
+
+def test_panel_matches_per_stock():
+    """面板模式结果应与逐股票计算一致"""
+    engine = _make_engine()
+    history = _make_history()
+    
+    panel_result = engine.calculate_technical_factors_panel([], '2024-03-01', '2024-03-01', history=history)
+    
+    for factor_id in FactorEngine.PANEL_TECHNICAL_FACTORS:
+        expected = engine.builtin_factors[factor_id]({'history': history}, factor_id)
+        actual = panel_result[panel_result['factor_id'] == factor_id]
+        
+        merged = expected.merge(actual, on=['ts_code', 'trade_date', 'factor_id'], how='outer', indicator=True)
+        assert (merged['_merge'] == 'both').all(), f"{factor_id} 行集合不一致"
+        assert np.allclose(merged['factor_value_x'], merged['factor_value_y']), f"{factor_id} 数值不一致"
+    
+    print("✅ 面板模式与逐股票计算结果一致")
+
+
+def test_panel_skips_missing_rows():
+    """停牌日不应产生因子值"""
+    engine = _make_engine()
+    history = _make_history(n_stocks=3, n_days=40)
+    suspended = (history['ts_code'] == '000001.SZ') & (history['trade_date'] == history['trade_date'].max())
+    history = history[~suspended]
+    
+    result = engine.calculate_technical_factors_panel([], '2024-02-01', '2024-02-01',
+                                                      factor_ids=['momentum_1d'], history=history)
+    last_date = result['trade_date'].max()
+    assert '000001.SZ' not in set(result.loc[result['trade_date'] == last_date, 'ts_code'])
+    print("✅ 停牌日无因子输出")
+
+
+def test_panel_matches_per_stock_with_mid_series_suspension():
+    """停牌期间的窗口按股票自己的交易日计数，复牌后的因子值与逐股票计算一致"""
+    engine = _make_engine()
+    history = _make_history(n_stocks=4, n_days=80, seed=2)
+    dates = history['trade_date'].drop_duplicates().sort_values()
+    suspended = (history['ts_code'] == '000001.SZ') & history['trade_date'].isin(dates.iloc[30:37])
+    history = history[~suspended]
+    
+    panel_result = engine.calculate_technical_factors_panel([], '2024-03-01', '2024-03-01', history=history)
+    
+    for factor_id in FactorEngine.PANEL_TECHNICAL_FACTORS:
+        expected = engine.builtin_factors[factor_id]({'history': history}, factor_id)
+        actual = panel_result[panel_result['factor_id'] == factor_id]
+        
+        merged = expected.merge(actual, on=['ts_code', 'trade_date', 'factor_id'], how='outer', indicator=True)
+        assert (merged['_merge'] == 'both').all(), f"{factor_id} 行集合不一致"
+        assert np.allclose(merged['factor_value_x'], merged['factor_value_y']), f"{factor_id} 数值不一致"
+        # 复牌当天已有因子值
+        resumed = actual[(actual['ts_code'] == '000001.SZ') & (actual['trade_date'] == dates.iloc[37])]
+        assert len(resumed) == 1, factor_id
+    
+    print("✅ 停牌后复牌的面板结果与逐股票计算一致")
+
+
+def test_rolling_percentile_matches_scipy():
+    """滚动分位数内核应与 percentileofscore 口径一致（含重复值）"""
+    rng = np.random.default_rng(1)
+    values = np.round(rng.normal(10, 2, 600))
+    group_ids = np.repeat([0, 1, 2], [300, 250, 50])
+    
+    actual = rolling_percentile_rank(values, group_ids, window=40, min_periods=5)
+    expected = pd.Series(values).groupby(group_ids).transform(
+        lambda s: s.rolling(40, min_periods=5).apply(lambda x: stats.percentileofscore(x, x.iloc[-1]) / 100)
+    ).to_numpy()
+    
+    assert np.allclose(actual, expected, equal_nan=True)
+    print("✅ 滚动分位数与scipy一致")
+
+
+if __name__ == '__main__':
+    test_panel_matches_per_stock()
+    test_panel_skips_missing_rows()
+    test_panel_matches_per_stock_with_mid_series_suspension()
+    test_rolling_percentile_matches_scipy()
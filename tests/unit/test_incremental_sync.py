@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基于高水位的增量同步测试
+使用本地模拟Baostock模块和SQLite内存数据库，验证缺口补齐与已是最新股票的跳过
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime
+
+import fake_baostock
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.sync_state import SyncState
+from app.services.minute_data_sync_service import MinuteDataSyncService
+
+
+def test_incremental_sync_fills_gaps_and_skips_current(app):
+    """首次同步写入高水位；再次同步时已是最新的股票不发起请求，落后的股票只补缺失交易日"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, SyncState.__table__])
+        
+        with MinuteDataSyncService(bs_module=fake_baostock) as service:
+            stocks = ['000001.SZ', '600000.SH']
+            # 2024-01-05 为周五
+            result = service.sync_incremental(stocks, '5min', end_date='2024-01-05', default_start='2024-01-04')
+            assert result['success_stocks'] == 2
+            assert StockMinuteData.query.count() == 2 * 2 * 48
+            
+            watermarks = SyncState.load_watermarks('5min')
+            assert watermarks['000001.SZ'] == datetime(2024, 1, 5, 15, 0)
+            
+            # 人为回退一只股票的高水位，模拟漏跑了周五
+            SyncState.save_watermarks('5min', {'600000.SH': datetime(2024, 1, 4, 15, 0)})
+            
+            fake_baostock.history_queries.clear()
+            # 截止到下周一：周末不是交易日，两只股票都需要同步周一
+            result = service.sync_incremental(stocks, '5min', end_date='2024-01-08')
+            queries = {code: (start, end) for code, start, end in fake_baostock.history_queries}
+            assert queries['sz.000001'] == ('2024-01-08', '2024-01-08')
+            assert queries['sh.600000'] == ('2024-01-05', '2024-01-08')
+            
+            fake_baostock.history_queries.clear()
+            result = service.sync_incremental(stocks, '5min', end_date='2024-01-08')
+            assert result['skipped_stocks'] == 2
+            assert fake_baostock.history_queries == []
+            print(f"✅ 增量同步完成, 共 {StockMinuteData.query.count()} 条记录")
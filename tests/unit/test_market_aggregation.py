@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+市场聚合统计测试
+验证市场宽度和行业板块统计与逐只股票计算结果一致、每次请求只有固定条数查询，
+以及同一根K线内的重复请求命中缓存
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+import app.services.market_aggregation as market_aggregation
+from app.extensions import db
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+from app.services.market_aggregation import MarketAggregationService, UNKNOWN_INDUSTRY
+from app.services.realtime_data_manager import RealtimeDataManager
+from app.services.realtime_monitor_service import RealtimeMonitorService
+
+INDUSTRIES = ['银行', '医药', '电子', None]
+
+
+def _market(n_stocks=40, n_bars=90):
+    """生成 n_stocks 只股票的1分钟K线，部分股票提前停止更新"""
+    rng = np.random.default_rng(7)
+    start = datetime(2024, 3, 4, 9, 31)
+    frames = []
+    for i in range(n_stocks):
+        bars = n_bars - (i % 5) * 3
+        close = 10 + np.cumsum(rng.normal(0, 0.05, bars))
+        pre_close = np.concatenate([[close[0]], close[:-1]])
+        frames.append(pd.DataFrame({
+            'ts_code': f'{i:06d}.SZ',
+            'period_type': '1min',
+            'datetime': [start + timedelta(minutes=k) for k in range(bars)],
+            'open': pre_close,
+            'high': close + 0.02,
+            'low': close - 0.02,
+            'close': close,
+            'volume': rng.integers(100, 1000, bars),
+            'amount': close * 1000,
+            'pre_close': pre_close,
+            'pct_chg': (close - pre_close) / pre_close * 100
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _expected(bars, window_minutes):
+    """逐只股票计算的参考结果"""
+    latest_time = bars['datetime'].max()
+    window = bars[bars['datetime'] > latest_time - timedelta(minutes=window_minutes)]
+    rows = []
+    for i, (ts_code, group) in enumerate(window.groupby('ts_code')):
+        first, last = group.iloc[0], group.iloc[-1]
+        rows.append({
+            'ts_code': ts_code,
+            'industry': INDUSTRIES[int(ts_code[:6]) % len(INDUSTRIES)] or UNKNOWN_INDUSTRY,
+            'pct_chg': last['pct_chg'],
+            'change_pct': (last['close'] - first['pre_close']) / first['pre_close'] * 100,
+            'volume': last['volume'],
+            'amount': last['amount']
+        })
+    return latest_time, pd.DataFrame(rows)
+
+
+@pytest.fixture
+def market_app(app, monkeypatch):
+    monkeypatch.setattr(market_aggregation, '_service', None)
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, StockBasic.__table__])
+        bars = _market()
+        bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        codes = bars['ts_code'].unique()
+        db.session.add_all([StockBasic(ts_code=c, name=f'股票{c[:6]}', industry=INDUSTRIES[i % len(INDUSTRIES)])
+                            for i, c in enumerate(codes)])
+        db.session.commit()
+        yield bars
+
+
+def test_breadth_and_sectors_match_reference(market_app):
+    bars = market_app
+    service = MarketAggregationService()
+
+    latest_time, breadth = service.get_market_breadth('1min', window_minutes=5)
+    expected_time, expected = _expected(bars, 5)
+    assert latest_time == expected_time
+    assert breadth['total_stocks'] == len(expected)
+    assert breadth['rising_stocks'] == int((expected['pct_chg'] > 0).sum())
+    assert breadth['falling_stocks'] == int((expected['pct_chg'] < 0).sum())
+    assert breadth['total_volume'] == pytest.approx(expected['volume'].sum())
+    assert breadth['avg_pct_chg'] == pytest.approx(round(expected['pct_chg'].mean(), 2))
+
+    _, sectors = service.get_sector_stats('1min', window_minutes=60)
+    _, expected = _expected(bars, 60)
+    reference = expected.groupby('industry')['change_pct'].mean().sort_values(ascending=False)
+    assert [s['sector_name'] for s in sectors] == list(reference.index)
+    assert UNKNOWN_INDUSTRY in reference.index
+    for sector in sectors:
+        members = expected[expected['industry'] == sector['sector_name']]
+        assert sector['avg_change_pct'] == pytest.approx(members['change_pct'].mean())
+        assert sector['stock_count'] == len(members)
+        assert sector['rising_count'] == int((members['change_pct'] > 0).sum())
+        assert sector['total_amount'] == pytest.approx(members['amount'].sum())
+
+
+def test_constant_queries_and_cache_per_bar(market_app):
+    """首次请求两条查询（最大时间 + 分组聚合），同一根K线内再次请求只查最大时间；新K线到达后重新聚合"""
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        manager = RealtimeDataManager()
+        monitor = RealtimeMonitorService()
+
+        overview = manager.get_market_overview()
+        # 最近5分钟内有K线的股票：停止更新不超过3分钟的两组
+        assert overview['success'] and overview['data']['total_stocks'] == 16
+        assert len(statements) == 2
+
+        statements.clear()
+        assert manager.get_market_overview() == overview
+        assert len(statements) == 1
+
+        statements.clear()
+        sectors = monitor.get_sector_performance(period_hours=1)
+        assert sectors['success'] and sectors['data']['total_sectors'] == len(INDUSTRIES)
+        assert len(statements) == 2
+
+        latest = market_app['datetime'].max() + timedelta(minutes=1)
+        pd.DataFrame([{
+            'ts_code': '000000.SZ', 'period_type': '1min', 'datetime': latest, 'open': 10.0, 'high': 10.5,
+            'low': 10.0, 'close': 10.5, 'volume': 100, 'amount': 1050.0, 'pre_close': 10.0, 'pct_chg': 5.0
+        }]).to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+
+        statements.clear()
+        refreshed = manager.get_market_overview()
+        assert len(statements) == 2
+        assert refreshed['data']['update_time'] == latest.isoformat()
+        assert refreshed['data']['total_stocks'] == 16
+        assert refreshed['data']['avg_pct_chg'] != overview['data']['avg_pct_chg']
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
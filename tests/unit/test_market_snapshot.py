@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+最新行情快照缓存测试
+验证增量更新口径（前收盘价、当日OHLCV、滚动平均成交量）、冷启动批量加载、Redis镜像，
+实时行情接口和分钟数据入库对快照的使用，以及非入库进程读取时重新核对新K线
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+import app.services.market_snapshot as market_snapshot
+from app.extensions import db
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+from app.services.market_snapshot import MarketSnapshotStore
+from app.services.minute_data_sync_service import MinuteDataSyncService
+from app.services.realtime_monitor_service import RealtimeMonitorService
+from fake_redis import FakeRedis
+
+
+def _bars(ts_code, day, n, seed=0, start_price=10.0):
+    rng = np.random.default_rng(seed)
+    close = start_price + np.cumsum(rng.normal(0, 0.02, n))
+    return pd.DataFrame({
+        'ts_code': ts_code,
+        'period_type': '1min',
+        'datetime': [datetime.combine(day, datetime.min.time()).replace(hour=9, minute=31) + timedelta(minutes=i)
+                     for i in range(n)],
+        'open': close - 0.01,
+        'high': close + 0.03,
+        'low': close - 0.03,
+        'close': close,
+        'volume': rng.integers(100, 1000, n),
+        'amount': close * 1000
+    })
+
+
+@pytest.fixture
+def snapshot_registry(monkeypatch):
+    """替换全局快照缓存，避免测试之间共享状态"""
+    stores = {}
+    monkeypatch.setattr(market_snapshot, '_stores', stores)
+    return stores
+
+
+def test_incremental_fields():
+    """前收盘价取上一交易日最后收盘，当日OHLCV累计，平均成交量不含当前K线"""
+    store = MarketSnapshotStore(mirror=False, volume_window=3)
+    day1 = _bars('000001.SZ', datetime(2024, 1, 2).date(), 5, seed=1)
+    day2 = _bars('000001.SZ', datetime(2024, 1, 3).date(), 4, seed=2)
+    for bar in pd.concat([day1, day2]).to_dict('records'):
+        store.update_bar('000001.SZ', bar)
+    # 重复或更早的K线被忽略
+    assert store.update_bar('000001.SZ', day2.iloc[1].to_dict()) is None
+
+    snapshot = store.get('000001.SZ')
+    assert snapshot['prev_close'] == pytest.approx(day1['close'].iloc[-1])
+    assert snapshot['close'] == pytest.approx(day2['close'].iloc[-1])
+    assert snapshot['day_open'] == pytest.approx(day2['open'].iloc[0])
+    assert snapshot['day_high'] == pytest.approx(day2['high'].max())
+    assert snapshot['day_low'] == pytest.approx(day2['low'].min())
+    assert snapshot['day_volume'] == day2['volume'].sum()
+    assert snapshot['avg_volume'] == pytest.approx(day2['volume'].iloc[-4:-1].mean())
+    assert snapshot['volume_ratio'] == pytest.approx(day2['volume'].iloc[-1] / day2['volume'].iloc[-4:-1].mean())
+    assert snapshot['change_pct'] == pytest.approx((day2['close'].iloc[-1] / day1['close'].iloc[-1] - 1) * 100)
+
+    # 批量更新与逐根更新结果一致
+    batch_store = MarketSnapshotStore(mirror=False, volume_window=3)
+    assert batch_store.update_bars(pd.concat([day1, day2])) == 1
+    assert batch_store.get('000001.SZ') == snapshot
+
+
+def test_cold_load_and_redis_mirror(app):
+    """冷启动两次查询加载全部股票；快照镜像到Redis后其他进程可直接恢复"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, StockBasic.__table__])
+        codes = [f'{i:06d}.SZ' for i in range(30)]
+        today = datetime.now().date()
+        frames = []
+        for i, ts_code in enumerate(codes):
+            frames.append(_bars(ts_code, today - timedelta(days=3), 30, seed=i))
+            frames.append(_bars(ts_code, today - timedelta(days=2), 20, seed=100 + i))
+        bars = pd.concat(frames, ignore_index=True)
+        bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        db.session.add_all([StockBasic(ts_code=c, name=f'股票{c[:6]}') for c in codes])
+        db.session.commit()
+
+        client = FakeRedis()
+        store = MarketSnapshotStore(redis_client=client)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        snapshots = store.ensure_loaded(codes)
+        loaded_queries = len(statements)
+        store.ensure_loaded(codes)
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert loaded_queries == 2 and len(statements) == 2
+        assert len(snapshots) == 30
+        first = bars[bars['ts_code'] == codes[0]]
+        assert snapshots[codes[0]]['name'] == '股票000000'
+        assert snapshots[codes[0]]['prev_close'] == pytest.approx(first['close'].iloc[29])
+        assert snapshots[codes[0]]['close'] == pytest.approx(first['close'].iloc[-1])
+
+        other = MarketSnapshotStore(redis_client=client)
+        assert other.load_from_redis(codes) == 30
+        restored = other.get(codes[0])
+        for field in ('close', 'prev_close', 'day_volume', 'volume_ratio', 'change_pct'):
+            assert restored[field] == pytest.approx(snapshots[codes[0]][field])
+        assert restored['datetime'] == snapshots[codes[0]]['datetime']
+
+
+def test_mirror_disabled_when_redis_unavailable():
+    class BrokenRedis:
+        def pipeline(self, transaction=True):
+            raise ConnectionError('redis down')
+
+    store = MarketSnapshotStore(redis_client=BrokenRedis())
+    store.update_bar('000001.SZ', _bars('000001.SZ', datetime(2024, 1, 2).date(), 1).iloc[0].to_dict())
+    assert store.mirror is False
+    assert store.get('000001.SZ') is not None
+
+
+def test_quotes_and_ingest_use_snapshot(app, snapshot_registry):
+    """实时行情接口批量读取快照；分钟数据入库后快照随之更新"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, StockBasic.__table__])
+        snapshot_registry['1min'] = MarketSnapshotStore(redis_client=FakeRedis())
+        today = datetime.now().date() - timedelta(days=1)
+        now = datetime.now()
+        codes = ['000001.SZ', '600000.SH']
+        service = MinuteDataSyncService()
+        for i, ts_code in enumerate(codes):
+            bars = _bars(ts_code, today, 10, seed=i)
+            bars['datetime'] = [now - timedelta(minutes=30 - k) for k in range(10)]
+            service.upsert_minute_dataframe(bars)
+
+        # 首次读取前全局缓存中已有入库时写入的快照
+        assert set(snapshot_registry['1min'].snapshots) == set(codes)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        result = RealtimeMonitorService().get_realtime_quotes(codes)
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert result['success'] and result['data']['total_count'] == 2
+        assert statements == []
+        quote = result['data']['quotes'][0]
+        assert quote['current_price'] == pytest.approx(snapshot_registry['1min'].get('000001.SZ')['close'])
+
+
+def test_universe_anomaly_scan(app, snapshot_registry):
+    """全市场异动扫描：冷启动一次读取全部股票，之后只增量读取新K线；结果与逐只股票计算一致，只返回前 top_k 只"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, StockBasic.__table__])
+        snapshot_registry['1min'] = MarketSnapshotStore(mirror=False)
+        day1, day2 = datetime(2024, 3, 4).date(), datetime(2024, 3, 5).date()
+        frames = []
+        for i in range(40):
+            ts_code = f'{i:06d}.SZ'
+            today = _bars(ts_code, day2, 60, seed=100 + i)
+            if i % 4 == 0:
+                # 放量拉升
+                today.loc[today.index[-1], ['close', 'high', 'volume']] = [11.0, 11.1, 5000]
+            frames += [_bars(ts_code, day1, 120, seed=i), today]
+        bars = pd.concat(frames, ignore_index=True)
+        bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        db.session.add_all([StockBasic(ts_code=c, name=f'股票{c[:6]}') for c in bars['ts_code'].unique()])
+        db.session.commit()
+
+        reference = {}
+        for ts_code, group in bars.groupby('ts_code'):
+            prev_close = group[group['datetime'].dt.date == day1]['close'].iloc[-1]
+            last, prior = group.iloc[-1], group.iloc[-21:-1]
+            change_pct = (last['close'] - prev_close) / prev_close * 100
+            volume_ratio = last['volume'] / prior['volume'].mean()
+            types = []
+            if abs(change_pct) >= 5.0:
+                types.append('急涨' if change_pct > 0 else '急跌')
+            if volume_ratio >= 3.0:
+                types.append('放量')
+            if last['high'] > prior['high'].max() * 1.01 or last['low'] < prior['low'].min() * 0.99:
+                types.append('突破')
+            if types:
+                reference[ts_code] = (types, min(50, abs(change_pct) * 5) + min(50, (volume_ratio - 1) * 10))
+
+        monitor = RealtimeMonitorService()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = monitor.detect_anomalies(top_k=5)
+            # 最大id、最大时间、上一交易日最后时间、K线、股票名称
+            assert len(statements) == 5
+
+            statements.clear()
+            sentiment = monitor.get_market_sentiment()
+            assert len(statements) == 1
+
+            new_bar = _bars('000001.SZ', day2, 61, seed=101).iloc[[-1]]
+            new_bar.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+            statements.clear()
+            monitor.detect_anomalies()
+            assert len(statements) == 2
+            assert snapshot_registry['1min'].get('000001.SZ')['datetime'] == new_bar['datetime'].iloc[0]
+
+            # 另一只股票同一时间的K线在上次同步之后才写入，仍会被读到
+            late_bar = _bars('000002.SZ', day2, 61, seed=102).iloc[[-1]]
+            late_bar.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+            monitor.detect_anomalies()
+            assert snapshot_registry['1min'].get('000002.SZ')['datetime'] == late_bar['datetime'].iloc[0]
+            assert snapshot_registry['1min'].get('000001.SZ')['datetime'] == new_bar['datetime'].iloc[0]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert result['success'] and result['data']['total_count'] == len(reference) > 5
+        anomalies = result['data']['anomalies']
+        expected_top = sorted(reference, key=lambda code: reference[code][1], reverse=True)[:5]
+        assert [a['ts_code'] for a in anomalies] == expected_top
+        for anomaly in anomalies:
+            types, score = reference[anomaly['ts_code']]
+            assert anomaly['anomaly_types'] == types
+            assert anomaly['anomaly_score'] == pytest.approx(score)
+
+        assert sentiment['success'] and sentiment['data']['total_stocks'] == 40
+        assert monitor._calculate_anomaly_score(-6.0, 2.0) == pytest.approx(40.0)
+
+
+def test_readers_revalidate_and_ingest_always_mirrors(app, snapshot_registry, monkeypatch):
+    """
+    非入库进程：超过 max_age 后按数据库最新K线时间重新核对；入库路径（批量和逐条写入）
+    即使进程内尚未创建快照缓存也会镜像到Redis，其他进程从Redis读到最新K线
+    """
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, StockBasic.__table__])
+        day1, day2 = datetime(2024, 3, 4).date(), datetime(2024, 3, 5).date()
+        bars = pd.concat([_bars('000001.SZ', day1, 30, seed=1), _bars('000001.SZ', day2, 20, seed=2)],
+                         ignore_index=True)
+        bars.iloc[:-1].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        end_time = datetime(2024, 3, 5, 15)
+
+        reader = MarketSnapshotStore(mirror=False, max_age=0)
+        monkeypatch.setattr(market_snapshot, 'datetime', type('FrozenDatetime', (datetime,), {
+            'now': classmethod(lambda cls: end_time)}))
+        assert reader.ensure_loaded(['000001.SZ'])['000001.SZ']['datetime'] == bars['datetime'].iloc[-2]
+
+        # 其他进程写入新K线后，读取端增量回放，结果与冷启动一致
+        bars.iloc[[-1]].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        refreshed = reader.ensure_loaded(['000001.SZ'])['000001.SZ']
+        cold = MarketSnapshotStore(mirror=False)
+        cold.load_from_db(['000001.SZ'], end_time=end_time)
+        assert refreshed['datetime'] == bars['datetime'].iloc[-1]
+        for field in ('close', 'prev_close', 'day_volume', 'avg_volume', 'prior_high'):
+            assert refreshed[field] == pytest.approx(cold.get('000001.SZ')[field])
+
+        # max_age 内不再查询数据库
+        reader.max_age = 60
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        reader.ensure_loaded(['000001.SZ'])
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert statements == []
+
+        # 入库进程没有预先创建快照缓存：批量写入和逐条写入都镜像到Redis
+        client = FakeRedis()
+        monkeypatch.setattr('app.extensions.redis_client', client)
+        service = MinuteDataSyncService()
+        new_bars = _bars('600000.SH', day2, 21, seed=3)
+        service.upsert_minute_dataframe(new_bars.iloc[:20])
+        assert client.hashes['market_snapshot:1min:600000.SH']['datetime'] == \
+            new_bars['datetime'].iloc[19].isoformat()
+
+        other = MarketSnapshotStore(redis_client=client, max_age=0)
+        assert other.ensure_loaded(['600000.SH'])['600000.SH']['datetime'] == new_bars['datetime'].iloc[19]
+        service._write_minute_rows(service._stage_minute_dataframe(new_bars.iloc[[20]]))
+        statements.clear()
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        latest = other.ensure_loaded(['600000.SH'])['600000.SH']
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        assert latest['datetime'] == new_bars['datetime'].iloc[20] and statements == []
+
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+参数化均值-方差问题测试
+验证缓存问题的解与直接构造稠密问题一致、同结构的重复求解复用已编译问题，
+以及换手率惩罚和换手率上限（含已移出股票的卖出）
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+
+from app.services.backtest_engine import BacktestEngine
+from app.services.mean_variance import MeanVarianceProblemCache, get_problem_cache
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import FactorRiskModel
+
+
+def _factor_model(n_stocks=120, n_industries=6, seed=0):
+    rng = np.random.default_rng(seed)
+    exposures = np.hstack([np.eye(n_industries)[rng.integers(0, n_industries, n_stocks)],
+                           rng.normal(size=(n_stocks, 4))])
+    factor_cov = np.cov(rng.normal(0, 0.01, (250, exposures.shape[1])), rowvar=False)
+    return FactorRiskModel(None, [f'S{i}' for i in range(n_stocks)], [f'F{k}' for k in range(exposures.shape[1])],
+                           exposures, factor_cov, rng.uniform(1e-4, 9e-4, n_stocks))
+
+
+def _utility(weights, expected_returns, covariance, risk_aversion):
+    return expected_returns @ weights - 0.5 * risk_aversion * weights @ covariance @ weights
+
+
+def test_cached_problem_matches_dense_formulation():
+    model = _factor_model()
+    rng = np.random.default_rng(1)
+    expected_returns = pd.Series(rng.normal(0, 0.002, len(model)), index=model.ts_codes)
+    constraints = {'risk_aversion': 4.0, 'max_weight': 0.05}
+    get_problem_cache().clear()
+
+    result = PortfolioOptimizer().optimize_portfolio(expected_returns, model, 'mean_variance', constraints)
+    weights = pd.Series(result['weights']).reindex(model.ts_codes).to_numpy()
+    assert np.isclose(weights.sum(), 1.0) and weights.max() <= 0.05 + 1e-6 and weights.min() >= 0
+
+    w = cp.Variable(len(model))
+    covariance = model.covariance()
+    reference = cp.Problem(cp.Maximize(expected_returns.values @ w - 2.0 * cp.quad_form(w, cp.psd_wrap(covariance))),
+                           [cp.sum(w) == 1, w >= 0, w <= 0.05])
+    reference.solve(solver='CLARABEL')
+    assert _utility(weights, expected_returns.values, covariance, 4.0) >= reference.value - 1e-7
+
+
+def test_problem_reused_across_rebalances():
+    cache = MeanVarianceProblemCache()
+    model = _factor_model()
+    first = cache.get(len(model), 10)
+    # 因子数在同一块内变化时复用同一问题
+    assert cache.get(len(model), 12) is first
+    assert cache.get(len(model), 10, turnover_penalty=True) is not first
+    assert cache.stats() == {'problems': 2, 'hits': 1, 'misses': 2}
+
+    rng = np.random.default_rng(2)
+    for _ in range(3):
+        values, status = first.solve(rng.normal(0, 0.002, len(model)), model.loadings, model.specific_var, 2.0)
+        assert values is not None and np.isclose(values.sum(), 1.0)
+    assert first.solves == 3
+
+
+def test_turnover_penalty_and_limit():
+    model = _factor_model(seed=3)
+    rng = np.random.default_rng(4)
+    codes = model.ts_codes
+    optimizer = PortfolioOptimizer()
+    base = {'risk_aversion': 4.0, 'max_weight': 0.1}
+    previous = pd.Series(optimizer.optimize_portfolio(
+        pd.Series(rng.normal(0, 0.002, len(codes)), index=codes), model, 'mean_variance', base)['weights'])
+    # 上一期还持有一只已不在候选中的股票
+    previous = pd.concat([previous * 0.95, pd.Series({'OLD': 0.05})])
+    expected_returns = pd.Series(rng.normal(0, 0.002, len(codes)), index=codes)
+
+    free = optimizer.optimize_portfolio(expected_returns, model, 'mean_variance', base, previous_weights=previous)
+    penalized = optimizer.optimize_portfolio(expected_returns, model, 'mean_variance',
+                                             dict(base, turnover_penalty=0.002), previous_weights=previous)
+    limited = optimizer.optimize_portfolio(expected_returns, model, 'mean_variance',
+                                           dict(base, max_turnover=0.2), previous_weights=previous)
+
+    assert free['portfolio_stats']['turnover'] > 0.2
+    assert penalized['portfolio_stats']['turnover'] < free['portfolio_stats']['turnover']
+    assert limited['portfolio_stats']['turnover'] <= 0.2 + 1e-5
+    assert np.isclose(limited['portfolio_stats']['turnover'],
+                      optimizer.calculate_turnover(pd.Series(limited['weights']), previous))
+
+    # 依赖上一期权重的配置不在策略间按日期共享目标权重
+    assert BacktestEngine.path_dependent({'method': 'mean_variance', 'constraints': {'max_turnover': 0.2}})
+    assert not BacktestEngine.path_dependent({'method': 'mean_variance', 'constraints': base})
+    assert not BacktestEngine.path_dependent({'method': 'risk_parity', 'constraints': {'max_turnover': 0.2}})
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+机器学习目标收益率测试
+验证批量 shift 计算的未来收益率与原实现逐日期向后取第 period 个交易日的结果一致，
+包括数据在特征结束后不足 period 个交易日的股票、停牌股票和长期停牌跨过读取缓冲区的股票，
+且补读时不使用 MySQL 5.7 不支持的窗口函数
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import StockDailyHistory
+from app.services.ml_models import MLModelManager
+
+
+def _seed():
+    """
+    A: 完整行情；B: 最后特征日之后只有3个交易日；C: 中途停牌；
+    D: 最后特征日之后停牌两个多月，复牌日在读取缓冲区之后
+    """
+    rng = np.random.default_rng(0)
+    days = pd.bdate_range('2024-01-01', periods=160)
+    feature_days = days[:100]
+    frames = []
+    for ts_code, keep in [
+        ('000001.SZ', np.ones(len(days), dtype=bool)),
+        ('000002.SZ', np.arange(len(days)) < 103),
+        ('000003.SZ', ~np.isin(np.arange(len(days)), np.arange(40, 48))),
+        ('000004.SZ', (np.arange(len(days)) < 100) | (np.arange(len(days)) >= 150)),
+    ]:
+        close = 10 * np.exp(rng.normal(0, 0.02, len(days)).cumsum())
+        frames.append(pd.DataFrame({'ts_code': ts_code, 'trade_date': days.date, 'close': close.round(4)})[keep])
+    prices = pd.concat(frames, ignore_index=True)
+    db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__])
+    prices.to_sql('stock_daily_history', db.engine, if_exists='append', index=False)
+    # 按库中存储精度比较
+    prices = pd.read_sql(db.session.query(StockDailyHistory.ts_code, StockDailyHistory.trade_date,
+                                          StockDailyHistory.close).statement, db.engine)
+    prices['close'] = prices['close'].astype(float)
+
+    features = pd.DataFrame([(code, day) for code in prices['ts_code'].unique() for day in feature_days.date],
+                            columns=['ts_code', 'trade_date'])
+    return prices, features
+
+
+def _reference_targets(prices, features, period):
+    """原实现：逐只股票、逐个特征日期向后取第 period 个交易日的收盘价（不含模拟收益率的分支）"""
+    rows = []
+    for ts_code, stock_features in features.groupby('ts_code'):
+        price_data = prices[prices['ts_code'] == ts_code].sort_values('trade_date')
+        for current_date in stock_features['trade_date']:
+            current = price_data[price_data['trade_date'] == current_date]
+            if current.empty:
+                continue
+            future = price_data[price_data['trade_date'] > current_date].head(period)
+            if len(future) >= period:
+                current_price = current.iloc[0]['close']
+                rows.append({'ts_code': ts_code, 'trade_date': current_date,
+                             'target': (future.iloc[period - 1]['close'] - current_price) / current_price})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize('target_type, period', [('return_5d', 5), ('return_20d', 20)])
+def test_target_returns_match_per_date_loop(app, target_type, period):
+    with app.app_context():
+        prices, features = _seed()
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        actual = MLModelManager()._calculate_target_returns(features, target_type)
+        event.remove(db.engine, 'before_cursor_execute', listener)
+        # 不使用窗口函数（MySQL 5.7 不支持）：行情、缓冲区后有行情的股票、复牌股票的后续行情各一次查询
+        assert not any(' OVER ' in s.upper() for s in statements)
+        assert len(statements) == 3
+        expected = _reference_targets(prices, features, period)
+
+        merged = expected.merge(actual, on=['ts_code', 'trade_date'], how='outer', indicator=True)
+        assert (merged['_merge'] == 'both').all()
+        assert np.allclose(merged['target_x'], merged['target_y'])
+
+        counts = actual.groupby('ts_code').size()
+        # B 最后几个特征日缺少未来价格被剔除，C 停牌日没有样本，D 跨过缓冲区取到复牌后的价格
+        assert counts['000001.SZ'] == 100
+        assert counts['000002.SZ'] == 100 - max(period - 3, 0)
+        assert counts['000003.SZ'] == 92
+        assert counts['000004.SZ'] == 100 - max(period - 10, 0)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+实时指标宽表测试
+验证长表到宽表的迁移、NumPy数组读取接口，以及批量引擎写入宽表与长表结果一致
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.realtime_indicator_wide import RealtimeIndicatorWide, WIDE_INDICATOR_COLUMNS
+from app.services.batch_indicator_engine import BatchIndicatorEngine
+from app.services.realtime_trading_signal_engine import RealtimeTradingSignalEngine
+
+
+def _make_bars(codes, n, start, seed=5):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for ts_code in codes:
+        close = 10 + np.cumsum(rng.normal(0, 0.05, n))
+        frames.append(pd.DataFrame({
+            'ts_code': ts_code,
+            'period_type': '5min',
+            'datetime': [start + timedelta(minutes=5 * i) for i in range(n)],
+            'open': close,
+            'high': close + rng.uniform(0, 0.1, n),
+            'low': close - rng.uniform(0, 0.1, n),
+            'close': close,
+            'volume': rng.integers(100, 1000, n).astype(float),
+            'amount': close * 1000
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _long_values(ts_code):
+    """长表中某只股票的 {(时间, 宽表列): 值}"""
+    values = {}
+    for row in RealtimeIndicator.query.filter_by(ts_code=ts_code).all():
+        for i, column in enumerate(WIDE_INDICATOR_COLUMNS.get(row.indicator_name, [])):
+            value = getattr(row, f'value{i + 1}')
+            if value is not None:
+                values[(pd.Timestamp(row.datetime), column)] = value
+    return values
+
+
+def _wide_values(arrays):
+    values = {}
+    for i, dt in enumerate(pd.to_datetime(arrays['datetime'])):
+        for column, array in arrays.items():
+            if column != 'datetime' and not np.isnan(array[i]):
+                values[(dt, column)] = float(array[i])
+    return values
+
+
+def test_migrate_long_to_wide_and_read_arrays(app):
+    """长表迁移到宽表后数值一致（单精度），读取一次查询返回NumPy数组"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[
+            StockMinuteData.__table__, RealtimeIndicator.__table__, RealtimeIndicatorWide.__table__
+        ])
+        end_time = datetime(2024, 1, 5, 15, 0)
+        bars = _make_bars(['000001.SZ', '600000.SH'], 80, datetime(2024, 1, 4, 9, 35))
+        db.session.bulk_insert_mappings(StockMinuteData, bars.to_dict('records'))
+        db.session.commit()
+
+        result = BatchIndicatorEngine().calculate(['000001.SZ', '600000.SH'], ['5min'],
+                                                  lookback_days=3, end_time=end_time)
+        assert result['success']
+        long_rows = RealtimeIndicator.query.count()
+
+        migrated = RealtimeIndicatorWide.migrate_from_long(batch_size=1)
+        assert migrated['long_rows'] == long_rows
+        assert migrated['wide_rows'] == len(bars)
+        # 重复执行结果不变
+        RealtimeIndicatorWide.migrate_from_long()
+        assert RealtimeIndicatorWide.query.count() == len(bars)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        arrays = RealtimeIndicatorWide.read_arrays('000001.SZ', '5min')
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert len(statements) == 1
+        assert arrays['datetime'].dtype.kind == 'M' and len(arrays['datetime']) == 80
+        assert arrays['macd_dif'].dtype == np.float32
+        expected = _long_values('000001.SZ')
+        actual = _wide_values(arrays)
+        assert set(actual) == set(expected)
+        for key, value in expected.items():
+            assert np.isclose(actual[key], value, rtol=1e-6, atol=1e-4), key
+
+        partial = RealtimeIndicatorWide.read_arrays('000001.SZ', '5min', start_time=datetime(2024, 1, 4, 14, 0),
+                                                    columns=['rsi', 'kdj_k'])
+        assert set(partial) == {'datetime', 'rsi', 'kdj_k'}
+        assert (partial['datetime'] >= np.datetime64('2024-01-04T14:00')).all()
+
+
+def test_batch_engine_wide_layout_and_signal_reader(app):
+    """批量引擎直接写入宽表，信号引擎读取宽表得到与长表相同的结构"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[
+            StockMinuteData.__table__, RealtimeIndicator.__table__, RealtimeIndicatorWide.__table__
+        ])
+        end_time = datetime(2024, 1, 5, 15, 0)
+        bars = _make_bars(['000001.SZ'], 60, datetime(2024, 1, 4, 9, 35))
+        db.session.bulk_insert_mappings(StockMinuteData, bars.to_dict('records'))
+        db.session.commit()
+
+        engine = BatchIndicatorEngine()
+        wide = engine.calculate(['000001.SZ'], ['5min'], lookback_days=3, end_time=end_time, layout='wide')
+        assert wide['success'] and wide['stored_records'] == 60
+        assert RealtimeIndicator.query.count() == 0
+        engine.calculate(['000001.SZ'], ['5min'], lookback_days=3, end_time=end_time)
+
+        start_time = end_time - timedelta(days=3)
+        signal_engine = RealtimeTradingSignalEngine()
+        from_wide = signal_engine._get_indicators_data('000001.SZ', '5min', start_time, end_time)
+        RealtimeIndicatorWide.query.delete()
+        db.session.commit()
+        from_long = signal_engine._get_indicators_data('000001.SZ', '5min', start_time, end_time)
+
+        assert set(from_wide) == set(from_long)
+        for name, rows in from_long.items():
+            assert len(from_wide[name]) == len(rows), name
+            for wide_row, long_row in zip(from_wide[name], rows):
+                assert wide_row['datetime'] == long_row['datetime']
+                for key in ('value1', 'value2', 'value3', 'value4'):
+                    if long_row[key] is None:
+                        assert wide_row[key] is None
+                    else:
+                        assert type(wide_row[key]) is float
+                        assert np.isclose(wide_row[key], long_row[key], rtol=1e-6, atol=1e-4)
+
+
+        # 宽表停留在旧时间，实时引擎继续写入长表：较新的指标接在宽表数据之后
+        engine.calculate(['000001.SZ'], ['5min'], lookback_days=3, end_time=datetime(2024, 1, 4, 13, 30),
+                         layout='wide')
+        merged = signal_engine._get_indicators_data('000001.SZ', '5min', start_time, end_time)
+        for name, rows in from_long.items():
+            assert [row['datetime'] for row in merged[name]] == [row['datetime'] for row in rows], name
+            assert merged[name][-1]['value1'] == rows[-1]['value1']
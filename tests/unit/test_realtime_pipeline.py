@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+事件驱动实时管道测试
+用模拟行情源驱动 K线 → 指标 → 信号 → 风险 → 推送，验证每根K线只处理对应股票、定向推送和延迟统计，
+并分别验证进程内总线的后台线程模式、Redis Streams总线的按股票分区、入库路径发布新K线，
+以及推送服务启动时预热活跃股票、新K线只推送到个股房间
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from app.extensions import db
+from app.models.portfolio_position import PortfolioPosition
+from app.models.stock_minute_data import StockMinuteData
+from app.models.trading_signal import TradingSignal
+from app.services import market_snapshot
+from app.services.minute_data_sync_service import MinuteDataSyncService
+from app.services.websocket_push_service import WebSocketPushService
+from app.websocket import websocket_events
+from app.services.realtime_pipeline import (
+    RealtimePipeline, InProcessEventBus, RedisStreamEventBus, FakeBarFeed, LatencyHistogram, STAGES,
+    BAR_TOPIC, bar_event, register_ingest_bus, unregister_ingest_bus
+)
+from fake_redis import FakeRedis
+
+CODES = ['000001.SZ', '600000.SH', '300750.SZ']
+
+
+def _seed_positions(app):
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[PortfolioPosition.__table__, TradingSignal.__table__])
+        # 只有 600000.SH 有持仓，且止损价高于行情价格，每根K线都会触发止损预警
+        db.session.add(PortfolioPosition(portfolio_id='p1', ts_code='600000.SH', position_size=1000,
+                                         avg_cost=10.5, stop_loss_price=100.0))
+        db.session.commit()
+
+
+def test_fake_feed_drives_all_stages(app):
+    """每根K线依次经过四个阶段，只处理并推送对应股票"""
+    _seed_positions(app)
+    with app.app_context():
+        emitted = []
+        pipeline = RealtimePipeline(bus=InProcessEventBus(), emitter=emitted.append, min_signal_bars=30)
+        feed = FakeBarFeed(CODES, start=datetime(2024, 1, 2, 9, 30), seed=3)
+        published = feed.run(pipeline, n_bars=125)
+
+        assert published == 125 * len(CODES)
+        assert len(emitted) == published
+        for event in emitted:
+            assert event['bar']['close'] > 0
+            assert all(signal['ts_code'] == event['ts_code'] for signal in event['signals'])
+            if event['ts_code'] == '600000.SH':
+                assert [a['alert_type'] for a in event['alerts']] == ['stop_loss_triggered']
+                assert event['alerts'][0]['portfolio_id'] == 'p1'
+            else:
+                assert event['alerts'] == []
+
+        # 指标在窗口填满后出现，且为流式引擎的增量结果
+        last = [e for e in emitted if e['ts_code'] == '000001.SZ'][-1]
+        assert {'MA5', 'MA60', 'MACD', 'RSI', 'KDJ', 'BOLL', 'OBV'} <= set(last['indicators'])
+
+        # 午间休市被跳过
+        times = sorted({e['bar']['datetime'] for e in emitted})
+        assert '2024-01-02T12:00:00' not in times and '2024-01-02T13:01:00' in times
+
+        # 持仓价格随行情更新
+        position = PortfolioPosition.query.filter_by(ts_code='600000.SH').first()
+        assert position.current_price == [e for e in emitted if e['ts_code'] == '600000.SH'][-1]['bar']['close']
+
+        stats = pipeline.get_latency_stats()
+        for stage in STAGES + ['end_to_end']:
+            assert stats[stage]['count'] == published
+        assert stats['end_to_end']['p99_ms'] >= stats['push']['p50_ms']
+        assert TradingSignal.query.count() == sum(len(e['signals']) for e in emitted)
+
+
+def test_background_worker_thread(app):
+    """后台消费线程在应用上下文中处理事件"""
+    _seed_positions(app)
+    emitted = []
+    pipeline = RealtimePipeline(bus=InProcessEventBus(), emitter=emitted.append, persist_signals=False)
+    pipeline.start(app)
+    try:
+        feed = FakeBarFeed(CODES, start=datetime(2024, 1, 2, 9, 30), seed=4)
+        published = feed.run(pipeline, n_bars=20, drain=False)
+        deadline = time.time() + 10
+        while len(emitted) < published and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        pipeline.stop()
+    assert len(emitted) == published
+    assert pipeline.bus.failed_events == 0
+
+
+def test_redis_stream_bus(app):
+    """Redis Streams 总线：事件序列化后经消费组投递并确认"""
+    _seed_positions(app)
+    with app.app_context():
+        client = FakeRedis()
+        emitted = []
+        bus = RedisStreamEventBus(redis_client=client, stream_prefix='test_pipeline', consumer='worker-1')
+        pipeline = RealtimePipeline(bus=bus, emitter=emitted.append, persist_signals=False)
+        feed = FakeBarFeed(CODES, start=datetime(2024, 1, 2, 9, 30), seed=5)
+        published = feed.run(pipeline, n_bars=10)
+
+        assert len(emitted) == published
+        assert bus.pending == 0
+        assert emitted[0]['bar']['datetime'] == '2024-01-02T09:31:00'
+        assert pipeline.get_latency_stats()['end_to_end']['count'] == published
+
+
+def test_partitioned_streams_keep_stock_on_one_process(app):
+    """按股票哈希分区：每个消费进程只处理自己分区的股票，同一股票的全部K线进入同一个管道"""
+    _seed_positions(app)
+    with app.app_context():
+        client = FakeRedis()
+        codes = [f'{i:06d}.SZ' for i in range(12)]
+        producer = RedisStreamEventBus(redis_client=client, stream_prefix='test_pipeline', partitions=2,
+                                       assigned_partitions=[])
+        workers = []
+        for partition in range(2):
+            emitted = []
+            bus = RedisStreamEventBus(redis_client=client, stream_prefix='test_pipeline', partitions=2,
+                                      assigned_partitions=[partition], consumer=f'worker-{partition}')
+            workers.append((RealtimePipeline(bus=bus, emitter=emitted.append, persist_signals=False), emitted))
+
+        feed = FakeBarFeed(codes, start=datetime(2024, 1, 2, 9, 30), seed=6)
+        for _ in range(5):
+            for bar in feed.next_bars():
+                producer.publish(BAR_TOPIC, bar_event(bar['ts_code'], '1min', bar))
+        for pipeline, _ in workers:
+            while pipeline.bus.process_pending():
+                pass
+
+        seen = []
+        for partition, (pipeline, emitted) in enumerate(workers):
+            assert emitted and all(producer.partition_of(e['ts_code']) == partition for e in emitted)
+            assert all(len(history) == 5 for history in pipeline.price_history.values())
+            assert pipeline.bus.pending == 0
+            seen += [e['ts_code'] for e in emitted]
+        assert sorted(seen) == sorted(codes * 5)
+
+
+def test_ingest_path_publishes_bars(app, monkeypatch):
+    """分钟数据入库后新K线发布到已注册的管道总线"""
+    _seed_positions(app)
+    monkeypatch.setattr(market_snapshot, '_stores', {})
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__])
+        emitted = []
+        pipeline = RealtimePipeline(bus=InProcessEventBus(), emitter=emitted.append, persist_signals=False)
+        register_ingest_bus(pipeline.bus)
+        try:
+            bars = pd.DataFrame(FakeBarFeed(CODES, start=datetime(2024, 1, 2, 9, 30), seed=7).next_bars())
+            bars['period_type'] = '1min'
+            MinuteDataSyncService().upsert_minute_dataframe(bars)
+        finally:
+            unregister_ingest_bus(pipeline.bus)
+        while pipeline.bus.process_pending():
+            pass
+
+        assert sorted(e['ts_code'] for e in emitted) == sorted(CODES)
+        assert all(e['bar']['datetime'] == '2024-01-02T09:31:00' for e in emitted)
+
+
+def test_push_service_warms_up_and_targets_stock_rooms(app, monkeypatch):
+    """event 模式启动时预热活跃股票，第一根新K线即有指标；行情不转发到全局房间"""
+    _seed_positions(app)
+    monkeypatch.setattr(market_snapshot, '_stores', {})
+    rooms = []
+    monkeypatch.setattr(websocket_events, 'broadcast_market_data', lambda symbol, data: rooms.append(symbol))
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__])
+        start = datetime.now().replace(second=0, microsecond=0) - timedelta(minutes=60)
+        bars = pd.DataFrame([{'ts_code': ts_code, 'period_type': '1min', 'datetime': start + timedelta(minutes=i),
+                              'open': 10.0 + i * 0.01, 'high': 10.1 + i * 0.01, 'low': 9.9 + i * 0.01,
+                              'close': 10.0 + i * 0.01, 'volume': 1000, 'amount': 10000.0}
+                             for ts_code in CODES for i in range(60)])
+        bars.to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        service = WebSocketPushService()
+    for config in service.push_config.values():
+        config['enabled'] = False
+
+    service.start_push_service(mode='event', app=app)
+    try:
+        pipeline = service.pipeline
+        assert all(len(pipeline.price_history[(ts_code, '1min')]) == 60 for ts_code in CODES)
+        emitted = []
+        pipeline.emitter = lambda event: emitted.append(event) or service._push_pipeline_event(event)
+        with app.app_context():
+            service.publish_bars({'ts_code': '000001.SZ', 'datetime': start + timedelta(minutes=60), 'open': 10.6,
+                                  'high': 10.7, 'low': 10.5, 'close': 10.6, 'volume': 1000, 'amount': 10600.0})
+        deadline = time.time() + 10
+        while not emitted and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        service.stop_push_service()
+
+    assert len(emitted) == 1 and {'MA5', 'MA60', 'MACD'} <= set(emitted[0]['indicators'])
+    assert rooms == ['000001.SZ']
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets_ms=(1, 10, 100))
+    for seconds in [0.0005] * 90 + [0.05] * 9 + [0.5]:
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert snapshot['p50_ms'] == 1
+    assert snapshot['p95_ms'] == 100
+    assert snapshot['p99_ms'] == 100
+    assert snapshot['max_ms'] == 500.0
+    assert snapshot['buckets'] == {'<=1ms': 90, '<=10ms': 0, '<=100ms': 9, '>100ms': 1}
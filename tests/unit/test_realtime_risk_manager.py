@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+实时组合风险计算测试
+验证批量读取价格与逐只股票查询结果一致且只发起一次查询、R @ w 组合收益与逐只累加一致、
+上三角掩码找出的高相关股票对与双重循环一致，以及持仓监控批量取当前价格
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models.portfolio_position import PortfolioPosition
+from app.models.risk_alert import RiskAlert
+from app.models.stock_basic import StockBasic
+from app.models.stock_minute_data import StockMinuteData
+from app.services.realtime_risk_manager import RealtimeRiskManager
+
+
+def _seed(codes, n_days=40, seed=0):
+    """每只股票每天4根60分钟K线，前两只股票高度相关，最后一只缺少前几天的数据"""
+    rng = np.random.default_rng(seed)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = [today - timedelta(days=n_days - i) for i in range(n_days)]
+    times = [day + timedelta(hours=hour) for day in days for hour in (10, 11, 14, 15)]
+    common = rng.normal(0, 0.01, len(times))
+    frames = []
+    for i, ts_code in enumerate(codes):
+        noise = rng.normal(0, 0.01, len(times))
+        steps = common + 0.1 * noise if i < 2 else noise
+        close = 10 * np.exp(np.cumsum(steps))
+        frame = pd.DataFrame({
+            'ts_code': ts_code, 'period_type': '60min', 'datetime': times,
+            'open': close, 'high': close, 'low': close, 'close': close, 'volume': 100, 'amount': close * 100
+        })
+        if i == len(codes) - 1:
+            frame = frame.iloc[12:]
+        frames.append(frame)
+    bars = pd.concat(frames, ignore_index=True)
+    # 打乱写入顺序，结果不应依赖主键顺序
+    bars.sample(frac=1, random_state=seed).to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+
+    positions = [PortfolioPosition(portfolio_id='P1', ts_code=ts_code, position_size=100 * (i + 1), avg_cost=10,
+                                   market_value=1000.0 * (i + 1), weight=10.0, sector=f'行业{i % 3}')
+                 for i, ts_code in enumerate(codes)]
+    db.session.add_all(positions)
+    db.session.commit()
+    return bars
+
+
+def _reference_prices(bars, start_date, end_date):
+    """原实现：逐只股票取每日最后一根K线"""
+    frames = []
+    for ts_code, df in bars.groupby('ts_code'):
+        df = df[(df['datetime'] >= start_date) & (df['datetime'] <= end_date)].sort_values('datetime')
+        daily = df.groupby(df['datetime'].dt.date)['close'].last().rename_axis('date').reset_index()
+        daily['ts_code'] = ts_code
+        frames.append(daily)
+    return pd.concat(frames).pivot(index='date', columns='ts_code', values='close').ffill()
+
+
+def _setup(app, codes):
+    db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, PortfolioPosition.__table__,
+                                                   RiskAlert.__table__, StockBasic.__table__])
+    return _seed(codes)
+
+
+def test_bulk_price_data_matches_per_stock_queries(app):
+    with app.app_context():
+        codes = [f'{600000 + i}.SH' for i in range(6)]
+        bars = _setup(app, codes)
+        manager = RealtimeRiskManager()
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=30)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        prices = manager._get_price_data(codes, start_date, end_date)
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+        assert len(statements) == 1
+        expected = _reference_prices(bars, start_date, end_date)
+        pd.testing.assert_frame_equal(prices, expected, check_names=False)
+
+        # 分批查询结果相同
+        manager.price_query_batch = 4
+        pd.testing.assert_frame_equal(manager._get_price_data(codes, start_date, end_date), prices)
+
+
+def test_vectorized_metrics_match_loops():
+    rng = np.random.default_rng(1)
+    codes = [f'{i:06d}.SZ' for i in range(8)]
+    common = rng.normal(0, 0.01, (120, 1))
+    returns = pd.DataFrame(rng.normal(0, 0.01, (120, 8)), columns=codes)
+    returns.iloc[:, :3] += 5 * common
+    returns.iloc[:, 3] = -returns.iloc[:, 0]
+    # 权重中包含没有价格数据的股票
+    weights = {code: 1 / 9 for code in codes + ['999999.SZ']}
+    manager = RealtimeRiskManager()
+
+    loop_returns = pd.Series(0, index=returns.index)
+    for ts_code, weight in weights.items():
+        if ts_code in returns.columns:
+            loop_returns += returns[ts_code] * weight
+    np.testing.assert_allclose(manager._portfolio_returns(returns, weights), loop_returns, rtol=1e-12)
+
+    metrics = manager._calculate_correlation_matrix(returns)
+    corr = returns.corr()
+    loop_pairs = [(corr.columns[i], corr.columns[j], corr.iloc[i, j])
+                  for i in range(len(codes)) for j in range(i + 1, len(codes))
+                  if abs(corr.iloc[i, j]) > manager.risk_thresholds['correlation_limit']]
+    pairs = [(p['stock1'], p['stock2'], p['correlation']) for p in metrics['high_correlation_pairs']]
+    assert pairs == loop_pairs and len(pairs) >= 4
+    assert any(value < 0 for _, _, value in pairs)
+
+    var_metrics = manager._calculate_var_cvar(returns, weights)
+    assert var_metrics['var_95'] == pytest.approx(np.percentile(loop_returns, 5))
+    assert var_metrics['cvar_95'] == pytest.approx(loop_returns[loop_returns <= var_metrics['var_95']].mean())
+
+
+def test_portfolio_risk_and_monitor_use_bulk_queries(app):
+    with app.app_context():
+        codes = [f'{600000 + i}.SH' for i in range(6)]
+        bars = _setup(app, codes)
+        manager = RealtimeRiskManager()
+
+        result = manager.calculate_portfolio_risk('P1', period_days=20)
+        assert result['success']
+        data = result['data']
+        assert data['total_positions'] == 6
+        assert {'var_95', 'cvar_95', 'var_99', 'cvar_99'} <= set(data['var_metrics'])
+        pairs = {(p['stock1'], p['stock2']) for p in data['correlation_metrics']['high_correlation_pairs']}
+        assert (codes[0], codes[1]) in pairs
+
+        latest = bars.sort_values('datetime').groupby('ts_code')['close'].last()
+        assert manager._get_current_prices(codes) == pytest.approx(latest.to_dict())
+
+        result = manager.monitor_position_risk('P1')
+        assert result['success']
+        position = PortfolioPosition.get_position_by_stock('P1', codes[2])
+        assert position.current_price == pytest.approx(latest[codes[2]])
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+因子风险模型测试
+验证估计只使用估计日及之前的数据、快照按日期持久化和时点查询，
+以及低秩加对角形式与稠密协方差的计算结果一致
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from app.extensions import db
+from app.models import StockDailyHistory, StockDailyBasic, StockBasic, RiskModelSnapshot
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import FactorRiskModel, RiskModelService, get_risk_model_service
+
+INDUSTRIES = ['银行', '医药', '电子']
+
+
+def _seed(n_stocks=12, seed=0):
+    rng = np.random.default_rng(seed)
+    codes = [f'{600000 + i}.SH' for i in range(n_stocks)]
+    days = pd.bdate_range('2024-01-01', '2024-06-28').date
+    close = rng.uniform(5, 50, n_stocks) * np.exp(rng.normal(0, 0.02, (len(days), n_stocks)).cumsum(axis=0))
+    db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, StockDailyBasic.__table__,
+                                                   StockBasic.__table__, RiskModelSnapshot.__table__])
+    pd.DataFrame({
+        'ts_code': np.tile(codes, len(days)),
+        'trade_date': np.repeat(days, n_stocks),
+        'close': close.ravel().round(4)
+    }).to_sql('stock_daily_history', db.engine, if_exists='append', index=False)
+    pd.DataFrame({
+        'ts_code': codes,
+        'name': codes,
+        'industry': [INDUSTRIES[i % len(INDUSTRIES)] for i in range(n_stocks)]
+    }).to_sql('stock_basic', db.engine, if_exists='append', index=False)
+    return codes
+
+
+def _random_model(n_stocks=40, n_factors=6, seed=1):
+    rng = np.random.default_rng(seed)
+    factors = rng.normal(size=(n_factors, n_factors))
+    return FactorRiskModel(date(2024, 6, 28), [f'S{i}' for i in range(n_stocks)],
+                           [f'F{k}' for k in range(n_factors)], rng.normal(size=(n_stocks, n_factors)),
+                           factors @ factors.T / n_factors, rng.uniform(0.01, 0.05, n_stocks))
+
+
+def test_factor_form_matches_dense_covariance():
+    model = _random_model()
+    dense = model.covariance()
+    w = np.random.default_rng(2).dirichlet(np.ones(len(model)))
+
+    assert np.allclose(model.dot(w), dense @ w)
+    assert np.allclose(model.dot(np.column_stack([w, 2 * w])), dense @ np.column_stack([w, 2 * w]))
+    assert np.isclose(model.portfolio_variance(w), w @ dense @ w)
+
+    restored = FactorRiskModel.from_bytes(model.to_bytes(), model.trade_date)
+    assert list(restored.ts_codes) == list(model.ts_codes)
+    assert np.allclose(restored.covariance(), dense)
+
+    # 子模型按给定顺序排列，缺失股票取平均暴露和中位数特异方差
+    sub = model.subset(['S3', 'S1', 'NEW'])
+    assert np.allclose(sub.covariance()[:2, :2], dense[np.ix_([3, 1], [3, 1])])
+    assert np.allclose(sub.exposures[2], model.exposures.mean(axis=0))
+    assert sub.specific_var[2] == np.median(model.specific_var)
+
+
+def test_estimate_is_point_in_time(app):
+    with app.app_context():
+        codes = _seed()
+        service = RiskModelService(lookback_days=60)
+        before = service.estimate('2024-04-30')
+        assert before is not None and before.trade_date == date(2024, 4, 30)
+        assert before.factor_names[:len(INDUSTRIES)] == [f'industry:{name}' for name in sorted(INDUSTRIES)]
+        assert np.all(before.specific_var > 0)
+
+        # 修改估计日之后的价格不影响估计结果
+        db.session.query(StockDailyHistory).filter(
+            StockDailyHistory.trade_date > date(2024, 4, 30),
+            StockDailyHistory.ts_code == codes[0]
+        ).update({StockDailyHistory.close: StockDailyHistory.close * 3})
+        db.session.commit()
+        after = service.estimate('2024-04-30')
+        assert np.allclose(after.covariance(), before.covariance())
+
+
+def test_snapshot_persisted_and_queried_as_of(app):
+    with app.app_context():
+        codes = _seed()
+        service = RiskModelService(lookback_days=60)
+        estimates = []
+        original = service.estimate
+        service.estimate = lambda trade_date, ts_codes=None: estimates.append(trade_date) or original(trade_date)
+
+        # 周六查询落到周五的交易日，估计一次并保存快照
+        model = service.get_risk_model('2024-05-04', codes[:5])
+        assert estimates == [date(2024, 5, 3)]
+        assert list(model.ts_codes) == codes[:5]
+        snapshot = RiskModelSnapshot.query.one()
+        assert snapshot.trade_date == date(2024, 5, 3) and snapshot.n_stocks == len(codes)
+
+        # 新的服务实例（无进程内缓存）直接读取快照，不再估计
+        service.clear()
+        reloaded = service.get_risk_model('2024-05-05', codes[:5])
+        assert estimates == [date(2024, 5, 3)]
+        assert np.allclose(reloaded.covariance(), model.covariance())
+
+
+        # 进程内缓存按最近交易日区分：当日行情入库后同一个 as_of 取到新交易日的模型
+        service.get_risk_model('2024-07-01')
+        assert estimates[-1] == date(2024, 6, 28)
+        pd.DataFrame({'ts_code': codes, 'trade_date': date(2024, 7, 1), 'close': 10.0}).to_sql(
+            'stock_daily_history', db.engine, if_exists='append', index=False)
+        assert service.get_risk_model('2024-07-01').trade_date == date(2024, 7, 1)
+        assert estimates[-1] == date(2024, 7, 1)
+
+
+def test_optimizer_uses_point_in_time_model(app):
+    with app.app_context():
+        codes = _seed()
+        get_risk_model_service().clear()
+        expected_returns = pd.Series(np.linspace(0.01, 0.05, 6), index=codes[:6])
+        optimizer = PortfolioOptimizer()
+
+        result = optimizer.optimize_portfolio(expected_returns, method='risk_parity', as_of_date='2024-04-30')
+        assert 'error' not in result
+        assert np.isclose(sum(result['weights'].values()), 1.0, atol=1e-4)
+        assert RiskModelSnapshot.query.one().trade_date == date(2024, 4, 30)
+
+        # 调用方传入的稠密协方差仍然可用
+        covariance = pd.DataFrame(np.diag(np.linspace(1.0, 6.0, 6)), index=codes[:6], columns=codes[:6])
+        result = optimizer.optimize_portfolio(expected_returns, covariance, method='risk_parity')
+        assert 'error' not in result
+        weights = pd.Series(result['weights'])
+        assert weights[codes[0]] > weights[codes[5]]
+        get_risk_model_service().clear()
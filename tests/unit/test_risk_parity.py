@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+风险平价求解测试
+验证等风险贡献/风险预算的解、热启动、稠密协方差输入，以及按日期批量优化
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from app.extensions import db
+from app.models import StockDailyHistory, StockDailyBasic, StockBasic, RiskModelSnapshot
+from app.services.portfolio_optimizer import PortfolioOptimizer
+from app.services.risk_model import FactorRiskModel, get_risk_model_service
+from app.services.risk_parity import solve_risk_parity
+
+
+def _factor_model(n_stocks=500, n_industries=10, seed=0):
+    rng = np.random.default_rng(seed)
+    exposures = np.hstack([np.eye(n_industries)[rng.integers(0, n_industries, n_stocks)],
+                           rng.normal(size=(n_stocks, 4))])
+    factor_cov = np.cov(rng.normal(0, 0.01, (250, exposures.shape[1])), rowvar=False)
+    return FactorRiskModel(None, [f'S{i}' for i in range(n_stocks)], [f'F{k}' for k in range(exposures.shape[1])],
+                           exposures, factor_cov, rng.uniform(1e-4, 9e-4, n_stocks))
+
+
+def _contribution_shares(model, weights):
+    contributions = weights * model.dot(weights)
+    return contributions / contributions.sum()
+
+
+def test_equal_risk_contribution_and_budgets():
+    model = _factor_model()
+    weights, info = solve_risk_parity(model)
+    assert info['converged'] and info['iterations'] < 30
+    assert np.all(weights > 0) and np.isclose(weights.sum(), 1.0)
+    assert np.allclose(_contribution_shares(model, weights), 1.0 / len(model), atol=1e-8)
+
+    budgets = np.linspace(1, 3, len(model))
+    weights, info = solve_risk_parity(model, budgets=budgets)
+    assert info['converged']
+    assert np.allclose(_contribution_shares(model, weights), budgets / budgets.sum(), atol=1e-8)
+
+
+def test_warm_start_and_dense_covariance():
+    model = _factor_model(seed=1)
+    cold, cold_info = solve_risk_parity(model)
+
+    # 模型小幅变化后，用上一期的解热启动（部分股票缺失）
+    shifted = FactorRiskModel(None, model.ts_codes, model.factor_names, model.exposures,
+                              model.factor_cov * 1.05, model.specific_var * 0.95)
+    initial = cold.copy()
+    initial[:10] = np.nan
+    warm, warm_info = solve_risk_parity(shifted, initial_weights=initial)
+    reference, reference_info = solve_risk_parity(shifted)
+    assert warm_info['converged'] and warm_info['iterations'] <= reference_info['iterations']
+    assert np.allclose(warm, reference, atol=1e-10)
+
+    rng = np.random.default_rng(2)
+    a = rng.normal(size=(8, 8))
+    covariance = pd.DataFrame(a @ a.T + 0.1 * np.eye(8))
+    weights, info = solve_risk_parity(FactorRiskModel.from_covariance(covariance))
+    contributions = weights * (covariance.to_numpy() @ weights)
+    assert info['converged'] and np.allclose(contributions, contributions.mean())
+
+
+def test_optimize_batch_uses_point_in_time_models(app):
+    with app.app_context():
+        rng = np.random.default_rng(4)
+        codes = [f'{600000 + i}.SH' for i in range(10)]
+        days = pd.bdate_range('2024-01-01', '2024-06-28').date
+        close = rng.uniform(5, 50, 10) * np.exp(rng.normal(0, 0.02, (len(days), 10)).cumsum(axis=0))
+        db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, StockDailyBasic.__table__,
+                                                       StockBasic.__table__, RiskModelSnapshot.__table__])
+        pd.DataFrame({
+            'ts_code': np.tile(codes, len(days)),
+            'trade_date': np.repeat(days, 10),
+            'close': close.ravel().round(4)
+        }).to_sql('stock_daily_history', db.engine, if_exists='append', index=False)
+        get_risk_model_service().clear()
+
+        optimizer = PortfolioOptimizer()
+        warm_starts = []
+        original = optimizer._risk_parity_optimization
+        optimizer.optimization_methods['risk_parity'] = lambda er, rm, c, previous: \
+            warm_starts.append(previous) or original(er, rm, c, previous)
+        universes = {'2024-05-31': codes[2:], '2024-03-29': codes[:8], '2024-04-30': codes[1:9]}
+
+        results = optimizer.optimize_batch(universes)
+
+        assert list(results) == ['2024-03-29', '2024-04-30', '2024-05-31']
+        assert all(result['success'] for result in results.values())
+        assert warm_starts[0] is None
+        assert list(warm_starts[1].index) == codes[:8]
+        snapshots = {s.trade_date.isoformat() for s in RiskModelSnapshot.query.all()}
+        assert snapshots == set(universes)
+        get_risk_model_service().clear()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+并行策略比较测试
+验证进程池并行比较与逐个策略单独回测的结果一致、返回每个策略的耗时，
+以及选股口径相同的策略在同一日期只计算一次选股、比较不占用调用方引擎的面板
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+import pandas as pd
+
+from app.extensions import db
+from app.models import StockDailyHistory, FactorValues, StockBasic
+from app.services.backtest_engine import BacktestEngine
+from app.services.strategy_comparison import StrategyComparisonRunner
+
+FACTORS = ['momentum_20d', 'pe_ttm', 'roe']
+
+
+def _seed(n_stocks=30):
+    rng = np.random.default_rng(3)
+    codes = [f'{600000 + i}.SH' for i in range(n_stocks)]
+    days = pd.bdate_range('2024-01-01', '2024-03-29').date
+    close = rng.uniform(5, 50, n_stocks) * np.exp(rng.normal(0, 0.02, (len(days), n_stocks)).cumsum(axis=0))
+    db.metadata.create_all(bind=db.engine, tables=[StockDailyHistory.__table__, FactorValues.__table__,
+                                                   StockBasic.__table__])
+    pd.DataFrame({
+        'ts_code': np.tile(codes, len(days)),
+        'trade_date': np.repeat(days, n_stocks),
+        'close': close.ravel().round(2)
+    }).to_sql('stock_daily_history', db.engine, if_exists='append', index=False)
+    pd.DataFrame({
+        'ts_code': np.tile(codes, len(days) * len(FACTORS)),
+        'trade_date': np.tile(np.repeat(days, n_stocks), len(FACTORS)),
+        'factor_id': np.repeat(FACTORS, len(days) * n_stocks),
+        'z_score': rng.normal(size=len(days) * n_stocks * len(FACTORS)).round(4)
+    }).to_sql('factor_values', db.engine, if_exists='append', index=False)
+
+
+def _strategies():
+    """两种选股口径 × 不同调仓频率、交易成本和初始资金"""
+    strategies = []
+    for i, (factors, frequency, cost) in enumerate([
+        (['momentum_20d', 'pe_ttm'], 'weekly', 0.001), (['momentum_20d', 'pe_ttm'], 'weekly', 0.003),
+        (['momentum_20d', 'pe_ttm'], 'monthly', 0.001), (['roe'], 'weekly', 0.001)
+    ]):
+        strategies.append({
+            'name': f'S{i}',
+            'config': {'selection_method': 'factor_based', 'factor_list': factors, 'top_n': 5,
+                       'transaction_cost': cost},
+            'rebalance_frequency': frequency,
+            'initial_capital': 1000000.0 * (i + 1)
+        })
+    return strategies
+
+
+def _assert_same(result, reference):
+    assert result['daily_positions'] == reference['daily_positions']
+    assert np.allclose([v['total_value'] for v in result['portfolio_values']],
+                       [v['total_value'] for v in reference['portfolio_values']])
+
+
+def test_parallel_comparison_matches_individual_runs(make_app, tmp_path, monkeypatch):
+    # 工作进程数不超过CPU核数，单核环境下也按两个进程运行
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    app = make_app(f"sqlite:///{tmp_path / 'backtest.db'}")
+    with app.app_context():
+        _seed()
+        strategies = _strategies()
+        references = [BacktestEngine().run_backtest(s['config'], '2024-01-01', '2024-03-29', s['initial_capital'],
+                                                    s['rebalance_frequency']) for s in strategies]
+
+        result = BacktestEngine().compare_strategies(strategies, '2024-01-01', '2024-03-29', max_workers=2)
+
+        assert result['success'] and result['timing']['workers'] == 2
+        assert result['timing']['selection_groups'] == 2
+        assert [s['strategy_name'] for s in result['strategies']] == ['S0', 'S1', 'S2', 'S3']
+        for entry, reference in zip(result['strategies'], references):
+            _assert_same(entry['result'], reference)
+            assert entry['wall_time'] > 0
+        assert set(result['comparison']['wall_time']) == {'S0', 'S1', 'S2', 'S3'}
+        assert result['comparison']['summary']['total_strategies'] == 4
+
+
+def test_serial_comparison_memoizes_selection(app):
+    with app.app_context():
+        _seed()
+        strategies = _strategies()
+        engine = BacktestEngine()
+        calls = []
+        original = engine._select_stocks
+        engine._select_stocks = lambda config, trade_date: calls.append(trade_date) or original(config, trade_date)
+
+        result = StrategyComparisonRunner(engine).run(strategies, '2024-01-01', '2024-03-29')
+
+        assert not result['failed'] and result['timing']['workers'] == 1
+        weekly = set(engine._generate_trade_dates('2024-01-01', '2024-03-29', 'weekly'))
+        monthly = set(engine._generate_trade_dates('2024-01-01', '2024-03-29', 'monthly'))
+        # 前三个策略共享一组选股（周、月调仓日的并集各算一次），第四个策略单独一组
+        assert len(calls) == len(weekly | monthly) + len(weekly)
+        # 比较结束后释放共享面板和缓存
+        assert engine.panel is None and engine.selection_cache == {}
+
+
+def test_comparison_leaves_caller_engine_alone(app, monkeypatch):
+    """策略比较使用独立引擎，不替换或清空调用方引擎上进行中回测的面板；工作进程数不超过CPU核数"""
+    with app.app_context():
+        _seed()
+        engine = BacktestEngine()
+        engine.panel = in_flight = object()
+        engine.selection_cache['in_flight'] = []
+
+        result = engine.compare_strategies(_strategies()[:2], '2024-01-01', '2024-03-29')
+        assert result['success'] and len(result['strategies']) == 2
+        assert engine.panel is in_flight and 'in_flight' in engine.selection_cache
+
+        monkeypatch.setattr(os, 'cpu_count', lambda: 1)
+        result = BacktestEngine().compare_strategies(_strategies()[:2], '2024-01-01', '2024-03-29', max_workers=64)
+        assert result['timing']['workers'] == 1
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式增量指标测试
+验证逐根K线更新的结果与批量计算一致、快照恢复后可继续计算，以及增量写入只追加新行
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.extensions import db
+from app.models.stock_minute_data import StockMinuteData
+from app.models.realtime_indicator import RealtimeIndicator
+from app.models.indicator_stream_state import IndicatorStreamState
+from app.services.realtime_indicator_engine import RealtimeIndicatorEngine
+from app.services.streaming_indicators import StreamingIndicatorEngine
+
+
+def _make_bars(n=200, start=None, seed=3):
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.05, n))
+    start = start or datetime.now().replace(hour=9, minute=35, second=0, microsecond=0) - timedelta(days=2)
+    return pd.DataFrame({
+        'datetime': [start + timedelta(minutes=5 * i) for i in range(n)],
+        'open': close,
+        'high': close + rng.uniform(0, 0.1, n),
+        'low': close - rng.uniform(0, 0.1, n),
+        'close': close,
+        'volume': rng.integers(100, 1000, n).astype(float),
+        'amount': close * 1000
+    })
+
+
+def _batch_rows(df):
+    """用批量计算函数得到 {(指标名, 序号): 值列表}"""
+    engine = RealtimeIndicatorEngine()
+    expected = {}
+    for indicator, func in engine.supported_indicators.items():
+        for name, values in func(df).items():
+            for i, value in enumerate(values):
+                if value is None:
+                    continue
+                value = list(value) if isinstance(value, (list, tuple)) else [value]
+                if any(pd.isna(v) for v in value):
+                    continue
+                # 流式EMA在累计满一个周期后才输出
+                if name.startswith('EMA') and i < int(name[3:]) - 1:
+                    continue
+                expected[(name, i)] = value
+    return expected
+
+
+def test_streaming_matches_batch():
+    """逐根更新的指标值与批量计算一致"""
+    df = _make_bars()
+    expected = _batch_rows(df)
+    
+    engine = StreamingIndicatorEngine()
+    actual = {}
+    for i, bar in enumerate(df.to_dict('records')):
+        for row in engine.update('000001.SZ', '5min', bar):
+            values = [row[f'value{k}'] for k in range(1, 5) if row[f'value{k}'] is not None]
+            actual[(row['indicator_name'], i)] = values
+    
+    assert set(actual) == set(expected)
+    for key, values in expected.items():
+        assert np.allclose(actual[key], values, rtol=1e-9, atol=1e-9), key
+
+
+def test_snapshot_restore_continues():
+    """快照恢复后的状态与不中断时的结果一致"""
+    df = _make_bars()
+    full = StreamingIndicatorEngine()
+    full_rows = full.update_many('000001.SZ', '5min', df)
+    
+    first = StreamingIndicatorEngine()
+    first_rows = first.update_many('000001.SZ', '5min', df.iloc[:120])
+    snapshot = json.loads(json.dumps(first.snapshot()))
+    
+    resumed = StreamingIndicatorEngine()
+    resumed.restore(snapshot)
+    resumed_rows = resumed.update_many('000001.SZ', '5min', df)
+    
+    assert len(first_rows) + len(resumed_rows) == len(full_rows)
+    assert resumed_rows == full_rows[len(first_rows):]
+
+
+def test_incremental_process_appends_only_new_rows(app):
+    """增量处理只追加新K线的指标行，并通过快照表恢复状态"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, RealtimeIndicator.__table__,
+                                                       IndicatorStreamState.__table__])
+        df = _make_bars(100)
+        df['ts_code'] = '000001.SZ'
+        df['period_type'] = '5min'
+        df.iloc[:80].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        
+        engine = RealtimeIndicatorEngine()
+        result = engine.calculate_indicators_incremental('000001.SZ', '5min', ['MACD', 'RSI', 'OBV'])
+        assert result['success'] and result['new_bars'] == 80
+        first_count = RealtimeIndicator.query.count()
+        
+        df.iloc[80:].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        # 新引擎实例从快照表恢复状态，只处理20根新K线
+        engine = RealtimeIndicatorEngine()
+        result = engine.calculate_indicators_incremental('000001.SZ', '5min', ['MACD', 'RSI', 'OBV'])
+        assert result['new_bars'] == 20
+        assert result['stored_records'] == 20 * 3
+        assert RealtimeIndicator.query.count() == first_count + 60
+
+
+def test_incremental_switches_indicator_set_and_commits_atomically(app, monkeypatch):
+    """指标集合从子集改为全部时重建引擎；快照写入失败时指标行一并回滚，下次从快照重新追加"""
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[StockMinuteData.__table__, RealtimeIndicator.__table__,
+                                                       IndicatorStreamState.__table__])
+        df = _make_bars(100)
+        df['ts_code'] = '000001.SZ'
+        df['period_type'] = '5min'
+        df.iloc[:60].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+
+        engine = RealtimeIndicatorEngine()
+        engine.calculate_indicators_incremental('000001.SZ', '5min', ['RSI'])
+        assert engine.streaming_engine.indicators == {'RSI'}
+
+        df.iloc[60:80].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        result = engine.calculate_indicators_incremental('000001.SZ', '5min')
+        assert engine.streaming_engine.indicators is None
+        names = {name for (name,) in db.session.query(RealtimeIndicator.indicator_name).filter(
+            RealtimeIndicator.datetime > df['datetime'].iloc[59].to_pydatetime()).distinct()}
+        assert {'RSI', 'MACD', 'OBV', 'MA5'} <= names
+        count = RealtimeIndicator.query.count()
+        saved = IndicatorStreamState.query.one().last_datetime
+
+        # 快照写入失败：本批指标行不落库，内存状态丢弃
+        df.iloc[80:].to_sql('stock_minute_data', db.engine, if_exists='append', index=False)
+        def fail_snapshot(ts_code, period_type):
+            raise RuntimeError('写入快照失败')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(engine.streaming_engine, '_snapshot_record', fail_snapshot)
+            result = engine.calculate_indicators_incremental('000001.SZ', '5min')
+        assert not result['success']
+        assert RealtimeIndicator.query.count() == count
+        assert ('000001.SZ', '5min') not in engine.streaming_engine.states
+
+        result = engine.calculate_indicators_incremental('000001.SZ', '5min')
+        assert result['success'] and result['new_bars'] == 20
+        assert IndicatorStreamState.query.one().last_datetime > saved
+        assert RealtimeIndicator.query.count() == count + result['stored_records']
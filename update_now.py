@@ -10,7 +10,7 @@ import pandas as pd
 import pymysql
 import os
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 
 # 数据库配置
@@ -37,21 +37,30 @@ def get_trading_days(start_date, end_date):
             dates.append(row[0])
     return dates
 
-def get_last_update_date(ts_code):
-    """获取某只股票的最后更新日期"""
+def get_last_update_dates():
+    """一次分组查询获取所有股票的最后更新日期（高水位）"""
     try:
         conn = pymysql.connect(**DB_CONFIG)
         with conn.cursor() as cursor:
             cursor.execute(
-                "SELECT MAX(trade_date) FROM stock_business WHERE ts_code = %s",
-                (ts_code,)
+                "SELECT ts_code, MAX(trade_date) FROM stock_business GROUP BY ts_code"
             )
-            result = cursor.fetchone()
-            conn.close()
-            return result[0] if result[0] else None
+            watermarks = {row[0]: str(row[1])[:10] for row in cursor.fetchall() if row[1]}
+        conn.close()
+        return watermarks
     except Exception as e:
-        print(f"[ERROR] 获取 {ts_code} 的最后更新日期失败: {e}")
-        return None
+        print(f"[ERROR] 获取最后更新日期失败: {e}")
+        return {}
+
+def get_start_date(last_date, trading_days, default_start="2024-01-01"):
+    """根据高水位计算需要补齐的起始交易日，已是最新时返回 None"""
+    if not last_date:
+        return default_start
+    # 下一个交易日（跨越周末、节假日和漏跑的日期）
+    for day in trading_days:
+        if day > last_date:
+            return day
+    return None
 
 def fetch_stock_data(ts_code, start_date):
     """从 Baostock 获取股票数据"""
@@ -140,23 +149,32 @@ def run_update():
     
     # 更新数据
     print("\n[3/4] 更新行情数据...")
+    watermarks = get_last_update_dates()
+    today = datetime.now().strftime("%Y-%m-%d")
+    earliest = min(watermarks.values()) if watermarks else "2024-01-01"
+    trading_days = get_trading_days(earliest, today)
+    
+    # 已更新到最新交易日的股票不发起网络请求
+    pending = []
+    for ts_code in stocks:
+        start_date = get_start_date(watermarks.get(ts_code), trading_days)
+        if start_date:
+            pending.append((ts_code, start_date))
+    print(f"[OK] 需更新 {len(pending)} 只股票，{len(stocks) - len(pending)} 只已是最新")
+    
     total_inserted = 0
-    for idx, ts_code in enumerate(stocks):
+    for idx, (ts_code, start_date) in enumerate(pending):
         # 转换格式：600000.SH -> sh.600000
         parts = ts_code.split('.')
         baostock_code = f"{parts[1].lower()}.{parts[0]}"
         
-        # 获取最后更新日期
-        last_date = get_last_update_date(ts_code)
-        start_date = (datetime.strptime(last_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d") if last_date else "2024-01-01"
-        
         # 获取并插入数据
         df = fetch_stock_data(baostock_code, start_date)
         inserted = insert_stock_data(df, ts_code)
         total_inserted += inserted
         
         if (idx + 1) % 100 == 0:
-            print(f"[PROGRESS] 已处理 {idx + 1}/{len(stocks)} 只股票，已插入 {total_inserted} 条记录")
+            print(f"[PROGRESS] 已处理 {idx + 1}/{len(pending)} 只股票，已插入 {total_inserted} 条记录")
         
         # 避免请求过于频繁
         time.sleep(0.1)